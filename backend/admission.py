@@ -0,0 +1,193 @@
+"""
+🎟️ ADMISSION CONTROL FOR AGENT RUNS
+A global cap on concurrent agent runs. When it's full, turns wait in fair
+queues:
+- across channels: weighted (stride scheduling), phone calls ahead of webchat
+  without starving it
+- within a channel: round-robin over users, so one busy user can't crowd out
+  everyone else
+
+A turn that can't start within its channel's max wait (or the time its
+deadline has left, whichever is shorter) is rejected with AdmissionRejected,
+and the caller answers with a fast "busy" response.
+
+Usage:
+    async with admission.admit(user_identifier, platform_type):
+        ... agent.run_stream(...)
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from deadlines import capped_wait
+from structured_logging import get_logger
+
+log = get_logger("chat")
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "8"))
+
+# Channel → (scheduling weight, max wait seconds). Voice can't sit in silence for long.
+CHANNEL_POLICIES = {
+    "phone": (4, float(os.getenv("ADMISSION_PHONE_MAX_WAIT_SECONDS", "3"))),
+    "webchat": (1, ADMISSION_MAX_WAIT_SECONDS),
+}
+DEFAULT_POLICY = (1, ADMISSION_MAX_WAIT_SECONDS)
+WAIT_SAMPLES = 500
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn couldn't be admitted before its max wait"""
+    def __init__(self, channel: str, waited: float):
+        self.channel = channel
+        self.waited = waited
+        super().__init__(f"{channel} turn not admitted after {waited:.2f}s (server busy)")
+
+
+class ChannelQueue:
+    """Waiters of one channel, round-robin over users, plus its metrics"""
+
+    def __init__(self, weight: int, max_wait_seconds: float):
+        self.weight = weight
+        self.max_wait_seconds = max_wait_seconds
+        self.pass_value = 0.0   # stride-scheduling virtual time
+        self.users: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.depth = 0
+        self.max_depth = 0
+        self.admitted = 0
+        self.shed = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    def push(self, user: str, waiter: asyncio.Future):
+        self.users.setdefault(user, deque()).append(waiter)
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """Next waiter: first one of the user at the head, who then goes to the back"""
+        while self.users:
+            user, waiters = next(iter(self.users.items()))
+            waiter = waiters.popleft()
+            self.depth -= 1
+            if waiters:
+                self.users.move_to_end(user)
+            else:
+                del self.users[user]
+            if not waiter.done():
+                return waiter
+        return None
+
+    def remove(self, user: str, waiter: asyncio.Future):
+        waiters = self.users.get(user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.depth -= 1
+            if not waiters:
+                del self.users[user]
+
+    def snapshot(self) -> Dict[str, float]:
+        waits = sorted(self.waits)
+        return {
+            "queued": self.depth,
+            "max_queued": self.max_depth,
+            "waiting_users": len(self.users),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "weight": self.weight,
+        }
+
+
+class AdmissionController:
+    """Global concurrency cap with weighted-fair channel queues and per-user round-robin"""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.channels: Dict[str, ChannelQueue] = {}
+        print(f"🎟️ AdmissionController initialized (max {max_concurrent} concurrent agent runs)")
+
+    def _channel(self, name: str) -> ChannelQueue:
+        queue = self.channels.get(name)
+        if queue is None:
+            queue = self.channels[name] = ChannelQueue(*CHANNEL_POLICIES.get(name, DEFAULT_POLICY))
+        return queue
+
+    @asynccontextmanager
+    async def admit(self, user: str, channel: str = "webchat", max_wait_seconds: Optional[float] = None):
+        """Hold one agent-run slot for the duration of the block"""
+        queue = self._channel(channel)
+        started = time.monotonic()
+
+        if self.in_flight < self.max_concurrent and not any(q.depth for q in self.channels.values()):
+            self.in_flight += 1
+        else:
+            if not queue.depth:
+                # An idle channel rejoins at the current virtual time instead of cashing in saved credit
+                active = [q.pass_value for q in self.channels.values() if q.depth]
+                queue.pass_value = max(queue.pass_value, min(active) if active else 0.0)
+            waiter = asyncio.get_running_loop().create_future()
+            queue.push(user, waiter)
+            timeout = capped_wait(queue.max_wait_seconds if max_wait_seconds is None else max_wait_seconds)
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            except asyncio.CancelledError:
+                # Client went away: leave the queue, or pass on a slot that was just handed over
+                if waiter.done():
+                    self._release()
+                else:
+                    queue.remove(user, waiter)
+                    waiter.cancel()
+                raise
+            if not waiter.done():
+                queue.remove(user, waiter)
+                waiter.cancel()
+                queue.shed += 1
+                waited = time.monotonic() - started
+                log.warning(f"🎟️ Shed {channel} turn for {user} after {waited:.2f}s",
+                            in_flight=self.in_flight, queued=queue.depth)
+                raise AdmissionRejected(channel, waited)
+            # The slot was handed over by _release (in_flight already counts it)
+
+        queue.admitted += 1
+        queue.waits.append(time.monotonic() - started)
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        """Hand the slot to the next waiter (weighted across channels), or free it"""
+        while True:
+            candidates = [q for q in self.channels.values() if q.depth]
+            if not candidates:
+                self.in_flight -= 1
+                return
+            queue = min(candidates, key=lambda q: q.pass_value)
+            waiter = queue.pop()
+            if waiter is None:
+                continue
+            queue.pass_value += 1 / queue.weight
+            waiter.set_result(True)
+            return
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_concurrent": self.max_concurrent,
+            "queued": sum(q.depth for q in self.channels.values()),
+            "channels": {name: queue.snapshot() for name, queue in self.channels.items()},
+        }
+
+
+# Global instance
+admission = AdmissionController()
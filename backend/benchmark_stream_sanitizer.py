@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+🧽 BENCHMARK: per-delta strip_html_for_streaming vs StreamingHTMLSanitizer
+
+Streams an HTML-heavy and a mostly-prose answer in deltas of several sizes and
+reports time per streamed character, how many tag fragments leaked to the
+client, and whether the incremental output equals sanitizing the whole answer at once.
+
+Run from backend/:
+    python benchmark_stream_sanitizer.py
+"""
+
+import re
+import timeit
+
+from stream_sanitizer import StreamingHTMLSanitizer, strip_html_for_streaming
+
+ANSWERS = {
+    "html-heavy": (
+        '<div class="product-card"><h3>Gray Sectional &amp; Ottoman</h3>'
+        '<p>Price: <strong>$1,899</strong> &lt;in stock&gt;</p>'
+        '<a href="https://woodstockoutlet.com/p/12345?utm_source=chat">View details</a></div>\n'
+        "Here are a few more options you might like. "
+    ) * 40,
+    "prose": (
+        "Great choice! The Bellamy sectional comes in gray and beige, seats six, and is currently "
+        "<strong>$1,899</strong> at our Woodstock showroom. It pairs well with the matching ottoman "
+        "and we can deliver it within two weeks. Would you like to see a few similar options? "
+    ) * 40,
+}
+DELTA_SIZES = [1, 4, 16, 64]
+LEAK_RE = re.compile(r'<|class=|href=|/div|/strong')
+
+
+def deltas(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def per_delta(parts):
+    return ''.join(strip_html_for_streaming(part) for part in parts)
+
+
+def incremental(parts):
+    sanitizer = StreamingHTMLSanitizer()
+    return ''.join(sanitizer.feed(part) for part in parts) + sanitizer.finish()
+
+
+def main():
+    print(f"{'answer':<11} {'delta':>5}  {'per-delta ns/char':>18}  {'incremental ns/char':>20}  "
+          f"{'per-delta leaks':>15}  {'incremental ok':>14}")
+    for name, answer in ANSWERS.items():
+        expected = strip_html_for_streaming(answer)
+        for size in DELTA_SIZES:
+            parts = deltas(answer, size)
+            runs = max(3, 2000 // len(parts))
+            old = min(timeit.repeat(lambda: per_delta(parts), number=runs, repeat=5)) / runs
+            new = min(timeit.repeat(lambda: incremental(parts), number=runs, repeat=5)) / runs
+            leaks = len(LEAK_RE.findall(per_delta(parts)))
+            print(f"{name:<11} {size:>5}  {old * 1e9 / len(answer):>18.1f}  {new * 1e9 / len(answer):>20.1f}  "
+                  f"{leaks:>15}  {str(incremental(parts) == expected):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+🧭 BENCHMARK: full toolset vs per-intent tool subsets
+
+Offline (default): captures the tool definitions each agent would send to the
+model and counts their tokens per sample message.
+Live (--live): runs every sample through the full agent and the routed agent
+against the real model and compares request tokens and latency.
+
+Run from backend/:
+    python benchmark_tool_subsets.py
+    python benchmark_tool_subsets.py --live --repeat 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-offline")
+
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from main import TurnDeps, UserContext, agent, prompt_content, tool_router
+from prompt_budget import count_tokens
+from tool_routing import classify_intent
+
+SAMPLES = [
+    "hi",
+    "what are your store hours?",
+    "show me sectionals under $2000",
+    "do you have any gray recliners?",
+    "show me the second one",
+    "what's the status of my order?",
+    "my phone is 407-288-6040, what did I buy last year?",
+    "my couch arrived damaged, I need help",
+    "I'd like to book an appointment to see dining sets",
+]
+
+
+def tool_schema_tokens(run_agent, message: str) -> int:
+    """Tokens of the tool definitions the agent sends for one request"""
+    captured = {}
+
+    def capture(messages, info: AgentInfo) -> ModelResponse:
+        captured["tools"] = [
+            {"name": tool.name, "description": tool.description, "parameters": tool.parameters_json_schema}
+            for tool in info.function_tools
+        ]
+        return ModelResponse(parts=[TextPart("ok")])
+
+    with run_agent.override(model=FunctionModel(capture)):
+        run_agent.run_sync(message, deps=TurnDeps("benchmark", 0, "webchat", UserContext("benchmark")))
+    return count_tokens(json.dumps(captured["tools"]))
+
+
+def offline():
+    prompt_tokens = count_tokens(prompt_content)
+    print(f"System prompt: {prompt_tokens} tokens (same for every agent)\n")
+    print(f"{'message':<58} {'intent':<9} {'full':>6} {'routed':>7} {'saved':>6}")
+    full_total = routed_total = 0
+    for message in SAMPLES:
+        intent = classify_intent(message, has_product_context=message.startswith("show me the"))
+        full = tool_schema_tokens(agent, message)
+        routed = tool_schema_tokens(tool_router.agents[intent], message)
+        full_total += full
+        routed_total += routed
+        print(f"{message[:57]:<58} {intent:<9} {full:>6} {routed:>7} {full - routed:>6}")
+    print(f"\nTool-schema tokens: full={full_total} routed={routed_total} "
+          f"({100 * (full_total - routed_total) / full_total:.0f}% fewer)")
+
+
+async def live(repeat: int):
+    deps = TurnDeps("benchmark", 0, "webchat", UserContext("benchmark"))
+    rows = []
+    for message in SAMPLES:
+        intent = classify_intent(message, has_product_context=message.startswith("show me the"))
+        for label, run_agent in (("full", agent), ("routed", tool_router.agents[intent])):
+            for _ in range(repeat):
+                started = time.monotonic()
+                result = await run_agent.run(message, deps=deps)
+                rows.append((message, intent, label, result.usage().request_tokens or 0, time.monotonic() - started))
+
+    for label in ("full", "routed"):
+        tokens = [row[3] for row in rows if row[2] == label]
+        latency = [row[4] for row in rows if row[2] == label]
+        print(f"{label:<7} request_tokens avg={statistics.mean(tokens):.0f}  "
+              f"latency p50={statistics.median(latency) * 1000:.0f}ms max={max(latency) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full toolset vs per-intent tool subsets")
+    parser.add_argument("--live", action="store_true", help="Call the real model (needs OPENAI_API_KEY)")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    if args.live:
+        asyncio.run(live(args.repeat))
+    else:
+        offline()
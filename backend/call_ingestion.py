@@ -0,0 +1,168 @@
+"""
+📥 ASYNCHRONOUS END-OF-CALL INGESTION
+Vapi waits on the end-of-call webhook, so the webhook only validates the report
+and queues it; this worker does the rest in the background:
+- resolve the caller and their phone conversation
+- insert the whole transcript in one transaction (memory.save_transcript)
+- run memory extraction once for the call, not every few messages
+- a report that fails (e.g. the database is down) is retried with backoff;
+  once CALL_INGEST_MAX_ATTEMPTS are spent, on_failure(call_id) lets the
+  webhook forget the call's idempotency key so a resend is ingested
+
+    call_ingestion.start(resolve_conversation, extract_memory, on_failure)   # at startup
+    if not call_ingestion.enqueue(call_id, phone_number, transcript):
+        ...                                                      # queue full → 503, Vapi retries
+    await call_ingestion.stop()                                  # at shutdown, drains the queue
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from conversation_memory import memory
+from structured_logging import get_logger
+
+log = get_logger("voice")
+
+CALL_INGEST_QUEUE_SIZE = int(os.getenv("CALL_INGEST_QUEUE_SIZE", "1000"))
+CALL_INGEST_DRAIN_SECONDS = float(os.getenv("CALL_INGEST_DRAIN_SECONDS", "10"))
+CALL_INGEST_MAX_ATTEMPTS = int(os.getenv("CALL_INGEST_MAX_ATTEMPTS", "4"))
+# Delay before the first retry, doubled for each later one
+CALL_INGEST_RETRY_SECONDS = float(os.getenv("CALL_INGEST_RETRY_SECONDS", "2"))
+
+ROLE_ALIASES = {"user": "user", "assistant": "assistant", "bot": "assistant"}
+
+
+def transcript_messages(transcript: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """(role, content) for each transcript line we store; unknown roles and empty lines are dropped"""
+    messages = []
+    for line in transcript:
+        if not isinstance(line, dict):
+            continue
+        role = ROLE_ALIASES.get(line.get("role") or "")
+        content = line.get("content") or line.get("message") or ""
+        if role and content:
+            messages.append((role, content))
+    return messages
+
+
+class CallReport:
+    __slots__ = ("call_id", "phone_number", "messages", "received_at", "attempts")
+
+    def __init__(self, call_id: str, phone_number: str, messages: List[Tuple[str, str]]):
+        self.call_id = call_id
+        self.phone_number = phone_number
+        self.messages = messages
+        self.received_at = time.monotonic()
+        self.attempts = 0
+
+
+class CallIngestion:
+    """Bounded queue of end-of-call reports and the worker that stores them"""
+
+    def __init__(self, max_queued: int = CALL_INGEST_QUEUE_SIZE):
+        self._queue: "asyncio.Queue[CallReport]" = asyncio.Queue(maxsize=max_queued)
+        self._worker: Optional[asyncio.Task] = None
+        self._resolve_conversation: Optional[Callable[[str], Awaitable[Tuple[str, str]]]] = None
+        self._extract_memory: Optional[Callable[[str, str], Awaitable[None]]] = None
+        self._on_failure: Optional[Callable[[str], None]] = None
+        self._retrying = 0   # reports waiting for their next attempt
+        self.stats = {"queued": 0, "rejected": 0, "calls": 0, "messages": 0, "retries": 0, "failures": 0,
+                      "last_insert_ms": 0.0, "last_lag_ms": 0.0}
+
+    def start(self, resolve_conversation: Callable[[str], Awaitable[Tuple[str, str]]],
+              extract_memory: Optional[Callable[[str, str], Awaitable[None]]] = None,
+              on_failure: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            resolve_conversation: phone number → (caller key, conversation_id)
+            extract_memory: (conversation_id, caller key) → memory extraction, once per call
+            on_failure: call_id of a report given up on after CALL_INGEST_MAX_ATTEMPTS
+        """
+        self._resolve_conversation = resolve_conversation
+        self._extract_memory = extract_memory
+        self._on_failure = on_failure
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, call_id: str, phone_number: str, messages: List[Tuple[str, str]]) -> bool:
+        """Queue a call's transcript; False when the queue is full"""
+        try:
+            self._queue.put_nowait(CallReport(call_id, phone_number, messages))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            log.warning(f"⚠️ Call ingestion queue full, rejecting call {call_id}")
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _run(self):
+        while True:
+            report = await self._queue.get()
+            try:
+                await self._ingest(report)
+            except Exception as e:
+                self._failed(report, e)
+            finally:
+                self._queue.task_done()
+
+    def _failed(self, report: CallReport, error: Exception):
+        """Schedule the next attempt with backoff, or give the report up"""
+        report.attempts += 1
+        if report.attempts < CALL_INGEST_MAX_ATTEMPTS:
+            delay = CALL_INGEST_RETRY_SECONDS * 2 ** (report.attempts - 1)
+            self.stats["retries"] += 1
+            self._retrying += 1
+            log.warning(f"⚠️ Call ingestion failed for {report.call_id} (attempt {report.attempts}), "
+                        f"retrying in {delay:.1f}s: {error}")
+            asyncio.get_running_loop().call_later(delay, self._retry, report)
+            return
+        self.stats["failures"] += 1
+        log.error(f"❌ Call ingestion failed for {report.call_id} after {report.attempts} attempts, "
+                  f"{len(report.messages)} transcript messages not saved: {error}")
+        if self._on_failure is not None:
+            self._on_failure(report.call_id)
+
+    def _retry(self, report: CallReport):
+        self._retrying -= 1
+        try:
+            self._queue.put_nowait(report)
+        except asyncio.QueueFull:
+            self._failed(report, RuntimeError("ingestion queue full"))
+
+    async def _ingest(self, report: CallReport):
+        self.stats["last_lag_ms"] = round((time.monotonic() - report.received_at) * 1000, 1)
+        caller_key, conversation_id = await self._resolve_conversation(report.phone_number)
+        started = time.monotonic()
+        saved = await memory.save_transcript(conversation_id, report.messages)
+        self.stats["last_insert_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self.stats["calls"] += 1
+        self.stats["messages"] += saved
+        log.info(f"💾 Call {report.call_id}: {saved} transcript messages saved in one transaction")
+        if saved and self._extract_memory is not None:
+            # The transcript is stored: a failed extraction must not retry (and duplicate) the insert
+            try:
+                await self._extract_memory(conversation_id, caller_key)
+            except Exception as e:
+                log.warning(f"⚠️ Memory extraction failed for call {report.call_id}: {e}")
+
+    async def stop(self):
+        """Finish the queued calls (up to CALL_INGEST_DRAIN_SECONDS), then stop the worker"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), CALL_INGEST_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            log.warning(f"⚠️ {self._queue.qsize()} call reports not ingested before shutdown")
+        if self._retrying:
+            log.warning(f"⚠️ {self._retrying} call reports were waiting for a retry at shutdown")
+        self._worker.cancel()
+        self._worker = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": self._queue.qsize(), "retrying": self._retrying, "running": bool(self._worker and not self._worker.done())}
+
+
+# Global instance
+call_ingestion = CallIngestion()
@@ -0,0 +1,95 @@
+"""
+⏱️ PER-STEP DEADLINES FOR TURN CONTEXT
+Independent context sources (history, enhanced memory, ...) are started as
+tasks at the same time; each has its own deadline and fallback, so a slow
+source is skipped instead of holding up the turn.
+
+Usage:
+    history_task = context_steps.start("history", memory.get_message_history(cid), fallback=[])
+    ...
+    message_history = await history_task   # never raises: fallback on timeout/error
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Dict
+
+from deadlines import capped_wait
+from structured_logging import get_logger
+
+log = get_logger("chat")
+
+# Per-step deadlines (ms), overridable with CONTEXT_DEADLINE_<STEP>_MS
+STEP_DEADLINES_MS = {
+    "history": 2000,
+    "enhanced_context": 800,
+}
+
+
+def step_deadline(name: str) -> float:
+    """Deadline for a step in seconds"""
+    return int(os.getenv(f"CONTEXT_DEADLINE_{name.upper()}_MS", STEP_DEADLINES_MS.get(name, 1000))) / 1000
+
+
+class StepStats:
+    """Outcome counters and latency for one step"""
+
+    def __init__(self):
+        self.ok = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        runs = self.ok + self.timed_out + self.failed
+        return {
+            "ok": self.ok,
+            "timed_out": self.timed_out,
+            "failed": self.failed,
+            "avg_ms": round(self.total_ms / runs, 1) if runs else 0.0,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class ContextSteps:
+    """Runs context steps as deadline-bounded tasks and keeps per-step stats"""
+
+    def __init__(self):
+        self.stats: Dict[str, StepStats] = {}
+
+    def start(self, name: str, coro: Awaitable, fallback: Any, deadline: float = None) -> "asyncio.Task":
+        """Start a step now; the task resolves to its result, or `fallback` on timeout/error"""
+        if deadline is None:
+            deadline = step_deadline(name)
+        # A step never outlives the turn's own deadline
+        deadline = capped_wait(deadline)
+        return asyncio.create_task(self._run(name, coro, deadline, fallback))
+
+    async def _run(self, name: str, coro: Awaitable, deadline: float, fallback: Any) -> Any:
+        stats = self.stats.setdefault(name, StepStats())
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(coro, timeout=deadline)
+            stats.ok += 1
+            return result
+        except asyncio.TimeoutError:
+            stats.timed_out += 1
+            log.info(f"⏱️ Skipped {name}: no result within {deadline * 1000:.0f}ms")
+            return fallback
+        except Exception as e:
+            stats.failed += 1
+            log.warning(f"⚠️ {name} failed, continuing without it: {e}")
+            return fallback
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+# Global instance
+context_steps = ContextSteps()
@@ -1,72 +1,314 @@
 """
 Simple Conversation Memory using EXISTING PostgreSQL tables
+
+Safe to run in several workers with STATE_STORE=postgres:
+- active conversation ids live in the state store ("conversation_ids")
+- each worker's history cache entry carries the conversation's version from
+  the state store ("history_versions"), bumped on every save; an entry whose
+  version moved on elsewhere is reloaded
+- messages are written through instead of queued, so a direct DB read on any
+  worker already sees them (the write-behind queue only batches when the
+  state is per-process, i.e. one worker)
 """
 
 import asyncio
 import json
 import uuid
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, List, Optional, Dict, Any, Tuple
 import asyncpg
 import os
 from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, UserPromptPart, TextPart
 
+from state_store import state_store
+from structured_logging import get_logger
+
+log = get_logger("db")
+
+HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW_MESSAGES', '50'))
+HISTORY_CACHE_CONVERSATIONS = int(os.getenv('HISTORY_CACHE_CONVERSATIONS', '500'))
+CONVERSATION_ID_TTL_SECONDS = int(os.getenv('CONVERSATION_ID_TTL_SECONDS', '86400'))
+HISTORY_VERSION_TTL_SECONDS = int(os.getenv('HISTORY_VERSION_TTL_SECONDS', '86400'))
+MESSAGE_FLUSH_INTERVAL_SECONDS = int(os.getenv('MESSAGE_FLUSH_INTERVAL_MS', '50')) / 1000
+MESSAGE_FLUSH_BATCH_SIZE = int(os.getenv('MESSAGE_FLUSH_BATCH_SIZE', '200'))
+MESSAGE_FLUSH_MAX_RETRIES = 3
+
+INSERT_MESSAGE_SQL = """
+    INSERT INTO chatbot_messages (
+        conversation_id, message_role, message_content,
+        executed_function_name, function_input_parameters, function_output_result,
+        message_created_at
+    ) VALUES ($1, $2, $3, $4, $5, $6, $7::timestamptz)
+"""
+# Errors caused by a row itself (e.g. a conversation_id that violates the FK), not by the connection
+ROW_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+
+def to_model_message(role: str, content: str, function_name: Optional[str] = None,
+                     function_args: Any = None) -> Optional[ModelMessage]:
+    """Stored chat row → PydanticAI message (None for roles we don't replay)"""
+    if role == 'user':
+        return ModelRequest(parts=[UserPromptPart(content=content)])
+    if role != 'assistant':
+        return None
+
+    # 🔥 BUG-005 FIX: Include function execution context so the model sees "I called X() and got Y, so..."
+    if function_name:
+        function_context = f"\n\n[Function Call Context: {function_name}("
+        if function_args:
+            try:
+                args_dict = json.loads(function_args) if isinstance(function_args, str) else function_args
+                function_context += f"{json.dumps(args_dict)}"
+            except Exception:
+                function_context += "..."
+        function_context += ") executed]"
+        content = function_context + "\n\n" + content
+    return ModelResponse(parts=[TextPart(content=content)])
+
+
+class CrossChannelHistory:
+    """
+    A caller's newest messages across every channel, loaded once per turn by a
+    channel endpoint (phone). The chat pipeline splits them into this
+    conversation's history and a short context block for the other channels,
+    instead of querying the conversation's history again.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows    # oldest first, as get_unified_conversation_history returns them
+
+    def history(self, conversation_id: str) -> List[ModelMessage]:
+        """PydanticAI history of this conversation"""
+        return [
+            message for message in (
+                to_model_message(row['role'], row['content'],
+                                 row.get('executed_function_name'), row.get('function_input_parameters'))
+                for row in self.rows if str(row.get('conversation_id')) == str(conversation_id)
+            ) if message is not None
+        ]
+
+    def other_channels(self, conversation_id: str, max_messages: int = 5, max_chars: int = 100) -> str:
+        """Newest messages from the caller's other conversations, as one context block"""
+        rows = [row for row in self.rows if str(row.get('conversation_id')) != str(conversation_id)
+                and row.get('role') in ('user', 'assistant')][-max_messages:]
+        if not rows:
+            return ""
+        lines = [f"[{row.get('platform_type') or 'unknown'}] {row['role']}: {(row.get('content') or '')[:max_chars]}"
+                 for row in rows]
+        return "Previous conversation context (other channels):\n" + "\n".join(lines)
+
+
+class _CachedHistory:
+    __slots__ = ("messages", "version")
+
+    def __init__(self, messages: Deque[ModelMessage], version: Optional[int]):
+        self.messages = messages
+        self.version = version
+
+
+class HistoryCache:
+    """
+    LRU of built PydanticAI message lists per conversation (last HISTORY_WINDOW messages).
+    Saves append to a cached conversation, so a typical turn needs no history query.
+    Each entry remembers the conversation version it is current for (None when unversioned).
+    """
+
+    def __init__(self, window: int = HISTORY_WINDOW, max_conversations: int = HISTORY_CACHE_CONVERSATIONS):
+        self.window = window
+        self.max_conversations = max_conversations
+        self._entries: "OrderedDict[str, _CachedHistory]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "appends": 0, "evictions": 0}
+
+    def get(self, conversation_id: str, limit: int, version: Optional[int] = None) -> Optional[List[ModelMessage]]:
+        entry = self._entries.get(conversation_id)
+        if entry is not None and entry.version != version:
+            # Another worker saved to this conversation since the entry was built
+            self.invalidate(conversation_id)
+            self.stats["stale"] += 1
+            entry = None
+        if entry is None or limit > self.window:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.stats["hits"] += 1
+        return list(entry.messages)[-limit:] if limit else []
+
+    def put(self, conversation_id: str, messages: List[ModelMessage], version: Optional[int] = None):
+        self._entries[conversation_id] = _CachedHistory(deque(messages, maxlen=self.window), version)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def append(self, conversation_id: str, message: Optional[ModelMessage],
+               previous: Optional[int] = None, version: Optional[int] = None):
+        """
+        Add a just-saved message; only conversations already cached are kept up to date.
+        The save moved the conversation from `previous` to `version`: an entry at any
+        other version has missed someone else's save and is dropped instead.
+        """
+        entry = self._entries.get(conversation_id)
+        if entry is None or message is None:
+            return
+        if entry.version != previous:
+            self.invalidate(conversation_id)
+            self.stats["stale"] += 1
+            return
+        entry.messages.append(message)
+        entry.version = version
+        self.stats["appends"] += 1
+
+    def invalidate(self, conversation_id: str):
+        self._entries.pop(conversation_id, None)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "conversations": len(self._entries), "window": self.window}
+
+
 class SimpleMemory:
     def __init__(self):
         self.db_url = os.getenv('DATABASE_URL')
         self.pool = None
-        print("🔧 SimpleMemory initialized")
+        self.history_cache = HistoryCache()
+        self._upsert_ready = False
+        # "platform_type:user_identifier" → active conversation_id, shared by every worker
+        self._conversation_ids = state_store.namespace("conversation_ids", CONVERSATION_ID_TTL_SECONDS)
+        # conversation_id → version, bumped on every save (see HistoryCache)
+        self._history_versions = state_store.namespace("history_versions", HISTORY_VERSION_TTL_SECONDS)
+        # Write-behind message queue: (conversation_id, role, content, fn, args, result, created_at)
+        self._pending: List[tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_retries = 0
+        self.write_stats = {"queued": 0, "written_through": 0, "flushed": 0, "batches": 0, "failures": 0, "dropped": 0}
+        log.notice("🔧 SimpleMemory initialized")
     
     async def init_pool(self):
         """Initialize database connection pool"""
         if not self.pool:
             self.pool = await asyncpg.create_pool(self.db_url, min_size=1, max_size=3)
-            print("✅ PostgreSQL pool initialized")
+            log.notice("✅ PostgreSQL pool initialized")
     
     async def init_db(self):
         """Initialize database connection pool"""
         if not self.pool:
             self.pool = await asyncpg.create_pool(self.db_url, min_size=1, max_size=3)
-            print("✅ PostgreSQL pool initialized")
+            log.notice("✅ PostgreSQL pool initialized")
+            try:
+                async with self.pool.acquire() as conn:
+                    # Tail-window history reads walk this index newest-first
+                    await conn.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_chatbot_messages_conversation_created
+                        ON chatbot_messages (conversation_id, message_created_at DESC)
+                    """)
+            except Exception as e:
+                log.warning(f"⚠️ Could not ensure history index: {e}")
+            await self._ensure_active_conversation_index()
+    
+    async def _ensure_active_conversation_index(self):
+        """One active conversation per (user, platform), so session resolution can be a single upsert"""
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    # Older racing inserts may have left duplicates; keep only the most recent active one
+                    retired = await conn.execute("""
+                        UPDATE chatbot_conversations SET is_active = false
+                        WHERE conversation_id IN (
+                            SELECT conversation_id FROM (
+                                SELECT conversation_id, ROW_NUMBER() OVER (
+                                    PARTITION BY user_identifier, platform_type
+                                    ORDER BY last_message_at DESC
+                                ) AS rank
+                                FROM chatbot_conversations WHERE is_active = true
+                            ) ranked WHERE rank > 1
+                        )
+                    """)
+                    await conn.execute("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS uq_chatbot_conversations_active
+                        ON chatbot_conversations (user_identifier, platform_type) WHERE is_active = true
+                    """)
+            self._upsert_ready = True
+            log.notice(f"✅ Active-conversation unique index ready ({retired})")
+        except Exception as e:
+            log.warning(f"⚠️ Could not ensure active-conversation index, using SELECT-then-INSERT: {e}")
     
     async def get_or_create_conversation(self, user_identifier: str, platform_type: str = 'webchat') -> str:
-        """Get existing conversation or create new one - MULTI-CHANNEL SUPPORT"""
+        """Get existing conversation or create new one - MULTI-CHANNEL SUPPORT (cached per session)"""
+        key = f"{platform_type}:{user_identifier}"
+        cached = await self._conversation_ids.get(key)
+        if cached:
+            return cached
+        
         try:
             async with self.pool.acquire() as conn:
-                # Get existing active conversation for this platform
-                conversation = await conn.fetchrow("""
-                    SELECT conversation_id FROM chatbot_conversations 
-                    WHERE user_identifier = $1 AND platform_type = $2 AND is_active = true
-                    ORDER BY last_message_at DESC
-                    LIMIT 1
-                """, user_identifier, platform_type)
-                
-                if conversation:
-                    conv_id = str(conversation['conversation_id'])
-                    print(f"📚 Found existing {platform_type} conversation: {conv_id}")
-                    return conv_id
-                
-                # Create new conversation
-                conversation_id = await conn.fetchval("""
-                    INSERT INTO chatbot_conversations (user_identifier, platform_type)
-                    VALUES ($1, $2)
-                    RETURNING conversation_id
-                """, user_identifier, platform_type)
+                if self._upsert_ready:
+                    # One round trip, race-free: the partial unique index makes concurrent creates converge
+                    conversation_id = await conn.fetchval("""
+                        INSERT INTO chatbot_conversations (user_identifier, platform_type)
+                        VALUES ($1, $2)
+                        ON CONFLICT (user_identifier, platform_type) WHERE is_active = true
+                        DO UPDATE SET is_active = true
+                        RETURNING conversation_id
+                    """, user_identifier, platform_type)
+                else:
+                    conversation_id = await conn.fetchval("""
+                        SELECT conversation_id FROM chatbot_conversations 
+                        WHERE user_identifier = $1 AND platform_type = $2 AND is_active = true
+                        ORDER BY last_message_at DESC
+                        LIMIT 1
+                    """, user_identifier, platform_type)
+                    if not conversation_id:
+                        conversation_id = await conn.fetchval("""
+                            INSERT INTO chatbot_conversations (user_identifier, platform_type)
+                            VALUES ($1, $2)
+                            RETURNING conversation_id
+                        """, user_identifier, platform_type)
                 
                 conv_id = str(conversation_id)
-                print(f"✅ New {platform_type} conversation created: {conv_id}")
+                await self._conversation_ids.set(key, conv_id)
+                log.info(f"📚 Resolved {platform_type} conversation: {conv_id}")
                 return conv_id
                 
         except Exception as e:
-            print(f"❌ Error managing conversation: {e}")
+            log.error(f"❌ Error managing conversation: {e}")
+            return str(uuid.uuid4())
+    
+    async def start_new_conversation(self, user_identifier: str, platform_type: str = 'webchat') -> str:
+        """Retire the user's active conversation on this platform and open a fresh one"""
+        key = f"{platform_type}:{user_identifier}"
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        UPDATE chatbot_conversations SET is_active = false
+                        WHERE user_identifier = $1 AND platform_type = $2 AND is_active = true
+                    """, user_identifier, platform_type)
+                    conversation_id = await conn.fetchval("""
+                        INSERT INTO chatbot_conversations (user_identifier, platform_type)
+                        VALUES ($1, $2)
+                        RETURNING conversation_id
+                    """, user_identifier, platform_type)
+            conv_id = str(conversation_id)
+            await self._conversation_ids.set(key, conv_id)
+            log.info(f"✅ New {platform_type} conversation created: {conv_id}")
+            return conv_id
+        except Exception as e:
+            log.error(f"❌ Error starting conversation: {e}")
+            await self._conversation_ids.delete(key)
             return str(uuid.uuid4())
     
-    async def get_unified_conversation_history(self, user_identifier: str, limit: int = 20) -> List[Dict]:
-        """Get conversation history across ALL channels for a user"""
+    async def get_unified_conversation_history(self, user_identifier: str, limit: int = 20,
+                                               aliases: Optional[List[str]] = None) -> List[Dict]:
+        """Get conversation history across ALL channels for a user (and any linked identifiers)"""
+        await self._read_barrier()
+        identifiers = list(dict.fromkeys([user_identifier] + (aliases or [])))
         try:
             async with self.pool.acquire() as conn:
                 messages = await conn.fetch("""
                     SELECT 
+                        cm.conversation_id,
                         cm.message_role as role,
                         cm.message_content as content,
                         cm.message_created_at as created_at,
@@ -76,77 +318,193 @@ class SimpleMemory:
                         cm.function_output_result
                     FROM chatbot_messages cm
                     JOIN chatbot_conversations cc ON cm.conversation_id = cc.conversation_id
-                    WHERE cc.user_identifier = $1
+                    WHERE cc.user_identifier = ANY($1::text[])
                     ORDER BY cm.message_created_at DESC
                     LIMIT $2
-                """, user_identifier, limit)
+                """, identifiers, limit)
                 
                 return [dict(msg) for msg in reversed(messages)]
         except Exception as e:
-            print(f"❌ Error getting unified history: {e}")
+            log.error(f"❌ Error getting unified history: {e}")
             return []
     
+    def _validate_content(self, role: str, content: str) -> Optional[str]:
+        """🔥 BUG-016 / BUG-017 FIX: drop empty messages, truncate ones over 5000 characters"""
+        if not content or not content.strip():
+            log.warning(f"⚠️ Skipping empty {role} message (BUG-016 prevention)")
+            return None
+        if len(content) > 5000:
+            log.warning(f"⚠️ Truncating long {role} message: {len(content)} chars → 5000 chars (BUG-017 prevention)")
+            content = content[:4950] + "\n\n[...message truncated for length...]"
+        return content
+    
     async def save_user_message(self, conversation_id: str, content: str):
-        """Save user message with validation (BUG-016 & BUG-017 FIX)"""
-        try:
-            # 🔥 BUG-016 FIX: Validate content is not empty/null
-            if not content or not content.strip():
-                print(f"⚠️ Skipping empty user message (BUG-016 prevention)")
-                return None
-            
-            # 🔥 BUG-017 FIX: Truncate messages over 5000 characters
-            if len(content) > 5000:
-                print(f"⚠️ Truncating long user message: {len(content)} chars → 5000 chars (BUG-017 prevention)")
-                content = content[:4950] + "\n\n[...message truncated for length...]"
-            
-            async with self.pool.acquire() as conn:
-                message_id = await conn.fetchval("""
-                    INSERT INTO chatbot_messages (conversation_id, message_role, message_content)
-                    VALUES ($1, 'user', $2)
-                    RETURNING message_id
-                """, conversation_id, content)
-                print(f"💾 User message saved (ID: {message_id}, length: {len(content)} chars)")
-                return message_id
-        except Exception as e:
-            print(f"❌ Error saving user message: {e}")
+        """Save a user message (queued or written through, see _write); True when saved"""
+        content = self._validate_content('user', content)
+        if content is None:
             return None
+        await self._write(conversation_id, 'user', content, None, None, None)
+        await self._append_history(conversation_id, to_model_message('user', content))
+        return True
     
     async def save_assistant_message(self, conversation_id: str, content: str, 
                                    function_name: Optional[str] = None,
                                    function_args: Optional[Dict] = None,
                                    function_result: Optional[Any] = None):
-        """Save assistant message with optional function data (BUG-016 & BUG-017 FIX)"""
-        try:
-            # 🔥 BUG-016 FIX: Validate content is not empty/null
-            if not content or not content.strip():
-                print(f"⚠️ Skipping empty assistant message (BUG-016 prevention)")
-                return None
-            
-            # 🔥 BUG-017 FIX: Truncate messages over 5000 characters
-            if len(content) > 5000:
-                print(f"⚠️ Truncating long assistant message: {len(content)} chars → 5000 chars (BUG-017 prevention)")
-                content = content[:4950] + "\n\n[...message truncated for length...]"
-            
-            async with self.pool.acquire() as conn:
-                message_id = await conn.fetchval("""
-                    INSERT INTO chatbot_messages (
-                        conversation_id, message_role, message_content,
-                        executed_function_name, function_input_parameters, function_output_result
-                    ) VALUES ($1, 'assistant', $2, $3, $4, $5)
-                    RETURNING message_id
-                """, 
-                    conversation_id, content, function_name,
-                    json.dumps(function_args) if function_args else None,
-                    json.dumps(function_result) if function_result else None
-                )
-                print(f"💾 Assistant message saved (ID: {message_id}, length: {len(content)} chars)")
-                return message_id
-        except Exception as e:
-            print(f"❌ Error saving assistant message: {e}")
+        """Save an assistant message (with optional function data), queued or written through"""
+        content = self._validate_content('assistant', content)
+        if content is None:
             return None
+        await self._write(
+            conversation_id, 'assistant', content, function_name,
+            json.dumps(function_args) if function_args else None,
+            json.dumps(function_result) if function_result else None
+        )
+        await self._append_history(
+            conversation_id, to_model_message('assistant', content, function_name, function_args)
+        )
+        return True
+    
+    async def _append_history(self, conversation_id: str, message: Optional[ModelMessage]):
+        previous, version = await self._history_versions.bump(conversation_id)
+        self.history_cache.append(conversation_id, message, previous, version)
+    
+    # ------------------------------------------------------------------
+    # Write-behind: messages are inserted in batches off the response path.
+    # The history cache already holds them, so the same process reads its own writes;
+    # direct DB reads flush first, and close() drains everything.
+    # With a shared state store other workers read the database directly, so rows
+    # are inserted at once and only the ones that fail are queued for retry.
+    # ------------------------------------------------------------------
+    
+    async def _write(self, conversation_id: str, role: str, content: str, function_name: Optional[str],
+                     function_args: Optional[str], function_result: Optional[str]):
+        # Timestamp now: rows flushed in one transaction would otherwise share NOW()
+        row = (conversation_id, role, content, function_name, function_args, function_result,
+               datetime.now(timezone.utc))
+        if state_store.backend.shared:
+            try:
+                async with self.pool.acquire() as conn:
+                    await conn.execute(INSERT_MESSAGE_SQL, *row)
+                self.write_stats["written_through"] += 1
+                return
+            except Exception as e:
+                log.error(f"❌ Could not write {role} message through ({e}), queueing it for retry")
+        self._enqueue(row)
+    
+    def _enqueue(self, row: tuple):
+        self._pending.append(row)
+        self.write_stats["queued"] += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._pending) >= MESSAGE_FLUSH_BATCH_SIZE:
+            self._flush_wakeup.set()
+    
+    async def _flush_loop(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=MESSAGE_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Insert every queued message now (one executemany per batch)"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:MESSAGE_FLUSH_BATCH_SIZE]
+                del self._pending[:len(batch)]
+                try:
+                    async with self.pool.acquire() as conn:
+                        await conn.executemany(INSERT_MESSAGE_SQL, batch)
+                    self.write_stats["flushed"] += len(batch)
+                    self.write_stats["batches"] += 1
+                    log.info(f"💾 Flushed {len(batch)} messages")
+                except ROW_ERRORS as e:
+                    # The batch is shared by every conversation: one bad row must not cost the others theirs
+                    self.write_stats["failures"] += 1
+                    log.error(f"❌ Batch of {len(batch)} messages rejected ({e}), inserting row by row")
+                    try:
+                        await self._insert_each(batch)
+                    except Exception as e:
+                        if self._requeue(batch, e):
+                            return
+                except Exception as e:
+                    if self._requeue(batch, e):
+                        return
+                self._flush_retries = 0
     
-    async def get_recent_messages(self, conversation_id: str, limit: int = 10) -> List[Dict]:
-        """Get recent messages from conversation"""
+    async def _insert_each(self, batch: List[tuple]):
+        """Insert rows one at a time, dropping only the ones the database rejects; rows are removed from batch as they're done"""
+        async with self.pool.acquire() as conn:
+            while batch:
+                row = batch[0]
+                try:
+                    await conn.execute(INSERT_MESSAGE_SQL, *row)
+                    self.write_stats["flushed"] += 1
+                except ROW_ERRORS as e:
+                    self.write_stats["dropped"] += 1
+                    log.error(f"❌ Dropped {row[1]} message for conversation {row[0]}: {e}")
+                del batch[0]
+    
+    def _requeue(self, batch: List[tuple], error: Exception) -> bool:
+        """
+        Rows that failed for a non-row reason (connection, pool) go back in order at the head of
+        the queue, for the loop to retry after the interval. True when requeued; once retries
+        are exhausted they are dropped and flushing goes on.
+        """
+        self.write_stats["failures"] += 1
+        log.error(f"❌ Error flushing {len(batch)} messages: {error}")
+        if self._flush_retries < MESSAGE_FLUSH_MAX_RETRIES:
+            self._flush_retries += 1
+            self._pending[:0] = batch
+            return True
+        self.write_stats["dropped"] += len(batch)
+        return False
+    
+    async def save_transcript(self, conversation_id: str, messages: List[Tuple[str, str]]) -> int:
+        """
+        Insert a whole transcript [(role, content), ...] in one transaction (one executemany),
+        bypassing the write-behind queue; returns the number of messages saved
+        """
+        started = datetime.now(timezone.utc)
+        rows = []
+        for role, content in messages:
+            content = self._validate_content(role, content)
+            if content is None:
+                continue
+            # One microsecond apart, so the transcript keeps its order
+            rows.append((conversation_id, role, content, started + timedelta(microseconds=len(rows))))
+        if not rows:
+            return 0
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO chatbot_messages (conversation_id, message_role, message_content, message_created_at)
+                    VALUES ($1, $2, $3, $4::timestamptz)
+                """, rows)
+        previous, version = await self._history_versions.bump(conversation_id)
+        for _, role, content, _ in rows:
+            self.history_cache.append(conversation_id, to_model_message(role, content), previous, version)
+            previous = version
+        return len(rows)
+    
+    async def _read_barrier(self):
+        """Direct DB reads must see queued messages (other workers' saves are written through)"""
+        if self._pending:
+            await self.flush()
+    
+    def write_snapshot(self) -> Dict[str, int]:
+        return {**self.write_stats, "pending": len(self._pending)}
+    
+    async def get_recent_messages(self, conversation_id: str, limit: int = 10,
+                                  before: Optional[datetime] = None) -> List[Dict]:
+        """
+        Newest `limit` user/assistant messages of a conversation, oldest first.
+        Pass `before` (a message_created_at) to page further back (keyset pagination).
+        """
+        await self._read_barrier()
         try:
             async with self.pool.acquire() as conn:
                 messages = await conn.fetch("""
@@ -155,33 +513,55 @@ class SimpleMemory:
                         message_content,
                         executed_function_name,
                         function_input_parameters,
-                        function_output_result,
                         message_created_at
                     FROM chatbot_messages 
                     WHERE conversation_id = $1
-                    ORDER BY message_created_at ASC
+                    AND message_role IN ('user', 'assistant')
+                    AND ($3::timestamp IS NULL OR message_created_at < $3)
+                    ORDER BY message_created_at DESC
                     LIMIT $2
-                """, conversation_id, limit)
+                """, conversation_id, limit, before)
                 
-                # Convert to simple format for PydanticAI
+                # Tail was fetched newest-first; hand it back in conversation order
                 simple_messages = []
-                for msg in messages:
-                    # Only add user and assistant messages to history
-                    if msg['message_role'] in ['user', 'assistant']:
-                        simple_messages.append({
-                            'role': msg['message_role'],
-                            'content': msg['message_content']
-                        })
+                for msg in reversed(messages):
+                    simple_messages.append({
+                        'role': msg['message_role'],
+                        'content': msg['message_content'],
+                        'executed_function_name': msg['executed_function_name'],
+                        'function_input_parameters': msg['function_input_parameters'],
+                        'created_at': msg['message_created_at']
+                    })
                 
-                print(f"📚 Loaded {len(simple_messages)} messages from DB")
+                log.info(f"📚 Loaded {len(simple_messages)} messages from DB")
                 return simple_messages
                 
         except Exception as e:
-            print(f"❌ Error getting messages: {e}")
+            log.error(f"❌ Error getting messages: {e}")
             return []
     
+    async def get_message_history(self, conversation_id: str, limit: int = HISTORY_WINDOW) -> List[ModelMessage]:
+        """PydanticAI message history (newest `limit`), served from the in-process cache when warm and current"""
+        version = await self._history_versions.get(conversation_id)
+        cached = self.history_cache.get(conversation_id, limit, version)
+        if cached is not None:
+            log.info(f"📚 History cache hit: {len(cached)} messages for {conversation_id}")
+            return cached
+        
+        rows = await self.get_recent_messages(conversation_id, limit=max(limit, self.history_cache.window))
+        history = [
+            message for message in (
+                to_model_message(row['role'], row['content'],
+                                 row.get('executed_function_name'), row.get('function_input_parameters'))
+                for row in rows
+            ) if message is not None
+        ]
+        self.history_cache.put(conversation_id, history, version)
+        return history[-limit:] if limit else []
+    
     async def extract_customer_context(self, conversation_id: str) -> Optional[Dict]:
         """Extract customer info from conversation messages"""
+        await self._read_barrier()
         try:
             async with self.pool.acquire() as conn:
                 # Look for function results that contain customer data
@@ -198,20 +578,23 @@ class SimpleMemory:
                 if customer_msg and customer_msg['function_output_result']:
                     result = json.loads(customer_msg['function_output_result'])
                     if result.get('data'):
-                        print(f"👤 Found customer context in conversation")
+                        log.info("👤 Found customer context in conversation")
                         return result['data']
                 
                 return None
                 
         except Exception as e:
-            print(f"❌ Error extracting customer context: {e}")
+            log.error(f"❌ Error extracting customer context: {e}")
             return None
     
     async def close(self):
-        """Close database connections"""
+        """Drain queued messages, then close database connections"""
         if self.pool:
+            await self.flush()
+            if self._pending:
+                log.warning(f"⚠️ {len(self._pending)} messages could not be written before shutdown")
             await self.pool.close()
-            print("🔚 Database pool closed")
+            log.notice("🔚 Database pool closed")
 
 # Global instance
 memory = SimpleMemory()
@@ -0,0 +1,281 @@
+"""
+📇 LOFT CUSTOMER DATA LAYER
+Typed fetchers for the LOFT customer/order API.
+Tools render these records; composite tools combine them directly instead of
+re-parsing the text another tool produced.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Any
+
+import httpx
+
+from deadlines import deadline_stats, partial_budget, upstream_timeout
+from upstream_limits import upstream
+from structured_logging import get_logger
+
+log = get_logger("tool")
+
+LOFT_API_BASE = os.getenv('WOODSTOCK_API_BASE', 'https://api.woodstockoutlet.com/public/index.php/april')
+LOFT_TIMEOUT_SECONDS = 10.0
+
+# Keywords that mark an order line as belonging to a product category
+CATEGORY_KEYWORDS = ["Sectional", "Recliner", "Console"]
+HIGH_VALUE_THRESHOLD = 1500
+
+
+@dataclass
+class Customer:
+    """LOFT customer record"""
+    customer_id: str
+    first_name: str = ""
+    last_name: str = ""
+    email: str = ""
+    phone: str = ""
+    address: str = ""
+    zipcode: str = ""
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}".strip()
+
+    @classmethod
+    def from_entry(cls, entry: Dict[str, Any], phone: str = "") -> "Customer":
+        """Build from a LOFT 'entry' item"""
+        address = entry.get('address1') or ""
+        if address:
+            if entry.get('city'):
+                address += f", {entry.get('city')}"
+            if entry.get('state'):
+                address += f", {entry.get('state')}"
+        return cls(
+            customer_id=str(entry.get('customerid') or ""),
+            first_name=entry.get('firstname') or "",
+            last_name=entry.get('lastname') or "",
+            email=entry.get('email') or "",
+            phone=phone or entry.get('phonenumber') or "",
+            address=address,
+            zipcode=entry.get('zipcode') or "",
+            raw=entry,
+        )
+
+
+@dataclass
+class Order:
+    """LOFT order header"""
+    order_id: str
+    status: str = ""
+    total: float = 0.0
+    date: str = ""
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_entry(cls, entry: Dict[str, Any]) -> "Order":
+        return cls(
+            order_id=str(entry.get('orderid') or ""),
+            status=entry.get('orderstatus') or "",
+            total=_to_float(entry.get('ordertotal')),
+            date=entry.get('orderdate') or "",
+            raw=entry,
+        )
+
+
+@dataclass
+class OrderLine:
+    """Single line item of an order"""
+    description: str
+    item_price: float = 0.0
+
+    @property
+    def is_benefit_plan(self) -> bool:
+        return 'BENEFIT PLAN' in self.description
+
+
+@dataclass
+class OrderDetails:
+    """Line items for one order"""
+    order_id: str
+    lines: List[OrderLine] = field(default_factory=list)
+
+    @property
+    def product_lines(self) -> List[OrderLine]:
+        """Lines that are actual products (benefit plans excluded)"""
+        return [line for line in self.lines if line.description and not line.is_benefit_plan]
+
+    @property
+    def total(self) -> float:
+        return sum(line.item_price for line in self.product_lines if line.item_price > 0)
+
+
+@dataclass
+class CustomerPatterns:
+    """Aggregates computed from a customer's order details"""
+    customer_id: str
+    orders_analyzed: int
+    total_spent: float
+    favorite_categories: List[str] = field(default_factory=list)
+
+    @property
+    def is_high_value(self) -> bool:
+        return self.total_spent > HIGH_VALUE_THRESHOLD
+
+
+@dataclass
+class CustomerProfile:
+    """Customer 360: record, orders, recent order details and computed aggregates"""
+    customer: Customer
+    orders: List[Order]
+    details: List[OrderDetails]
+    patterns: CustomerPatterns
+    partial: bool = False     # some order details missed the turn deadline
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def classify_identifier(identifier: str) -> str:
+    """Detect whether an identifier is an 'email', a 10-digit 'customer_id' or a 'phone'"""
+    identifier = identifier.strip()
+    if "@" in identifier:
+        return "email"
+    if len(identifier) == 10 and identifier.isdigit():
+        return "customer_id"
+    return "phone"
+
+
+# Shared client - one connection pool for every LOFT call instead of one per call
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=LOFT_TIMEOUT_SECONDS)
+    return _client
+
+
+async def close_loft_client():
+    """Close the shared LOFT HTTP client (called on shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def _get_entries(endpoint: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    """GET a LOFT endpoint and return its 'entry' list (empty when nothing found)"""
+    url = f"{LOFT_API_BASE}/{endpoint}"
+    log.info(f"🌐 Calling LOFT API: {endpoint}", params=params)
+    async with upstream("loft").slot():
+        response = await _get_client().get(url, params=params, timeout=upstream_timeout(LOFT_TIMEOUT_SECONDS))
+    response.raise_for_status()
+    data = response.json()
+    if data and data.get('entry'):
+        return data['entry']
+    return []
+
+
+async def fetch_customer_by_phone(phone: str) -> Optional[Customer]:
+    """Look up a customer by phone number"""
+    entries = await _get_entries("GetCustomerByPhone", {'phone': phone.strip()})
+    return Customer.from_entry(entries[0], phone=phone) if entries else None
+
+
+async def fetch_customer_by_email(email: str) -> Optional[Customer]:
+    """Look up a customer by email address"""
+    entries = await _get_entries("GetCustomerByEmail", {'email': email.strip()})
+    return Customer.from_entry(entries[0]) if entries else None
+
+
+async def fetch_customer(identifier: str, type: str = "auto") -> Optional[Customer]:
+    """Look up a customer by phone or email ('auto' detects which)"""
+    if type == "auto":
+        type = "email" if "@" in identifier else "phone"
+    if type == "email":
+        return await fetch_customer_by_email(identifier)
+    return await fetch_customer_by_phone(identifier)
+
+
+async def fetch_orders(customer_id: str) -> List[Order]:
+    """Get a customer's order headers"""
+    entries = await _get_entries("GetOrdersByCustomer", {'custid': customer_id})
+    return [Order.from_entry(entry) for entry in entries]
+
+
+async def fetch_order_details(order_id: str) -> OrderDetails:
+    """Get the line items of one order"""
+    entries = await _get_entries("GetDetailsByOrder", {'orderid': order_id})
+    return OrderDetails(
+        order_id=order_id,
+        lines=[
+            OrderLine(description=entry.get('description') or "", item_price=_to_float(entry.get('itemprice')))
+            for entry in entries
+        ],
+    )
+
+
+async def fetch_order_details_many(order_ids: List[str]) -> List[OrderDetails]:
+    """
+    Fetch details for several orders concurrently, keeping input order.
+    Under a turn deadline, orders still loading when it runs out are left out (partial result).
+    """
+    budget = partial_budget()
+    if budget is None:
+        return list(await asyncio.gather(*(fetch_order_details(order_id) for order_id in order_ids)))
+    tasks = [asyncio.create_task(fetch_order_details(order_id)) for order_id in order_ids]
+    done, pending = await asyncio.wait(tasks, timeout=budget) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    if pending:
+        deadline_stats.partial_results += 1
+        log.info(f"⏳ Order details: {len(done)}/{len(tasks)} loaded within the turn deadline")
+    details = []
+    for task in tasks:
+        if task in done:
+            details.append(task.result())   # a failed fetch raises, as with gather
+    return details
+
+
+def analyze_patterns(customer_id: str, orders: List[Order], details: List[OrderDetails]) -> CustomerPatterns:
+    """Compute spending and category aggregates from order details"""
+    categories: List[str] = []
+    for order_details in details:
+        for line in order_details.product_lines:
+            for keyword in CATEGORY_KEYWORDS:
+                if keyword in line.description and keyword not in categories:
+                    categories.append(keyword)
+    return CustomerPatterns(
+        customer_id=customer_id,
+        orders_analyzed=len(orders),
+        total_spent=sum(order_details.total for order_details in details),
+        favorite_categories=categories,
+    )
+
+
+async def resolve_customer(identifier: str, type: str = "auto") -> Optional[Customer]:
+    """Phone/email → LOFT lookup; a bare 10-digit customer_id is used as-is"""
+    kind = classify_identifier(identifier) if type == "auto" else type
+    if kind in ("customer_id", "customerid"):
+        return Customer(customer_id=identifier.strip())
+    return await fetch_customer(identifier, kind)
+
+
+async def load_customer_profile(customer: Customer, max_orders: int = 5) -> CustomerProfile:
+    """Fetch orders and the details of the most recent ones (concurrently), then aggregate"""
+    orders = await fetch_orders(customer.customer_id)
+    order_ids = [order.order_id for order in orders if order.order_id][:max_orders]
+    details = await fetch_order_details_many(order_ids)
+    return CustomerProfile(
+        customer=customer,
+        orders=orders,
+        details=details,
+        patterns=analyze_patterns(customer.customer_id, orders, details),
+        partial=len(details) < len(order_ids),
+    )
@@ -0,0 +1,191 @@
+"""
+🗂️ CUSTOMER 360 PROFILE CACHE
+Per-customer cache of customer record + orders + order details + aggregates.
+- Filled on first access (concurrent misses for the same customer share one load)
+- Stale-while-revalidate: stale entries are served immediately and refreshed in the background
+- Invalidated when something touches the customer (support escalation, end-of-call webhook)
+"""
+
+import asyncio
+import contextvars
+import os
+import re
+import time
+from typing import Dict, Optional, Set
+
+from customer_data import CustomerProfile, classify_identifier, resolve_customer, load_customer_profile
+from structured_logging import get_logger
+
+log = get_logger("tool")
+
+# Identifier kind → key prefix; phones and customer_ids are both digits and must not share keys
+KEY_PREFIXES = {"phone": "phone", "email": "email", "customer_id": "customer", "customerid": "customer"}
+
+
+def normalize_profile_key(identifier: str, type: str = "auto") -> str:
+    """Same customer → same key, per identifier kind: email:<lowercase>, phone:<10 digits>, customer:<id>"""
+    identifier = identifier.strip()
+    kind = classify_identifier(identifier) if type == "auto" else type
+    prefix = KEY_PREFIXES.get(kind, kind)
+    if prefix == "email":
+        return f"email:{identifier.lower()}"
+    if prefix == "customer":
+        return f"customer:{identifier}"
+    digits = re.sub(r'\D', '', identifier)
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return f"{prefix}:{digits or identifier}"
+
+
+class _ProfileEntry:
+    """Cached profile plus the monotonic time it was loaded"""
+    def __init__(self, profile: CustomerProfile, aliases: Set[str]):
+        self.profile = profile
+        self.aliases = aliases
+        self.loaded_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+
+class CustomerProfileCache:
+    """
+    Customer 360 cache keyed by customer_id, reachable through any alias
+    (phone, email, customer_id) used to look the customer up.
+    """
+
+    def __init__(self, fresh_seconds: int = 300, stale_seconds: int = 3600, max_entries: int = 2000):
+        """
+        Args:
+            fresh_seconds: Serve without refreshing for this long (5 min default)
+            stale_seconds: Serve stale + refresh in background up to this age (1 hour default)
+            max_entries: Oldest profiles are evicted beyond this many customers
+        """
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, _ProfileEntry] = {}     # customer_id → entry
+        self._aliases: Dict[str, str] = {}               # normalized alias → customer_id
+        self._loading: Dict[str, asyncio.Task] = {}      # normalized alias → in-flight load
+        self._refreshing: Set[str] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0, "errors": 0}
+        log.notice(f"✅ CustomerProfileCache initialized (fresh={fresh_seconds}s, stale={stale_seconds}s)")
+
+    async def get(self, identifier: str, type: str = "auto") -> Optional[CustomerProfile]:
+        """Get the profile for a phone/email/customer_id, loading it on a miss"""
+        key = normalize_profile_key(identifier, type)
+        entry = self._lookup(key)
+
+        if entry and entry.age() < self.fresh_seconds:
+            self.stats["hits"] += 1
+            return entry.profile
+
+        if entry and entry.age() < self.stale_seconds:
+            self.stats["stale_hits"] += 1
+            self._schedule_refresh(identifier, type, key)
+            return entry.profile
+
+        self.stats["misses"] += 1
+        return await self._load(identifier, type, key)
+
+    def invalidate(self, identifier: str, type: str = "auto"):
+        """Drop a customer's profile (by any alias) so the next access reloads it"""
+        customer_id = self._aliases.get(normalize_profile_key(identifier, type))
+        if customer_id and customer_id in self._entries:
+            self._drop(customer_id)
+            self.stats["invalidations"] += 1
+            log.info(f"🗑️ Invalidated customer profile {customer_id} (via {identifier})")
+
+    def snapshot(self) -> Dict[str, int]:
+        """Stats for the health endpoint"""
+        return {**self.stats, "entries": len(self._entries), "aliases": len(self._aliases)}
+
+    def _lookup(self, key: str) -> Optional[_ProfileEntry]:
+        customer_id = self._aliases.get(key)
+        return self._entries.get(customer_id) if customer_id else None
+
+    async def _load(self, identifier: str, type: str, key: str) -> Optional[CustomerProfile]:
+        # Single-flight: concurrent misses for the same alias share one load task. Callers wait on it
+        # shielded, so one that is cancelled (turn deadline, disconnect) doesn't fail the others.
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_and_store(identifier, type, key))
+            self._loading[key] = task
+            task.add_done_callback(lambda done: self._load_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _load_and_store(self, identifier: str, type: str, key: str) -> Optional[CustomerProfile]:
+        profile = await self._fetch(identifier, type)
+        if profile and not profile.partial:
+            self._store(key, profile)
+        return profile
+
+    def _load_done(self, key: str, task: asyncio.Task):
+        if self._loading.get(key) is task:
+            del self._loading[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here, so a load whose callers all went away isn't logged as unhandled
+            self.stats["errors"] += 1
+
+    async def _fetch(self, identifier: str, type: str) -> Optional[CustomerProfile]:
+        customer = await resolve_customer(identifier, type)
+        if not customer or not customer.customer_id:
+            return None
+        return await load_customer_profile(customer)
+
+    def _store(self, key: str, profile: CustomerProfile):
+        customer = profile.customer
+        customer_id = customer.customer_id
+        aliases = {key, normalize_profile_key(customer_id, "customer_id")}
+        if customer.email:
+            aliases.add(normalize_profile_key(customer.email, "email"))
+        if customer.phone:
+            aliases.add(normalize_profile_key(customer.phone, "phone"))
+
+        previous = self._entries.pop(customer_id, None)
+        if previous:
+            aliases |= previous.aliases
+        self._entries[customer_id] = _ProfileEntry(profile, aliases)
+        for alias in aliases:
+            self._aliases[alias] = customer_id
+
+        # Dicts keep insertion order → first entry is the least recently loaded
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, customer_id: str):
+        entry = self._entries.pop(customer_id, None)
+        if entry:
+            for alias in entry.aliases:
+                if self._aliases.get(alias) == customer_id:
+                    del self._aliases[alias]
+
+    def _schedule_refresh(self, identifier: str, type: str, key: str):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        # Fresh context: a background refresh isn't bound by the deadline of the turn that triggered it
+        task = asyncio.create_task(self._refresh(identifier, type, key), context=contextvars.Context())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh(self, identifier: str, type: str, key: str):
+        try:
+            self.stats["refreshes"] += 1
+            profile = await self._fetch(identifier, type)
+            if profile and not profile.partial:
+                self._store(key, profile)
+                log.info(f"🔄 Refreshed customer profile {profile.customer.customer_id} in background")
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"⚠️ Background profile refresh failed for {identifier}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+
+# Global instance
+profile_cache = CustomerProfileCache(
+    fresh_seconds=int(os.getenv('CUSTOMER_PROFILE_FRESH_SECONDS', '300')),
+    stale_seconds=int(os.getenv('CUSTOMER_PROFILE_STALE_SECONDS', '3600')),
+)
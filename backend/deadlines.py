@@ -0,0 +1,216 @@
+"""
+⏳ PER-TURN DEADLINES
+Every upstream call used to have its own fixed timeout (10s LOFT, 15-25s
+Magento) and composite tools chain several, so one turn could run past a
+minute; on a phone call that is dead air. Each turn now gets one deadline,
+set at the endpoint from its channel:
+
+    deadline = Deadline.for_channel(platform_type)     # phone 4s, webchat 20s
+    turn_deps.deadline = deadline                      # tools read ctx.deps.deadline
+    current_deadline.set(deadline)                     # upstream calls outside tools
+
+- deadline_tool() runs each tool within the time left for tools (the deadline
+  minus a reserve for the model's answer). A tool that runs out returns the
+  last result it gave the same user for the same arguments (cached fallback;
+  tools read per-user state from ctx.deps, e.g. "product #2") or a
+  budget-exhausted note the model can relay, never a guess.
+- upstream_timeout(cap) gives each HTTP call min(its own timeout, time left);
+  capped_wait(cap) does the same for queue waits (admission, bulkheads, context steps)
+- partial_budget() lets a composite step (several orders' details) keep what
+  finished in time instead of failing as a whole
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from structured_logging import get_logger
+
+log = get_logger("tool")
+
+# Turn budget per channel (TURN_DEADLINE_<CHANNEL>_MS), and the part of it kept for the final answer
+CHANNEL_DEADLINES_MS = {"phone": 4000, "webchat": 20000}
+ANSWER_RESERVE_MS = {"phone": 1500, "webchat": 4000}
+DEFAULT_DEADLINE_MS = int(os.getenv("TURN_DEADLINE_DEFAULT_MS", "20000"))
+DEFAULT_ANSWER_RESERVE_MS = 4000
+
+# An upstream call inside a tool may outlive the tool's budget by this much, so the
+# tool is cancelled (and falls back) before the HTTP client reports its own timeout
+UPSTREAM_GRACE_SECONDS = 0.25
+# Composite steps stop waiting this long before the tool budget ends, to return what they have
+PARTIAL_MARGIN_SECONDS = 0.3
+TOOL_FALLBACK_TTL_SECONDS = int(os.getenv("TOOL_FALLBACK_TTL_SECONDS", "900"))
+TOOL_FALLBACK_MAX_ENTRIES = 2000
+
+
+class DeadlineExceeded(Exception):
+    """The turn has no time left for another upstream call"""
+
+
+class Deadline:
+    """One turn's deadline (monotonic clock)"""
+
+    __slots__ = ("channel", "at", "tools_until")
+
+    def __init__(self, channel: str, seconds: float, answer_reserve_seconds: float, started: Optional[float] = None):
+        started = time.monotonic() if started is None else started
+        self.channel = channel
+        self.at = started + seconds
+        self.tools_until = self.at - min(answer_reserve_seconds, seconds / 2)
+
+    @classmethod
+    def for_channel(cls, channel: str, started: Optional[float] = None) -> "Deadline":
+        channel = channel or "webchat"
+        budget_ms = int(os.getenv(f"TURN_DEADLINE_{channel.upper()}_MS",
+                                  CHANNEL_DEADLINES_MS.get(channel, DEFAULT_DEADLINE_MS)))
+        reserve_ms = ANSWER_RESERVE_MS.get(channel, DEFAULT_ANSWER_RESERVE_MS)
+        return cls(channel, budget_ms / 1000, reserve_ms / 1000, started)
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    def tool_remaining(self) -> float:
+        return max(0.0, self.tools_until - time.monotonic())
+
+    def llm_timeout(self) -> float:
+        """Per-request model timeout: what is left, but never less than the answer reserve"""
+        return max(self.remaining(), self.at - self.tools_until)
+
+
+current_deadline: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("current_deadline", default=None)
+
+
+def upstream_timeout(cap: float) -> float:
+    """Timeout for one upstream call: its own cap, or the time the turn has left"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return cap
+    left = deadline.tool_remaining() + UPSTREAM_GRACE_SECONDS
+    if left <= UPSTREAM_GRACE_SECONDS:
+        deadline_stats.upstream_refused += 1
+        raise DeadlineExceeded(f"no time left for an upstream call ({deadline.channel} turn)")
+    return min(cap, left)
+
+
+def capped_wait(cap: float) -> float:
+    """A wait (queue slot, context step) bounded by the time the turn has left; never raises"""
+    deadline = current_deadline.get()
+    return cap if deadline is None else min(cap, deadline.tool_remaining())
+
+
+def partial_budget() -> Optional[float]:
+    """Seconds a composite step can wait before keeping a partial result; None without a deadline"""
+    deadline = current_deadline.get()
+    return None if deadline is None else max(0.0, deadline.tool_remaining() - PARTIAL_MARGIN_SECONDS)
+
+
+class DeadlineStats:
+    """Turns per channel, over-budget turns and how tools degraded"""
+
+    def __init__(self):
+        self.turns: Dict[str, int] = {}
+        self.overruns: Dict[str, int] = {}
+        self.tool_timeouts = 0
+        self.cached_fallbacks = 0
+        self.partial_results = 0
+        self.upstream_refused = 0
+
+    def record_turn(self, deadline: Deadline):
+        self.turns[deadline.channel] = self.turns.get(deadline.channel, 0) + 1
+        if deadline.remaining() <= 0:
+            self.overruns[deadline.channel] = self.overruns.get(deadline.channel, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "turns": dict(self.turns),
+            "overruns": dict(self.overruns),
+            "tool_timeouts": self.tool_timeouts,
+            "cached_fallbacks": self.cached_fallbacks,
+            "partial_results": self.partial_results,
+            "upstream_refused": self.upstream_refused,
+            "budgets_ms": {channel: int(os.getenv(f"TURN_DEADLINE_{channel.upper()}_MS", ms))
+                           for channel, ms in CHANNEL_DEADLINES_MS.items()},
+        }
+
+
+deadline_stats = DeadlineStats()
+
+
+class ToolFallbacks:
+    """Last successful result per (tool, user, arguments), served when a later call runs out of time"""
+
+    def __init__(self, max_entries: int = TOOL_FALLBACK_MAX_ENTRIES, ttl_seconds: float = TOOL_FALLBACK_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._results: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+
+    @staticmethod
+    def key(tool_name: str, scope: str, kwargs: Dict[str, Any]) -> Tuple[str, str, str]:
+        """scope: whose result it is (user or conversation); one user's result is never served to another"""
+        return tool_name, scope, json.dumps(kwargs, sort_keys=True, default=str)
+
+    def remember(self, key: Tuple[str, str, str], result: Any):
+        self._results[key] = (time.monotonic(), result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def recall(self, key: Tuple[str, str, str]) -> Optional[Tuple[float, Any]]:
+        """(age in seconds, result) of a result still within the TTL"""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[0]
+        if age > self.ttl_seconds:
+            del self._results[key]
+            return None
+        return age, entry[1]
+
+
+tool_fallbacks = ToolFallbacks()
+
+
+def budget_exhausted_result(tool_name: str) -> str:
+    return (f"⏳ {tool_name} could not finish within this turn's time budget. Tell the customer you're "
+            f"still checking and offer to follow up or try again; do not guess the result.")
+
+
+def deadline_tool(func):
+    """Wrap a tool so it runs within the turn's tool budget (ctx.deps.deadline) and falls back when out of time"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        deps = getattr(ctx, "deps", None)
+        deadline = getattr(deps, "deadline", None)
+        scope = getattr(deps, "user_identifier", None) or getattr(deps, "conversation_id", None)
+        if deadline is None or args:
+            return await func(ctx, *args, **kwargs)
+        # No user to scope by: run under the deadline without a cached fallback
+        key = tool_fallbacks.key(name, str(scope), kwargs) if scope else None
+        # Upstream calls inside the tool read the deadline from the context (copied into wait_for's task)
+        token = current_deadline.set(deadline)
+        try:
+            result = await asyncio.wait_for(func(ctx, **kwargs), timeout=deadline.tool_remaining())
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            deadline_stats.tool_timeouts += 1
+            cached = tool_fallbacks.recall(key) if key else None
+            if cached is not None:
+                age, result = cached
+                deadline_stats.cached_fallbacks += 1
+                log.notice(f"⏳ {name} out of time ({deadline.channel}), serving result from {age:.0f}s ago")
+                return f"{result}\n\n(Live lookup timed out; this result is from {age / 60:.0f} min ago.)"
+            log.notice(f"⏳ {name} out of time ({deadline.channel}), no cached result")
+            return budget_exhausted_result(name)
+        finally:
+            current_deadline.reset(token)
+        if key and not (isinstance(result, str) and result.startswith("❌")):
+            tool_fallbacks.remember(key, result)
+        return result
+
+    return wrapper
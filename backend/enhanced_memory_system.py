@@ -16,6 +16,11 @@ from sentence_transformers import SentenceTransformer
 import openai
 from openai import AsyncOpenAI
 
+from upstream_limits import upstream
+from structured_logging import get_logger
+
+log = get_logger("memory")
+
 @dataclass
 class MemoryEntity:
     """Memory entity inspired by Memento MCP"""
@@ -67,13 +72,13 @@ class EnhancedMemorySystem:
         
         # Initialize sentence transformer for embeddings (lightweight, fast)
         self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        print("🧠 Enhanced Memory System initialized")
+        log.notice("🧠 Enhanced Memory System initialized")
         
     async def init_db(self):
         """Initialize enhanced memory tables"""
         if not self.pool:
             self.pool = await asyncpg.create_pool(self.db_url, min_size=2, max_size=5)
-            print("✅ Enhanced Memory Pool initialized")
+            log.notice("✅ Enhanced Memory Pool initialized")
             
         async with self.pool.acquire() as conn:
             # Create vector extension if not exists
@@ -149,7 +154,7 @@ class EnhancedMemorySystem:
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_long_term_memories_user ON long_term_memories(user_context);")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_long_term_memories_type ON long_term_memories(memory_type);")
             
-            print("✅ Enhanced memory tables created/verified")
+            log.notice("✅ Enhanced memory tables created/verified")
             
     async def create_entity(self, entity: MemoryEntity, user_context: str) -> str:
         """Create a new memory entity"""
@@ -167,7 +172,7 @@ class EnhancedMemorySystem:
             entity.name, entity.entity_type, json.dumps(entity.observations), 
             entity.confidence, json.dumps(entity.metadata), embedding, user_context)
             
-            print(f"✅ Created entity: {entity.name} ({entity.entity_type})")
+            log.info(f"✅ Created entity: {entity.name} ({entity.entity_type})")
             return str(entity_id)
             
     async def create_relation(self, relation: MemoryRelation, user_context: str):
@@ -191,15 +196,19 @@ class EnhancedMemorySystem:
                 """, from_id, to_id, relation.relation_type, relation.strength, 
                 relation.confidence, json.dumps(relation.metadata))
                 
-                print(f"✅ Created relation: {relation.from_entity} -[{relation.relation_type}]-> {relation.to_entity}")
+                log.info(f"✅ Created relation: {relation.from_entity} -[{relation.relation_type}]-> {relation.to_entity}")
+
+    async def embed(self, text: str) -> List[float]:
+        """Embedding off the event loop (MiniLM encoding is CPU-bound)"""
+        return (await asyncio.to_thread(self.encoder.encode, text)).tolist()
 
     async def semantic_search_entities(self, query: str, user_context: str, 
-                                     limit: int = 5, min_similarity: float = 0.6) -> List[Dict]:
+                                     limit: int = 5, min_similarity: float = 0.6,
+                                     query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Semantic search for relevant entities (Memento MCP style)"""
+        if query_embedding is None:
+            query_embedding = await self.embed(query)
         async with self.pool.acquire() as conn:
-            # Generate query embedding
-            query_embedding = self.encoder.encode(query).tolist()
-            
             results = await conn.fetch("""
                 SELECT 
                     name, entity_type, observations, confidence, metadata,
@@ -231,14 +240,15 @@ class EnhancedMemorySystem:
                 VALUES ($1, $2, $3, $4, $5, $6)
             """, user_context, content, memory_type, importance, embedding, conversation_id)
             
-            print(f"💾 Stored long-term memory: {content[:50]}...")
+            log.info(f"💾 Stored long-term memory: {content[:50]}...")
 
     async def retrieve_long_term_memories(self, query: str, user_context: str, 
-                                        limit: int = 3, min_similarity: float = 0.5) -> List[Dict]:
+                                        limit: int = 3, min_similarity: float = 0.5,
+                                        query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Retrieve relevant long-term memories"""
+        if query_embedding is None:
+            query_embedding = await self.embed(query)
         async with self.pool.acquire() as conn:
-            query_embedding = self.encoder.encode(query).tolist()
-            
             results = await conn.fetch("""
                 SELECT 
                     memory_content, memory_type, importance_score,
@@ -254,14 +264,13 @@ class EnhancedMemorySystem:
                 LIMIT $4
             """, query_embedding, user_context, min_similarity, limit)
             
-            # Update access count
+            # Update access count (one statement for all returned memories)
             if results:
-                for result in results:
-                    await conn.execute("""
-                        UPDATE long_term_memories 
-                        SET access_count = access_count + 1, last_accessed = NOW()
-                        WHERE memory_content = $1 AND user_context = $2
-                    """, result['memory_content'], user_context)
+                await conn.execute("""
+                    UPDATE long_term_memories 
+                    SET access_count = access_count + 1, last_accessed = NOW()
+                    WHERE memory_content = ANY($1::text[]) AND user_context = $2
+                """, [result['memory_content'] for result in results], user_context)
             
             return [dict(r) for r in results]
 
@@ -317,19 +326,20 @@ class EnhancedMemorySystem:
             """
             
             try:
-                response = await self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",  # Fast and cheap
-                    messages=[{"role": "user", "content": extraction_prompt}],
-                    temperature=0.1,
-                    response_format={"type": "json_object"}
-                )
+                async with upstream("openai").slot():
+                    response = await self.openai_client.chat.completions.create(
+                        model="gpt-4o-mini",  # Fast and cheap
+                        messages=[{"role": "user", "content": extraction_prompt}],
+                        temperature=0.1,
+                        response_format={"type": "json_object"}
+                    )
                 
                 insights = json.loads(response.choices[0].message.content)
-                print(f"🧠 Extracted insights: {len(insights.get('entities', []))} entities, {len(insights.get('long_term_memories', []))} memories")
+                log.info(f"🧠 Extracted insights: {len(insights.get('entities', []))} entities, {len(insights.get('long_term_memories', []))} memories")
                 return insights
                 
             except Exception as e:
-                print(f"❌ Error extracting insights: {e}")
+                log.error(f"❌ Error extracting insights: {e}")
                 return {}
 
     async def process_conversation_memory(self, conversation_id: str, user_identifier: str):
@@ -381,26 +391,31 @@ class EnhancedMemorySystem:
 
     async def get_conversation_context(self, query: str, user_identifier: str) -> Dict[str, Any]:
         """Get comprehensive context for a user query"""
-        # Get semantic entities
-        entities = await self.semantic_search_entities(query, user_identifier, limit=5)
-        
-        # Get long-term memories  
-        memories = await self.retrieve_long_term_memories(query, user_identifier, limit=3)
+        # One embedding for both searches, which then run concurrently on separate connections
+        query_embedding = await self.embed(query)
+        entities, memories = await asyncio.gather(
+            self.semantic_search_entities(query, user_identifier, limit=5, query_embedding=query_embedding),
+            self.retrieve_long_term_memories(query, user_identifier, limit=3, query_embedding=query_embedding),
+        )
         
-        # Get entity relations
+        # Get entity relations: top 3 per entity for the top entities, in one query
         relations = []
         if entities:
+            top_names = [entity['name'] for entity in entities[:3]]
             async with self.pool.acquire() as conn:
-                for entity in entities[:3]:  # Only for top entities
-                    entity_relations = await conn.fetch("""
-                        SELECT e1.name as from_name, e2.name as to_name, r.relation_type, r.strength
+                rows = await conn.fetch("""
+                    SELECT from_name, to_name, relation_type, strength FROM (
+                        SELECT e1.name as from_name, e2.name as to_name, r.relation_type, r.strength,
+                               ROW_NUMBER() OVER (PARTITION BY e1.name ORDER BY r.strength DESC) AS rank
                         FROM memory_relations r
                         JOIN memory_entities e1 ON r.from_entity_id = e1.entity_id
                         JOIN memory_entities e2 ON r.to_entity_id = e2.entity_id
-                        WHERE e1.name = $1 AND e1.user_context = $2
-                        ORDER BY r.strength DESC LIMIT 3
-                    """, entity['name'], user_identifier)
-                    relations.extend([dict(r) for r in entity_relations])
+                        WHERE e1.name = ANY($1::text[]) AND e1.user_context = $2
+                    ) ranked
+                    WHERE rank <= 3
+                    ORDER BY array_position($1::text[], from_name), strength DESC
+                """, top_names, user_identifier)
+            relations = [dict(r) for r in rows]
         
         return {
             "entities": entities,
@@ -421,7 +436,7 @@ class EnhancedMemorySystem:
                 RETURNING count(*)
             """ % days_old, min_access_count)
             
-            print(f"🧹 Cleaned up {deleted or 0} old memories")
+            log.notice(f"🧹 Cleaned up {deleted or 0} old memories")
 
     async def get_memory_stats(self, user_context: str) -> Dict[str, int]:
         """Get memory system statistics"""
@@ -449,5 +464,5 @@ async def init_enhanced_memory(db_url: str, openai_api_key: str):
     if not enhanced_memory:
         enhanced_memory = EnhancedMemorySystem(db_url, openai_api_key)
         await enhanced_memory.init_db()
-        print("🧠 Global Enhanced Memory System ready!")
+        log.notice("🧠 Global Enhanced Memory System ready!")
     return enhanced_memory
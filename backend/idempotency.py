@@ -0,0 +1,173 @@
+"""
+🔁 IDEMPOTENT REQUEST HANDLING
+Vapi retries webhooks and mobile clients double-submit chat messages on flaky
+networks; without a dedup key every duplicate re-inserts a transcript or runs
+another full LLM turn. Requests that carry a key run once:
+- a repeat after completion gets the stored result
+- a repeat while the first is still running waits for it (attaches to the
+  in-flight execution) instead of starting its own
+- a failed execution is forgotten, so the client's retry runs again
+- reusing a key for a different request body is rejected (IdempotencyConflict)
+
+    response, replayed = await idempotency.run(f"vapi-eoc:{call_id}", handle, ttl_seconds=86400)
+
+Keys live in a bounded in-process LRU (IDEMPOTENCY_MAX_KEYS), so duplicates are
+caught per worker; retries of the same request normally land within seconds.
+
+Streaming chat turns are wrapped in RecordedStream: the SSE chunks are kept as
+they are produced, and every request with the same key (the first included)
+reads them from the start and then follows the live stream.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from structured_logging import get_logger
+
+log = get_logger("chat")
+
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_CHAT_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_CHAT_TTL_SECONDS", "600"))
+IDEMPOTENCY_WEBHOOK_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_WEBHOOK_TTL_SECONDS", "86400"))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable digest of what a request asked for"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+class _Key:
+    __slots__ = ("future", "fingerprint", "expires_at")
+
+    def __init__(self, future: asyncio.Future, request_fingerprint: Optional[str], expires_at: float):
+        self.future = future
+        self.fingerprint = request_fingerprint
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Bounded LRU of idempotency keys → in-flight or finished executions"""
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[str, _Key]" = OrderedDict()
+        self.stats = {"executed": 0, "replayed": 0, "attached": 0, "failed": 0, "conflicts": 0, "evicted": 0}
+
+    async def run(self, key: str, execute: Callable[[], Awaitable[Any]], ttl_seconds: float,
+                  request_fingerprint: Optional[str] = None,
+                  retryable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Run execute() once per key; returns (result, replayed).
+
+        Args:
+            retryable: results it accepts (e.g. a 503) are returned but not stored, like a failure
+        """
+        now = time.monotonic()
+        entry = self._keys.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self.forget(key)
+            entry = None
+        if entry is not None:
+            if request_fingerprint and entry.fingerprint and request_fingerprint != entry.fingerprint:
+                self.stats["conflicts"] += 1
+                raise IdempotencyConflict(f"Idempotency key reused for a different request: {key}")
+            self._keys.move_to_end(key)
+            self.stats["attached" if not entry.future.done() else "replayed"] += 1
+            log.info(f"🔁 Duplicate request {key} ({'in flight' if not entry.future.done() else 'replayed'})")
+            # Shielded: a waiter that goes away must not cancel the execution it attached to
+            return await asyncio.shield(entry.future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._keys[key] = _Key(future, request_fingerprint, now + ttl_seconds)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+            self.stats["evicted"] += 1
+        self.stats["executed"] += 1
+        try:
+            result = await execute()
+        except BaseException as e:
+            self.stats["failed"] += 1
+            self.forget(key, future)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            elif not future.done():
+                future.set_exception(e)
+                future.exception()   # retrieved here, so an execution nobody attached to isn't logged as unhandled
+            raise
+        if retryable is not None and retryable(result):
+            self.forget(key, future)
+        if not future.done():
+            future.set_result(result)
+        return result, False
+
+    def forget(self, key: str, future: Optional[asyncio.Future] = None):
+        """Drop a key (only if it still belongs to this execution, when one is given)"""
+        entry = self._keys.get(key)
+        if entry is not None and (future is None or entry.future is future):
+            del self._keys[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "keys": len(self._keys), "max_keys": self.max_keys}
+
+
+class RecordedStream:
+    """
+    One SSE stream shared by every request with the same idempotency key.
+    A background task reads the source; readers replay the recorded chunks and
+    follow new ones. When the last reader goes away before the end, the source
+    is cancelled (the turn stops, as for a single disconnected client); a
+    stream that doesn't complete calls on_abandoned(), so a retry starts over.
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_abandoned: Optional[Callable[[], None]] = None):
+        self._source = source
+        self._on_abandoned = on_abandoned
+        self._chunks: List[str] = []
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._readers = 0
+        self.complete = False
+        self.finished = False
+
+    async def _pump(self):
+        try:
+            async for chunk in self._source:
+                self._chunks.append(chunk)
+                self._changed.set()
+            self.complete = True
+        finally:
+            self.finished = True
+            self._changed.set()
+            if not self.complete and self._on_abandoned is not None:
+                self._on_abandoned()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self._readers += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._pump())
+        position = 0
+        try:
+            while True:
+                while position < len(self._chunks):
+                    yield self._chunks[position]
+                    position += 1
+                if self.finished:
+                    break
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            self._readers -= 1
+            if self._readers == 0 and not self.finished:
+                self._task.cancel()
+
+
+# Global instance
+idempotency = IdempotencyStore()
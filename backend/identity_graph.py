@@ -0,0 +1,252 @@
+"""
+🪪 CROSS-CHANNEL IDENTITY GRAPH
+Links every key a shopper shows up under (E.164 phone from Vapi, email, LOFT
+customer_id, webchat session) to ONE canonical user key, so conversation
+history, caches and enhanced memory all hit the same entry.
+
+- In-memory map identifier → canonical key (O(1) lookups, warmed from the table)
+- chatbot_identity_links table is the durable copy (one row per identifier)
+- Only trusted identifiers are linked together (channel phone, authenticated
+  params, session). Identifiers typed in a message are resolved, never linked,
+  so an agent looking up customers doesn't merge them into one person.
+- Every link or merge bumps the identity's version in the state store
+  ("identity_versions"); a worker whose in-memory copy of an identity is at
+  another version reloads its members from the table (several workers)
+"""
+
+import asyncio
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from state_store import state_store
+from structured_logging import get_logger
+
+log = get_logger("db")
+
+# Higher wins when picking the canonical key of a new or merged identity
+KIND_PRIORITY = {"customer": 4, "phone": 3, "email": 2, "session": 1, "anonymous": 0}
+
+WARM_LIMIT = 50000
+IDENTITY_VERSION_TTL_SECONDS = int(os.getenv("IDENTITY_VERSION_TTL_SECONDS", "86400"))
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """Any US phone format → E.164 (+1XXXXXXXXXX); None when it isn't a phone number"""
+    digits = re.sub(r'\D', '', phone or "")
+    if len(digits) == 10:
+        return f"+1{digits}"
+    if len(digits) == 11 and digits.startswith('1'):
+        return f"+{digits}"
+    if phone and phone.strip().startswith('+') and 8 <= len(digits) <= 15:
+        return f"+{digits}"
+    return None
+
+
+def identity_key(kind: str, value: str) -> Optional[str]:
+    """Normalized node key for one identifier (e.g. '+15551234567', 'a@b.com', 'customer:123')"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    if kind == "phone":
+        return normalize_phone(value)
+    if kind == "email":
+        return value.lower() if "@" in value else None
+    if kind in ("customer", "session", "anonymous"):
+        return f"{kind}:{value}"
+    return None
+
+
+def key_kind(key: str) -> str:
+    if key.startswith("+"):
+        return "phone"
+    if "@" in key and ":" not in key:
+        return "email"
+    return key.split(":", 1)[0]
+
+
+def classify_user_identifier(identifier: str) -> Tuple[str, str]:
+    """Best guess (kind, value) for a free-form user identifier (phone, email, customer_id, other)"""
+    identifier = (identifier or "").strip()
+    if "@" in identifier:
+        return "email", identifier
+    if identifier.isdigit() and len(identifier) == 10:
+        return "customer", identifier   # bare 10 digits is a LOFT customer_id (see customer_data.classify_identifier)
+    if normalize_phone(identifier):
+        return "phone", identifier
+    return "session", identifier
+
+
+class IdentityGraph:
+    """identifier → canonical user key, with a Postgres table behind the in-memory map"""
+
+    def __init__(self):
+        self.pool = None
+        self._canonical: Dict[str, str] = {}      # identifier key → canonical key
+        self._members: Dict[str, Set[str]] = {}   # canonical key → identifier keys
+        self._versions: Dict[str, Optional[int]] = {}   # canonical key → version the members are current for
+        self.versions = state_store.namespace("identity_versions", IDENTITY_VERSION_TTL_SECONDS)
+        self._lock = asyncio.Lock()
+        self.stats = {"hits": 0, "db_lookups": 0, "created": 0, "linked": 0, "merged": 0, "reloads": 0}
+        log.notice("🪪 IdentityGraph initialized")
+
+    async def init(self, pool):
+        """Create the links table and warm the in-memory map"""
+        self.pool = pool
+        if not pool:
+            return
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS chatbot_identity_links (
+                        identifier TEXT PRIMARY KEY,
+                        identifier_type TEXT NOT NULL,
+                        canonical_key TEXT NOT NULL,
+                        linked_at TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_identity_links_canonical ON chatbot_identity_links(canonical_key);")
+                rows = await conn.fetch("""
+                    SELECT identifier, canonical_key FROM chatbot_identity_links
+                    ORDER BY linked_at DESC
+                    LIMIT $1
+                """, WARM_LIMIT)
+            for row in rows:
+                self._remember(row['identifier'], row['canonical_key'])
+            log.notice(f"✅ Identity graph warmed with {len(rows)} links")
+        except Exception as e:
+            log.warning(f"⚠️ Identity graph table unavailable, using in-memory links only: {e}")
+
+    def canonical_for(self, identifier: str) -> Optional[str]:
+        """O(1) in-memory lookup of an already-known identifier key"""
+        return self._canonical.get(identifier)
+
+    def aliases(self, canonical_key: str) -> List[str]:
+        """Every identifier key linked to a canonical key (including itself)"""
+        return sorted(self._members.get(canonical_key, set()) | {canonical_key})
+
+    async def resolve(self, linked: Dict[str, Optional[str]], lookup_only: Optional[Tuple[str, str]] = None) -> str:
+        """
+        Resolve a request's identifiers to one canonical key.
+
+        Args:
+            linked: Trusted identifiers by kind ("customer", "phone", "email", "session");
+                all of them are linked to the same identity.
+            lookup_only: (kind, value) taken from message text; used only when no
+                trusted identifier is present and never linked to anything else.
+        """
+        keys = [key for key in (identity_key(kind, value) for kind, value in linked.items() if value) if key]
+        if not keys and lookup_only:
+            key = identity_key(*lookup_only)
+            keys = [key] if key else []
+        if not keys:
+            return "anonymous"
+
+        # Fast path: everything already points at one identity that no other worker has changed
+        known = {self._canonical.get(key) for key in keys}
+        if None not in known and len(known) == 1:
+            canonical = known.pop()
+            if await self._current(canonical):
+                self.stats["hits"] += 1
+                return canonical
+
+        async with self._lock:
+            await self._load(keys)
+            return await self._link(keys)
+
+    async def _current(self, canonical: str) -> bool:
+        """True when this worker's members of canonical are at its shared version; otherwise forgets them"""
+        version = await self.versions.get(canonical)
+        if self._versions.get(canonical) == version:
+            return True
+        self.stats["reloads"] += 1
+        self._forget(canonical)
+        return False
+
+    async def _load(self, keys: List[str]):
+        missing = [key for key in keys if key not in self._canonical]
+        if not missing or not self.pool:
+            return
+        self.stats["db_lookups"] += 1
+        try:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT l.identifier, l.canonical_key, m.identifier AS member
+                    FROM chatbot_identity_links l
+                    JOIN chatbot_identity_links m ON m.canonical_key = l.canonical_key
+                    WHERE l.identifier = ANY($1::text[])
+                """, missing)
+            for row in rows:
+                self._remember(row['member'], row['canonical_key'])
+            for canonical in {row['canonical_key'] for row in rows}:
+                self._versions[canonical] = await self.versions.get(canonical)
+        except Exception as e:
+            log.warning(f"⚠️ Identity lookup failed: {e}")
+
+    async def _link(self, keys: List[str]) -> str:
+        existing = {self._canonical[key] for key in keys if key in self._canonical}
+        candidates = existing or set(keys)
+        canonical = max(candidates, key=lambda key: (KIND_PRIORITY.get(key_kind(key), 0), key in existing, key))
+
+        new_keys = [key for key in keys if key not in self._canonical]
+        merged = existing - {canonical}
+        moved: List[str] = []
+        for old in merged:
+            moved.extend(self._members.pop(old, {old}))
+        for key in new_keys + moved:
+            self._remember(key, canonical)
+
+        if not existing:
+            self.stats["created"] += 1
+        if new_keys and existing:
+            self.stats["linked"] += len(new_keys)
+        if merged:
+            self.stats["merged"] += len(merged)
+            log.info(f"🪪 Merged identities {sorted(merged)} into {canonical}")
+
+        if (new_keys or moved) and self.pool:
+            try:
+                async with self.pool.acquire() as conn:
+                    await conn.executemany("""
+                        INSERT INTO chatbot_identity_links (identifier, identifier_type, canonical_key)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (identifier) DO UPDATE SET canonical_key = EXCLUDED.canonical_key, linked_at = NOW()
+                    """, [(key, key_kind(key), canonical) for key in new_keys + moved])
+            except Exception as e:
+                log.warning(f"⚠️ Could not persist identity links: {e}")
+
+        if new_keys or moved:
+            await self._bump(canonical)
+        for old in merged:
+            await self.versions.bump(old)
+            self._versions.pop(old, None)
+        return canonical
+
+    async def _bump(self, canonical: str):
+        """Tell other workers the members changed; keep ours only if nobody else changed them in between"""
+        previous, version = await self.versions.bump(canonical)
+        if version is not None and self._versions.get(canonical) == previous:
+            self._versions[canonical] = version
+        else:
+            self._forget(canonical)
+
+    def _forget(self, canonical: str):
+        for key in self._members.pop(canonical, {canonical}):
+            if self._canonical.get(key) == canonical:
+                del self._canonical[key]
+        self._versions.pop(canonical, None)
+
+    def _remember(self, key: str, canonical: str):
+        previous = self._canonical.get(key)
+        if previous and previous != canonical:
+            self._members.get(previous, set()).discard(key)
+        self._canonical[key] = canonical
+        self._members.setdefault(canonical, set()).add(key)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Stats for the health endpoint"""
+        return {**self.stats, "identifiers": len(self._canonical), "identities": len(self._members)}
+
+
+# Global instance
+identity_graph = IdentityGraph()
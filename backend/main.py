@@ -3,6 +3,9 @@
 import json
 import asyncio
 import re
+import time
+import uuid
+import secrets
 
 # FIX TASKGROUP ERROR: nest-asyncio for PydanticAI + MCP compatibility (Railway compatible!)
 try:
@@ -24,18 +27,17 @@ except ValueError as e:
         print(f"⚠️ nest-asyncio error: {e}")
 except Exception as e:
     print(f"⚠️ nest-asyncio failed: {e} - continuing without patch")
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.messages import ModelRequest, ModelResponse, UserPromptPart, TextPart
+from pydantic_ai.messages import ToolCallPart
 import pydantic_ai
 print("🔥 pydantic_ai version:", getattr(pydantic_ai, "__version__", "unknown"))
 from dotenv import load_dotenv
 import os
 from typing import AsyncIterator, Dict, List, Any, Optional
-from datetime import datetime
 import httpx
 # Import MCP optionally to prevent Railway crashes
 try:
@@ -52,7 +54,40 @@ except Exception as _e:
     print(f"⚠️ MCP disabled: {type(_e).__name__}: {_e}")
 
 from schemas import ChatRequest, ChatResponse, ChatMessage
-from conversation_memory import memory
+from conversation_memory import memory, CrossChannelHistory, HISTORY_WINDOW
+from customer_data import (
+    Customer, Order, OrderDetails, CustomerPatterns, CustomerProfile,
+    fetch_customer_by_phone, fetch_customer_by_email, fetch_orders, fetch_order_details,
+    close_loft_client,
+)
+from customer_profile_cache import profile_cache
+from upstream_limits import upstream, upstream_metrics, UpstreamOverloaded, rate_limited_model
+from identity_graph import identity_graph, classify_user_identifier
+from prompt_budget import PromptAssembler, prompt_cache_metrics, fit_to_budget, CONTEXT_TOKENS
+from tool_routing import ToolRouter
+from context_steps import context_steps
+from stream_sanitizer import StreamingHTMLSanitizer
+from response_cache import response_cache, cached_answer_chunks
+from admission import admission, AdmissionRejected
+from state_store import state_store
+from call_ingestion import call_ingestion, transcript_messages
+from deadlines import Deadline, current_deadline, deadline_tool, deadline_stats, upstream_timeout
+from tool_outputs import compact_tool, tool_output_stats, TurnToolOutputs
+from idempotency import (
+    idempotency, fingerprint, IdempotencyConflict, RecordedStream,
+    IDEMPOTENCY_CHAT_TTL_SECONDS, IDEMPOTENCY_WEBHOOK_TTL_SECONDS,
+)
+from voice_stream import (
+    SpeechStream, completion_chunk, new_completion_id, voice_stats,
+    VOICE_FIRST_SENTENCE_DEADLINE_MS, FILLER_LOOKUP, FILLER_THINKING,
+)
+from structured_logging import get_logger, log_stats
+from turn_events import TurnEvents, publishing_tool, sse_event
+from speculation import TurnSpeculation, speculative_tool, speculation_stats
+
+log = get_logger("chat")
+tool_log = get_logger("tool")
+voice_log = get_logger("voice")
 
 # 🧠 ENHANCED MEMORY SYSTEM INTEGRATION
 try:
@@ -66,17 +101,6 @@ except ImportError as e:
     orchestrator = None
     memory_router = None
 
-# SCRUM FIX: HTML stripping utility for streaming
-def strip_html_for_streaming(text):
-    """Strip HTML tags from streaming text to match frontend pattern expectations"""
-    if not text:
-        return text
-    # Remove HTML tags but preserve content
-    clean_text = re.sub(r'<[^>]+>', '', text)
-    # Convert HTML entities back to text
-    clean_text = clean_text.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
-    return clean_text
-
 # Load environment variables
 load_dotenv()
 
@@ -96,6 +120,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 # Mount static files for frontend
@@ -111,22 +136,51 @@ if os.path.exists(frontend_path):
 
 class ProductSummary:
     """Lightweight product summary for context tracking"""
+    __slots__ = ("sku", "name", "price", "position", "search_query")
+    
     def __init__(self, sku: str, name: str, price: float, position: int, search_query: str = ""):
         self.sku = sku
         self.name = name
         self.price = price
         self.position = position
         self.search_query = search_query
-        self.timestamp = datetime.now()
 
 class SearchContext:
-    """Context for a product search"""
+    """Context for a product search (products[i] is at position i + 1)"""
+    __slots__ = ("query", "products", "total_found", "timestamp", "selected_skus", "_by_sku")
+    
     def __init__(self, query: str, products: List[ProductSummary], total_found: int):
         self.query = query
         self.products = products
         self.total_found = total_found
-        self.timestamp = datetime.now()
+        self.timestamp = time.time()
         self.selected_skus: List[str] = []
+        self._by_sku: Optional[Dict[str, ProductSummary]] = None
+    
+    def product_at(self, position: int) -> Optional[ProductSummary]:
+        """O(1) positional lookup ("the second one" → 2)"""
+        if 1 <= position <= len(self.products):
+            return self.products[position - 1]
+        return None
+    
+    def product_by_sku(self, sku: str) -> Optional[ProductSummary]:
+        if self._by_sku is None:
+            self._by_sku = {prod.sku: prod for prod in self.products}
+        return self._by_sku.get(sku)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        # Compact: one [sku, name, price] row per product; position and query are implied
+        return {"q": self.query, "n": self.total_found, "t": self.timestamp, "sel": list(self.selected_skus),
+                "p": [[prod.sku, prod.name, prod.price] for prod in self.products]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SearchContext":
+        query = data["q"]
+        products = [ProductSummary(sku, name, price, i, query) for i, (sku, name, price) in enumerate(data["p"], start=1)]
+        context = cls(query, products, data["n"])
+        context.timestamp = data["t"]
+        context.selected_skus = list(data["sel"])
+        return context
 
 class ProductContextManager:
     """
@@ -134,6 +188,10 @@ class ProductContextManager:
     Fixes BUG-022: 'show me the second one' → instant SKU lookup
     Fixes BUG-030: Grey sofa - no pics before carousel
     Fixes BUG-032: Context loss mid-conversation
+    
+    Searches live in the state store (see state_store.py). In process they stay
+    live SearchContext objects (positional and SKU lookups use them directly);
+    only the postgres backend stores their compact dicts.
     """
     
     def __init__(self, max_searches: int = 5, ttl_seconds: int = 1800):
@@ -142,13 +200,35 @@ class ProductContextManager:
             max_searches: Keep last N searches per user
             ttl_seconds: Time-to-live for stored searches (30 min default)
         """
-        # user_identifier → List[SearchContext]
-        self.user_searches: Dict[str, List[SearchContext]] = {}
+        # user_identifier → [SearchContext, ...] (most recent first; dicts when read back from postgres)
+        self.user_searches = state_store.namespace(
+            "product_context", ttl_seconds, encode=lambda searches: [search.to_dict() for search in searches]
+        )
         self.max_searches = max_searches
         self.ttl_seconds = ttl_seconds
-        print(f"✅ ProductContextManager initialized (max_searches={max_searches}, ttl={ttl_seconds}s)")
+        tool_log.info(f"✅ ProductContextManager initialized (max_searches={max_searches}, ttl={ttl_seconds}s)")
+    
+    @staticmethod
+    def _search(stored: Any) -> Optional[SearchContext]:
+        """A stored search as a SearchContext (live in process, rebuilt from its dict otherwise)"""
+        if isinstance(stored, SearchContext):
+            return stored
+        try:
+            return SearchContext.from_dict(stored)
+        except (KeyError, TypeError, ValueError):
+            return None   # stored in an older record shape; treated as expired
+    
+    async def _stored(self, user_identifier: str) -> List[Any]:
+        return await self.user_searches.get(user_identifier) or []
+    
+    async def _load(self, user_identifier: str) -> List[SearchContext]:
+        searches = [self._search(stored) for stored in await self._stored(user_identifier)]
+        return [search for search in searches if search is not None]
+    
+    async def _save(self, user_identifier: str, searches: List[SearchContext]):
+        await self.user_searches.set(user_identifier, searches)
     
-    def store_search(self, user_identifier: str, query: str, products: List[Dict[str, Any]]) -> SearchContext:
+    async def store_search(self, user_identifier: str, query: str, products: List[Dict[str, Any]]) -> SearchContext:
         """Store a product search result for later reference"""
         # Convert products to ProductSummary
         product_summaries = []
@@ -169,78 +249,62 @@ class ProductContextManager:
             total_found=len(products)
         )
         
-        # Initialize user searches if needed
-        if user_identifier not in self.user_searches:
-            self.user_searches[user_identifier] = []
+        # Add to user's search history, keeping only max_searches
+        searches = await self._load(user_identifier)
+        searches.insert(0, context)
+        await self._save(user_identifier, searches[:self.max_searches])
         
-        # Add to user's search history
-        self.user_searches[user_identifier].insert(0, context)
-        
-        # Keep only max_searches
-        if len(self.user_searches[user_identifier]) > self.max_searches:
-            self.user_searches[user_identifier] = self.user_searches[user_identifier][:self.max_searches]
-        
-        print(f"📦 Stored search context: '{query}' with {len(product_summaries)} products for user {user_identifier}")
+        tool_log.info(f"📦 Stored search context: '{query}' with {len(product_summaries)} products for user {user_identifier}")
         return context
     
-    def get_last_search(self, user_identifier: str) -> Optional[SearchContext]:
+    async def get_last_search(self, user_identifier: str) -> Optional[SearchContext]:
         """Get user's most recent search"""
-        searches = self.user_searches.get(user_identifier, [])
-        if searches:
+        stored = await self._stored(user_identifier)
+        last_search = self._search(stored[0]) if stored else None
+        if last_search:
             # Check if expired
-            last_search = searches[0]
-            age = (datetime.now() - last_search.timestamp).total_seconds()
+            age = time.time() - last_search.timestamp
             if age < self.ttl_seconds:
                 return last_search
             else:
-                print(f"⏰ Last search for {user_identifier} expired ({age}s > {self.ttl_seconds}s)")
+                tool_log.info(f"⏰ Last search for {user_identifier} expired ({age}s > {self.ttl_seconds}s)")
         return None
     
-    def get_product_by_position(self, user_identifier: str, position: int) -> Optional[ProductSummary]:
+    async def get_product_by_position(self, user_identifier: str, position: int) -> Optional[ProductSummary]:
         """
         Get product by position from last search
         e.g., "show me the second one" → position=2
         """
-        last_search = self.get_last_search(user_identifier)
-        if last_search:
-            for prod in last_search.products:
-                if prod.position == position:
-                    print(f"✅ Found product at position {position}: {prod.sku} - {prod.name}")
-                    return prod
-        return None
+        last_search = await self.get_last_search(user_identifier)
+        prod = last_search.product_at(position) if last_search else None
+        if prod:
+            tool_log.info(f"✅ Found product at position {position}: {prod.sku} - {prod.name}")
+        return prod
     
-    def get_product_by_sku(self, user_identifier: str, sku: str) -> Optional[ProductSummary]:
+    async def get_product_by_sku(self, user_identifier: str, sku: str) -> Optional[ProductSummary]:
         """Get product by SKU from last search"""
-        last_search = self.get_last_search(user_identifier)
-        if last_search:
-            for prod in last_search.products:
-                if prod.sku == sku:
-                    return prod
-        return None
+        last_search = await self.get_last_search(user_identifier)
+        return last_search.product_by_sku(sku) if last_search else None
     
-    def mark_product_selected(self, user_identifier: str, sku: str):
+    async def mark_product_selected(self, user_identifier: str, sku: str):
         """Mark a product as selected for tracking user preferences"""
-        last_search = self.get_last_search(user_identifier)
-        if last_search and sku not in last_search.selected_skus:
-            last_search.selected_skus.append(sku)
-            print(f"✅ Marked SKU {sku} as selected for user {user_identifier}")
+        searches = await self._load(user_identifier)
+        if searches and sku not in searches[0].selected_skus:
+            searches[0].selected_skus.append(sku)
+            await self._save(user_identifier, searches)
+            tool_log.info(f"✅ Marked SKU {sku} as selected for user {user_identifier}")
     
-    def get_all_searches(self, user_identifier: str) -> List[SearchContext]:
+    async def get_all_searches(self, user_identifier: str) -> List[SearchContext]:
         """Get all valid searches for a user"""
-        searches = self.user_searches.get(user_identifier, [])
+        searches = await self._load(user_identifier)
         # Filter expired
-        valid_searches = []
-        for search in searches:
-            age = (datetime.now() - search.timestamp).total_seconds()
-            if age < self.ttl_seconds:
-                valid_searches.append(search)
-        return valid_searches
+        now = time.time()
+        return [search for search in searches if now - search.timestamp < self.ttl_seconds]
     
-    def clear_user_context(self, user_identifier: str):
+    async def clear_user_context(self, user_identifier: str):
         """Clear all stored context for a user"""
-        if user_identifier in self.user_searches:
-            del self.user_searches[user_identifier]
-            print(f"🗑️ Cleared context for user {user_identifier}")
+        await self.user_searches.delete(user_identifier)
+        tool_log.info(f"🗑️ Cleared context for user {user_identifier}")
 
 # Initialize global ProductContextManager
 product_context = ProductContextManager(max_searches=5, ttl_seconds=1800)
@@ -258,6 +322,8 @@ class UserContext:
     Holds user authentication context from URL parameters
     Used for authenticated features (order history, personalization, admin)
     """
+    __slots__ = ("user_identifier", "customer_id", "loft_id", "email", "auth_level")
+    
     def __init__(
         self,
         user_identifier: str,
@@ -276,7 +342,7 @@ class UserContext:
         if customer_id or loft_id or email:
             self.auth_level = "authenticated"
         
-        print(f"👤 UserContext created: {self.user_identifier} (level: {self.auth_level})")
+        log.info(f"👤 UserContext created: {self.user_identifier} (level: {self.auth_level})")
     
     def is_authenticated(self) -> bool:
         """Check if user is authenticated"""
@@ -290,20 +356,49 @@ class UserContext:
         """Get best identifier for API calls (customer_id > loft_id > email)"""
         return self.customer_id or self.loft_id or self.email
 
-# Global thread-safe storage for user contexts (conversation_id → UserContext)
-from threading import Lock
-user_contexts: Dict[str, UserContext] = {}
-user_contexts_lock = Lock()
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
 
-def set_user_context(conversation_id: str, context: UserContext):
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserContext":
+        """Rebuild a stored context (without logging it as a new one)"""
+        context = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(context, field, data.get(field))
+        return context
+
+# Shared storage for user contexts (conversation_id → UserContext.to_dict()), see state_store.py
+USER_CONTEXT_TTL_SECONDS = int(os.getenv("USER_CONTEXT_TTL_SECONDS", "86400"))
+user_contexts = state_store.namespace("user_contexts", USER_CONTEXT_TTL_SECONDS)
+
+async def set_user_context(conversation_id: str, context: UserContext):
     """Store user context for a conversation"""
-    with user_contexts_lock:
-        user_contexts[conversation_id] = context
+    await user_contexts.set(conversation_id, context.to_dict())
 
-def get_user_context(conversation_id: str) -> Optional[UserContext]:
+async def get_user_context(conversation_id: str) -> Optional[UserContext]:
     """Retrieve user context for a conversation"""
-    with user_contexts_lock:
-        return user_contexts.get(conversation_id)
+    data = await user_contexts.get(conversation_id)
+    return UserContext.from_dict(data) if data else None
+
+class TurnDeps:
+    """
+    Per-turn dependencies passed to agent runs as ctx.deps.
+    Resolved once per request so tools never look the session up again.
+    """
+    def __init__(self, user_identifier: str, conversation_id: str, platform_type: str,
+                 user_context: Optional[UserContext] = None):
+        self.user_identifier = user_identifier
+        self.conversation_id = conversation_id
+        self.platform_type = platform_type
+        self.user_context = user_context
+        self.speculation: Optional[TurnSpeculation] = None   # lookups started from the message
+        self.tool_outputs = TurnToolOutputs()                  # UI payloads kept out of the model's view
+        self.deadline: Optional[Deadline] = None               # the turn's channel deadline
+
+class DirectToolContext:
+    """Stand-in for RunContext when a tool is called directly (fast-path) instead of by the agent"""
+    def __init__(self, deps: TurnDeps):
+        self.deps = deps
 
 # ============================================================================
 # END USER AUTHENTICATION CONTEXT
@@ -315,12 +410,15 @@ def get_user_context(conversation_id: str) -> Optional[UserContext]:
 
 class ChainState:
     """Tracks state for multi-step command chains"""
+    __slots__ = ("chain_id", "user_identifier", "steps_completed", "results", "created_at",
+                 "waiting_for_user", "current_step")
+    
     def __init__(self, chain_id: str, user_identifier: str):
         self.chain_id = chain_id
         self.user_identifier = user_identifier
         self.steps_completed: List[str] = []
         self.results: Dict[str, Any] = {}
-        self.created_at = datetime.now()
+        self.created_at = time.time()
         self.waiting_for_user = False
         self.current_step: Optional[str] = None
     
@@ -328,42 +426,48 @@ class ChainState:
         """Store result from a step"""
         self.steps_completed.append(step_name)
         self.results[step_name] = result
-        print(f"✅ Chain {self.chain_id}: Completed step '{step_name}'")
+        tool_log.info(f"✅ Chain {self.chain_id}: Completed step '{step_name}'")
     
     def get_result(self, step_name: str) -> Optional[Any]:
         """Get result from a previous step"""
         return self.results.get(step_name)
 
-# Global chain state storage (chain_id → ChainState)
-active_chains: Dict[str, ChainState] = {}
-chains_lock = Lock()
-
-def create_chain(user_identifier: str) -> ChainState:
+    def to_dict(self) -> Dict[str, Any]:
+        return {"chain_id": self.chain_id, "user_identifier": self.user_identifier,
+                "steps_completed": list(self.steps_completed), "results": dict(self.results),
+                "created_at": self.created_at, "waiting_for_user": self.waiting_for_user,
+                "current_step": self.current_step}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChainState":
+        chain = cls(data["chain_id"], data["user_identifier"])
+        chain.steps_completed = list(data["steps_completed"])
+        chain.results = dict(data["results"])
+        chain.created_at = data["created_at"]
+        chain.waiting_for_user = data["waiting_for_user"]
+        chain.current_step = data["current_step"]
+        return chain
+
+# Shared chain state storage (chain_id → ChainState.to_dict()); chains expire after an hour
+active_chains = state_store.namespace("active_chains", 3600)
+
+async def create_chain(user_identifier: str) -> ChainState:
     """Create a new chain"""
     import uuid
     chain_id = str(uuid.uuid4())[:8]
     chain = ChainState(chain_id, user_identifier)
-    with chains_lock:
-        active_chains[chain_id] = chain
-    print(f"🔗 Created chain {chain_id} for user {user_identifier}")
+    await save_chain(chain)
+    tool_log.info(f"🔗 Created chain {chain_id} for user {user_identifier}")
     return chain
 
-def get_chain(chain_id: str) -> Optional[ChainState]:
+async def save_chain(chain: ChainState):
+    """Store a chain's progress so any worker can pick it up"""
+    await active_chains.set(chain.chain_id, chain.to_dict())
+
+async def get_chain(chain_id: str) -> Optional[ChainState]:
     """Get an existing chain"""
-    with chains_lock:
-        return active_chains.get(chain_id)
-
-def cleanup_old_chains(max_age_seconds: int = 3600):
-    """Remove chains older than max_age"""
-    with chains_lock:
-        expired = []
-        for chain_id, chain in active_chains.items():
-            age = (datetime.now() - chain.created_at).total_seconds()
-            if age > max_age_seconds:
-                expired.append(chain_id)
-        for chain_id in expired:
-            del active_chains[chain_id]
-            print(f"🗑️ Cleaned up expired chain {chain_id}")
+    data = await active_chains.get(chain_id)
+    return ChainState.from_dict(data) if data else None
 
 # ============================================================================
 # END CHAINED COMMAND EXECUTOR
@@ -467,28 +571,24 @@ YOU: Call get_orders_by_customer("9318667498") ← USE THE ID!
 2. CALL THE FUNCTION IMMEDIATELY
 3. ⏳ WAIT FOR FUNCTION TO COMPLETE (DO NOT respond until you have the result!)
 4. USE the complete function result
-5. RESPOND with the data INCLUDING all images, links, and carousel data
+5. RESPOND using the function result
 
-🎨 CRITICAL: PRESERVE **CAROUSEL_DATA:**
+🎨 PRODUCT CARDS ARE SHOWN AUTOMATICALLY
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-When a function returns **CAROUSEL_DATA:** with JSON, YOU MUST:
-✅ INCLUDE the **CAROUSEL_DATA:** {json} line EXACTLY as the function returned it
-✅ DO NOT reformat, simplify, or remove the carousel data
-✅ DO NOT convert carousel to plain list
-✅ You can ADD friendly text before/after, but PRESERVE the **CAROUSEL_DATA:**
+When a function result says products are shown to the customer as product cards:
+✅ The customer already sees every product with photo, price and link
+✅ Write a short friendly intro and highlight 2-3 products by name and price
+✅ End with a helpful follow-up question (color, brand, budget, dimensions...)
+✅ Use the SKUs from the result when the customer picks a product
 
 Example CORRECT response:
-"Here are some great recliners I found for you!
-
-1. Product A - $999
-2. Product B - $1499
-
-**CAROUSEL_DATA:** {"products": [full json here]}
+"Here are some great recliners I found for you! The Product A ($999) is a customer
+favorite, and the Product B ($1,499) adds power reclining.
 
 Would you like to filter by color or brand?"
 
 ❌ WRONG - DO NOT DO THIS:
-"Here are recliners: 1. Product A, 2. Product B" (missing CAROUSEL_DATA)
+Writing JSON or a **CAROUSEL_DATA:** line, or repeating every product of the cards as a list
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 ═══════════════════════════════════════════════════════════════════
@@ -638,8 +738,8 @@ Just tell me what you're looking for and I'll help however I can!"
    - **🔥 BUG-030 FIX - MANDATORY PROCESS:**
      1. IMMEDIATELY call search_magento_products() - NO EXCEPTIONS
      2. DO NOT provide any response until function returns
-     3. WAIT for complete result with CAROUSEL_DATA
-     4. Return the function result EXACTLY as provided
+     3. WAIT for the complete result (the products are shown as cards)
+     4. Answer from the function result
      5. NEVER give product info without calling the function first
    - **FORBIDDEN:** Giving product suggestions without calling search functions
    - **Enhanced approach:** Make product discovery CONVERSATIONAL and EASY
@@ -1048,6 +1148,10 @@ if 'defer_model_check' in agent_params:
 print(f"🤖 Creating Agent with: {list(agent_kwargs.keys())}")
 agent = Agent(**agent_kwargs)
 
+# 📏 Per-section token budgets for each turn's prompt. With `system_prompt=` PydanticAI only sends the
+# prompt when the history is empty, so the assembler puts it at the head of the history itself.
+prompt_assembler = PromptAssembler(prompt_content, system_prompt_in_history='instructions' not in agent_kwargs)
+
 # Add toolsets after creation if not supported in constructor
 if 'toolsets' not in agent_params and calendar_server:
     try:
@@ -1062,10 +1166,183 @@ if 'toolsets' not in agent_params and calendar_server:
     except Exception as e:
         print(f"⚠️ Could not add MCP toolset: {e}")
 
-# LOFT Function Definitions with @agent.tool decorators
+# ============================================================================
+# LOFT RESULT RENDERERS - text/HTML built from typed customer_data records
+# ============================================================================
+
+def render_customer_card(customer: Customer, phone: str) -> str:
+    """Customer card returned by get_customer_by_phone (JSON + HTML for the frontend)"""
+    json_data = json.dumps({
+        "function": "getCustomerByPhone",
+        "status": "success",
+        "data": {
+            "customerid": customer.raw.get('customerid'),
+            "firstname": customer.raw.get('firstname'),
+            "lastname": customer.raw.get('lastname'),
+            "email": customer.raw.get('email'),
+            "phone": phone,
+            "address": customer.address,
+            "zipcode": customer.raw.get('zipcode')
+        },
+        "message": f"Customer {customer.name} found successfully"
+    })
+
+    # 🧠 ENHANCED CUSTOMER RECOGNITION (PRAGMATIC INFERENCE)
+    return f"""**Function Result (getCustomerByPhone):**
+{json_data}
+
+<div class="customer-card">
+  <h3 class="customer-name">Hello {customer.name}! Great to see you again.</h3>
+  <div class="recognition-context">I have your information here - how can I help you today?</div>
+  <div class="customer-details">
+    📱 {phone} | 🆔 ID: {customer.raw.get('customerid')} | 📧 {customer.raw.get('email')}
+    <br>🏠 {customer.address}
+  </div>
+</div>
+
+**What would you like to do today?**
+• 📦 **View Your Orders** - Check your order history and status
+• ⭐ **Get Recommendations** - Products picked based on your previous purchases
+• 🏪 **Visit Store** - Find your nearest Woodstock location
+• 💬 **Need Support?** - Connect with our customer service team"""
+
+def render_customer_summary(customer: Customer, email: str) -> str:
+    """Plain-text customer summary returned by get_customer_by_email"""
+    customer_info = [f"📧 Email: {email}"]
+    if customer.customer_id:
+        customer_info.append(f"🆔 Customer ID: {customer.customer_id}")
+    if customer.name:
+        customer_info.append(f"👤 Name: {customer.name}")
+    if customer.raw.get('phonenumber'):
+        customer_info.append(f"📱 Phone: {customer.raw.get('phonenumber')}")
+    return "✅ Customer found:\n" + "\n".join(customer_info)
+
+def render_customer(customer: Customer, identifier: str) -> str:
+    """Render a customer the way the matching lookup tool would"""
+    if "@" in identifier:
+        return render_customer_summary(customer, identifier)
+    return render_customer_card(customer, identifier)
+
+def render_customer_not_found(identifier: str) -> str:
+    """🧠 ENHANCED ERROR RECOVERY (NO DEAD ENDS)"""
+    if "@" in identifier:
+        return f"""I don't have a customer record for {identifier} in our system yet.
+
+**Let me help you get started:**
+• 🆕 **Create Account** - Get personalized service and order tracking
+• 🛒 **Browse Products** - See our full selection
+• 📞 **Call Store** - Speak with our team about setting up your account
+• 🏪 **Visit in Person** - Our team can help you get started
+
+What brings you to Woodstock today?"""
+    return f"""I don't have a customer record for {identifier} in our system yet.
+
+**Let me help you get started:**
+• 🆕 **Create Account** - Get personalized service and faster checkout
+• 🛒 **Browse Products** - See our full selection without an account
+• 📞 **Call Store Directly** - Speak with our team about your account
+• 🏪 **Visit in Person** - Our team can help set up your account
+
+**Or try a different phone number if you have multiple numbers on file.**
+
+What would you like to do?"""
+
+def render_orders(customer_id: str, orders: List[Order]) -> str:
+    """Order history JSON - frontend renders the HTML"""
+    if not orders:
+        # 🧠 ENHANCED ERROR RECOVERY (TURN NEGATIVES INTO OPPORTUNITIES)
+        return f"""I don't see any orders for customer {customer_id} yet.
+
+**Let's get you started with your first purchase!**
+• 🛒 **Browse Our Selection** - See what catches your eye
+• ⭐ **Get Recommendations** - Tell me what you're looking for
+• 🏪 **Visit Store** - See our full showroom in person
+• 📞 **Talk to Sales Expert** - Get personalized guidance
+
+What kind of furniture or mattress are you interested in?"""
+    return json.dumps({
+        "function": "getOrdersByCustomer",
+        "status": "success",
+        "data": {
+            "orders": [order.raw for order in orders],
+            "customer_id": customer_id,
+            "total_orders": len(orders)
+        },
+        "message": f"Found {len(orders)} orders for customer {customer_id}"
+    })
+
+def render_order_details(details: OrderDetails) -> str:
+    """Line-item listing for one order"""
+    if not details.lines:
+        return f"❌ No details found for order {details.order_id}."
+
+    detail_info = [f"📦 Order Details for {details.order_id}:", f"📋 {len(details.lines)} item(s)"]
+    for i, line in enumerate(details.lines, 1):
+        if line.description and not line.is_benefit_plan:
+            detail_info.append(f"\n🛍️ Item #{i}:")
+            detail_info.append(f"   📦 {line.description}")
+            if line.item_price > 0:
+                detail_info.append(f"   💰 ${line.item_price}")
+
+    if details.total > 0:
+        detail_info.append(f"\n💰 Total: ${details.total:.2f}")
+    return "\n".join(detail_info)
+
+def render_patterns(patterns: CustomerPatterns) -> str:
+    """Purchase pattern report"""
+    patterns_info = [
+        f"📊 CUSTOMER PURCHASE PATTERNS for {patterns.customer_id}:",
+        f"📦 Total Orders Analyzed: {patterns.orders_analyzed}",
+        f"💰 Total Spending Analyzed: ${patterns.total_spent:.2f}",
+    ]
+    if patterns.favorite_categories:
+        patterns_info.append(f"🎯 Favorite Categories: {', '.join(patterns.favorite_categories)}")
+    patterns_info.append(f"\n💡 Customer Profile: {'High-value' if patterns.is_high_value else 'Regular'} customer")
+    return "\n".join(patterns_info)
+
+def render_no_patterns(customer_id: str) -> str:
+    return f"There are currently no purchase patterns available to analyze for customer {customer_id}, likely because there are no recorded orders in the system. If you would like to check again, search by another method, or need assistance with something else, please let me know!"
+
+def render_customer_journey(profile: CustomerProfile, identifier: str, max_details: int = 3) -> str:
+    journey_info = []
+    journey_info.append("🎯 COMPLETE CUSTOMER JOURNEY:")
+    journey_info.append(render_customer(profile.customer, identifier))
+    journey_info.append("")
+    journey_info.append(render_orders(profile.customer.customer_id, profile.orders))
+    for details in profile.details[:max_details]:
+        journey_info.append("")
+        journey_info.append(render_order_details(details))
+    return "\n".join(journey_info)
+
+# ============================================================================
+# END LOFT RESULT RENDERERS
+# ============================================================================
+
+# 🧭 Every tool is registered on the full agent and recorded here, so the per-intent
+# agents (ToolRouter in tool_routing.py) can be built from subsets of the same functions.
+TOOL_FUNCTIONS: Dict[str, Any] = {}
+
+
+def register_tool(func):
+    """@agent.tool that also records the function in TOOL_FUNCTIONS
+
+    The agents get a wrapper that reuses a matching speculative lookup, keeps
+    the call within the turn's deadline (cached or budget-exhausted result
+    when it runs out), publishes tool_start / tool_result (with the full UI
+    payload) to the turn's event stream and hands the model the compact view
+    of product results; direct calls between tools (and the fast-path) use
+    the plain function.
+    """
+    tool = compact_tool(publishing_tool(deadline_tool(speculative_tool(func))))
+    TOOL_FUNCTIONS[func.__name__] = tool
+    agent.tool(tool)
+    return func
+
+
+# LOFT Function Definitions with @register_tool decorators
 print("🔧 Adding LOFT functions to agent...")
 
-@agent.tool
+@register_tool
 async def get_customer_by_phone(ctx: RunContext, phone: str) -> str:
     """Look up customer information using their phone number.
     
@@ -1085,106 +1362,19 @@ async def get_customer_by_phone(ctx: RunContext, phone: str) -> str:
         - "my phone is 678-123-4567" → Use this function
         - "show orders for 770-653-7383" → Use this function FIRST, then get_orders_by_customer
     """
-    API_BASE = os.getenv('WOODSTOCK_API_BASE', 'https://api.woodstockoutlet.com/public/index.php/april')
-    
     try:
-        print(f"🔧 Function Call: getCustomerByPhone({phone})")
+        tool_log.info(f"🔧 Function Call: getCustomerByPhone({phone})")
         
         if not phone or len(phone.strip()) < 7:
             return "❌ Invalid phone number format. Please provide a valid phone number."
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = f"{API_BASE}/GetCustomerByPhone"
-            params = {'phone': phone.strip()}
-            
-            print(f"🌐 Calling LOFT API: {url} with phone: {phone}")
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            print(f"📊 LOFT API Response: {data}")
-            
-            # LOFT API returns data in 'entry' array
-            if data and data.get('entry') and len(data['entry']) > 0:
-                customer_data = data['entry'][0]
-                
-                # Initialize safe defaults before conditionals
-                name = ""
-                address = ""
-                
-                customer_info = []
-                customer_info.append(f"📱 Phone: {phone}")
-                
-                if customer_data.get('customerid'):
-                    customer_info.append(f"🆔 Customer ID: {customer_data.get('customerid')}")
-                
-                if customer_data.get('firstname') or customer_data.get('lastname'):
-                    name = f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip()
-                    if name:
-                        customer_info.append(f"👤 Name: {name}")
-                
-                if customer_data.get('email'):
-                    customer_info.append(f"📧 Email: {customer_data.get('email')}")
-                
-                if customer_data.get('address1'):
-                    address = customer_data.get('address1')
-                    if customer_data.get('city'):
-                        address += f", {customer_data.get('city')}"
-                    if customer_data.get('state'):
-                        address += f", {customer_data.get('state')}"
-                    customer_info.append(f"🏠 Address: {address}")
-                
-                # Return BOTH JSON + TEXT for frontend extraction
-                import json
-                json_data = json.dumps({
-                    "function": "getCustomerByPhone",
-                    "status": "success", 
-                    "data": {
-                        "customerid": customer_data.get('customerid'),
-                        "firstname": customer_data.get('firstname'),
-                        "lastname": customer_data.get('lastname'),
-                        "email": customer_data.get('email'),
-                        "phone": phone,
-                        "address": address,
-                        "zipcode": customer_data.get('zipcode')
-                    },
-                    "message": f"Customer {name} found successfully"
-                })
-                
-                # 🧠 ENHANCED CUSTOMER RECOGNITION (PRAGMATIC INFERENCE)
-                return f"""**Function Result (getCustomerByPhone):**
-{json_data}
-
-<div class="customer-card">
-  <h3 class="customer-name">Hello {name}! Great to see you again.</h3>
-  <div class="recognition-context">I have your information here - how can I help you today?</div>
-  <div class="customer-details">
-    📱 {phone} | 🆔 ID: {customer_data.get('customerid')} | 📧 {customer_data.get('email')}
-    <br>🏠 {address}
-  </div>
-</div>
-
-**What would you like to do today?**
-• 📦 **View Your Orders** - Check your order history and status
-• ⭐ **Get Recommendations** - Products picked based on your previous purchases  
-• 🏪 **Visit Store** - Find your nearest Woodstock location
-• 💬 **Need Support?** - Connect with our customer service team"""
-            else:
-                # 🧠 ENHANCED ERROR RECOVERY (NO DEAD ENDS)
-                return f"""I don't have a customer record for {phone} in our system yet.
-
-**Let me help you get started:**
-• 🆕 **Create Account** - Get personalized service and faster checkout
-• 🛒 **Browse Products** - See our full selection without an account
-• 📞 **Call Store Directly** - Speak with our team about your account
-• 🏪 **Visit in Person** - Our team can help set up your account
-
-**Or try a different phone number if you have multiple numbers on file.**
-
-What would you like to do?"""
+        customer = await fetch_customer_by_phone(phone)
+        if customer:
+            return render_customer_card(customer, phone)
+        return render_customer_not_found(phone)
                 
     except Exception as error:
-        print(f"❌ Error in getCustomerByPhone: {error}")
+        tool_log.error(f"❌ Error in getCustomerByPhone: {error}")
         # 🧠 ENHANCED ERROR RECOVERY (GRACEFUL DEGRADATION)
         return f"""I'm having trouble accessing customer information right now. While I work on that, let me help you in other ways:
 
@@ -1196,129 +1386,37 @@ What would you like to do?"""
 
 Or just tell me what you're looking for and I'll help however I can!"""
 
-@agent.tool
+@register_tool
 async def get_orders_by_customer(ctx: RunContext, customer_id: str) -> str:
     """📦 ORDER HISTORY: Get customer's order history when they specifically ask for 'my orders', 'purchase history', 'order status'. NOT for customer identification - use only after customer requests order information."""
-    API_BASE = os.getenv('WOODSTOCK_API_BASE', 'https://api.woodstockoutlet.com/public/index.php/april')
-    
     try:
-        print(f"🔧 Function Call: getOrdersByCustomer({customer_id})")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = f"{API_BASE}/GetOrdersByCustomer"
-            params = {'custid': customer_id}
-            
-            print(f"🌐 Calling LOFT API: {url} with customer: {customer_id}")
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            print(f"📊 Orders API Response: {data}")
-            
-            if data and data.get('entry') and len(data['entry']) > 0:
-                orders = data['entry']
-                
-                order_info = []
-                order_info.append(f"📦 Found {len(orders)} order(s) for customer {customer_id}:")
-                
-                for i, order in enumerate(orders[:5], 1):  # Limit to 5 recent orders
-                    order_info.append(f"\n🛍️ Order #{i}:")
-                    if order.get('orderid'):
-                        order_info.append(f"   📋 Order ID: {order.get('orderid')}")
-                    if order.get('orderstatus'):
-                        order_info.append(f"   📊 Status: {order.get('orderstatus')}")
-                    if order.get('ordertotal'):
-                        order_info.append(f"   💰 Total: ${order.get('ordertotal')}")
-                    if order.get('orderdate'):
-                        order_info.append(f"   📅 Date: {order.get('orderdate')}")
-                
-                if len(orders) > 5:
-                    order_info.append(f"\n... and {len(orders) - 5} more orders")
-                
-                # Return JSON like original - frontend will render HTML
-                import json
-                return json.dumps({
-                    "function": "getOrdersByCustomer",
-                    "status": "success",
-                    "data": {
-                        "orders": orders,
-                        "customer_id": customer_id,
-                        "total_orders": len(orders)
-                    },
-                    "message": f"Found {len(orders)} orders for customer {customer_id}"
-                })
-            else:
-                # 🧠 ENHANCED ERROR RECOVERY (TURN NEGATIVES INTO OPPORTUNITIES)
-                return f"""I don't see any orders for customer {customer_id} yet.
-
-**Let's get you started with your first purchase!**
-• 🛒 **Browse Our Selection** - See what catches your eye
-• ⭐ **Get Recommendations** - Tell me what you're looking for
-• 🏪 **Visit Store** - See our full showroom in person
-• 📞 **Talk to Sales Expert** - Get personalized guidance
-
-What kind of furniture or mattress are you interested in?"""
+        tool_log.info(f"🔧 Function Call: getOrdersByCustomer({customer_id})")
+    
+        orders = await fetch_orders(customer_id)
+        return render_orders(customer_id, orders)
                 
     except Exception as error:
-        print(f"❌ Error in getOrdersByCustomer: {error}")
+        tool_log.error(f"❌ Error in getOrdersByCustomer: {error}")
         return f"❌ Error searching for orders: {str(error)}"
 
 # FUNCTION REMOVED - SearchProducts endpoint does not exist!
 
-@agent.tool
+@register_tool
 async def get_customer_by_email(ctx: RunContext, email: str) -> str:
     """Buscar cliente por email en LOFT"""
-    API_BASE = os.getenv('WOODSTOCK_API_BASE', 'https://api.woodstockoutlet.com/public/index.php/april')
-    
     try:
-        print(f"🔧 Function Call: getCustomerByEmail({email})")
+        tool_log.info(f"🔧 Function Call: getCustomerByEmail({email})")
         
         if not email or '@' not in email:
             return "❌ Invalid email format. Please provide a valid email address."
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = f"{API_BASE}/GetCustomerByEmail"
-            params = {'email': email.strip()}
-            
-            print(f"🌐 Calling LOFT API: {url} with email: {email}")
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            print(f"📊 LOFT Email API Response: {data}")
-            
-            if data and data.get('entry') and len(data['entry']) > 0:
-                customer_data = data['entry'][0]
-                
-                customer_info = []
-                customer_info.append(f"📧 Email: {email}")
-                
-                if customer_data.get('customerid'):
-                    customer_info.append(f"🆔 Customer ID: {customer_data.get('customerid')}")
-                
-                if customer_data.get('firstname') or customer_data.get('lastname'):
-                    name = f"{customer_data.get('firstname', '')} {customer_data.get('lastname', '')}".strip()
-                    if name:
-                        customer_info.append(f"👤 Name: {name}")
-                
-                if customer_data.get('phonenumber'):
-                    customer_info.append(f"📱 Phone: {customer_data.get('phonenumber')}")
-                
-                return "✅ Customer found:\n" + "\n".join(customer_info)
-            else:
-                # 🧠 ENHANCED ERROR RECOVERY (NO DEAD ENDS)
-                return f"""I don't have a customer record for {email} in our system yet.
-
-**Let me help you get started:**
-• 🆕 **Create Account** - Get personalized service and order tracking
-• 🛒 **Browse Products** - See our full selection
-• 📞 **Call Store** - Speak with our team about setting up your account
-• 🏪 **Visit in Person** - Our team can help you get started
-
-What brings you to Woodstock today?"""
+        customer = await fetch_customer_by_email(email)
+        if customer:
+            return render_customer_summary(customer, email)
+        return render_customer_not_found(email)
                 
     except Exception as error:
-        print(f"❌ Error in getCustomerByEmail: {error}")
+        tool_log.error(f"❌ Error in getCustomerByEmail: {error}")
         # 🧠 ENHANCED ERROR RECOVERY (GRACEFUL DEGRADATION)  
         return f"""I'm having trouble accessing customer information right now. While I work on that, let me help you in other ways:
 
@@ -1330,105 +1428,37 @@ What brings you to Woodstock today?"""
 
 Just tell me what you're looking for and I'll help however I can!"""
 
-@agent.tool
+@register_tool
 async def get_order_details(ctx: RunContext, order_id: str) -> str:
     """Get detailed line items for a specific order"""
-    API_BASE = os.getenv('WOODSTOCK_API_BASE', 'https://api.woodstockoutlet.com/public/index.php/april')
-    
     try:
-        print(f"🔧 Function Call: getDetailsByOrder({order_id})")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = f"{API_BASE}/GetDetailsByOrder"
-            params = {'orderid': order_id}
-            
-            print(f"🌐 Calling LOFT API: {url} with order: {order_id}")
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            print(f"📊 Order Details API Response: {data}")
-            
-            if data and data.get('entry') and len(data['entry']) > 0:
-                details = data['entry']
-                
-                detail_info = []
-                detail_info.append(f"📦 Order Details for {order_id}:")
-                detail_info.append(f"📋 {len(details)} item(s)")
-                
-                total_value = 0
-                for i, item in enumerate(details, 1):
-                    if item.get('description') and 'BENEFIT PLAN' not in item.get('description', ''):
-                        detail_info.append(f"\n🛍️ Item #{i}:")
-                        detail_info.append(f"   📦 {item.get('description', 'N/A')}")
-                        
-                        price = float(item.get('itemprice', 0) or 0)
-                        if price > 0:
-                            detail_info.append(f"   💰 ${price}")
-                            total_value += price
-                
-                if total_value > 0:
-                    detail_info.append(f"\n💰 Total: ${total_value:.2f}")
-                
-                return "\n".join(detail_info)
-            else:
-                return f"❌ No details found for order {order_id}."
+        tool_log.info(f"🔧 Function Call: getDetailsByOrder({order_id})")
+    
+        details = await fetch_order_details(order_id)
+        return render_order_details(details)
                 
     except Exception as error:
-        print(f"❌ Error in getDetailsByOrder: {error}")
+        tool_log.error(f"❌ Error in getDetailsByOrder: {error}")
         return f"❌ Error getting order details: {str(error)}"
 
-@agent.tool
+@register_tool
 async def get_customer_journey(ctx: RunContext, identifier: str, type: str = "phone") -> str:
     """Get complete customer journey - COMPOSITE FUNCTION combining multiple API calls"""
     try:
-        print(f"🔧 COMPOSITE Function: getCustomerJourney({identifier}, {type})")
-        
-        # Step 1: Get customer info
-        if type == "phone":
-            customer_result = await get_customer_by_phone(ctx, identifier)
-        else:
-            customer_result = await get_customer_by_email(ctx, identifier)
+        tool_log.info(f"🔧 COMPOSITE Function: getCustomerJourney({identifier}, {type})")
         
-        if "❌" in customer_result:
-            return customer_result
+        # Customer + orders + details of the most recent orders (one cache read on repeat visits)
+        profile = await profile_cache.get(identifier, type)
+        if not profile:
+            return render_customer_not_found(identifier)
         
-        # Extract customer ID from result
-        import re
-        customer_id_match = re.search(r'Customer ID: (\d+)', customer_result)
-        if not customer_id_match:
-            return "❌ Could not extract customer ID from customer data"
-        
-        customer_id = customer_id_match.group(1)
-        
-        # Step 2: Get orders
-        orders_result = await get_orders_by_customer(ctx, customer_id)
-        
-        if "❌" in orders_result:
-            return f"✅ Customer found but no orders: {customer_result}\n\n{orders_result}"
-        
-        # Step 3: Get details for each order (extract order IDs)
-        order_ids = re.findall(r'Order ID: ([A-Z0-9]+)', orders_result)
-        
-        journey_info = []
-        journey_info.append("🎯 COMPLETE CUSTOMER JOURNEY:")
-        journey_info.append(customer_result)
-        journey_info.append("")
-        journey_info.append(orders_result)
-        
-        # Get details for each order
-        for order_id in order_ids[:3]:  # Limit to 3 most recent orders
-            details_result = await get_order_details(ctx, order_id)
-            journey_info.append("")
-            journey_info.append(details_result)
-        
-        return "\n".join(journey_info)
+        return render_customer_journey(profile, identifier, max_details=3)
         
     except Exception as error:
-        print(f"❌ Error in getCustomerJourney: {error}")
+        tool_log.error(f"❌ Error in getCustomerJourney: {error}")
         return f"❌ Error getting customer journey: {str(error)}"
 
-@agent.tool
+@register_tool
 async def analyze_customer_patterns(ctx: RunContext, customer_identifier: str) -> str:
     """Analyze customer's purchase history to identify spending patterns and product preferences.
     
@@ -1460,104 +1490,31 @@ async def analyze_customer_patterns(ctx: RunContext, customer_identifier: str) -
         Trust this function to handle the complete workflow internally.
     """
     try:
-        print(f"🔧 DATABASE Function: analyzeCustomerPatterns({customer_identifier})")
-        
-        # Initialize variables
-        customer_id = None
-        orders_result = None
-        
-        # Determine if it's phone, email, or customer ID
-        if "@" in customer_identifier:
-            # It's an email
-            customer_result = await get_customer_by_email(ctx, customer_identifier)
-            # Extract customer ID from email result
-            import re
-            customer_id_match = re.search(r'Customer ID: (\d+)', customer_result)
-            if customer_id_match:
-                customer_id = customer_id_match.group(1)
-                orders_result = await get_orders_by_customer(ctx, customer_id)
-            else:
-                return f"❌ Could not extract customer ID from email lookup"
-                
-        elif len(customer_identifier) == 10 and customer_identifier.isdigit():
-            # It's a customer ID - use directly
-            customer_id = customer_identifier
-            orders_result = await get_orders_by_customer(ctx, customer_id)
-            print(f"🔍 Direct customer ID lookup: {customer_id}, orders result: {orders_result[:100]}...")
-            
-        else:
-            # Assume it's a phone
-            customer_result = await get_customer_by_phone(ctx, customer_identifier)
-            # Extract customer ID from phone result
-            import re
-            customer_id_match = re.search(r'Customer ID: (\d+)', customer_result)
-            if customer_id_match:
-                customer_id = customer_id_match.group(1)
-                orders_result = await get_orders_by_customer(ctx, customer_id)
-            else:
-                return f"❌ Could not extract customer ID from phone lookup"
-        
-        if "❌" in orders_result:
-            return f"There are currently no purchase patterns available to analyze for customer {customer_id}, likely because there are no recorded orders in the system. If you would like to check again, search by another method, or need assistance with something else, please let me know!"
-        
-        # Extract order details for analysis
-        import re, json
-        order_ids = []
+        tool_log.info(f"🔧 DATABASE Function: analyzeCustomerPatterns({customer_identifier})")
         
-        # Try to parse JSON first (new format)
-        try:
-            if orders_result.startswith('{'):
-                orders_data = json.loads(orders_result)
-                if orders_data.get('status') == 'success' and orders_data.get('data', {}).get('orders'):
-                    order_ids = [order.get('orderid') for order in orders_data['data']['orders'] if order.get('orderid')]
-                    print(f"🔍 Extracted order IDs from JSON: {order_ids}")
-        except:
-            # Fallback to regex for text format
-            order_ids = re.findall(r'Order ID: ([A-Z0-9]+)', orders_result)
-            print(f"🔍 Extracted order IDs from text: {order_ids}")
-        
-        if not order_ids:
-            return f"No order IDs were found for customer {customer_id}, so their purchase patterns cannot be analyzed at this time. If you have a different phone number, email, or customer ID, please provide it for further assistance."
-        
-        # Analyze patterns from order details
-        patterns_info = []
-        patterns_info.append(f"📊 CUSTOMER PURCHASE PATTERNS for {customer_id}:")
-        patterns_info.append(f"📦 Total Orders Analyzed: {len(order_ids)}")
-        
-        # Get details for pattern analysis
-        total_spent = 0
-        product_categories = []
-        
-        for order_id in order_ids[:5]:  # Analyze up to 5 recent orders
-            details_result = await get_order_details(ctx, order_id)
-            
-            # Extract spending patterns
-            spending_matches = re.findall(r'\$([0-9.]+)', details_result)
-            for amount in spending_matches:
-                total_spent += float(amount)
-            
-            # Extract product categories
-            if "Sectional" in details_result:
-                product_categories.append("Sectional")
-            if "Recliner" in details_result:
-                product_categories.append("Recliner")
-            if "Console" in details_result:
-                product_categories.append("Console")
+        profile = await profile_cache.get(customer_identifier)
+        if not profile:
+            return f"❌ Could not find a customer for {customer_identifier}"
         
-        patterns_info.append(f"💰 Total Spending Analyzed: ${total_spent:.2f}")
-        
-        if product_categories:
-            patterns_info.append(f"🎯 Favorite Categories: {', '.join(set(product_categories))}")
-        
-        patterns_info.append(f"\n💡 Customer Profile: {'High-value' if total_spent > 1500 else 'Regular'} customer")
-        
-        return "\n".join(patterns_info)
+        if not profile.orders:
+            return render_no_patterns(profile.customer.customer_id)
+                
+        return render_patterns(profile.patterns)
         
     except Exception as error:
-        print(f"❌ Error in analyzeCustomerPatterns: {error}")
+        tool_log.error(f"❌ Error in analyzeCustomerPatterns: {error}")
         return f"❌ Error analyzing patterns: {str(error)}"
 
-@agent.tool
+def recommendation_query(patterns: Optional[CustomerPatterns]) -> str:
+    """Pick the Magento search term for recommendations from purchase patterns"""
+    if patterns and "Sectional" in patterns.favorite_categories:
+        return "sectional"
+    if patterns and "Recliner" in patterns.favorite_categories:
+        return "recliner"
+    # Default to sectionals (most popular)
+    return "sectional"
+
+@register_tool
 async def get_product_recommendations(ctx: RunContext, identifier: str, type: str = "auto") -> str:
     """Generate personalized product recommendations based on customer's purchase history.
     
@@ -1572,8 +1529,8 @@ async def get_product_recommendations(ctx: RunContext, identifier: str, type: st
         type: Usually keep as "auto" for automatic detection
     
     Returns:
-        Product carousel with 6-8 personalized recommendations based on purchase history,
-        includes CAROUSEL_DATA JSON for frontend rendering
+        6-8 personalized recommendations based on purchase history: one line per product
+        (name, SKU, price); the customer sees them as product cards
         
     Examples:
         - "get product recommendations for 770-653-7383" → Use this function
@@ -1590,112 +1547,91 @@ async def get_product_recommendations(ctx: RunContext, identifier: str, type: st
         Trust this function to handle the workflow - it chains analyze + search internally.
     """
     try:
-        print(f"🔧 HYBRID Function: getProductRecommendations({identifier}, {type})")
-        
-        # Get patterns first using the hybrid analyze function
-        patterns_result = await analyze_customer_patterns(ctx, identifier)
-        
-        if "❌" in patterns_result:
-            return patterns_result
+        tool_log.info(f"🔧 HYBRID Function: getProductRecommendations({identifier}, {type})")
         
-        recommendations = []
-        recommendations.append("🎯 PERSONALIZED PRODUCT RECOMMENDATIONS:")
+        profile = await profile_cache.get(identifier)
+        if not profile:
+            return f"❌ Could not find a customer for {identifier}"
         
-        # Generate recommendations based on patterns
         # Use Magento search for real product recommendations
-        if "Sectional" in patterns_result:
-            return await search_magento_products(ctx, "sectional", 8)
-        elif "Recliner" in patterns_result:
-            return await search_magento_products(ctx, "recliner", 8)
-        else:
-            # Default to sectionals (most popular)
-            return await search_magento_products(ctx, "sectional", 8)
+        return await search_magento_products(ctx, recommendation_query(profile.patterns), 8)
         
     except Exception as error:
-        print(f"❌ Error in getProductRecommendations: {error}")
+        tool_log.error(f"❌ Error in getProductRecommendations: {error}")
         return f"❌ Error getting recommendations: {str(error)}"
 
-@agent.tool
+@register_tool
 async def get_customer_analytics(ctx: RunContext, identifier: str, type: str = "phone") -> str:
     """📊 MANDATORY ANALYTICS: When user asks 'show customer analytics', 'analytics for customer', or mentions customer analytics/insights, YOU MUST call this function. Do not give generic responses - GET THE ACTUAL DATA."""
     try:
-        print(f"🔧 ANALYTICS Function: getCustomerAnalytics({identifier}, {type})")
-        
-        # Get customer journey first
-        journey_result = await get_customer_journey(ctx, identifier, type)
-        
-        if "❌" in journey_result:
-            return journey_result
+        tool_log.info(f"🔧 ANALYTICS Function: getCustomerAnalytics({identifier}, {type})")
         
-        # Extract customer ID from journey result for analytics
-        customer_id_match = re.search(r'Customer ID: (\d+)', journey_result)
-        if customer_id_match:
-            patterns_result = await analyze_customer_patterns(ctx, customer_id_match.group(1))
-        else:
-            patterns_result = "❌ No customer ID found for patterns analysis"
+        # One profile feeds both the journey and the pattern analysis
+        profile = await profile_cache.get(identifier, type)
+        if not profile:
+            return render_customer_not_found(identifier)
         
         analytics = []
         analytics.append("📈 COMPREHENSIVE CUSTOMER ANALYTICS:")
         analytics.append("")
         analytics.append("🎯 CUSTOMER JOURNEY:")
-        analytics.append(journey_result)
+        analytics.append(render_customer_journey(profile, identifier))
         analytics.append("")
         
-        if "❌" not in patterns_result:
+        if profile.orders:
             analytics.append("📊 PURCHASE PATTERNS:")
-            analytics.append(patterns_result)
+            analytics.append(render_patterns(profile.patterns))
         
         return "\n".join(analytics)
         
     except Exception as error:
-        print(f"❌ Error in getCustomerAnalytics: {error}")
+        tool_log.error(f"❌ Error in getCustomerAnalytics: {error}")
         return f"❌ Error getting analytics: {str(error)}"
 
 # FUNCTION REMOVED: handle_order_confirmation_cross_sell - never used, adds to tool count bloat
 
-@agent.tool
+@register_tool
 async def handle_support_escalation(ctx: RunContext, identifier: str, issue_description: str, type: str = "auto") -> str:
     """🚨 MANDATORY SUPPORT ESCALATION: When user mentions 'damaged', 'broken', 'return', 'problem', 'issue', 'help with', 'defective', or ANY support issues, YOU MUST immediately call this function to create a support ticket. Do not ask for more details first - ESCALATE IMMEDIATELY."""
     try:
-        print(f"🔧 PROACTIVE Function: handleSupportEscalation({identifier}, {issue_description}, {type})")
+        tool_log.info(f"🔧 PROACTIVE Function: handleSupportEscalation({identifier}, {issue_description}, {type})")
         
         # SMART PARAMETER DETECTION
-        customer_result = None
+        customer = None
         customer_name = "Customer"
         
-        # If it's already a customer ID (numeric), get customer info via orders
+        # If it's already a customer ID (numeric), no lookup needed
         if identifier.isdigit() and len(identifier) >= 7:
-            print(f"🆔 Detected customerid: {identifier}")
+            tool_log.info(f"🆔 Detected customerid: {identifier}")
             customer_name = f"Customer ID {identifier}"
-            customer_result = f"✅ Customer ID: {identifier} (from previous lookup)"
         
         # If it looks like a phone number
         elif any(char.isdigit() for char in identifier) and ('-' in identifier or len(identifier.replace('-', '').replace(' ', '')) >= 10):
-            print(f"📱 Detected phone: {identifier}")
-            customer_result = await get_customer_by_phone(ctx, identifier)
+            tool_log.info(f"📱 Detected phone: {identifier}")
+            customer = await fetch_customer_by_phone(identifier)
         
         # If it looks like an email
         elif '@' in identifier:
-            print(f"📧 Detected email: {identifier}")
-            customer_result = await get_customer_by_email(ctx, identifier)
+            tool_log.info(f"📧 Detected email: {identifier}")
+            customer = await fetch_customer_by_email(identifier)
         
         # If type is explicitly specified
         elif type == "phone":
-            customer_result = await get_customer_by_phone(ctx, identifier)
+            customer = await fetch_customer_by_phone(identifier)
         elif type == "email":
-            customer_result = await get_customer_by_email(ctx, identifier)
+            customer = await fetch_customer_by_email(identifier)
         elif type == "customerid":
             customer_name = f"Customer ID {identifier}"
-            customer_result = f"✅ Customer ID: {identifier} (from previous lookup)"
         else:
             return f"❌ Could not determine identifier type for: {identifier}. Please specify phone, email, or customerid."
         
-        # Extract customer name if available
-        if customer_result and "❌" not in customer_result:
-            import re
-            name_match = re.search(r'Name: ([^\\n]+)', customer_result)
-            if name_match:
-                customer_name = name_match.group(1)
+        if customer and customer.name:
+            customer_name = customer.name
+
+        # The customer was touched - next profile read must reload
+        profile_cache.invalidate(identifier, type)
+        if customer:
+            profile_cache.invalidate(customer.customer_id, "customer_id")
         
         escalation = []
         escalation.append(f"🚨 SUPPORT ESCALATION for {customer_name}:")
@@ -1711,10 +1647,10 @@ async def handle_support_escalation(ctx: RunContext, identifier: str, issue_desc
         escalation.append("📞 Direct contact: 1-800-WOODSTOCK")
         escalation.append("📧 Email updates: support@woodstockoutlet.com")
         
-        return "\\n".join(escalation)
+        return "\n".join(escalation)
         
     except Exception as error:
-        print(f"❌ Error in handleSupportEscalation: {error}")
+        tool_log.error(f"❌ Error in handleSupportEscalation: {error}")
         return f"❌ Error escalating support: {str(error)}"
 
 # FUNCTION REMOVED: handle_loyalty_upgrade - never used, adds to tool count bloat (31 → 30 tools)
@@ -1725,7 +1661,7 @@ async def handle_support_escalation(ctx: RunContext, identifier: str, issue_desc
 # CHAINED COMMAND TOOLS - MULTI-STEP WORKFLOWS
 # ============================================================================
 
-@agent.tool
+@register_tool
 async def get_complete_customer_journey(ctx: RunContext, phone_or_email: str) -> str:
     """Get complete customer profile, orders, patterns, and recommendations in one operation.
     
@@ -1762,46 +1698,37 @@ async def get_complete_customer_journey(ctx: RunContext, phone_or_email: str) ->
         Handles all lookups and error recovery internally.
     """
     try:
-        print(f"🔗 Starting chained customer journey for: {phone_or_email}")
+        tool_log.info(f"🔗 Starting chained customer journey for: {phone_or_email}")
         
         # Create chain to track progress
-        chain = create_chain(phone_or_email)
+        chain = await create_chain(phone_or_email)
         chain.current_step = "customer_lookup"
         
-        # STEP 1: Get customer
-        if '@' in phone_or_email:
-            customer_result = await get_customer_by_email(ctx, phone_or_email)
-        else:
-            customer_result = await get_customer_by_phone(ctx, phone_or_email)
+        # STEP 1: Get customer 360 profile (customer, orders, details, aggregates)
+        profile = await profile_cache.get(phone_or_email)
+        if not profile:
+            return render_customer_not_found(phone_or_email)  # Early exit if customer not found
         
+        customer = profile.customer
+        customer_result = render_customer(customer, phone_or_email)
         chain.add_result("customer_lookup", customer_result)
-        
-        if "❌" in customer_result:
-            return customer_result  # Early exit if customer not found
-        
-        # Extract customer_id
-        import re
-        customer_id_match = re.search(r'Customer ID: (\d+)', customer_result)
-        if not customer_id_match:
-            return "❌ Could not extract customer ID from result"
-        
-        customer_id = customer_id_match.group(1)
-        chain.add_result("customer_id", customer_id)
+        chain.add_result("customer_id", customer.customer_id)
         
         # STEP 2: Get order history
         chain.current_step = "order_history"
-        orders_result = await get_orders_by_customer(ctx, customer_id)
+        orders_result = render_orders(customer.customer_id, profile.orders)
         chain.add_result("order_history", orders_result)
         
-        # STEP 3: Analyze patterns
+        # STEP 3: Analyze patterns from the profile aggregates
         chain.current_step = "pattern_analysis"
-        patterns_result = await analyze_customer_patterns(ctx, customer_id)
+        patterns_result = render_patterns(profile.patterns) if profile.orders else render_no_patterns(customer.customer_id)
         chain.add_result("pattern_analysis", patterns_result)
         
         # STEP 4: Get personalized recommendations
         chain.current_step = "recommendations"
-        recs_result = await get_product_recommendations(ctx, customer_id)
+        recs_result = await search_magento_products(ctx, recommendation_query(profile.patterns), 8)
         chain.add_result("recommendations", recs_result)
+        await save_chain(chain)
         
         # Compile complete journey
         journey_summary = f"""🎯 **COMPLETE CUSTOMER JOURNEY**
@@ -1825,11 +1752,11 @@ async def get_complete_customer_journey(ctx: RunContext, phone_or_email: str) ->
 ✅ **Chain ID:** {chain.chain_id} (completed in {len(chain.steps_completed)} steps)
 📊 **Data completeness:** 100% - Full customer profile available"""
 
-        print(f"✅ Chain {chain.chain_id} completed successfully")
+        tool_log.info(f"✅ Chain {chain.chain_id} completed successfully")
         return journey_summary
         
     except Exception as error:
-        print(f"❌ Error in chained customer journey: {error}")
+        tool_log.error(f"❌ Error in chained customer journey: {error}")
         return f"""❌ Chain execution failed at step: {chain.current_step if 'chain' in locals() else 'initialization'}
 
 **Error:** {str(error)}
@@ -1842,11 +1769,11 @@ async def get_complete_customer_journey(ctx: RunContext, phone_or_email: str) ->
 # MCP Calendar tools are automatically available through the agent's toolsets
 # No need for custom book_appointment function - the agent will use MCP tools directly
 
-@agent.tool
+@register_tool
 async def connect_to_support(ctx: RunContext, name: str, email: str, location: str) -> str:
     """Connect customer to human support team"""
     try:
-        print(f"🔧 SUPPORT Function: connectToSupport({name}, {email}, {location})")
+        tool_log.info(f"🔧 SUPPORT Function: connectToSupport({name}, {email}, {location})")
         
         support_info = []
         support_info.append(f"🚨 SUPPORT CONNECTION for {name}")
@@ -1881,14 +1808,14 @@ async def connect_to_support(ctx: RunContext, name: str, email: str, location: s
         return "\n".join(support_info)
         
     except Exception as error:
-        print(f"❌ Error in connectToSupport: {error}")
+        tool_log.error(f"❌ Error in connectToSupport: {error}")
         return f"❌ Error connecting to support: {str(error)}"
 
-@agent.tool
+@register_tool
 async def show_directions(ctx: RunContext, store_name: str) -> str:
     """Show Google Maps directions to the specified store"""
     try:
-        print(f"🔧 DIRECTIONS Function: showDirections({store_name})")
+        tool_log.info(f"🔧 DIRECTIONS Function: showDirections({store_name})")
         
         # Store mapping to Google Maps URLs
         store_maps = {
@@ -1914,28 +1841,24 @@ async def show_directions(ctx: RunContext, store_name: str) -> str:
             return f"❌ Store not found: {store_name}. Please specify one of our locations: Acworth, Dallas/Hiram, Rome, Covington, Canton, or Douglasville."
         
     except Exception as error:
-        print(f"❌ Error in showDirections: {error}")
+        tool_log.error(f"❌ Error in showDirections: {error}")
         return f"❌ Error getting directions: {str(error)}"
 
 # 🧠 PHASE 2: COMPLETE MAGENTO PRODUCT DISCOVERY FUNCTIONS
 # Based on Postman collection and MAGENTO_API_RESPONSES.json analysis
 print("🔧 Adding enhanced Magento product discovery functions...")
 
-@agent.tool
+@register_tool
 async def get_all_furniture_brands(ctx: RunContext) -> str:
     """🏭 GET ALL BRANDS: Show available furniture brands for filtering. Use when customer asks 'what brands do you have' or wants to filter by brand."""
     try:
-        print("🔧 Getting all Magento furniture brands")
+        tool_log.info("🔧 Getting all Magento furniture brands")
         
         token = await get_magento_token()
         if not token:
             return "❌ Unable to access brand information at this time"
         
-        response = await httpx.AsyncClient().get(
-            'https://woodstockoutlet.com/rest/V1/products/attributes/brand/options',
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=15.0
-        )
+        response = await magento_get('https://woodstockoutlet.com/rest/V1/products/attributes/brand/options', token, timeout=15.0)
         
         if response.status_code != 200:
             return "❌ Brand information not available right now"
@@ -1968,24 +1891,20 @@ async def get_all_furniture_brands(ctx: RunContext) -> str:
 Tell me which brand catches your eye or what style you prefer!"""
         
     except Exception as error:
-        print(f"❌ Error getting brands: {error}")
+        tool_log.error(f"❌ Error getting brands: {error}")
         return "❌ Error accessing brand information"
 
-@agent.tool  
+@register_tool
 async def get_all_furniture_colors(ctx: RunContext) -> str:
     """🎨 GET ALL COLORS: Show available colors for filtering. Use when customer asks about colors or wants to filter by color."""
     try:
-        print("🔧 Getting all Magento furniture colors")
+        tool_log.info("🔧 Getting all Magento furniture colors")
         
         token = await get_magento_token()
         if not token:
             return "❌ Unable to access color information at this time"
         
-        response = await httpx.AsyncClient().get(
-            'https://woodstockoutlet.com/rest/V1/products/attributes/color',
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=15.0
-        )
+        response = await magento_get('https://woodstockoutlet.com/rest/V1/products/attributes/color', token, timeout=15.0)
         
         if response.status_code != 200:
             return "❌ Color information not available right now"
@@ -2019,10 +1938,10 @@ async def get_all_furniture_colors(ctx: RunContext) -> str:
 What color are you thinking about?"""
         
     except Exception as error:
-        print(f"❌ Error getting colors: {error}")
+        tool_log.error(f"❌ Error getting colors: {error}")
         return "❌ Error accessing color information"
 
-@agent.tool
+@register_tool
 async def search_products_by_price_range(ctx: RunContext, category: str, min_price: float = 0, max_price: float = 10000) -> str:
     """Search furniture products within a specific price range.
     
@@ -2036,8 +1955,8 @@ async def search_products_by_price_range(ctx: RunContext, category: str, min_pri
         max_price: Maximum price in dollars (default 10000)
     
     Returns:
-        Product list with CAROUSEL_DATA JSON for frontend rendering, including
-        product names, prices, SKUs, and images
+        Matching products, one line each (name, SKU, price); the customer sees them
+        as product cards with images
         
     Examples:
         - "sectionals under 2000" → category='sectional', max_price=2000
@@ -2046,7 +1965,7 @@ async def search_products_by_price_range(ctx: RunContext, category: str, min_pri
         - "mattresses under $1500" → category='mattress', max_price=1500
     """
     try:
-        print(f"🔧 Searching products by price: {category}, ${min_price}-${max_price}")
+        tool_log.info(f"🔧 Searching products by price: {category}, ${min_price}-${max_price}")
         
         token = await get_magento_token()
         if not token:
@@ -2074,11 +1993,7 @@ async def search_products_by_price_range(ctx: RunContext, category: str, min_pri
         
         url = 'https://woodstockoutlet.com/rest/V1/products?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        response = await httpx.AsyncClient().get(
-            url,
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=15.0
-        )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Price search failed: {response.status_code}"
@@ -2156,14 +2071,14 @@ Which items interest you?"""
 What would work better for you?"""
             
     except Exception as error:
-        print(f"❌ Error in price search: {error}")
+        tool_log.error(f"❌ Error in price search: {error}")
         return "❌ Error searching by price range"
 
-@agent.tool
+@register_tool
 async def search_products_by_brand_and_category(ctx: RunContext, brand: str, category: str = "all") -> str:
     """🏭 BRAND-SPECIFIC SEARCH: Find products from specific brands like Ashley, HomeStretch, Simmons. Use when customer asks 'show me Ashley sectionals' or wants brand-specific options."""
     try:
-        print(f"🔧 Searching by brand: {brand}, category: {category}")
+        tool_log.info(f"🔧 Searching by brand: {brand}, category: {category}")
         
         token = await get_magento_token()
         if not token:
@@ -2188,11 +2103,7 @@ async def search_products_by_brand_and_category(ctx: RunContext, brand: str, cat
         
         url = 'https://woodstockoutlet.com/rest/V1/products?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        response = await httpx.AsyncClient().get(
-            url,
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=15.0
-        )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Brand search failed: {response.status_code}"
@@ -2236,10 +2147,10 @@ Which {brand} items interest you most?"""
 What would you prefer to try?"""
             
     except Exception as error:
-        print(f"❌ Error in brand search: {error}")
+        tool_log.error(f"❌ Error in brand search: {error}")
         return "❌ Error searching by brand"
 
-@agent.tool
+@register_tool
 async def get_product_photos(ctx: RunContext, sku: str) -> str:
     """Retrieve product images and photo gallery for a specific product.
     
@@ -2265,17 +2176,13 @@ async def get_product_photos(ctx: RunContext, sku: str) -> str:
         you must first get the SKU from ProductContextManager using the previous search results.
     """
     try:
-        print(f"🔧 Getting product media for SKU: {sku}")
+        tool_log.info(f"🔧 Getting product media for SKU: {sku}")
         
         token = await get_magento_token()
         if not token:
             return "❌ Unable to access product images at this time"
         
-        response = await httpx.AsyncClient().get(
-            f'https://woodstockoutlet.com/rest/V1/products/{sku}/media',
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=15.0
-        )
+        response = await magento_get(f'https://woodstockoutlet.com/rest/V1/products/{sku}/media', token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Product photos not found for SKU: {sku}"
@@ -2327,10 +2234,10 @@ Ready to learn more about this item?"""
             return f"❌ No media found for product SKU: {sku}"
             
     except Exception as error:
-        print(f"❌ Error retrieving media: {error}")
+        tool_log.error(f"❌ Error retrieving media: {error}")
         return f"❌ Error getting product photos: {str(error)}"
 
-@agent.tool
+@register_tool
 async def get_featured_best_seller_products(ctx: RunContext, category: str = "all") -> str:
     """Show featured and best-selling furniture products.
     
@@ -2342,8 +2249,8 @@ async def get_featured_best_seller_products(ctx: RunContext, category: str = "al
         category: Product type to filter like 'sectional', 'recliner', 'mattress', or 'all' for everything
     
     Returns:
-        Product carousel with 8-12 featured items including CAROUSEL_DATA JSON,
-        product names, prices, SKUs, and images
+        8-12 featured items, one line each (name, SKU, price); the customer sees them
+        as product cards with images
         
     Examples:
         - "show featured products" → Use this function
@@ -2352,7 +2259,7 @@ async def get_featured_best_seller_products(ctx: RunContext, category: str = "al
         - "most recommended mattresses" → category='mattress'
     """
     try:
-        print(f"🔧 Getting featured/best seller products: {category}")
+        tool_log.info(f"🔧 Getting featured/best seller products: {category}")
         
         token = await get_magento_token()
         if not token:
@@ -2376,11 +2283,7 @@ async def get_featured_best_seller_products(ctx: RunContext, category: str = "al
         
         url = 'https://woodstockoutlet.com/rest/V1/products?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        response = await httpx.AsyncClient().get(
-            url,
-            headers={'Authorization': f'Bearer {token}'},
-            timeout=25.0
-        )
+        response = await magento_get(url, token, timeout=25.0)
         
         if response.status_code != 200:
             return f"❌ Featured products search failed: {response.status_code}"
@@ -2458,7 +2361,7 @@ Which ones catch your eye?"""
 What type of {category} are you most interested in?"""
             
     except Exception as error:
-        print(f"❌ Error getting featured products: {error}")
+        tool_log.error(f"❌ Error getting featured products: {error}")
         return "❌ Error accessing featured products"
 
 print(f"✅ Agent initialized with 25+ ENHANCED functions (19 LOFT + 6 NEW Magento Discovery + MCP Calendar tools)")
@@ -2467,6 +2370,24 @@ print(f"✅ Agent initialized with 25+ ENHANCED functions (19 LOFT + 6 NEW Magen
 # MAGENTO INTEGRATION (From original system)
 # =====================================================
 
+# Shared Magento client - one connection pool instead of a new client per call
+magento_client: Optional[httpx.AsyncClient] = None
+
+def get_magento_client() -> httpx.AsyncClient:
+    global magento_client
+    if magento_client is None or magento_client.is_closed:
+        magento_client = httpx.AsyncClient()
+    return magento_client
+
+async def magento_get(url: str, token: str, timeout: float = 15.0, upstream_name: str = "magento_catalog") -> httpx.Response:
+    """Authenticated Magento GET, rate limited per upstream (raises UpstreamOverloaded when shed)"""
+    async with upstream(upstream_name).slot():
+        return await get_magento_client().get(
+            url,
+            headers={'Authorization': f'Bearer {token}'},
+            timeout=upstream_timeout(timeout)
+        )
+
 async def get_magento_token(force_refresh=False):
     """Get Magento admin token with auto-refresh"""
     try:
@@ -2478,25 +2399,26 @@ async def get_magento_token(force_refresh=False):
         if not username or not password:
             raise ValueError("❌ MAGENTO_USERNAME and MAGENTO_PASSWORD must be set in environment variables")
         
-        response = await httpx.AsyncClient().post(
-            'https://woodstockoutlet.com/rest/all/V1/integration/admin/token',
-            headers={'Content-Type': 'application/json'},
-            json={'username': username, 'password': password},
-            timeout=10.0
-        )
+        async with upstream("magento_catalog").slot():
+            response = await get_magento_client().post(
+                'https://woodstockoutlet.com/rest/all/V1/integration/admin/token',
+                headers={'Content-Type': 'application/json'},
+                json={'username': username, 'password': password},
+                timeout=upstream_timeout(10.0)
+            )
         
         if response.status_code != 200:
             raise Exception(f"Magento auth failed: {response.status_code}")
         
         token = response.json().replace('"', '')
-        print(f"🔑 Magento token obtained: {token[:20]}...")
+        tool_log.debug(f"🔑 Magento token obtained: {token[:20]}...")
         return token
         
     except Exception as e:
-        print(f"❌ Magento token error: {e}")
+        tool_log.error(f"❌ Magento token error: {e}")
         return None
 
-@agent.tool
+@register_tool
 async def search_magento_products(ctx: RunContext, query: str, page_size: int = 8) -> str:
     """Search furniture catalog for products matching a search term.
     
@@ -2509,8 +2431,8 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
         page_size: Number of results to return (default 8, max 20)
     
     Returns:
-        Product carousel with images, prices, SKUs, and CAROUSEL_DATA JSON for frontend.
-        Includes product details and suggested filtering options.
+        Matching products, one line each (name, SKU, price); the customer sees them
+        as product cards with images. No need to list or repeat them in the reply.
         
     Examples:
         - "show me sectionals" → query='sectional'
@@ -2524,7 +2446,7 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
         "show me the second one" or "get photos of the first product".
     """
     try:
-        print(f"🔧 Searching Magento products: {query}")
+        tool_log.info(f"🔧 Searching Magento products: {query}")
         
         token = await get_magento_token()
         if not token:
@@ -2544,12 +2466,7 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
         
         url = 'https://woodstockoutlet.com/rest/V1/products?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=15.0
-            )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Product search failed: {response.status_code}"
@@ -2624,7 +2541,7 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
                 'custom_attributes': product.get('custom_attributes', [])
             })
         
-        print(f"✅ Found {len(formatted_products)} {query} products")
+        tool_log.info(f"✅ Found {len(formatted_products)} {query} products")
         
         # 🔥 CONTEXT MANAGER INTEGRATION - Store search results for BUG-022 fix
         # Get user_identifier from context if available (conversation-based tracking)
@@ -2633,8 +2550,8 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
             user_id = ctx.deps.user_identifier
         
         # Store products in context manager for follow-up queries
-        product_context.store_search(user_id, query, formatted_products)
-        print(f"📦 Stored {len(formatted_products)} products in context for user {user_id}")
+        await product_context.store_search(user_id, query, formatted_products)
+        tool_log.info(f"📦 Stored {len(formatted_products)} products in context for user {user_id}")
         
         # Return INSTANT carousel data (no streaming delay)
         # 🧠 ENHANCED CONVERSATIONAL PRODUCT DISCOVERY (PSYCHOLOGICAL UX FRAMEWORK)
@@ -2670,7 +2587,7 @@ async def search_magento_products(ctx: RunContext, query: str, page_size: int =
 Just tell me what matters most - style, price, comfort, or room fit?"""
         
     except Exception as error:
-        print(f"❌ Error in search_magento_products: {error}")
+        tool_log.error(f"❌ Error in search_magento_products: {error}")
         # 🧠 ENHANCED ERROR RECOVERY (NO DEAD ENDS - PSYCHOLOGICAL UX)
         return f"""I'm having trouble accessing our product catalog right now. While I work on that, let me help you in other ways:
 
@@ -2684,22 +2601,22 @@ Or just describe what you're looking for and I'll help however I can!
 
 **Error details:** {str(error)}"""
 
-@agent.tool
+@register_tool
 async def show_sectional_products(ctx: RunContext) -> str:
     """Show available sectional products with carousel"""
     return await search_magento_products(ctx, "sectional", 12)
 
-@agent.tool
+@register_tool
 async def show_recliner_products(ctx: RunContext) -> str:
     """Show available recliner products with carousel"""
     return await search_magento_products(ctx, "recliner", 12)
 
-@agent.tool
+@register_tool
 async def show_dining_products(ctx: RunContext) -> str:
     """Show available dining room products with carousel"""
     return await search_magento_products(ctx, "dining", 12)
 
-@agent.tool
+@register_tool
 async def get_product_by_position(ctx: RunContext, position: int, user_context_identifier: str = "default_user") -> str:
     """
     🎯 GET PRODUCT FROM PREVIOUS SEARCH: When user references a product by position
@@ -2707,7 +2624,7 @@ async def get_product_by_position(ctx: RunContext, position: int, user_context_i
     FIXES BUG-022 - photo context loss.
     """
     try:
-        print(f"🔧 Getting product at position {position} for user {user_context_identifier}")
+        tool_log.info(f"🔧 Getting product at position {position} for user {user_context_identifier}")
         
         # Get user identifier from context if available
         user_id = user_context_identifier
@@ -2715,7 +2632,7 @@ async def get_product_by_position(ctx: RunContext, position: int, user_context_i
             user_id = ctx.deps.user_identifier
         
         # Retrieve product from context
-        product_summary = product_context.get_product_by_position(user_id, position)
+        product_summary = await product_context.get_product_by_position(user_id, position)
         
         if not product_summary:
             return f"""❌ I couldn't find product #{position} from your recent search. 
@@ -2728,13 +2645,13 @@ async def get_product_by_position(ctx: RunContext, position: int, user_context_i
 What would you like to do?"""
         
         # Mark as selected
-        product_context.mark_product_selected(user_id, product_summary.sku)
+        await product_context.mark_product_selected(user_id, product_summary.sku)
         
         # Get full product details by SKU
         return await get_magento_product_by_sku(ctx, product_summary.sku)
         
     except Exception as error:
-        print(f"❌ Error getting product by position: {error}")
+        tool_log.error(f"❌ Error getting product by position: {error}")
         return f"""I had trouble retrieving that product. Let me help you find it:
 
 • 🔍 **Tell me the product name** or SKU
@@ -2745,11 +2662,11 @@ What works best for you?"""
 
 # SCRUM SPRINT 2: HIGH-PRIORITY MAGENTO ENDPOINTS (5 FUNCTIONS)
 
-@agent.tool
+@register_tool
 async def get_magento_product_by_sku(ctx: RunContext, sku: str) -> str:
     """Get detailed product information by SKU - most requested by customers"""
     try:
-        print(f"🔧 Getting Magento product by SKU: {sku}")
+        tool_log.info(f"🔧 Getting Magento product by SKU: {sku}")
         
         token = await get_magento_token()
         if not token:
@@ -2757,12 +2674,7 @@ async def get_magento_product_by_sku(ctx: RunContext, sku: str) -> str:
         
         url = f'https://woodstockoutlet.com/rest/V1/products/{sku}'
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=15.0
-            )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Product not found: SKU {sku}"
@@ -2792,14 +2704,14 @@ async def get_magento_product_by_sku(ctx: RunContext, sku: str) -> str:
 **Product Details Available** - Full specifications, images, and dimensions in our catalog."""
         
     except Exception as error:
-        print(f"❌ Error in get_magento_product_by_sku: {error}")
+        tool_log.error(f"❌ Error in get_magento_product_by_sku: {error}")
         return f"❌ Error retrieving product: {str(error)}"
 
-@agent.tool
+@register_tool
 async def get_magento_categories(ctx: RunContext) -> str:
     """Get all product categories hierarchy - enable category browsing"""
     try:
-        print(f"🔧 Getting Magento categories")
+        tool_log.info("🔧 Getting Magento categories")
         
         token = await get_magento_token()
         if not token:
@@ -2807,12 +2719,7 @@ async def get_magento_categories(ctx: RunContext) -> str:
         
         url = 'https://woodstockoutlet.com/rest/V1/categories'
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=15.0
-            )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Categories not available: {response.status_code}"
@@ -2836,14 +2743,14 @@ async def get_magento_categories(ctx: RunContext) -> str:
 Use category names or IDs to browse specific furniture types!"""
         
     except Exception as error:
-        print(f"❌ Error in get_magento_categories: {error}")
+        tool_log.error(f"❌ Error in get_magento_categories: {error}")
         return f"❌ Error retrieving categories: {str(error)}"
 
-@agent.tool
+@register_tool
 async def get_magento_customer_by_email(ctx: RunContext, email: str) -> str:
     """Find customer in Magento by email address - customer lookup integration"""
     try:
-        print(f"🔧 Getting Magento customer by email: {email}")
+        tool_log.info(f"🔧 Getting Magento customer by email: {email}")
         
         token = await get_magento_token()
         if not token:
@@ -2858,12 +2765,7 @@ async def get_magento_customer_by_email(ctx: RunContext, email: str) -> str:
         
         url = 'https://woodstockoutlet.com/rest/V1/customers/search?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=15.0
-            )
+        response = await magento_get(url, token, timeout=15.0, upstream_name="magento_customers")
         
         if response.status_code != 200:
             return f"❌ Customer search failed: {response.status_code}"
@@ -2889,16 +2791,16 @@ async def get_magento_customer_by_email(ctx: RunContext, email: str) -> str:
 **Magento customer data available** - Can access Magento orders and account details."""
         
     except Exception as error:
-        print(f"❌ Error in get_magento_customer_by_email: {error}")
+        tool_log.error(f"❌ Error in get_magento_customer_by_email: {error}")
         return f"❌ Error finding customer: {str(error)}"
 
 # DUPLICATE FUNCTION REMOVED - CAUSED PYDANTIC AI TOOL NAME CONFLICT
 
-@agent.tool
+@register_tool
 async def get_magento_products_by_category(ctx: RunContext, category_id: int, page_size: int = 20) -> str:
     """Get products filtered by category ID - category-based shopping"""
     try:
-        print(f"🔧 Getting Magento products by category: {category_id}")
+        tool_log.info(f"🔧 Getting Magento products by category: {category_id}")
         
         token = await get_magento_token()
         if not token:
@@ -2918,12 +2820,7 @@ async def get_magento_products_by_category(ctx: RunContext, category_id: int, pa
         
         url = 'https://woodstockoutlet.com/rest/V1/products?' + '&'.join([f'{k}={v}' for k, v in search_params.items()])
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=15.0
-            )
+        response = await magento_get(url, token, timeout=15.0)
         
         if response.status_code != 200:
             return f"❌ Category search failed: {response.status_code}"
@@ -2968,14 +2865,14 @@ async def get_magento_products_by_category(ctx: RunContext, category_id: int, pa
 **CAROUSEL_DATA:** {json.dumps(carousel_data)}"""
         
     except Exception as error:
-        print(f"❌ Error in get_magento_products_by_category: {error}")
+        tool_log.error(f"❌ Error in get_magento_products_by_category: {error}")
         return f"❌ Error searching category: {str(error)}"
 
-@agent.tool
+@register_tool
 async def recall_user_memory(ctx: RunContext, user_identifier: str, query: str) -> str:
     """🧠 MANDATORY MEMORY RECALL: When user asks 'do you remember', 'what did I tell you', 'my preferences', 'recall', or mentions previous conversations, YOU MUST call this function immediately. Do not say you don't remember - SEARCH THE MEMORY DATABASE FIRST."""
     try:
-        print(f"🧠 Function Call: recall_user_memory({user_identifier}, {query})")
+        tool_log.info(f"🧠 Function Call: recall_user_memory({user_identifier}, {query})")
         
         # Get enhanced context using the orchestrator
         if ENHANCED_MEMORY_AVAILABLE and orchestrator:
@@ -3014,14 +2911,24 @@ What would you like me to know about your furniture needs?"""
             return "🧠 Enhanced memory system not available. I can help with current conversation context."
             
     except Exception as error:
-        print(f"❌ Error in recall_user_memory: {error}")
+        tool_log.error(f"❌ Error in recall_user_memory: {error}")
         return f"❌ Error accessing memory: {str(error)}"
 
-@agent.tool
+async def vapi_create_call(vapi_private_key: str, call_data: Dict[str, Any]) -> httpx.Response:
+    """POST /call to VAPI without blocking the event loop, inside the vapi bulkhead"""
+    headers = {
+        "Authorization": f"Bearer {vapi_private_key}",
+        "Content-Type": "application/json"
+    }
+    async with upstream("vapi").slot():
+        async with httpx.AsyncClient(timeout=upstream_timeout(15.0)) as client:
+            return await client.post("https://api.vapi.ai/call", json=call_data, headers=headers)
+
+@register_tool
 async def start_demo_call(ctx: RunContext, phone_number: str) -> str:
     """📞 MANDATORY PHONE CALLS: When user says 'call me', 'can you call me', 'start a demo call', or provides a phone number to call, ALWAYS use this function. Do not give excuses - make the call! Phone number should be in format +1XXXXXXXXXX."""
-    print(f"🔥🔥🔥 START_DEMO_CALL FUNCTION CALLED! 🔥🔥🔥")
-    print(f"📞 DEMO: Starting call to {phone_number}")
+    tool_log.debug("🔥🔥🔥 START_DEMO_CALL FUNCTION CALLED! 🔥🔥🔥")
+    tool_log.info(f"📞 DEMO: Starting call to {phone_number}")
     
     try:
         # Get VAPI credentials with debugging
@@ -3029,9 +2936,9 @@ async def start_demo_call(ctx: RunContext, phone_number: str) -> str:
         vapi_assistant_id = os.getenv('VAPI_ASSISTANT_ID') 
         vapi_phone_number_id = os.getenv('VAPI_PHONE_NUMBER_ID')
         
-        print(f"🔑 VAPI Private Key: {'✅ Found' if vapi_private_key else '❌ MISSING'}")
-        print(f"🔑 VAPI Assistant ID: {'✅ Found' if vapi_assistant_id else '❌ MISSING'}")  
-        print(f"🔑 VAPI Phone Number ID: {'✅ Found' if vapi_phone_number_id else '❌ MISSING'}")
+        tool_log.debug(f"🔑 VAPI Private Key: {'✅ Found' if vapi_private_key else '❌ MISSING'}")
+        tool_log.debug(f"🔑 VAPI Assistant ID: {'✅ Found' if vapi_assistant_id else '❌ MISSING'}")
+        tool_log.debug(f"🔑 VAPI Phone Number ID: {'✅ Found' if vapi_phone_number_id else '❌ MISSING'}")
         
         if not all([vapi_private_key, vapi_assistant_id, vapi_phone_number_id]):
             return f"""❌ VAPI Configuration Missing:
@@ -3042,25 +2949,19 @@ async def start_demo_call(ctx: RunContext, phone_number: str) -> str:
 Add these to Railway environment variables in WoodstockNew service."""
         
         # Make VAPI call
-        import requests
-        headers = {
-            "Authorization": f"Bearer {vapi_private_key}",
-            "Content-Type": "application/json"
-        }
-        
         call_data = {
             "assistantId": vapi_assistant_id,
             "phoneNumberId": vapi_phone_number_id,
             "customer": {"number": phone_number}
         }
         
-        response = requests.post("https://api.vapi.ai/call", json=call_data, headers=headers)
+        response = await vapi_create_call(vapi_private_key, call_data)
         
         if response.status_code in [200, 201]:
             call_info = response.json()
             call_id = call_info.get('id')
             
-            print(f"✅ DEMO CALL INITIATED: {call_id}")
+            tool_log.info(f"✅ DEMO CALL INITIATED: {call_id}")
             
             return f"""📞 **Calling {phone_number}...**
 
@@ -3082,14 +2983,33 @@ Add these to Railway environment variables in WoodstockNew service."""
     # If an error happens (for example, a network issue or missing credentials), it prints the error to the server logs
     # and returns a user-friendly error message to the caller, including the error details.
     except Exception as e:
-        print(f"❌ Demo call error: {e}")
+        tool_log.error(f"❌ Demo call error: {e}")
         return f"❌ Demo call failed: {str(e)}"
 
 
+# 🧭 Per-intent agents: same prompt and model, only the tools the turn's intent needs
+tool_router = ToolRouter(agent, agent_kwargs, TOOL_FUNCTIONS)
+
+# Lookups chat_completions may start before the agent asks for them (see speculation.py)
+SPECULATIVE_TOOLS = {func.__name__: func for func in (
+    get_customer_by_phone, get_customer_by_email, get_magento_product_by_sku,
+)}
+
+# 💬 Cached answers are only valid for this prompt, model and toolset
+response_cache.set_version(prompt_content, os.getenv('OPENAI_MODEL', 'gpt-4.1'), ",".join(sorted(TOOL_FUNCTIONS)))
+
+
 # Startup and shutdown events
 async def startup_event():
     """Initialize services on startup"""
     await memory.init_db()
+    await identity_graph.init(memory.pool)
+    await state_store.init(memory.pool)
+    # Conversation ids and the history / identity versions are only shared through a shared state store
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and not state_store.backend.shared:
+        log.warning(f"⚠️ WEB_CONCURRENCY={workers} with {state_store.backend.name} state: workers won't see "
+                    f"each other's conversations and history; set STATE_STORE=postgres")
     
     # 🧠 Initialize Enhanced Memory System
     if ENHANCED_MEMORY_AVAILABLE and orchestrator:
@@ -3106,8 +3026,29 @@ async def startup_event():
             print(f"⚠️ Enhanced Memory System initialization failed: {e}")
             print("   Continuing with basic memory only...")
 
+    # Rolling summaries live in conversation_summaries (created by the enhanced memory system)
+    await prompt_assembler.summaries.init(memory.pool)
+    
+    # 💬 Semantic response cache tier reuses the enhanced memory MiniLM encoder
+    if ENHANCED_MEMORY_AVAILABLE:
+        import enhanced_memory_system
+        if enhanced_memory_system.enhanced_memory:
+            response_cache.attach_encoder(enhanced_memory_system.enhanced_memory.embed)
+    
+    # 📥 End-of-call transcripts are stored by a background worker, memory extracted once per call
+    call_ingestion.start(
+        resolve_phone_conversation,
+        orchestrator.process_conversation if ENHANCED_MEMORY_AVAILABLE and orchestrator else None,
+        # Given up after retries: a resend of the report must be ingested, not answered as a duplicate
+        lambda call_id: idempotency.forget(f"vapi-eoc:{call_id}"),
+    )
+
 async def shutdown_event():
     """Clean up on shutdown"""
+    await call_ingestion.stop()
+    await close_loft_client()
+    if magento_client is not None:
+        await magento_client.aclose()
     await memory.close()
 
 # Register lifespan events (modern FastAPI way)
@@ -3168,6 +3109,24 @@ async def health_check():
             "memory": "PostgreSQL (Existing Tables)",
             "mcp_calendar_status": mcp_status,
             "mcp_calendar_tools": mcp_tools,
+            "customer_profile_cache": profile_cache.snapshot(),
+            "upstreams": upstream_metrics(),
+            "identity_graph": identity_graph.snapshot(),
+            "history_cache": memory.history_cache.snapshot(),
+            "message_writes": memory.write_snapshot(),
+            "prompt_budget": {**prompt_assembler.last_stats, "summaries": prompt_assembler.summaries.stats},
+            "tool_routing": tool_router.snapshot(),
+            "context_steps": context_steps.snapshot(),
+            "response_cache": response_cache.snapshot(),
+            "admission": admission.snapshot(),
+            "logging": log_stats.snapshot(),
+            "speculation": speculation_stats.snapshot(),
+            "state_store": state_store.snapshot(),
+            "voice_streaming": voice_stats.snapshot(),
+            "call_ingestion": call_ingestion.snapshot(),
+            "idempotency": idempotency.snapshot(),
+            "tool_outputs": tool_output_stats.snapshot(),
+            "deadlines": deadline_stats.snapshot(),
         }
     except Exception as e:
         return {
@@ -3175,8 +3134,8 @@ async def health_check():
             "message": f"Health check failed: {str(e)}"
         }
 
-def extract_user_identifier(message: str) -> str:
-    """Extract phone or email from message"""
+def find_identifier_in_message(message: str) -> Optional[str]:
+    """Phone or email typed in the message, if any"""
     # Phone pattern
     phone_match = re.search(r'\b\d{3}-\d{3}-\d{4}\b', message)
     if phone_match:
@@ -3187,7 +3146,29 @@ def extract_user_identifier(message: str) -> str:
     if email_match:
         return email_match.group()
     
-    return f"webchat_user_{hash(message) % 10000}"
+    return None
+
+def extract_user_identifier(message: str) -> str:
+    """Extract phone or email from message"""
+    return find_identifier_in_message(message) or f"webchat_user_{hash(message) % 10000}"
+
+async def resolve_user_identifier(request: ChatRequest, session_id: str, caller_phone: Optional[str] = None) -> str:
+    """
+    Canonical user key for a chat request via the identity graph.
+    Only trusted identifiers are linked: the session, the authenticated URL params and
+    the caller's number on the phone channel. The client's sticky user_identifier and
+    phones/emails typed in the message are whatever was last typed into the UI (admins
+    type many customers' numbers, anyone can type someone else's), so they are used for
+    LOFT lookups only and never select or join an identity.
+    A session id we minted (client sent none) is only a last-resort key.
+    """
+    linked = {
+        "customer": request.customer_id or request.loft_id,
+        "email": request.email,
+        "session": request.session_id,
+        "phone": caller_phone,
+    }
+    return await identity_graph.resolve(linked, lookup_only=("session", session_id))
 
 def should_use_memory(message: str, user_identifier: str) -> bool:
     """
@@ -3213,7 +3194,7 @@ def should_use_memory(message: str, user_identifier: str) -> bool:
     ]
     
     if any(trigger in message_lower for trigger in new_session_triggers):
-        print(f"🆕 NEW SESSION triggered by explicit request: {message}")
+        log.info(f"🆕 NEW SESSION triggered by explicit request: {message}")
         return False
     
     # 🔥 BUG-032 FIX: SHORT RESPONSES = likely answering previous question
@@ -3228,7 +3209,7 @@ def should_use_memory(message: str, user_identifier: str) -> bool:
             bool(re.match(r'^\d{3}-\d{3}-\d{4}$', message.strip()))  # phone
         )
         if is_simple_answer:
-            print(f"🧠 MEMORY: Short answer detected (likely continuation): '{message}'")
+            log.info(f"🧠 MEMORY: Short answer detected (likely continuation): '{message}'")
             return True
     
     # USE MEMORY triggers  
@@ -3241,25 +3222,54 @@ def should_use_memory(message: str, user_identifier: str) -> bool:
     ]
     
     if any(trigger in message_lower for trigger in memory_triggers):
-        print(f"🧠 MEMORY triggered by context keyword: {message}")
+        log.info(f"🧠 MEMORY triggered by context keyword: {message}")
         return True
     
     # If user identifier found and it's a direct lookup, use memory  
     if user_identifier and (user_identifier in message):
-        print(f"👤 MEMORY for known user: {user_identifier}")
+        log.info(f"👤 MEMORY for known user: {user_identifier}")
         return True
     
     # 🔥 DEFAULT: ALWAYS USE MEMORY unless explicitly told not to
     # This prevents context loss during conversations
-    print(f"🧠 MEMORY: Using memory by default for conversation continuity")
+    log.info("🧠 MEMORY: Using memory by default for conversation continuity")
     return True
 
+async def build_phone_chat_request(user_message: str, call_id: str, phone_number: str, stream: bool):
+    """ChatRequest for one phone turn, plus the caller's cross-channel history (loaded once, reused by the pipeline)"""
+    if hasattr(memory, 'init_pool'):
+        await memory.init_pool()
+    caller_key = await identity_graph.resolve({"phone": phone_number})
+    channel_history = CrossChannelHistory(await memory.get_unified_conversation_history(
+        caller_key, limit=HISTORY_WINDOW, aliases=identity_graph.aliases(caller_key)
+    ))
+    
+    # The user message goes in as spoken; the cross-channel context becomes its own prompt block
+    chat_request = ChatRequest(
+        messages=[ChatMessage(role="user", content=user_message)],
+        user_identifier=phone_number,
+        stream=stream
+    )
+    
+    # CRITICAL: Set platform_type and channel_metadata after creation
+    chat_request.platform_type = "phone"
+    chat_request.channel_metadata = {
+        "call_id": call_id,
+        "phone_number": phone_number,
+        "provider": "voice_agent",
+        "has_previous_context": len(channel_history.rows) > 0
+    }
+    
+    voice_log.info(f"📞 PHONE REQUEST: platform_type={chat_request.platform_type}, user={phone_number}")
+    return chat_request, channel_history
+
 # Phone agent endpoint for voice calls
 @app.post("/v1/phone/chat")
 async def phone_chat(request: Dict):
     """Phone agent endpoint with unified memory and OTP verification"""
+    deadline = Deadline.for_channel("phone")
     try:
-        print(f"📞 Phone call received: {request}")
+        voice_log.debug("📞 Phone call received", payload=request)
         
         # Extract phone call data - VAPI sends complex objects
         message_data = request.get('message', {})
@@ -3277,55 +3287,21 @@ async def phone_chat(request: Dict):
             call_id = request.get('call_id', '')
             phone_number = request.get('phone_number', '')
         
-        print(f"📞 Extracted: message='{user_message}', call_id='{call_id}', phone='{phone_number}'")
+        voice_log.info(f"📞 Extracted: message='{user_message}', call_id='{call_id}', phone='{phone_number}'")
         
-        # Get previous conversation context for this user
-        if hasattr(memory, 'init_pool'):
-            await memory.init_pool()
-        previous_context = await memory.get_unified_conversation_history(phone_number, limit=10)
-        
-        # Build context summary for the phone agent
-        context_summary = ""
-        if previous_context:
-            context_summary = f"\\n\\nPREVIOUS CONVERSATION CONTEXT:\\n"
-            for msg in previous_context[-5:]:  # Last 5 messages
-                platform = msg.get('platform_type', 'unknown')
-                role = msg.get('role', 'unknown')
-                content = msg.get('content', '')[:100]
-                context_summary += f"[{platform}] {role}: {content}...\\n"
-        
-        # Create unified ChatRequest with context - FORCE PHONE PLATFORM
-        enhanced_message = user_message + context_summary
-        
-        # Create the request manually to ensure all fields are set
-        chat_request = ChatRequest(
-            messages=[ChatMessage(role="user", content=enhanced_message)],
-            user_identifier=phone_number,
-            stream=False
-        )
-        
-        # CRITICAL: Set platform_type and channel_metadata after creation
-        chat_request.platform_type = "phone"
-        chat_request.channel_metadata = {
-            "call_id": call_id,
-            "phone_number": phone_number,
-            "provider": "voice_agent",
-            "has_previous_context": len(previous_context) > 0
-        }
-        
-        print(f"📞 PHONE REQUEST: platform_type={chat_request.platform_type}, user={phone_number}")
+        chat_request, channel_history = await build_phone_chat_request(user_message, call_id, phone_number, stream=False)
         
         # Use the same chat logic
-        response = await chat_completions(chat_request)
+        response = await run_chat_turn(chat_request, channel_history, deadline, caller_phone=phone_number)
         
         # Return voice agent compatible response
         if hasattr(response, 'choices') and response.choices:
-            message_content = response.choices[0].get('delta', {}).get('content', '')
+            message_content = response.choices[0].get('message', {}).get('content', '')
             return {
                 "message": message_content,
                 "call_id": call_id,
-                "has_context": len(previous_context) > 0,
-                "context_messages": len(previous_context)
+                "has_context": len(channel_history.rows) > 0,
+                "context_messages": len(channel_history.rows)
             }
         else:
             return {
@@ -3334,14 +3310,101 @@ async def phone_chat(request: Dict):
                 "has_context": False
             }
             
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        # Shed by admission control: a quick spoken "busy" beats dead air
+        return {"message": BUSY_MESSAGE, "call_id": call_id, "busy": True}
     except Exception as e:
-        print(f"❌ Phone endpoint error: {e}")
+        voice_log.error(f"❌ Phone endpoint error: {e}")
         return {
-            "message": "I'm experiencing technical difficulties. Please try again.",
+            "message": ERROR_MESSAGE,
             "call_id": call_id,
             "error": str(e)
         }
 
+# Voice endpoint for Vapi's custom-LLM integration (server URL .../v1/phone)
+@app.post("/v1/phone/chat/completions")
+async def phone_chat_completions(request: Dict):
+    """
+    The phone turn streamed sentence by sentence as OpenAI chat.completion.chunk
+    events, so text-to-speech starts on the first sentence instead of after the
+    whole answer. If no sentence is ready by VOICE_FIRST_SENTENCE_DEADLINE_MS,
+    the first clause so far (or a short filler) is spoken.
+    """
+    started = time.monotonic()
+    messages = request.get('messages') or []
+    user_message = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    call_data = request.get('call') or {}
+    call_id = call_data.get('id', '')
+    phone_number = (call_data.get('customer') or {}).get('number', '')
+    completion_id = new_completion_id(call_id)
+    voice_log.info(f"🗣️ Voice turn (streaming): call_id='{call_id}', phone='{phone_number}'")
+    
+    async def run_turn(events: asyncio.Queue):
+        """Chat events of this turn into the queue, then None"""
+        try:
+            chat_request, channel_history = await build_phone_chat_request(user_message, call_id, phone_number, stream=True)
+            response = await run_chat_turn(chat_request, channel_history, Deadline.for_channel("phone", started),
+                                           caller_phone=phone_number)
+            if isinstance(response, StreamingResponse):
+                async for line in response.body_iterator:
+                    if not line.startswith("data: {"):
+                        continue
+                    event = json.loads(line[6:])
+                    if event["type"] == "text_delta":
+                        event = {"type": "text_delta", "text": event["choices"][0]["delta"]["content"]}
+                    await events.put(event)
+            else:
+                # Fast-path answers come back whole
+                await events.put({"type": "text_delta", "text": response.choices[0]["message"]["content"]})
+        except HTTPException as e:
+            # Shed by admission control: a quick spoken "busy" beats dead air
+            await events.put({"type": "text_delta", "text": BUSY_MESSAGE if e.status_code == 503 else ERROR_MESSAGE})
+        except Exception as e:
+            voice_log.error(f"❌ Voice streaming error: {e}")
+            await events.put({"type": "text_delta", "text": ERROR_MESSAGE})
+        finally:
+            await events.put(None)
+    
+    async def speak():
+        events: asyncio.Queue = asyncio.Queue()
+        turn_task = asyncio.create_task(run_turn(events))
+        speech = SpeechStream()
+        deadline = started + VOICE_FIRST_SENTENCE_DEADLINE_MS / 1000
+        first_spoken = False
+        looking_up = False
+        voice_stats.turns += 1
+        try:
+            while True:
+                try:
+                    timeout = None if first_spoken else max(0.0, deadline - time.monotonic())
+                    event = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    # First-sentence deadline: say the first clause so far, or a short filler
+                    sentences = speech.partial() or [FILLER_LOOKUP if looking_up else FILLER_THINKING]
+                    voice_stats.deadline_fills += 1
+                else:
+                    if event is None:
+                        break
+                    if event["type"] == "tool_start":
+                        looking_up = True
+                    sentences = speech.feed(event["text"]) if event["type"] == "text_delta" else []
+                for sentence in sentences:
+                    if not first_spoken:
+                        first_spoken = True
+                        voice_stats.first_sentence_ms.append((time.monotonic() - started) * 1000)
+                    yield completion_chunk(completion_id, sentence + " ")
+            for sentence in speech.finish():
+                yield completion_chunk(completion_id, sentence + " ")
+            yield completion_chunk(completion_id, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            # Caller hung up or barged in: stop the agent run
+            turn_task.cancel()
+    
+    return StreamingResponse(speak(), media_type="text/event-stream")
+
 # Unified memory testing endpoint
 @app.get("/v1/memory/unified/{user_identifier}")
 async def get_unified_memory(user_identifier: str):
@@ -3350,21 +3413,25 @@ async def get_unified_memory(user_identifier: str):
         if hasattr(memory, 'init_pool'):
             await memory.init_pool()
         
-        # Get conversation history across all platforms
-        unified_history = await memory.get_unified_conversation_history(user_identifier, limit=50)
+        # Get conversation history across all platforms and every linked identifier
+        user_key = await identity_graph.resolve({}, lookup_only=classify_user_identifier(user_identifier))
+        unified_history = await memory.get_unified_conversation_history(
+            user_key, limit=50, aliases=[user_identifier] + identity_graph.aliases(user_key)
+        )
         
         # Get enhanced memory if available
         enhanced_memories = []
         if ENHANCED_MEMORY_AVAILABLE and orchestrator:
             try:
-                enhanced_context = await orchestrator.get_enhanced_context("user history", user_identifier)
+                enhanced_context = await orchestrator.get_enhanced_context("user history", user_key)
                 if enhanced_context:
                     enhanced_memories.append(enhanced_context)
             except Exception as e:
-                print(f"⚠️ Enhanced memory error: {e}")
+                log.warning(f"⚠️ Enhanced memory error: {e}")
         
         return {
             "user_identifier": user_identifier,
+            "canonical_key": user_key,
             "total_messages": len(unified_history),
             "platforms_used": list(set([msg.get('platform_type', 'unknown') for msg in unified_history])),
             "conversation_history": unified_history,
@@ -3373,7 +3440,7 @@ async def get_unified_memory(user_identifier: str):
         }
         
     except Exception as e:
-        print(f"❌ Unified memory error: {e}")
+        log.error(f"❌ Unified memory error: {e}")
         return {"error": str(e), "user_identifier": user_identifier}
 
 # OTP verification endpoint for phone authentication
@@ -3402,7 +3469,7 @@ async def verify_otp(request: Dict):
             }
             
     except Exception as e:
-        print(f"❌ OTP verification error: {e}")
+        log.error(f"❌ OTP verification error: {e}")
         return {
             "verified": False,
             "message": "Verification system error. Please try again.",
@@ -3410,22 +3477,58 @@ async def verify_otp(request: Dict):
         }
 
 # Main chat completions endpoint with MEMORY
+# Shown when an upstream bulkhead sheds the turn instead of queueing it indefinitely
+BUSY_MESSAGE = "We're helping a lot of customers right now - please try again in a few seconds."
+ERROR_MESSAGE = "I'm experiencing technical difficulties. Please try again."
+
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatRequest):
-    """Chat completions with conversation memory using EXISTING PostgreSQL tables"""
+async def chat_completions(request: ChatRequest,
+                           idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")):
+    """
+    Chat completions with conversation memory using EXISTING PostgreSQL tables.
+    With an Idempotency-Key header, a double-submitted message runs one turn: repeats get the
+    stored answer, or follow the stream of the turn that is still running.
+    """
+    if not idempotency_key:
+        return await run_chat_turn(request)
+    
+    key = f"chat:{request.session_id or request.user_identifier or ''}:{idempotency_key}"
+    
+    async def execute():
+        response = await run_chat_turn(request)
+        if isinstance(response, StreamingResponse):
+            return response, RecordedStream(response.body_iterator, on_abandoned=lambda: idempotency.forget(key))
+        return response, None
+    
+    try:
+        (response, recorded), replayed = await idempotency.run(
+            key, execute, IDEMPOTENCY_CHAT_TTL_SECONDS, request_fingerprint=fingerprint(request.model_dump_json()))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if recorded is None:
+        return response
+    headers = {name: value for name, value in response.headers.items() if name.lower().startswith("x-")}
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return StreamingResponse(recorded.subscribe(), media_type="text/event-stream", headers=headers)
+
+async def run_chat_turn(request: ChatRequest, channel_history: Optional[CrossChannelHistory] = None,
+                        deadline: Optional[Deadline] = None, caller_phone: Optional[str] = None):
+    """
+    One chat turn. Channel endpoints that already loaded the caller's cross-channel
+    history (phone) pass it in: this conversation's part is the turn's history (no
+    second history query) and the other channels go into the prompt as a context block.
+    Endpoints that start their clock earlier pass their deadline; otherwise the turn
+    gets its channel's deadline from now. The phone endpoints pass the caller's number
+    (from the call, not the request body) as a trusted identifier.
+    """
+    started_at = time.monotonic()
     try:
-        print(f"📨 Chat request received: {len(request.messages)} messages")
+        log.info(f"📨 Chat request received: {len(request.messages)} messages")
         
         # Extract user message
         user_message = request.messages[-1].content if request.messages else ""
-        print(f"🤖 Processing prompt: {user_message[:50]}...")
-        
-        # Extract user identifier from message or use session info
-        user_identifier = None
-        if hasattr(request, 'user_identifier') and request.user_identifier:
-            user_identifier = request.user_identifier
-        else:
-            user_identifier = extract_user_identifier(user_message)
+        log.info(f"🤖 Processing prompt: {user_message[:50]}...")
         
         # 🔐 URL PARAMETER AUTHENTICATION - Extract from request
         customer_id = getattr(request, 'customer_id', None)
@@ -3433,85 +3536,133 @@ async def chat_completions(request: ChatRequest):
         email_param = getattr(request, 'email', None)
         auth_level = getattr(request, 'auth_level', 'anonymous')
         
+        # Check for admin mode
+        is_admin_mode = bool(request.admin_mode) or request.user_type == 'admin' or auth_level == 'admin'
+        
+        # Identifier as the client/message gave it (phone/email used for LOFT lookups)
+        raw_identifier = request.user_identifier or find_identifier_in_message(user_message)
+        
+        # Stable session key: honor the client's session_id, mint one (returned to the client) otherwise
+        session_id = request.session_id or f"session_{uuid.uuid4().hex}"
+        
+        # 🪪 One canonical key per person across phone / email / customer_id / session
+        user_identifier = await resolve_user_identifier(request, session_id, caller_phone)
+        
         # Create UserContext
         user_context_obj = UserContext(
-            user_identifier=user_identifier or "anonymous",
+            user_identifier=user_identifier,
             customer_id=customer_id,
             loft_id=loft_id,
             email=email_param,
             auth_level=auth_level
         )
         
-        # Check for admin mode
-        is_admin_mode = False
-        if hasattr(request, 'admin_mode'):
-            is_admin_mode = request.admin_mode
-        elif hasattr(request, 'user_type'):
-            is_admin_mode = request.user_type == 'admin'
-        elif user_context_obj.is_admin():
-            is_admin_mode = True
+        log.info(f"👤 User identifier: {user_identifier}")
+        log.info(f"🔐 Auth level: {user_context_obj.auth_level} (customer_id={customer_id}, loft_id={loft_id})")
+        log.info(f"🔧 Admin mode: {is_admin_mode}")
+        
+        # SMART SESSION MANAGEMENT - cuando usar memoria vs nueva sesión
+        use_memory = should_use_memory(user_message, raw_identifier)
+        log.info(f"🧠 Memory decision: {'USE MEMORY' if use_memory else 'NEW SESSION'}")
+        
+        # Get platform type from request - FIXED FOR PYDANTIC
+        platform_type = request.platform_type if hasattr(request, 'platform_type') and request.platform_type else 'webchat'
+        channel_metadata = request.channel_metadata if hasattr(request, 'channel_metadata') and request.channel_metadata else {}
+        
+        log.info(f"📱 Platform: {platform_type}")
+        
+        # ⏳ One deadline for the whole turn (phone 4s, webchat 20s): tools get it through
+        # ctx.deps, upstream calls and context steps through the context
+        deadline = deadline or Deadline.for_channel(platform_type, started_at)
+        current_deadline.set(deadline)
+        if channel_metadata:
+            log.debug(f"📋 Channel metadata: {channel_metadata}")
         
-        print(f"👤 User identifier: {user_identifier}")
-        print(f"🔐 Auth level: {user_context_obj.auth_level} (customer_id={customer_id}, loft_id={loft_id})")
-        print(f"🔧 Admin mode: {is_admin_mode}")
+        # ⏱️ Context sources run concurrently from here, each with its own deadline;
+        # enhanced memory only needs the message and the user key, so it starts first
+        enhanced_context_task = None
+        if ENHANCED_MEMORY_AVAILABLE and orchestrator and user_identifier:
+            enhanced_context_task = context_steps.start(
+                "enhanced_context", orchestrator.get_enhanced_context(user_message, user_identifier), fallback="")
         
-        # Get or create conversation
-        conversation_id = await memory.get_or_create_conversation(user_identifier or "anonymous")
+        # 🔑 Resolve the conversation ONCE for this turn (cached per session; one upsert on a miss)
+        if use_memory:
+            conversation_id = await memory.get_or_create_conversation(user_identifier, platform_type)
+        else:
+            # Fresh start: retire the active conversation and open a new one for the same user
+            conversation_id = await memory.start_new_conversation(user_identifier, platform_type)
+            log.info(f"🆕 Starting NEW {platform_type} session for: {user_identifier}")
+        
+        # 🔥 BUG-044 FIX: history from the CURRENT conversation only (not all user conversations).
+        # Newest 50 messages as PydanticAI messages (🔥 BUG-005 function context included),
+        # served from the in-process history cache when this conversation is warm
+        history_task = None
+        if channel_history is None:
+            history_task = context_steps.start("history", memory.get_message_history(conversation_id, limit=50), fallback=[])
         
         # 🔥 BUG-032 FIX: Check for existing UserContext to maintain continuity
-        existing_context = get_user_context(conversation_id)
+        existing_context = await get_user_context(conversation_id)
         if existing_context:
-            print(f"🔄 Found existing context for conversation {conversation_id}")
+            log.info(f"🔄 Found existing context for conversation {conversation_id}")
             # Update existing context with any new authentication info
             if customer_id and not existing_context.customer_id:
                 existing_context.customer_id = customer_id
                 existing_context.auth_level = "authenticated"
-                print(f"🔐 Updated existing context with customer_id: {customer_id}")
+                log.info(f"🔐 Updated existing context with customer_id: {customer_id}")
             if loft_id and not existing_context.loft_id:
                 existing_context.loft_id = loft_id
                 existing_context.auth_level = "authenticated"
-                print(f"🔐 Updated existing context with loft_id: {loft_id}")
+                log.info(f"🔐 Updated existing context with loft_id: {loft_id}")
             if email_param and not existing_context.email:
                 existing_context.email = email_param
                 existing_context.auth_level = "authenticated"
-                print(f"🔐 Updated existing context with email: {email_param}")
+                log.info(f"🔐 Updated existing context with email: {email_param}")
             
             # Use the existing context (maintains continuity)
             user_context_obj = existing_context
-            print(f"✅ Using existing UserContext (preserves conversation continuity)")
+            log.info("✅ Using existing UserContext (preserves conversation continuity)")
         else:
-            # Store new context for first message
-            set_user_context(conversation_id, user_context_obj)
-            print(f"💾 Stored NEW user context for conversation {conversation_id}")
+            log.info(f"💾 Storing NEW user context for conversation {conversation_id}")
+        
+        # Always update the stored context (new, or existing_context modified above)
+        await set_user_context(conversation_id, user_context_obj)
+        
+        # Everything tools need about this turn, handed to them as ctx.deps
+        turn_deps = TurnDeps(user_identifier, conversation_id, platform_type, user_context_obj)
+        turn_deps.deadline = deadline
         
-        # Always update the stored context (in case we modified existing_context)
-        set_user_context(conversation_id, user_context_obj)
+        # 🔮 Phone/email/SKU in the message: start the lookup the agent will ask for now,
+        # while the LLM request is still in flight
+        speculation = TurnSpeculation()
+        if speculation.start_from_message(user_message, SPECULATIVE_TOOLS, DirectToolContext(turn_deps)):
+            turn_deps.speculation = speculation
         
-        # 🔐 INJECT AUTH CONTEXT into first message if authenticated
-        if user_context_obj.is_authenticated() and request.messages:
-            auth_notice = f"\n[SYSTEM: User is AUTHENTICATED. customer_id={customer_id}, email={email_param}, loft_id={loft_id}, auth_level=authenticated. USE this customer_id for order lookups!]"
-            request.messages[0].content = auth_notice + "\n" + request.messages[0].content
-            print(f"🔐 Injected auth context into message")
+        # Per-turn notes go in the dynamic tail of the prompt, never into the cached prefix
+        turn_notes: List[str] = []
+        
+        # 🔐 AUTH CONTEXT for authenticated users
+        if user_context_obj.is_authenticated():
+            turn_notes.append(f"[SYSTEM: User is AUTHENTICATED. customer_id={user_context_obj.customer_id}, email={user_context_obj.email}, loft_id={user_context_obj.loft_id}, auth_level=authenticated. USE this customer_id for order lookups!]")
+            log.info("🔐 Added auth context to turn notes")
         
         # 🔗 INJECT CONTEXT FOR "TELL ME EVERYTHING" QUERIES
         # If user says "tell me everything about me" and we have phone/email/customer_id, inject it
         user_msg_lower = user_message.lower()
-        if ("tell me everything" in user_msg_lower or "complete info" in user_msg_lower) and request.messages:
+        if "tell me everything" in user_msg_lower or "complete info" in user_msg_lower:
             available_id = None
             if user_context_obj.customer_id:
                 available_id = user_context_obj.customer_id
-                print(f"🔗 Using customer_id from context: {available_id}")
+                log.info(f"🔗 Using customer_id from context: {available_id}")
             elif user_context_obj.email:
                 available_id = user_context_obj.email
-                print(f"🔗 Using email from context: {available_id}")
-            elif user_identifier and (len(user_identifier.replace('-', '').replace(' ', '')) >= 10 or '@' in user_identifier):
-                available_id = user_identifier
-                print(f"🔗 Using user_identifier: {available_id}")
+                log.info(f"🔗 Using email from context: {available_id}")
+            elif raw_identifier and (len(raw_identifier.replace('-', '').replace(' ', '')) >= 10 or '@' in raw_identifier):
+                available_id = raw_identifier
+                log.info(f"🔗 Using user_identifier: {available_id}")
             
             if available_id:
-                context_notice = f"\n[SYSTEM: User asked 'tell me everything about me'. Use identifier '{available_id}' (phone/email/customer_id) to call get_complete_customer_journey('{available_id}') IMMEDIATELY. DO NOT ask for phone/email - use what's available!]"
-                request.messages[-1].content = request.messages[-1].content + context_notice
-                print(f"🔗 Injected identifier context for 'tell me everything' query")
+                turn_notes.append(f"[SYSTEM: User asked 'tell me everything about me'. Use identifier '{available_id}' (phone/email/customer_id) to call get_complete_customer_journey('{available_id}') IMMEDIATELY. DO NOT ask for phone/email - use what's available!]")
+                log.info("🔗 Added identifier hint for 'tell me everything' query")
         
         # FAST-PATH: product browsing intents → call Magento directly for instant carousel
         # ⚠️ BUDGET DETECTION FIRST - Disable fast-path for budget searches
@@ -3519,8 +3670,9 @@ async def chat_completions(request: ChatRequest):
         has_budget_terms = any(term in msg_lower for term in ["under", "below", "less than", "between", "$", "budget", "max", "maximum"])
         
         fastpath_query = None
-        # Only use fast-path if NO budget terms detected
-        if not has_budget_terms:
+        # Only use fast-path if NO budget terms detected. Not on calls: it answers with the raw
+        # tool text (result JSON, product cards), which must not be read out.
+        if not has_budget_terms and platform_type != 'phone':
             if any(k in msg_lower for k in ["sectional", "sectionals"]):
                 fastpath_query = "sectional"
             # DISABLED: elif "recliner" in msg_lower or "recliners" in msg_lower:
@@ -3530,11 +3682,9 @@ async def chat_completions(request: ChatRequest):
 
         if fastpath_query:
             try:
-                print(f"⚡ Fast-path Magento search for: {fastpath_query}")
+                log.info(f"⚡ Fast-path Magento search for: {fastpath_query}")
                 # Call tool directly to guarantee CAROUSEL_DATA in response
-                result_text = await search_magento_products(None, fastpath_query, 12)
-                
-                conversation_id = await memory.get_or_create_conversation(user_identifier)
+                result_text = await search_magento_products(DirectToolContext(turn_deps), fastpath_query, 12)
                 
                 # 🧠 Enhanced Memory Integration - Save with enhancement
                 if ENHANCED_MEMORY_AVAILABLE and orchestrator:
@@ -3551,6 +3701,13 @@ async def chat_completions(request: ChatRequest):
                     # Fallback to basic memory
                     await memory.save_user_message(conversation_id, user_message)
                     await memory.save_assistant_message(conversation_id, result_text)
+                
+                # Answered: the agent won't run, so its context isn't needed. Only cancelled now, so a
+                # failure above falls through to the agent with history and context still loading.
+                for task in (history_task, enhanced_context_task):
+                    if task:
+                        task.cancel()
+                speculation.finish()
                 return ChatResponse(
                     choices=[{
                         "index": 0,
@@ -3562,104 +3719,127 @@ async def chat_completions(request: ChatRequest):
                         "prompt_tokens": len(user_message.split()),
                         "completion_tokens": len(result_text.split()),
                         "total_tokens": len(user_message.split()) + len(result_text.split())
-                    }
+                    },
+                    session_id=session_id
                 )
             except Exception as e:
-                print(f"❌ Fast-path error: {e}")
-
-        # SMART SESSION MANAGEMENT - cuando usar memoria vs nueva sesión
-        use_memory = should_use_memory(user_message, user_identifier)
-        print(f"🧠 Memory decision: {'USE MEMORY' if use_memory else 'NEW SESSION'}")
+                log.error(f"❌ Fast-path error: {e}")
         
-        # Get platform type from request - FIXED FOR PYDANTIC
-        platform_type = request.platform_type if hasattr(request, 'platform_type') and request.platform_type else 'webchat'
-        channel_metadata = request.channel_metadata if hasattr(request, 'channel_metadata') and request.channel_metadata else {}
-        
-        print(f"📱 Platform: {platform_type}")
-        if channel_metadata:
-            print(f"📋 Channel metadata: {channel_metadata}")
-        
-        # Get or create conversation using MULTI-CHANNEL support
-        if use_memory:
-            conversation_id = await memory.get_or_create_conversation(user_identifier, platform_type)
+        # ONLY pass the history, not the current message (that goes as user_prompt)
+        if history_task:
+            message_history = await history_task
         else:
-            # Force new conversation for fresh start
-            conversation_id = await memory.get_or_create_conversation(f"{user_identifier}_new_{int(asyncio.get_event_loop().time())}", platform_type)
-            print(f"🆕 Starting NEW {platform_type} session for: {user_identifier}")
-        
-        # 🔥 BUG-044 FIX: Get conversation history from CURRENT conversation only (not all user conversations)
-        # Changed from get_unified_conversation_history to get_recent_messages for conversation-specific history
-        # Increased limit from 10 to 50 to prevent context loss in long conversations
-        db_messages = await memory.get_recent_messages(conversation_id, limit=50)
-        print(f"📚 Loaded {len(db_messages)} messages from conversation {conversation_id}")
-        
-        # Convert to PydanticAI ModelMessage format with 🔥 BUG-005 FIX: Include function call context!
-        message_history = []
-        for msg in db_messages:
-            if msg["role"] == "user":
-                message_history.append(
-                    ModelRequest(parts=[UserPromptPart(content=msg["content"])])
-                )
-            elif msg["role"] == "assistant":
-                # 🔥 BUG-005 FIX: Include function execution context in message history
-                assistant_content = msg["content"]
-                
-                # If this message had a function call, append that context for OpenAI to see
-                if msg.get("executed_function_name"):
-                    func_name = msg.get("executed_function_name")
-                    func_args = msg.get("function_input_parameters")
-                    func_result = msg.get("function_output_result")
-                    
-                    # Add function context BEFORE the response so AI sees: "I called X() and got Y, so..."
-                    function_context = f"\n\n[Function Call Context: {func_name}("
-                    if func_args:
-                        try:
-                            args_dict = json.loads(func_args) if isinstance(func_args, str) else func_args
-                            function_context += f"{json.dumps(args_dict)}"
-                        except:
-                            function_context += "..."
-                    function_context += f") executed]"
-                    
-                    assistant_content = function_context + "\n\n" + assistant_content
+            message_history = channel_history.history(conversation_id)[-50:]
+        log.info(f"📚 Using {len(message_history)} historical messages")
+        has_history = bool(message_history)
+        
+        # 🧠 Enhanced conversation context ("" when it missed its deadline)
+        enhanced_context = await enhanced_context_task if enhanced_context_task else ""
+        if enhanced_context:
+            log.info(f"🧠 Enhanced context loaded: {len(enhanced_context)} chars")
+        
+        # 💬 FAQs (hours, directions, financing...) from anonymous webchat users are answered from
+        # the response cache. Answers are only stored from turns with no history and no tool calls,
+        # so a cached answer never carries another conversation's context or stale catalog data.
+        cacheable_turn = (
+            platform_type == 'webchat' and not is_admin_mode and not raw_identifier
+            and not user_context_obj.is_authenticated() and not enhanced_context
+            and response_cache.is_cacheable(user_message)
+        )
+        store_in_cache = cacheable_turn and not message_history
+        cached = await response_cache.get(user_message) if cacheable_turn else None
+        if cached:
+            answer, tier = cached
+            log.info(f"💬 Response cache {tier} hit for: {user_message[:50]}")
+            if ENHANCED_MEMORY_AVAILABLE and orchestrator:
+                await orchestrator.save_message_with_enhancement(conversation_id, 'user', user_message, user_identifier)
+                await orchestrator.save_message_with_enhancement(conversation_id, 'assistant', answer, user_identifier)
+            else:
+                await memory.save_user_message(conversation_id, user_message)
+                await memory.save_assistant_message(conversation_id, answer)
+            
+            if request.stream:
+                async def stream_cached_answer():
+                    sanitizer = StreamingHTMLSanitizer()
+                    pieces = [sanitizer.feed(piece) for piece in cached_answer_chunks(answer)] + [sanitizer.finish()]
+                    for piece in pieces:
+                        if piece:
+                            yield sse_event({"type": "text_delta", "text": piece})
+                    yield sse_event({"type": "done", "tools": [], "cached": tier})
+                    yield "data: [DONE]\n\n"
                 
-                message_history.append(
-                    ModelResponse(parts=[TextPart(content=assistant_content)])
-                )
-        
-        # ONLY pass the history, not the current message (that goes as user_prompt)
-        
-        print(f"📚 Using {len(message_history)} historical messages")
+                return StreamingResponse(stream_cached_answer(), media_type="text/event-stream",
+                                         headers={"X-Session-Id": session_id, "X-Response-Cache": tier})
+            
+            return ChatResponse(
+                choices=[{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                model="loft-chat",
+                usage={
+                    "prompt_tokens": len(user_message.split()),
+                    "completion_tokens": len(answer.split()),
+                    "total_tokens": len(user_message.split()) + len(answer.split())
+                },
+                session_id=session_id
+            )
         
-        # 🧠 Get enhanced conversation context
-        enhanced_context = ""
-        if ENHANCED_MEMORY_AVAILABLE and orchestrator and user_identifier:
-            try:
-                enhanced_context = await orchestrator.get_enhanced_context(user_message, user_identifier)
-                if enhanced_context:
-                    print(f"🧠 Enhanced context loaded: {len(enhanced_context)} chars")
-            except Exception as e:
-                print(f"⚠️ Enhanced context retrieval failed: {e}")
+        # 📏 Fit history (older turns → rolling summary) and context into their token budgets
+        assembled = await prompt_assembler.assemble(conversation_id, message_history, enhanced_context)
+        message_history = assembled.message_history
+        
+        # Prompt layout: [static instructions + tool schemas][history][this turn + everything dynamic].
+        # The first two are byte-stable across requests, so the provider's prompt cache can reuse them.
+        dynamic_blocks = list(turn_notes)
+        if channel_history is not None:
+            other_channels = channel_history.other_channels(conversation_id)
+            if other_channels:
+                dynamic_blocks.append(fit_to_budget(other_channels, CONTEXT_TOKENS))
+        if assembled.summary:
+            dynamic_blocks.append(f"Summary of the earlier conversation:\n{assembled.summary}")
+        if assembled.context:
+            dynamic_blocks.append(assembled.context)
+        dynamic_context = "\n\n".join(dynamic_blocks)
         
         # Modify user message with admin mode context if needed
-        final_user_message = user_message
         if is_admin_mode:
             final_user_message = f"""[ADMIN MODE] {user_message}
 
 Admin Context: You have full access to all 12 LOFT functions and can look up any customer data. Use technical language and provide comprehensive responses.
 
-{enhanced_context}"""
+{dynamic_context}"""
         else:
             final_user_message = f"""[CUSTOMER MODE] {user_message}
 
 Customer Context: Provide friendly, helpful responses focused on customer self-service. Only access customer's own data when appropriate.
 
-{enhanced_context}"""
+{dynamic_context}"""
+        
+        # 🧭 Only send the tool schemas this turn needs ("hi" doesn't need 29 tools)
+        intent, turn_agent = tool_router.select(
+            user_message,
+            has_product_context=await product_context.get_last_search(user_identifier) is not None,
+            is_authenticated=user_context_obj.is_authenticated(),
+            force_full=is_admin_mode,
+            conversation_id=conversation_id,
+            has_history=has_history,
+        )
+        log.info(f"🧭 Intent '{intent}' → {tool_router.tool_counts[intent]} tools")
         
         if request.stream:
-            print("🤖 Running streaming response with memory...")
+            log.info("🤖 Running streaming response with memory...")
             async def generate_stream():
-                try:
-                    async with agent.run_stream(final_user_message, message_history=message_history) as result:
+                # The agent runs in a background task; tool_start / tool_result events
+                # reach the client while it works, then the text deltas follow
+                events = TurnEvents()
+                
+                async def run_turn():
+                    async with admission.admit(user_identifier, platform_type), \
+                            turn_agent.run_stream(final_user_message, message_history=message_history, deps=turn_deps,
+                                                 model=rate_limited_model(agent_kwargs["model"]),   # 🚦 "openai" slot per request
+                                                 model_settings={"timeout": deadline.llm_timeout()}) as result:
                         # 🧠 Save user message with enhancement
                         if ENHANCED_MEMORY_AVAILABLE and orchestrator:
                             await orchestrator.save_message_with_enhancement(
@@ -3668,74 +3848,101 @@ Customer Context: Provide friendly, helpful responses focused on customer self-s
                         else:
                             await memory.save_user_message(conversation_id, user_message)
                         
-                        full_response = ""
-                        function_calls_made = []
+                        async for delta in result.stream_text(delta=True):
+                            events.publish("text_delta", text=delta)
+                        events.usage = result.usage()
                         
-                        async for message in result.stream_text(delta=True):
-                            full_response += message
-                            # SCRUM FIX: Strip HTML tags for streaming to match frontend patterns
-                            clean_message = strip_html_for_streaming(message)
-                            chunk = {
-                                "choices": [{"delta": {"content": clean_message}}],
-                                "model": "loft-chat"
-                            }
-                            yield f"data: {json.dumps(chunk)}\n\n"
+                try:
+                    events.start(run_turn)
+                    full_response = ""
+                    first_token_at = None
+                    # SCRUM FIX: Strip HTML tags for streaming to match frontend patterns
+                    # (stateful, so a tag split across deltas never leaks to the client)
+                    sanitizer = StreamingHTMLSanitizer()
                         
-                        # Check if any functions were called during this response
-                        if hasattr(result, 'all_messages'):
-                            for msg in result.all_messages():
-                                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                                    for tool_call in msg.tool_calls:
-                                        if hasattr(tool_call, 'function'):
-                                            function_calls_made.append({
-                                                'function_name': tool_call.function.name,
-                                                'arguments': tool_call.function.arguments
-                                            })
+                    async for event in events:
+                        if event["type"] != "text_delta":
+                            yield sse_event(event)
+                            continue
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        full_response += event["text"]
+                        clean_message = sanitizer.feed(event["text"])
+                        if clean_message:
+                            yield sse_event({"type": "text_delta", "text": clean_message})
+                    clean_message = sanitizer.finish()
+                    if clean_message:
+                        yield sse_event({"type": "text_delta", "text": clean_message})
                         
-                        # Send function metadata if functions were called
-                        if function_calls_made:
-                            function_metadata = {
-                                "choices": [{"delta": {"function_calls": function_calls_made}}],
-                                "model": "loft-chat"
-                            }
-                            yield f"data: {json.dumps(function_metadata)}\n\n"
+                    prompt_cache_metrics.record(events.usage, started_at, first_token_at, platform_type)
+                    tool_output_stats.record_turn(turn_deps.tool_outputs)
+                    deadline_stats.record_turn(deadline)
+                    yield sse_event({
+                        "type": "done",
+                        "tools": [{key: call[key] for key in ("tool", "call_id", "ok", "duration_ms")}
+                                  for call in events.tools],
+                        "tool_output_tokens_saved": turn_deps.tool_outputs.saved_tokens,
+                    })
                         
-                        # 🧠 Save assistant response with enhancement
-                        if ENHANCED_MEMORY_AVAILABLE and orchestrator:
-                            # Extract function information if available
-                            func_name = None
-                            func_args = None
-                            func_result = None
-                            if function_calls_made:
-                                func_name = function_calls_made[0].get('function_name')
-                                func_args = function_calls_made[0].get('arguments')
-                                func_result = full_response
+                    # 🧠 Save assistant response with enhancement
+                    if ENHANCED_MEMORY_AVAILABLE and orchestrator:
+                        # Function information from the first tool call, if any
+                        func_name = None
+                        func_args = None
+                        func_result = None
+                        if events.tools:
+                            func_name = events.tools[0]["tool"]
+                            func_args = events.tools[0]["arguments"]
+                            func_result = full_response
                             
-                            await orchestrator.save_message_with_enhancement(
-                                conversation_id, 'assistant', full_response, user_identifier,
-                                function_name=func_name, function_args=func_args, function_result=func_result
-                            )
-                        else:
-                            await memory.save_assistant_message(conversation_id, full_response)
+                        await orchestrator.save_message_with_enhancement(
+                            conversation_id, 'assistant', full_response, user_identifier,
+                            function_name=func_name, function_args=func_args, function_result=func_result
+                        )
+                    else:
+                        await memory.save_assistant_message(conversation_id, full_response)
                         
-                        yield "data: [DONE]\n\n"
+                    if store_in_cache and not events.tools:
+                        await response_cache.put(user_message, full_response)
                         
+                    yield "data: [DONE]\n\n"
+            
+                except (UpstreamOverloaded, AdmissionRejected) as e:
+                    log.info(f"🚦 Chat turn shed: {e}")
+                    yield sse_event({"type": "text_delta", "text": BUSY_MESSAGE})
+                    yield "data: [DONE]\n\n"
                 except Exception as e:
-                    error_chunk = {
-                        "choices": [{"delta": {"content": f"❌ Error: {str(e)}"}}],
-                        "model": "loft-chat"
-                    }
-                    yield f"data: {json.dumps(error_chunk)}\n\n"
+                    # Exception text stays in the log; it's shown in chat and read out on calls
+                    log.error(f"❌ Streaming turn failed: {e}")
+                    yield sse_event({"type": "text_delta", "text": ERROR_MESSAGE})
                     yield "data: [DONE]\n\n"
+                finally:
+                    # Client disconnected mid-turn: stop the agent (frees its admission slot)
+                    events.cancel()
+                    speculation.finish()
             
-            return StreamingResponse(generate_stream(), media_type="text/event-stream")
+            return StreamingResponse(generate_stream(), media_type="text/event-stream",
+                                     headers={"X-Session-Id": session_id})
         
         else:
-            print("🤖 Running non-streaming response with memory (via stream aggregator)...")
+            log.info("🤖 Running non-streaming response with memory (via stream aggregator)...")
             full_response = ""
-            async with agent.run_stream(final_user_message, message_history=message_history) as result:
-                async for chunk in result.stream_text(delta=True):
-                    full_response += chunk
+            first_token_at = None
+            try:
+                async with admission.admit(user_identifier, platform_type), \
+                        turn_agent.run_stream(final_user_message, message_history=message_history, deps=turn_deps,
+                                              model=rate_limited_model(agent_kwargs["model"]),   # 🚦 "openai" slot per request
+                                              model_settings={"timeout": deadline.llm_timeout()}) as result:
+                    async for chunk in result.stream_text(delta=True):
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        full_response += chunk
+            finally:
+                # Shed or failed runs too: speculative lookups stop with the turn, not at their TTL
+                speculation.finish()
+            prompt_cache_metrics.record(result.usage(), started_at, first_token_at, platform_type)
+            tool_output_stats.record_turn(turn_deps.tool_outputs)
+            deadline_stats.record_turn(deadline)
 
             # 🧠 Save messages to enhanced memory
             if ENHANCED_MEMORY_AVAILABLE and orchestrator:
@@ -3750,12 +3957,22 @@ Customer Context: Provide friendly, helpful responses focused on customer self-s
                 await memory.save_user_message(conversation_id, user_message)
                 await memory.save_assistant_message(conversation_id, full_response)
 
+            if store_in_cache and not any(isinstance(part, ToolCallPart)
+                                          for message in result.new_messages() for part in message.parts):
+                await response_cache.put(user_message, full_response)
+            
+            # Clients without the event stream read the product cards from the text (not stored in history)
+            content = full_response
+            carousel = turn_deps.tool_outputs.carousel()
+            if carousel and platform_type != 'phone':
+                content = f"{full_response}\n\n**CAROUSEL_DATA:** {json.dumps(carousel)}"
+
             response = ChatResponse(
                 choices=[{
                     "index": 0,
                     "message": {
                         "role": "assistant",
-                        "content": full_response
+                        "content": content
                     },
                     "finish_reason": "stop"
                 }],
@@ -3763,28 +3980,98 @@ Customer Context: Provide friendly, helpful responses focused on customer self-s
                 usage={
                     "prompt_tokens": len(user_message.split()),
                     "completion_tokens": len(full_response.split()),
-                    "total_tokens": len(user_message.split()) + len(full_response.split())
-                }
+                    "total_tokens": len(user_message.split()) + len(full_response.split()),
+                    "tool_output_tokens_saved": turn_deps.tool_outputs.saved_tokens,
+                },
+                session_id=session_id
             )
             return response
     
     except HTTPException:
         raise
+    except (UpstreamOverloaded, AdmissionRejected) as e:
+        log.info(f"🚦 Chat turn shed: {e}")
+        raise HTTPException(status_code=503, detail=BUSY_MESSAGE, headers={"Retry-After": "5"})
     except Exception as e:
-        print(f"❌ Chat completion error: {e}")
+        log.error(f"❌ Chat completion error: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
+# Prompt cache / time-to-first-token metrics
+@app.get("/v1/metrics/prompt")
+async def get_prompt_metrics():
+    """Cached-token ratio and TTFT per request, plus the last turn's prompt section sizes"""
+    return {**prompt_cache_metrics.snapshot(), "last_prompt_budget": prompt_assembler.last_stats}
+
+# Response cache metrics / invalidation
+@app.get("/v1/metrics/response-cache")
+async def get_response_cache_metrics():
+    """Hit rate per tier, entries and the current cache version"""
+    return response_cache.snapshot()
+
+def require_admin_token(authorization: Optional[str]):
+    """Admin endpoints take Authorization: Bearer $ADMIN_API_TOKEN; without the env var they are disabled"""
+    expected = os.getenv("ADMIN_API_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_TOKEN not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/v1/cache/responses/invalidate")
+async def invalidate_response_cache(authorization: Optional[str] = Header(default=None)):
+    """Drop every cached answer (e.g. after store hours or policies change); needs ADMIN_API_TOKEN"""
+    require_admin_token(authorization)
+    return {"invalidated": response_cache.invalidate()}
+
+# Speculative tool execution metrics
+@app.get("/v1/metrics/speculation")
+async def get_speculation_metrics():
+    """Speculative lookups started, used by the agent (hit rate), cancelled and wasted"""
+    return speculation_stats.snapshot()
+
+# Turn deadline metrics
+@app.get("/v1/metrics/deadlines")
+async def get_deadline_metrics():
+    """Turns per channel, turns over budget, and tool timeouts served from cache or as partial results"""
+    return deadline_stats.snapshot()
+
+# Compact tool output metrics
+@app.get("/v1/metrics/tool-outputs")
+async def get_tool_output_metrics():
+    """Prompt tokens kept out of the model's context by compact product results, per turn"""
+    return tool_output_stats.snapshot()
+
+# Voice sentence-streaming metrics
+@app.get("/v1/metrics/voice")
+async def get_voice_metrics():
+    """Time to first spoken sentence (p50/p95) and how often the deadline filler was used"""
+    return voice_stats.snapshot()
+
+# Admission control metrics
+@app.get("/v1/metrics/admission")
+async def get_admission_metrics():
+    """Agent runs in flight, queue depth and wait percentiles per channel"""
+    return admission.snapshot()
+
+# Upstream rate limit / bulkhead metrics
+@app.get("/v1/metrics/upstreams")
+async def get_upstream_metrics():
+    """Queued, in-flight, admitted and shed counts per upstream"""
+    return upstream_metrics()
+
 # Session info endpoint
 @app.get("/v1/sessions/{user_identifier}")
 async def get_session_info(user_identifier: str):
     """Get session/conversation info"""
     try:
-        conversation_id = await memory.get_or_create_conversation(user_identifier)
+        user_key = await identity_graph.resolve({}, lookup_only=classify_user_identifier(user_identifier))
+        conversation_id = await memory.get_or_create_conversation(user_key)
         messages = await memory.get_recent_messages(conversation_id)
         customer_context = await memory.extract_customer_context(conversation_id)
         
         return {
             "user_identifier": user_identifier,
+            "canonical_key": user_key,
             "conversation_id": conversation_id,
             "message_count": len(messages),
             "customer_context": customer_context
@@ -3901,8 +4188,8 @@ async def demo_start_call(request: Dict):
         phone_number = request.get('phone_number', '')
         user_identifier = request.get('user_identifier', phone_number)
         
-        print(f"📞 DEMO CALL TO: {phone_number}")
-        print(f"👤 User: {user_identifier}")
+        voice_log.info(f"📞 DEMO CALL TO: {phone_number}")
+        voice_log.info(f"👤 User: {user_identifier}")
         
         if not phone_number:
             return {"status": "error", "message": "Phone number required"}
@@ -3916,26 +4203,20 @@ async def demo_start_call(request: Dict):
             return {"status": "error", "message": "VAPI not configured"}
         
         # Make VAPI call
-        import requests
-        headers = {
-            "Authorization": f"Bearer {vapi_private_key}",
-            "Content-Type": "application/json"
-        }
-        
         call_data = {
             "assistantId": vapi_assistant_id,
             "phoneNumberId": vapi_phone_number_id,
             "customer": {"number": phone_number}
         }
         
-        response = requests.post("https://api.vapi.ai/call", json=call_data, headers=headers)
+        response = await vapi_create_call(vapi_private_key, call_data)
         
         if response.status_code in [200, 201]:
             call_info = response.json()
             call_id = call_info.get('id')
             call_status = call_info.get('status')
             
-            print(f"✅ DEMO CALL INITIATED: {call_id}")
+            voice_log.info(f"✅ DEMO CALL INITIATED: {call_id}")
             
             return {
                 "status": "success", 
@@ -3951,73 +4232,64 @@ async def demo_start_call(request: Dict):
 
 @app.post("/webhook/vapi/end-of-call")
 async def vapi_end_of_call_webhook(request: Request):
-    """🔥 VAPI END OF CALL WEBHOOK - CRITICAL FOR CROSS-CHANNEL MEMORY"""
+    """
+    🔥 VAPI END OF CALL WEBHOOK - CRITICAL FOR CROSS-CHANNEL MEMORY
+    Validates the report and queues the transcript (202); call_ingestion stores it in the background.
+    """
     try:
-        body = await request.body()
-        data = json.loads(body.decode())
-        
-        print(f"\n🔥🔥🔥 VAPI END OF CALL REPORT RECEIVED! 🔥🔥🔥")
-        print(f"📞 FULL CALL DATA:")
-        print(json.dumps(data, indent=2))
-        
-        # Extract call information
-        call_data = data.get('call', {})
-        call_id = call_data.get('id')
-        phone_number = call_data.get('customer', {}).get('number')
-        transcript = data.get('transcript', [])
+        data = json.loads(await request.body())
+    except ValueError:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "Invalid JSON"})
+    if not isinstance(data, dict):
+        return JSONResponse(status_code=400, content={"status": "error", "message": "Expected a JSON object"})
+        
+    voice_log.debug("📞 End-of-call report", payload=data)
+    call_id = (data.get('call') or {}).get('id')
+    if not call_id:
+        return await accept_end_of_call(data)
+        
+    # 🔁 Vapi retries webhooks: one ingestion per call.id (a queue-full 503 is not remembered)
+    response, _ = await idempotency.run(
+        f"vapi-eoc:{call_id}", lambda: accept_end_of_call(data), IDEMPOTENCY_WEBHOOK_TTL_SECONDS,
+        retryable=lambda response: response.status_code >= 500,
+    )
+    return response
         
-        print(f"\n📱 Phone Number: {phone_number}")
-        print(f"🆔 Call ID: {call_id}")
-        print(f"📝 Transcript Messages: {len(transcript)}")
+async def accept_end_of_call(data: Dict) -> JSONResponse:
+    """Queue a validated end-of-call report's transcript"""
+    call_data = data.get('call') or {}
+    call_id = call_data.get('id')
+    phone_number = (call_data.get('customer') or {}).get('number')
+    transcript = data.get('transcript') or []
+    messages = transcript_messages(transcript) if isinstance(transcript, list) else []
         
-        # Process transcript and save to memory
-        if phone_number and transcript:
-            # Initialize memory pool if needed
-            if hasattr(memory, 'init_pool'):
-                await memory.init_pool()
+    voice_log.info(f"📥 End of call {call_id}: phone={phone_number}, {len(messages)}/{len(transcript)} transcript messages")
             
-            # Get or create phone conversation
-            conversation_id = await memory.get_or_create_conversation(phone_number, 'phone')
-            print(f"📚 Phone conversation ID: {conversation_id}")
+    # The call may have changed what we know about this customer
+    if phone_number:
+        profile_cache.invalidate(phone_number, "phone")
             
-            # Save transcript messages to memory using correct method
-            saved_count = 0
-            for msg in transcript:
-                role = msg.get('role', 'unknown')
-                content = msg.get('content', '')
+    if not phone_number or not messages:
+        voice_log.warning("⚠️ Missing phone_number or transcript")
+        return JSONResponse(content={"status": "ignored", "message": "No phone number or transcript to save",
+                                     "queued_messages": 0})
                 
-                if role and content:
-                    # Use the correct SimpleMemory methods
-                    if role == 'user':
-                        message_id = await memory.save_user_message(conversation_id, content)
-                    elif role == 'assistant' or role == 'bot':
-                        message_id = await memory.save_assistant_message(
-                            conversation_id=conversation_id,
-                            content=content,
-                            function_name=None,
-                            function_args=None
-                        )
-                    else:
-                        print(f"⚠️ Unknown role: {role}")
-                        continue
+    if not call_ingestion.enqueue(call_id, phone_number, messages):
+        # Vapi retries a failed webhook; better than dropping the transcript
+        return JSONResponse(status_code=503, content={"status": "busy", "message": "Ingestion queue full"},
+                            headers={"Retry-After": "5"})
                     
-                    print(f"💾 Saved {role}: {content[:80]}... (ID: {message_id})")
-                    saved_count += 1
+    return JSONResponse(status_code=202, content={
+        "status": "accepted", "message": "End of call queued", "queued_messages": len(messages)
+    })
             
-            print(f"\n✅ END OF CALL PROCESSING COMPLETE!")
-            print(f"💾 Saved {saved_count} messages to memory")
-            print(f"🧠 Call context now available for webchat!")
-            print(f"🔗 Cross-channel memory: ACTIVE")
-        else:
-            print(f"⚠️ Missing phone_number or transcript")
-        
-        return {"status": "success", "message": "End of call processed", "saved_messages": saved_count if 'saved_count' in locals() else 0}
-        
-    except Exception as e:
-        print(f"❌ WEBHOOK ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-        return {"status": "error", "message": str(e)}
+async def resolve_phone_conversation(phone_number: str):
+    """Caller key and phone conversation for a call's transcript"""
+    if hasattr(memory, 'init_pool'):
+        await memory.init_pool()
+    caller_key = await identity_graph.resolve({"phone": phone_number})
+    conversation_id = await memory.get_or_create_conversation(caller_key, 'phone')
+    return caller_key, conversation_id
 
 @app.post("/webhook/vapi/call-status")
 async def vapi_call_status_webhook(request: Request):
@@ -4031,14 +4303,21 @@ async def vapi_call_status_webhook(request: Request):
         call_id = call_data.get('id')
         phone_number = call_data.get('customer', {}).get('number')
         
-        print(f"\n📞 CALL STATUS UPDATE: {status}")
-        print(f"🆔 Call ID: {call_id}")
-        print(f"📱 Phone: {phone_number}")
+        async def handle_status():
+            voice_log.info(f"📞 CALL STATUS UPDATE: {status}")
+            voice_log.info(f"🆔 Call ID: {call_id}")
+            voice_log.info(f"📱 Phone: {phone_number}")
+            return {"status": "success"}
         
-        return {"status": "success"}
+        if not call_id:
+            return await handle_status()
+        # 🔁 Each (call.id, status) update is handled once, retries included
+        result, replayed = await idempotency.run(
+            f"vapi-status:{call_id}:{status}", handle_status, IDEMPOTENCY_WEBHOOK_TTL_SECONDS)
+        return {**result, "duplicate": True} if replayed else result
         
     except Exception as e:
-        print(f"❌ CALL STATUS WEBHOOK ERROR: {e}")
+        voice_log.error(f"❌ CALL STATUS WEBHOOK ERROR: {e}")
         return {"status": "error", "message": str(e)}
 
 if __name__ == "__main__":
@@ -9,6 +9,11 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 from enhanced_memory_system import enhanced_memory, init_enhanced_memory
 from conversation_memory import memory as simple_memory
+from structured_logging import get_logger
+
+log = get_logger("memory")
+
+MESSAGE_COUNT_TRACKED_CONVERSATIONS = 5000
 
 class MemoryOrchestrator:
     """
@@ -17,13 +22,14 @@ class MemoryOrchestrator:
     
     def __init__(self):
         self.enhanced_ready = False
-        print("🎭 Memory Orchestrator initialized")
+        self._message_counts: Dict[str, int] = {}  # conversation_id → messages saved, most recent last
+        log.notice("🎭 Memory Orchestrator initialized")
     
     async def ensure_enhanced_memory(self):
         """Ensure enhanced memory is initialized"""
         if not self.enhanced_ready and enhanced_memory:
             self.enhanced_ready = True
-            print("✅ Enhanced memory is ready")
+            log.notice("✅ Enhanced memory is ready")
     
     async def save_message_with_enhancement(self, conversation_id: str, 
                                           message_role: str, message_content: str,
@@ -45,22 +51,33 @@ class MemoryOrchestrator:
         await self.ensure_enhanced_memory()
         if self.enhanced_ready:
             try:
-                # Process conversation every 5 messages for efficiency
-                async with simple_memory.pool.acquire() as conn:
-                    message_count = await conn.fetchval(
-                        "SELECT COUNT(*) FROM chatbot_messages WHERE conversation_id = $1", 
-                        conversation_id
-                    )
-                    
-                    # Process insights periodically or at conversation end
-                    if message_count % 5 == 0 or "goodbye" in message_content.lower():
-                        print(f"🧠 Processing memory insights for conversation {conversation_id}")
-                        asyncio.create_task(
-                            enhanced_memory.process_conversation_memory(conversation_id, user_identifier)
-                        )
+                # Process conversation every 5 messages for efficiency (counted in process, no COUNT(*) per message)
+                message_count = self._count_message(conversation_id)
+                
+                # Process insights periodically or at conversation end
+                if message_count % 5 == 0 or "goodbye" in message_content.lower():
+                    log.info(f"🧠 Processing memory insights for conversation {conversation_id}")
+                    # Insights read chatbot_messages, so write the queued messages first
+                    asyncio.create_task(self._process_after_flush(conversation_id, user_identifier))
                         
             except Exception as e:
-                print(f"⚠️ Enhanced memory processing failed (non-critical): {e}")
+                log.warning(f"⚠️ Enhanced memory processing failed (non-critical): {e}")
+
+    def _count_message(self, conversation_id: str) -> int:
+        self._message_counts[conversation_id] = self._message_counts.pop(conversation_id, 0) + 1
+        while len(self._message_counts) > MESSAGE_COUNT_TRACKED_CONVERSATIONS:
+            self._message_counts.pop(next(iter(self._message_counts)))
+        return self._message_counts[conversation_id]
+
+    async def process_conversation(self, conversation_id: str, user_identifier: str):
+        """Extract memory from a whole conversation at once (a finished call's transcript)"""
+        await self.ensure_enhanced_memory()
+        if self.enhanced_ready:
+            await self._process_after_flush(conversation_id, user_identifier)
+
+    async def _process_after_flush(self, conversation_id: str, user_identifier: str):
+        await simple_memory.flush()
+        await enhanced_memory.process_conversation_memory(conversation_id, user_identifier)
 
     async def get_enhanced_context(self, query: str, user_identifier: str) -> str:
         """Get enhanced context for better AI responses"""
@@ -102,7 +119,7 @@ class MemoryOrchestrator:
                 return "\n\n".join(context_parts) + "\n\nUse this context to provide more personalized and relevant responses.\n"
                 
         except Exception as e:
-            print(f"⚠️ Enhanced context retrieval failed: {e}")
+            log.warning(f"⚠️ Enhanced context retrieval failed: {e}")
             
         return ""
 
@@ -133,14 +150,14 @@ class MemoryOrchestrator:
             }
             
         except Exception as e:
-            print(f"❌ Error getting memory summary: {e}")
+            log.error(f"❌ Error getting memory summary: {e}")
             return {"status": "error", "message": str(e)}
 
     async def forget_user_data(self, user_identifier: str):
         """GDPR-compliant data deletion"""
         await self.ensure_enhanced_memory()
         if not self.enhanced_ready:
-            print("⚠️ Enhanced memory not ready for deletion")
+            log.warning("⚠️ Enhanced memory not ready for deletion")
             return
         
         try:
@@ -149,10 +166,10 @@ class MemoryOrchestrator:
                 await conn.execute("DELETE FROM long_term_memories WHERE user_context = $1", user_identifier)
                 await conn.execute("DELETE FROM memory_entities WHERE user_context = $1", user_identifier)
                 
-                print(f"🗑️ Deleted all memory data for user: {user_identifier}")
+                log.info(f"🗑️ Deleted all memory data for user: {user_identifier}")
                 
         except Exception as e:
-            print(f"❌ Error deleting user memory data: {e}")
+            log.error(f"❌ Error deleting user memory data: {e}")
 
 # Global orchestrator instance
 orchestrator = MemoryOrchestrator()
@@ -171,7 +188,7 @@ async def initialize_memory_orchestrator(db_url: str, openai_api_key: str):
     # Ensure orchestrator is ready
     await orchestrator.ensure_enhanced_memory()
     
-    print("🎭 Memory Orchestrator fully initialized!")
+    log.notice("🎭 Memory Orchestrator fully initialized!")
     return orchestrator
 
 
@@ -0,0 +1,395 @@
+"""
+📏 TOKEN-BUDGETED PROMPT ASSEMBLY
+Every section of a turn's prompt gets a token budget:
+- history: newest messages that fit, with old tool output (HTML, CAROUSEL_DATA JSON) compacted
+- summary: rolling summary of the turns that no longer fit (conversation_summaries table)
+- context: enhanced-memory context
+Token counts are cached per text, so re-assembling a warm conversation is cheap.
+Also records cached-token ratio and time-to-first-token per request (PromptCacheMetrics).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic_ai.messages import (
+    ModelMessage, ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+)
+
+from upstream_limits import upstream
+from structured_logging import get_logger
+
+log = get_logger("chat")
+
+HISTORY_TOKENS = int(os.getenv('PROMPT_BUDGET_HISTORY_TOKENS', '4000'))
+MESSAGE_TOKENS = int(os.getenv('PROMPT_BUDGET_MESSAGE_TOKENS', '500'))
+SUMMARY_TOKENS = int(os.getenv('PROMPT_BUDGET_SUMMARY_TOKENS', '300'))
+CONTEXT_TOKENS = int(os.getenv('PROMPT_BUDGET_CONTEXT_TOKENS', '600'))
+MIN_HISTORY_MESSAGES = 2          # always keep the last exchange, even if over budget
+HISTORY_REFILL_RATIO = 0.6        # after a cut, history restarts at this share of its budget
+TRACKED_CONVERSATIONS = 2000
+SUMMARY_MIN_NEW_MESSAGES = 6      # fold dropped turns into the summary in batches
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o-mini')
+
+CAROUSEL_RE = re.compile(r'\*\*CAROUSEL_DATA:\*\*\s*(\{.*\})')
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+# ============================================================================
+# TOKEN COUNTING
+# ============================================================================
+
+_encoding: Any = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """tiktoken encoder, loaded on first use; None → ~4 chars/token estimate"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            _encoding_failed = True
+            log.warning(f"⚠️ tiktoken unavailable, estimating tokens from length: {e}")
+    return _encoding
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Token count of a text (cached - history messages are counted once)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """Trim text to roughly max_tokens"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    return text[:keep].rstrip() + " …[trimmed]"
+
+
+# ============================================================================
+# HISTORY COMPACTION
+# ============================================================================
+
+def _carousel_note(match: "re.Match") -> str:
+    try:
+        products = json.loads(match.group(1)).get('products', [])
+    except (ValueError, AttributeError):
+        return "[product carousel shown]"
+    names = [
+        f"{i}. {p.get('name', '?')} (SKU {p.get('sku', '?')})"
+        for i, p in enumerate(products[:12], 1) if isinstance(p, dict)
+    ]
+    return f"[product carousel shown: {'; '.join(names)}]" if names else "[product carousel shown]"
+
+
+@lru_cache(maxsize=4096)
+def compact_history_text(text: str, max_tokens: int = MESSAGE_TOKENS) -> str:
+    """Past message as the model needs it: carousel JSON → product list, HTML stripped, length capped"""
+    compact = CAROUSEL_RE.sub(_carousel_note, text)
+    if '<' in compact:
+        compact = HTML_TAG_RE.sub(' ', compact)
+        compact = BLANK_LINES_RE.sub('\n\n', compact)
+    return fit_to_budget(compact.strip(), max_tokens)
+
+
+def message_text(message: ModelMessage) -> str:
+    return "\n".join(part.content for part in message.parts if isinstance(getattr(part, 'content', None), str))
+
+
+def message_marker(message: ModelMessage) -> str:
+    """Stable id for a history message (its role + content hash) used to track summary coverage"""
+    role = 'user' if isinstance(message, ModelRequest) else 'assistant'
+    return hashlib.sha1(f"{role}:{message_text(message)}".encode()).hexdigest()
+
+
+def _compacted(message: ModelMessage) -> Tuple[ModelMessage, int]:
+    text = message_text(message)
+    compact = compact_history_text(text)
+    if compact != text:
+        if isinstance(message, ModelRequest):
+            message = ModelRequest(parts=[UserPromptPart(content=compact)])
+        else:
+            message = ModelResponse(parts=[TextPart(content=compact)])
+    return message, count_tokens(compact)
+
+
+# ============================================================================
+# ROLLING SUMMARIES
+# ============================================================================
+
+class RollingSummary:
+    """Summary of a conversation's older turns, up to and including `covers_through`"""
+    def __init__(self, text: str, covers_through: Optional[str]):
+        self.text = text
+        self.covers_through = covers_through
+
+
+class RollingSummaryStore:
+    """Rolling summaries in conversation_summaries (summary_kind='rolling'), cached in process"""
+
+    def __init__(self):
+        self.pool = None
+        # LRU: most recently used conversation last (None = known to have no summary yet)
+        self._summaries: "OrderedDict[str, Optional[RollingSummary]]" = OrderedDict()
+        self._updating: Dict[str, asyncio.Task] = {}
+        self._client = None
+        self.stats = {"loaded": 0, "written": 0, "failures": 0}
+
+    async def init(self, pool):
+        """Add the rolling-summary columns (table is created by the enhanced memory system)"""
+        self.pool = pool
+        if not pool:
+            return
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute("""
+                    ALTER TABLE conversation_summaries
+                    ADD COLUMN IF NOT EXISTS summary_kind TEXT DEFAULT 'insight',
+                    ADD COLUMN IF NOT EXISTS covers_through TEXT
+                """)
+            log.notice("✅ Rolling conversation summaries ready")
+        except Exception as e:
+            self.pool = None
+            log.warning(f"⚠️ conversation_summaries unavailable, rolling summaries kept in process only: {e}")
+
+    async def get(self, conversation_id: str) -> Optional[RollingSummary]:
+        if conversation_id in self._summaries:
+            self._summaries.move_to_end(conversation_id)
+            return self._summaries[conversation_id]
+        summary = None
+        if self.pool:
+            try:
+                async with self.pool.acquire() as conn:
+                    row = await conn.fetchrow("""
+                        SELECT summary_text, covers_through FROM conversation_summaries
+                        WHERE conversation_id = $1 AND summary_kind = 'rolling'
+                        ORDER BY created_at DESC
+                        LIMIT 1
+                    """, conversation_id)
+                if row:
+                    summary = RollingSummary(row['summary_text'], row['covers_through'])
+                    self.stats["loaded"] += 1
+            except Exception as e:
+                log.warning(f"⚠️ Could not load rolling summary: {e}")
+        self._remember(conversation_id, summary)
+        return summary
+
+    def _remember(self, conversation_id: str, summary: Optional[RollingSummary]):
+        self._summaries[conversation_id] = summary
+        self._summaries.move_to_end(conversation_id)
+        while len(self._summaries) > TRACKED_CONVERSATIONS:
+            self._summaries.popitem(last=False)
+
+    def schedule_update(self, conversation_id: str, previous: Optional[RollingSummary],
+                        new_messages: List[ModelMessage]):
+        """Fold newly dropped messages into the summary in the background (one update at a time)"""
+        if conversation_id in self._updating:
+            return
+        task = asyncio.create_task(self._update(conversation_id, previous, new_messages))
+        self._updating[conversation_id] = task
+        task.add_done_callback(lambda _: self._updating.pop(conversation_id, None))
+
+    async def _update(self, conversation_id: str, previous: Optional[RollingSummary],
+                      new_messages: List[ModelMessage]):
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, ModelRequest) else 'Assistant'}: {compact_history_text(message_text(m), 200)}"
+            for m in new_messages
+        )
+        prompt = (
+            "Update the running summary of a furniture-store support conversation.\n"
+            "Keep customer names, phone numbers, emails, customer/order IDs, products and SKUs discussed, "
+            "stated preferences, budgets and open issues. At most 150 words, plain text.\n\n"
+            f"Current summary:\n{previous.text if previous else '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        try:
+            if self._client is None:
+                from openai import AsyncOpenAI
+                self._client = AsyncOpenAI()
+            async with upstream("openai").slot():
+                response = await self._client.chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                )
+            text = (response.choices[0].message.content or "").strip()
+            if not text:
+                return
+            summary = RollingSummary(text, message_marker(new_messages[-1]))
+            self._remember(conversation_id, summary)
+            if self.pool:
+                async with self.pool.acquire() as conn:
+                    await conn.execute("""
+                        INSERT INTO conversation_summaries
+                        (conversation_id, summary_text, summary_kind, covers_through)
+                        VALUES ($1, $2, 'rolling', $3)
+                    """, conversation_id, text, summary.covers_through)
+            self.stats["written"] += 1
+            log.info(f"📝 Rolling summary updated for {conversation_id} (+{len(new_messages)} messages)")
+        except Exception as e:
+            self.stats["failures"] += 1
+            log.warning(f"⚠️ Rolling summary update failed: {e}")
+
+
+# ============================================================================
+# PROMPT CACHE METRICS
+# ============================================================================
+
+class PromptCacheMetrics:
+    """Per-request cached-token ratio and time-to-first-token (last N requests + totals)"""
+
+    def __init__(self, window: int = 200):
+        self.recent: deque = deque(maxlen=window)
+        self.totals = {"requests": 0, "request_tokens": 0, "cached_tokens": 0}
+
+    def record(self, usage: Any, started_at: float, first_token_at: Optional[float], channel: str = "webchat"):
+        """Record one agent run (usage = result.usage(); times from time.monotonic())"""
+        request_tokens = getattr(usage, 'request_tokens', None) or 0
+        cached_tokens = (getattr(usage, 'details', None) or {}).get('cached_tokens', 0)
+        ttft_ms = round((first_token_at - started_at) * 1000) if first_token_at else None
+        ratio = round(cached_tokens / request_tokens, 3) if request_tokens else 0.0
+        self.recent.append({
+            "channel": channel, "request_tokens": request_tokens, "cached_tokens": cached_tokens,
+            "cached_ratio": ratio, "ttft_ms": ttft_ms, "at": time.time(),
+        })
+        self.totals["requests"] += 1
+        self.totals["request_tokens"] += request_tokens
+        self.totals["cached_tokens"] += cached_tokens
+        log.info(f"⏱️ Prompt cache: {cached_tokens}/{request_tokens} tokens cached ({ratio:.0%}), TTFT={ttft_ms}ms")
+
+    def snapshot(self) -> Dict[str, Any]:
+        ttfts = sorted(r["ttft_ms"] for r in self.recent if r["ttft_ms"] is not None)
+        return {
+            **self.totals,
+            "cached_ratio": round(self.totals["cached_tokens"] / self.totals["request_tokens"], 3)
+            if self.totals["request_tokens"] else 0.0,
+            "ttft_p50_ms": ttfts[len(ttfts) // 2] if ttfts else None,
+            "ttft_p95_ms": ttfts[int(len(ttfts) * 0.95)] if ttfts else None,
+            "recent": list(self.recent)[-20:],
+        }
+
+
+prompt_cache_metrics = PromptCacheMetrics()
+
+
+# ============================================================================
+# ASSEMBLER
+# ============================================================================
+
+class AssembledPrompt:
+    """One turn's budgeted prompt pieces"""
+    def __init__(self, message_history: List[ModelMessage], context: str, summary: str, stats: Dict[str, int]):
+        self.message_history = message_history  # static instructions + history (cache-friendly prefix)
+        self.context = context                  # enhanced-memory context (dynamic tail)
+        self.summary = summary                  # rolling summary of older turns (dynamic tail)
+        self.stats = stats
+
+
+class PromptAssembler:
+    """
+    Builds each turn's message history and context within the per-section budgets.
+
+    Layout for provider prompt caching: [static instructions][history][dynamic tail]. The instructions
+    are byte-identical on every request and history only grows, except when the budget forces a cut.
+    Cuts drop down to HISTORY_REFILL_RATIO of the budget and then stay put until it fills again,
+    so the cached prefix survives many turns instead of shifting every turn.
+    """
+
+    def __init__(self, system_prompt: str, system_prompt_in_history: bool):
+        """
+        Args:
+            system_prompt: The agent's static instructions (counted in the stats)
+            system_prompt_in_history: Put the system prompt at the head of the history. Needed when the
+                agent uses `system_prompt=`, which PydanticAI only sends when the history is empty.
+        """
+        self.system_prompt = system_prompt
+        self.system_prompt_in_history = system_prompt_in_history
+        self.summaries = RollingSummaryStore()
+        self._cuts: "OrderedDict[str, str]" = OrderedDict()  # conversation_id → marker of first kept message
+        self.last_stats: Dict[str, int] = {}
+
+    async def assemble(self, conversation_id: str, history: List[ModelMessage], context: str = "") -> AssembledPrompt:
+        compacted = [_compacted(message) for message in history]
+        cut = self._cut_index(conversation_id, history, [tokens for _, tokens in compacted])
+        kept = [message for message, _ in compacted[cut:]]
+        history_tokens = sum(tokens for _, tokens in compacted[cut:])
+        dropped = history[:cut]
+
+        summary = await self.summaries.get(conversation_id) if dropped else None
+        if dropped:
+            self._maybe_roll_summary(conversation_id, summary, dropped)
+        summary_text = fit_to_budget(summary.text, SUMMARY_TOKENS) if summary else ""
+
+        messages: List[ModelMessage] = kept
+        if self.system_prompt_in_history:
+            messages = [ModelRequest(parts=[SystemPromptPart(content=self.system_prompt)])] + kept
+
+        context = fit_to_budget(context, CONTEXT_TOKENS) if context else ""
+        stats = {
+            "system_tokens": count_tokens(self.system_prompt),
+            "summary_tokens": count_tokens(summary_text),
+            "history_tokens": history_tokens,
+            "history_messages": len(kept),
+            "dropped_messages": len(dropped),
+            "context_tokens": count_tokens(context),
+        }
+        self.last_stats = stats
+        log.info(f"📏 Prompt budget: system={stats['system_tokens']} summary={stats['summary_tokens']} "
+                 f"history={history_tokens}/{HISTORY_TOKENS} ({len(kept)} kept, {len(dropped)} dropped) "
+                 f"context={stats['context_tokens']}")
+        return AssembledPrompt(messages, context, summary_text, stats)
+
+    def _cut_index(self, conversation_id: str, history: List[ModelMessage], tokens: List[int]) -> int:
+        """Index of the first history message to send"""
+        previous = self._cuts.get(conversation_id)
+        if previous:
+            markers = [message_marker(m) for m in history]
+            if previous in markers:
+                cut = markers.index(previous)
+                if sum(tokens[cut:]) <= HISTORY_TOKENS:
+                    self._cuts.move_to_end(conversation_id)
+                    return cut
+
+        if sum(tokens) <= HISTORY_TOKENS:
+            self._cuts.pop(conversation_id, None)
+            return 0
+
+        # Over budget: refill only to HISTORY_REFILL_RATIO so the next turns append behind a stable cut
+        target = HISTORY_TOKENS * HISTORY_REFILL_RATIO
+        cut, used = len(history), 0
+        while cut > 0 and (len(history) - cut < MIN_HISTORY_MESSAGES or used + tokens[cut - 1] <= target):
+            cut -= 1
+            used += tokens[cut]
+        if cut > 0:
+            self._cuts[conversation_id] = message_marker(history[cut])
+            self._cuts.move_to_end(conversation_id)
+            while len(self._cuts) > TRACKED_CONVERSATIONS:
+                self._cuts.popitem(last=False)
+        return cut
+
+    def _maybe_roll_summary(self, conversation_id: str, summary: Optional[RollingSummary],
+                            dropped: List[ModelMessage]):
+        markers = [message_marker(m) for m in dropped]
+        if summary and summary.covers_through in markers:
+            unsummarized = dropped[markers.index(summary.covers_through) + 1:]
+        else:
+            # No summary yet, or it covers turns older than this history window
+            unsummarized = dropped
+        if len(unsummarized) >= SUMMARY_MIN_NEW_MESSAGES:
+            self.summaries.schedule_update(conversation_id, summary, unsummarized)
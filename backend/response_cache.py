@@ -0,0 +1,205 @@
+"""
+💬 RESPONSE CACHE FOR GENERAL QUESTIONS
+Store hours, directions, financing, delivery and return policies are asked over
+and over and don't depend on who is asking. Their answers are cached in front of the
+agent with two tiers:
+
+- exact: normalized message text → answer
+- semantic: MiniLM embedding (the enhanced memory encoder) with cosine
+  similarity above a threshold
+
+Only turns without personal context are looked up, and only answers written
+without calling a tool are stored: a tool result (products, stock, prices)
+can go stale, and the product cards it sent aren't part of the text. Entries expire
+after a TTL and are dropped when the cache version (prompt, model, tools,
+RESPONSE_CACHE_VERSION) changes or the cache is invalidated.
+"""
+
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from structured_logging import get_logger
+
+log = get_logger("chat")
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+
+# FAQs whose answer is the same for every shopper (not catalog questions: brands, colors, products)
+CACHEABLE_TOPICS = re.compile(
+    r"\b(hours|what time do you (open|close)|are you open|open (today|tomorrow|late|on \w+days?)|closing time|"
+    r"directions?|where are you( located)?|address|financing|payment plans?|"
+    r"delivery (fee|cost|area|options?)|do you deliver|return policy|warranty policy|"
+    r"phone number|contact (you|us|the store))\b"
+)
+# Anything about the asker makes the turn personal
+PERSONAL_RE = re.compile(r"\b(my|mine|order|orders|account)\b|@|\d{3}[-.\s]?\d{3}[-.\s]?\d{4}")
+# Answers that shouldn't be replayed
+UNCACHEABLE_ANSWER_RE = re.compile(r"❌|⚠️|error|try again", re.IGNORECASE)
+
+
+def normalize_question(message: str) -> str:
+    """Lowercase, punctuation-free, single-spaced text used as the exact-match key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+
+
+@dataclass
+class CachedAnswer:
+    """One cached answer"""
+    question: str
+    text: str
+    version: str
+    created_at: float
+    embedding: Any = None   # unit-length numpy vector when the encoder is available
+    hits: int = 0
+
+
+class ResponseCache:
+    """Exact + semantic cache of answers to non-personal questions"""
+
+    def __init__(self, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.version = os.getenv("RESPONSE_CACHE_VERSION", "1")
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._embed: Optional[Callable[[str], Awaitable[List[float]]]] = None
+        self._matrix = None          # stacked embeddings of _matrix_keys, rebuilt when entries change
+        self._matrix_keys: List[str] = []
+        self.stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "stored": 0,
+                      "expired": 0, "invalidations": 0}
+        print("💬 ResponseCache initialized")
+
+    def attach_encoder(self, embed: Callable[[str], Awaitable[List[float]]]):
+        """Enable the semantic tier with an async text → embedding function"""
+        self._embed = embed
+        print("💬 Response cache semantic tier enabled")
+
+    def set_version(self, *parts: str):
+        """Version from everything that shapes an answer; entries from another version never match"""
+        digest = hashlib.sha1("\x1f".join([os.getenv("RESPONSE_CACHE_VERSION", "1"), *parts]).encode()).hexdigest()[:12]
+        if digest != self.version:
+            self.version = digest
+            self.invalidate()
+
+    def invalidate(self) -> int:
+        """Drop every entry; returns how many were dropped"""
+        dropped = len(self._entries)
+        self._entries.clear()
+        self._matrix = None
+        self.stats["invalidations"] += 1
+        return dropped
+
+    def is_cacheable(self, message: str) -> bool:
+        """A general question with nothing about the asker in it"""
+        text = message.lower()
+        return (RESPONSE_CACHE_ENABLED and len(text) <= 300
+                and bool(CACHEABLE_TOPICS.search(text)) and not PERSONAL_RE.search(text))
+
+    async def get(self, message: str) -> Optional[Tuple[str, str]]:
+        """(answer, tier) for a cacheable question, or None"""
+        self.stats["lookups"] += 1
+        key = normalize_question(message)
+        entry = self._entries.get(key)
+        if entry and self._fresh(key, entry):
+            return self._hit(key, entry, "exact")
+
+        if self._embed and self._entries:
+            try:
+                vector = self._unit(await self._embed(message))
+                match = self._nearest(vector)
+                if match:
+                    match_key, score = match
+                    entry = self._entries[match_key]
+                    if self._fresh(match_key, entry):
+                        log.info(f"💬 Semantic cache match ({score:.3f}): '{message[:40]}' ≈ '{entry.question[:40]}'")
+                        return self._hit(match_key, entry, "semantic")
+            except Exception as e:
+                log.warning(f"⚠️ Semantic cache lookup failed: {e}")
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, message: str, answer: str):
+        """Cache the answer to a cacheable question"""
+        if not answer or UNCACHEABLE_ANSWER_RE.search(answer):
+            return
+        embedding = None
+        if self._embed:
+            try:
+                embedding = self._unit(await self._embed(message))
+            except Exception as e:
+                log.warning(f"⚠️ Could not embed cached question: {e}")
+        key = normalize_question(message)
+        self._entries[key] = CachedAnswer(message, answer, self.version, time.monotonic(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+        self.stats["stored"] += 1
+
+    def _fresh(self, key: str, entry: CachedAnswer) -> bool:
+        if entry.version == self.version and time.monotonic() - entry.created_at < self.ttl_seconds:
+            return True
+        del self._entries[key]
+        self._matrix = None
+        self.stats["expired"] += 1
+        return False
+
+    def _hit(self, key: str, entry: CachedAnswer, tier: str) -> Tuple[str, str]:
+        entry.hits += 1
+        self._entries.move_to_end(key)
+        self.stats[f"{tier}_hits"] += 1
+        return entry.text, tier
+
+    def _nearest(self, vector) -> Optional[Tuple[str, float]]:
+        import numpy as np   # present whenever the encoder is
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry.embedding is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[key].embedding for key in self._matrix_keys])
+        scores = self._matrix @ vector
+        best = int(scores.argmax())
+        if scores[best] < self.similarity:
+            return None
+        return self._matrix_keys[best], float(scores[best])
+
+    @staticmethod
+    def _unit(vector):
+        import numpy as np
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / self.stats["lookups"], 3) if self.stats["lookups"] else 0.0,
+            "semantic": self._embed is not None,
+            "version": self.version,
+        }
+
+
+def cached_answer_chunks(text: str, words_per_chunk: int = 6) -> List[str]:
+    """Split a cached answer into delta-sized pieces for streaming"""
+    words = re.split(r"(\s+)", text)
+    chunks = []
+    for i in range(0, len(words), words_per_chunk * 2):
+        chunks.append("".join(words[i:i + words_per_chunk * 2]))
+    return chunks
+
+
+# Global instance
+response_cache = ResponseCache()
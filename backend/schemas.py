@@ -26,9 +26,12 @@ class ChatRequest(BaseModel):
     loft_id: Optional[str] = Field(default=None, description="LOFT customer ID from URL parameters")
     email: Optional[str] = Field(default=None, description="Customer email from URL parameters (authenticated user)")
     auth_level: Optional[str] = Field(default="anonymous", description="Authentication level: anonymous, authenticated, admin")
+    admin_mode: Optional[bool] = Field(default=False, description="Admin console: look up any customer, never link typed identifiers")
+    user_type: Optional[str] = Field(default=None, description="User type: customer or admin")
 
 class ChatResponse(BaseModel):
     """Chat response model"""
     choices: List[Dict[str, Any]] = Field(..., description="Response choices")
     model: str = Field(..., description="Model used")
     usage: Optional[Dict[str, int]] = None
+    session_id: Optional[str] = Field(default=None, description="Session ID to send back on the next turn")
@@ -0,0 +1,162 @@
+"""
+🔮 SPECULATIVE TOOL EXECUTION
+When a message contains a phone number, email or SKU, the agent's first tool
+call is nearly always the matching lookup, but only after a full model
+round-trip. chat_completions starts those lookups as soon as the message
+arrives, concurrently with the LLM request:
+
+    speculation = TurnSpeculation()
+    speculation.start_from_message(user_message, TOOL_FUNCTIONS, DirectToolContext(turn_deps))
+    turn_deps.speculation = speculation
+    ...
+    speculation.finish()    # cancels whatever the agent didn't use
+
+Tools registered through speculative_tool() look at ctx.deps.speculation: a
+call with the same arguments awaits the lookup that is already running
+instead of starting its own.
+"""
+
+import asyncio
+import functools
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from structured_logging import get_logger
+from tool_routing import EMAIL_RE, PHONE_RE
+
+log = get_logger("tool")
+
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+# Safety net for turns that end on a path that doesn't call finish()
+SPECULATION_TTL_SECONDS = float(os.getenv("SPECULATION_TTL_SECONDS", "60"))
+MAX_SPECULATIONS_PER_TURN = 3
+
+SKU_RE = re.compile(r"\bsku\s*[:#]?\s*([A-Za-z0-9][A-Za-z0-9-]{4,})", re.IGNORECASE)
+
+# (regex, tool, argument name): what the agent would call for each identifier
+SPECULATIVE_LOOKUPS = [
+    (PHONE_RE, "get_customer_by_phone", "phone"),
+    (EMAIL_RE, "get_customer_by_email", "email"),
+    (SKU_RE, "get_magento_product_by_sku", "sku"),
+]
+
+
+def detect_lookups(message: str) -> List[Tuple[str, Dict[str, str]]]:
+    """(tool name, arguments) for each identifier in the message, in order, without duplicates"""
+    lookups = []
+    for pattern, tool_name, argument in SPECULATIVE_LOOKUPS:
+        for match in pattern.finditer(message):
+            value = match.group(match.lastindex or 0).strip()
+            lookup = (tool_name, {argument: value})
+            if lookup not in lookups:
+                lookups.append(lookup)
+    return lookups[:MAX_SPECULATIONS_PER_TURN]
+
+
+def _key(tool_name: str, arguments: Dict[str, Any]) -> Tuple:
+    return tool_name, tuple(sorted((name, str(value).strip()) for name, value in arguments.items()))
+
+
+class SpeculationStats:
+    """Process-wide counters: how much speculative work the agent actually used"""
+
+    def __init__(self):
+        self.started = 0
+        self.hits = 0           # agent calls answered by a speculative lookup
+        self.cancelled = 0      # unused and still running at the end of the turn
+        self.wasted = 0         # unused but already finished
+        self.saved_ms = 0.0     # lookup time already spent when the agent asked for it
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "cancelled": self.cancelled,
+            "wasted": self.wasted,
+            "hit_rate": round(self.hits / self.started, 3) if self.started else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+            "enabled": SPECULATION_ENABLED,
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+class TurnSpeculation:
+    """Speculative lookups of one turn, keyed by (tool, arguments)"""
+
+    def __init__(self):
+        self._tasks: Dict[Tuple, asyncio.Task] = {}
+        self._started_at: Dict[Tuple, float] = {}
+        self._claimed: set = set()
+        self._expiry: Optional[asyncio.TimerHandle] = None
+
+    def start(self, tool_name: str, func: Callable, ctx: Any, arguments: Dict[str, Any]):
+        key = _key(tool_name, arguments)
+        if key in self._tasks:
+            return
+        self._tasks[key] = asyncio.create_task(func(ctx, **arguments))
+        self._started_at[key] = time.monotonic()
+        speculation_stats.started += 1
+        log.info(f"🔮 Speculating {tool_name}({', '.join(map(str, arguments.values()))})")
+        if self._expiry is None:
+            self._expiry = asyncio.get_running_loop().call_later(SPECULATION_TTL_SECONDS, self.finish)
+
+    def start_from_message(self, message: str, tool_functions: Dict[str, Callable], ctx: Any) -> int:
+        """Start the lookups for every identifier in the message; returns how many started"""
+        if not SPECULATION_ENABLED:
+            return 0
+        started = 0
+        for tool_name, arguments in detect_lookups(message):
+            func = tool_functions.get(tool_name)
+            if func is not None:
+                self.start(tool_name, func, ctx, arguments)
+                started += 1
+        return started
+
+    def claim(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """The running lookup for this exact call, if one was speculated"""
+        key = _key(tool_name, arguments)
+        task = self._tasks.get(key)
+        if task is None or key in self._claimed or task.cancelled():
+            return None
+        self._claimed.add(key)
+        speculation_stats.hits += 1
+        speculation_stats.saved_ms += (time.monotonic() - self._started_at[key]) * 1000
+        return task
+
+    def finish(self):
+        """Cancel (or count as wasted) every lookup the agent didn't use"""
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        for key, task in self._tasks.items():
+            if key in self._claimed:
+                continue
+            if task.done():
+                speculation_stats.wasted += 1
+                if not task.cancelled():
+                    task.exception()   # retrieved, so a failed lookup isn't reported as never awaited
+            else:
+                task.cancel()
+                speculation_stats.cancelled += 1
+        self._tasks.clear()
+
+
+def speculative_tool(func):
+    """Wrap a tool so a call matching a speculative lookup reuses it"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        speculation = getattr(getattr(ctx, "deps", None), "speculation", None)
+        if speculation is not None and not args:
+            task = speculation.claim(name, kwargs)
+            if task is not None:
+                log.info(f"🔮 Speculation hit: {name}")
+                return await task
+        return await func(ctx, *args, **kwargs)
+
+    return wrapper
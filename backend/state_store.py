@@ -0,0 +1,374 @@
+"""
+🗄️ SHARED STATE STORE
+Conversation state that must survive from one request to the next
+(product_context searches, user_contexts, active_chains) lives behind this
+store instead of module-level dicts, with a TTL and a size bound.
+
+Backends (STATE_STORE):
+- memory (default): in-process dicts
+- postgres: UNLOGGED table chatbot_state on the conversation memory pool,
+  which survives restarts and deploys. UNLOGGED skips the WAL; the state is
+  short-lived and can be lost on a database crash.
+
+Several workers (WEB_CONCURRENCY > 1) need the postgres backend: conversation
+ids and the version tokens that keep each worker's history cache and identity
+links current live here, and with a shared backend messages are written
+through instead of queued (see conversation_memory.py).
+
+Values are JSON-compatible dicts/lists with a per-namespace TTL:
+
+    searches = state_store.namespace("product_context", ttl_seconds=1800)
+    await searches.set(user_identifier, [...])
+    await searches.get(user_identifier)
+
+Version tokens for per-worker caches: bump() atomically moves a key to its
+next version and reports the one it replaced, so a worker whose cached copy
+was at that previous version knows nobody else changed it in between:
+
+    previous, version = await versions.bump(conversation_id)
+
+A namespace with an encode function stores live objects instead: the
+in-process backend keeps them as they are (no rebuild per read), and only a
+serializing backend stores encode(value). Readers then get either the live
+value or its encoded form and convert the part they need.
+"""
+
+import heapq
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from structured_logging import get_logger
+
+log = get_logger("db")
+
+STATE_STORE = os.getenv("STATE_STORE", "memory").lower()
+# Expired rows are deleted every N writes (reads already ignore them)
+STATE_PURGE_EVERY_WRITES = int(os.getenv("STATE_PURGE_EVERY_WRITES", "500"))
+# In-process backend: entries across all namespaces before the least recently used is evicted
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "20000"))
+
+
+class StateBackend:
+    """Key-value storage with expiry, grouped by namespace"""
+
+    name = "base"
+    serializes = False   # values go through JSON (namespaces encode live objects first)
+    shared = False       # every worker sees the same values
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        raise NotImplementedError
+
+    async def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    async def bump(self, namespace: str, key: str, ttl_seconds: float) -> Tuple[Optional[int], int]:
+        """Atomically set key to its next version; returns (previous, new), previous None if absent or expired"""
+        raise NotImplementedError
+
+    async def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    def size(self) -> Dict[str, int]:
+        return {}
+
+    def gauges(self) -> Dict[str, Any]:
+        return {}
+
+
+class _Entry:
+    __slots__ = ("expires_at", "value", "size")
+
+    def __init__(self, expires_at: float, value: Any, size: int):
+        self.expires_at = expires_at
+        self.value = value
+        self.size = size
+
+
+def _fresh_version() -> int:
+    """First version of a key: microseconds since the epoch, so it is above anything an expired counter reached"""
+    return int(time.time() * 1_000_000)
+
+
+def _approx_size(value: Any) -> int:
+    """Approximate bytes held by a JSON-compatible value"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(key) + _approx_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_approx_size(item) for item in value)
+    return size
+
+
+class InProcessBackend(StateBackend):
+    """
+    Dicts in this process (one worker only), bounded so long-running replicas
+    don't grow:
+    - one LRU order across all namespaces, capped at STATE_MAX_ENTRIES
+    - expiry through a lazy-deletion heap of (expires_at, namespace, key):
+      rewriting a key leaves its old heap item behind, and that item is
+      skipped when it comes up because the entry's expires_at no longer matches
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = STATE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()   # LRU order, oldest first
+        self._expiry_heap: List[Tuple[float, str, str]] = []
+        self._counts: Dict[str, int] = {}   # namespace → entries
+        self._bytes = 0
+        self._lock = Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry.value
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._store(namespace, key, value, now + ttl_seconds)
+
+    async def bump(self, namespace: str, key: str, ttl_seconds: float) -> Tuple[Optional[int], int]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get((namespace, key))
+            previous = entry.value if entry is not None else None
+            version = previous + 1 if previous is not None else _fresh_version()
+            self._store(namespace, key, version, now + ttl_seconds)
+        return previous, version
+
+    def _store(self, namespace: str, key: str, value: Any, expires_at: float):
+        entry = _Entry(expires_at, value, _approx_size(value))
+        self._discard((namespace, key))
+        self._entries[(namespace, key)] = entry
+        self._counts[namespace] = self._counts.get(namespace, 0) + 1
+        self._bytes += entry.size
+        heapq.heappush(self._expiry_heap, (entry.expires_at, namespace, key))
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+            self.evicted += 1
+        # Too many stale heap items (keys rewritten many times): rebuild from live entries
+        if len(self._expiry_heap) > 2 * len(self._entries) + 1024:
+            self._expiry_heap = [(entry.expires_at, ns, k) for (ns, k), entry in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+    async def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._discard((namespace, key))
+
+    async def purge_expired(self) -> int:
+        with self._lock:
+            return self._expire(time.monotonic())
+
+    def _expire(self, now: float) -> int:
+        heap = self._expiry_heap
+        purged = 0
+        while heap and heap[0][0] <= now:
+            expires_at, namespace, key = heapq.heappop(heap)
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry.expires_at == expires_at:
+                self._discard((namespace, key))
+                purged += 1
+        self.expired += purged
+        return purged
+
+    def _discard(self, entry_key: Tuple[str, str]):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._counts[entry_key[0]] -= 1
+            self._bytes -= entry.size
+
+    def size(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def gauges(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "approx_bytes": self._bytes,
+            "expiry_heap": len(self._expiry_heap),
+            "expired": self.expired,
+            "evicted_lru": self.evicted,
+        }
+
+
+class PostgresBackend(StateBackend):
+    """UNLOGGED Postgres table shared by every worker and replica"""
+
+    name = "postgres"
+    serializes = True
+    shared = True
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._writes = 0
+
+    async def init(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS chatbot_state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value JSONB NOT NULL,
+                    expires_at TIMESTAMPTZ NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                );
+            """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_chatbot_state_expires ON chatbot_state(expires_at);")
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        async with self.pool.acquire() as conn:
+            value = await conn.fetchval("""
+                SELECT value FROM chatbot_state
+                WHERE namespace = $1 AND key = $2 AND expires_at > NOW()
+            """, namespace, key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO chatbot_state (namespace, key, value, expires_at)
+                VALUES ($1, $2, $3::jsonb, NOW() + make_interval(secs => $4))
+                ON CONFLICT (namespace, key) DO UPDATE
+                SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+            """, namespace, key, json.dumps(value, default=str), float(ttl_seconds))
+        self._writes += 1
+        if self._writes % STATE_PURGE_EVERY_WRITES == 0:
+            await self.purge_expired()
+
+    async def delete(self, namespace: str, key: str):
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM chatbot_state WHERE namespace = $1 AND key = $2", namespace, key)
+
+    async def bump(self, namespace: str, key: str, ttl_seconds: float) -> Tuple[Optional[int], int]:
+        fresh = _fresh_version()
+        async with self.pool.acquire() as conn:
+            # The row lock of ON CONFLICT DO UPDATE serializes concurrent bumps of one key
+            version = await conn.fetchval("""
+                INSERT INTO chatbot_state (namespace, key, value, expires_at)
+                VALUES ($1, $2, to_jsonb($3::bigint), NOW() + make_interval(secs => $4))
+                ON CONFLICT (namespace, key) DO UPDATE
+                SET value = CASE WHEN chatbot_state.expires_at > NOW()
+                                 THEN to_jsonb((chatbot_state.value #>> '{}')::bigint + 1)
+                                 ELSE EXCLUDED.value END,
+                    expires_at = EXCLUDED.expires_at
+                RETURNING (value #>> '{}')::bigint
+            """, namespace, key, fresh, float(ttl_seconds))
+        return (None if version == fresh else version - 1), version
+
+    async def purge_expired(self) -> int:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("DELETE FROM chatbot_state WHERE expires_at <= NOW()")
+        return int(result.split()[-1]) if result else 0
+
+
+class StateNamespace:
+    """One store (product_context, user_contexts, ...) with its TTL"""
+
+    def __init__(self, store: "StateStore", name: str, ttl_seconds: float,
+                 encode: Optional[Callable[[Any], Any]] = None):
+        self.store = store
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.encode = encode
+        self.stats = {"gets": 0, "hits": 0, "sets": 0, "deletes": 0, "bumps": 0, "errors": 0}
+
+    async def get(self, key: str) -> Optional[Any]:
+        self.stats["gets"] += 1
+        try:
+            value = await self.store.backend.get(self.name, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"⚠️ State read failed ({self.name}/{key}): {e}")
+            return None
+        if value is not None:
+            self.stats["hits"] += 1
+        return value
+
+    async def set(self, key: str, value: Any):
+        self.stats["sets"] += 1
+        try:
+            backend = self.store.backend
+            if self.encode is not None and backend.serializes:
+                value = self.encode(value)
+            await backend.set(self.name, key, value, self.ttl_seconds)
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"⚠️ State write failed ({self.name}/{key}): {e}")
+
+    async def delete(self, key: str):
+        self.stats["deletes"] += 1
+        try:
+            await self.store.backend.delete(self.name, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"⚠️ State delete failed ({self.name}/{key}): {e}")
+
+    async def bump(self, key: str) -> Tuple[Optional[int], Optional[int]]:
+        """(previous version, new version) of key; previous is None for a new key, both are None if the store failed"""
+        self.stats["bumps"] += 1
+        try:
+            return await self.store.backend.bump(self.name, key, self.ttl_seconds)
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"⚠️ State bump failed ({self.name}/{key}): {e}")
+            return None, None
+
+
+class StateStore:
+    """The configured backend plus the namespaces that use it"""
+
+    def __init__(self):
+        self.backend: StateBackend = InProcessBackend()
+        self.namespaces: Dict[str, StateNamespace] = {}
+        print(f"🗄️ StateStore initialized (STATE_STORE={STATE_STORE})")
+
+    def namespace(self, name: str, ttl_seconds: float,
+                  encode: Optional[Callable[[Any], Any]] = None) -> StateNamespace:
+        if name not in self.namespaces:
+            self.namespaces[name] = StateNamespace(self, name, ttl_seconds, encode)
+        return self.namespaces[name]
+
+    async def init(self, pool):
+        """Switch to the shared backend when STATE_STORE=postgres and the pool is up"""
+        if STATE_STORE != "postgres":
+            return
+        if not pool:
+            print("⚠️ STATE_STORE=postgres but no database pool, keeping in-process state (one worker only)")
+            return
+        try:
+            backend = PostgresBackend(pool)
+            await backend.init()
+            self.backend = backend
+            print("✅ Shared state store: Postgres (chatbot_state, UNLOGGED)")
+        except Exception as e:
+            print(f"⚠️ Shared state table unavailable, keeping in-process state: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "sizes": self.backend.size(),
+            "memory": self.backend.gauges(),
+            "namespaces": {name: dict(ns.stats, ttl_seconds=ns.ttl_seconds) for name, ns in self.namespaces.items()},
+        }
+
+
+# Global instance
+state_store = StateStore()
@@ -0,0 +1,103 @@
+"""
+🧽 HTML SANITIZING FOR STREAMED TEXT
+strip_html_for_streaming() cleans one complete string. StreamingHTMLSanitizer
+does the same to a stream of deltas: a tag or entity split across deltas
+(`<div cla` + `ss="x">`, `&am` + `p;`) is carried to the next delta instead of
+leaking, and every character is scanned once.
+
+Usage:
+    sanitizer = StreamingHTMLSanitizer()
+    async for delta in result.stream_text(delta=True):
+        yield sanitizer.feed(delta)
+    yield sanitizer.finish()
+"""
+
+import re
+
+TAG_RE = re.compile(r'<[^>]+>')
+ENTITY_RE = re.compile(r'&(?:lt|gt|amp);')
+ENTITIES = {'&lt;': '<', '&gt;': '>', '&amp;': '&'}
+ENTITY_PREFIXES = {entity[:i] for entity in ENTITIES for i in range(1, len(entity))}
+
+# A '<' with no '>' within this many characters is plain text ("under <$500"),
+# not a tag, so it can't hold back the rest of the answer
+MAX_TAG_CHARS = 256
+
+
+def strip_html_for_streaming(text):
+    """Strip HTML tags from streaming text to match frontend pattern expectations"""
+    if not text:
+        return text
+    # Remove HTML tags but preserve content
+    clean_text = TAG_RE.sub('', text)
+    # Convert HTML entities back to text
+    clean_text = clean_text.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+    return clean_text
+
+
+class StreamingHTMLSanitizer:
+    """Incremental strip_html_for_streaming: same output for the concatenated stream"""
+
+    __slots__ = ("_tag", "_entity")
+
+    def __init__(self):
+        self._tag = None    # text of an open tag (starting with '<') while inside one
+        self._entity = ""   # trailing '&', '&l', '&am', ... that may become an entity
+
+    def feed(self, delta: str) -> str:
+        """Clean the next delta; returns what can be sent to the client now"""
+        # Fast paths: plain text, or more of an open tag
+        if self._tag is None:
+            if not self._entity and '<' not in delta and '&' not in delta:
+                return delta
+        elif '>' not in delta:
+            self._tag += delta
+            return self._release_tag() if len(self._tag) > MAX_TAG_CHARS else ''
+
+        out = ''
+        if self._tag is not None:
+            end = delta.index('>')
+            if self._tag == '<' and end == 0:
+                out = self._text('<>')   # '<>' isn't a tag
+            self._tag = None
+            delta = delta[end + 1:]
+
+        # A '<' after the last '>' opens a tag that closes in a later delta; every
+        # tag before it is complete, so one regex pass removes them
+        open_at = delta.find('<', delta.rfind('>') + 1)
+        if open_at != -1:
+            self._tag = delta[open_at:]
+            delta = delta[:open_at]
+        out += self._text(TAG_RE.sub('', delta) if '<' in delta else delta)
+        if self._tag is not None and len(self._tag) > MAX_TAG_CHARS:
+            out += self._release_tag()
+        return out
+
+    def finish(self) -> str:
+        """Flush whatever is still held back (an unterminated tag or entity is plain text)"""
+        out = []
+        while self._tag is not None:
+            out.append(self._release_tag())
+        out.append(self._text('', final=True))
+        return ''.join(out)
+
+    def _release_tag(self) -> str:
+        # Not a tag after all: its '<' is text and the rest is scanned again
+        rest = self._tag[1:]
+        self._tag = None
+        return self._text('<') + self.feed(rest)
+
+    def _text(self, text: str, final: bool = False) -> str:
+        if not self._entity and '&' not in text:
+            return text
+        if self._entity:
+            text = self._entity + text
+            self._entity = ""
+        if not final:
+            amp = text.rfind('&', max(0, len(text) - 4))
+            if amp != -1 and text[amp:] in ENTITY_PREFIXES:
+                self._entity = text[amp:]
+                text = text[:amp]
+        if '&' not in text:
+            return text
+        return ENTITY_RE.sub(lambda match: ENTITIES[match.group()], text)
@@ -0,0 +1,222 @@
+"""
+📝 STRUCTURED, SAMPLED, NON-BLOCKING LOGGING
+Hot paths log through category loggers instead of print():
+
+    log = get_logger("chat")
+    log.info("📚 Using historical messages", count=len(history))
+    log.debug("📞 Phone call received", payload=request)
+
+- Levels: LOG_LEVEL (default INFO), plus NOTICE for once-per-process events
+  (startup, shutdown) that must not be sampled away
+- Sampling per category: LOG_SAMPLE_<CATEGORY>=0..1 for DEBUG/INFO records;
+  notices, warnings and errors are always kept
+- Fields are captured with a bounded repr (no full payload is ever rendered)
+  and messages are truncated to LOG_MAX_MESSAGE_CHARS
+- Emails, phone numbers and secrets are redacted (LOG_REDACT=false to disable)
+- Records go through a QueueHandler; formatting, redaction and the stdout
+  write happen on a listener thread, and a full queue drops records instead
+  of blocking the event loop
+- LOG_FORMAT=json emits one JSON object per line, text (default) stays readable
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import reprlib
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "500"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "200"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() == "true"
+
+NOTICE = 25
+logging.addLevelName(NOTICE, "NOTICE")
+
+# Share of DEBUG/INFO records kept per category (override with LOG_SAMPLE_<CATEGORY>)
+DEFAULT_SAMPLE_RATES = {
+    "chat": 1.0,
+    "tool": 1.0,
+    "voice": 1.0,
+    "db": 0.1,
+    "memory": 0.2,
+    "stream": 0.01,
+}
+
+REDACTIONS = [
+    (re.compile(r"(?i)(bearer\s+|(?<![a-z])(?:api[_-]?key|token|password)[\"']?\s*[=:]\s*[\"']?)[\w\-.~+/]{6,}"), r"\1<secret>"),
+    (re.compile(r"sk-[A-Za-z0-9_\-]{10,}"), "<secret>"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+"), "<email>"),
+    (re.compile(r"(?<![\w+])(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)"), "<phone>"),
+]
+
+_field_repr = reprlib.Repr()
+_field_repr.maxstring = LOG_MAX_FIELD_CHARS
+_field_repr.maxother = LOG_MAX_FIELD_CHARS
+_field_repr.maxlist = _field_repr.maxtuple = _field_repr.maxset = 10
+_field_repr.maxdict = 10
+_field_repr.maxlevel = 3
+
+
+def redact(text: str) -> str:
+    """Mask emails, phone numbers and secrets"""
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+class LogStats:
+    """Records kept / sampled out / dropped on a full queue, per category"""
+
+    def __init__(self):
+        self.kept: Dict[str, int] = {}
+        self.sampled_out: Dict[str, int] = {}
+        self.dropped = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"kept": dict(self.kept), "sampled_out": dict(self.sampled_out),
+                "dropped_queue_full": self.dropped, "queue_size": LOG_QUEUE_SIZE}
+
+
+log_stats = LogStats()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every notice/warning/error and a per-category share of DEBUG/INFO"""
+
+    def __init__(self):
+        super().__init__()
+        self.rates = {category: float(os.getenv(f"LOG_SAMPLE_{category.upper()}", rate))
+                      for category, rate in DEFAULT_SAMPLE_RATES.items()}
+
+    def rate(self, category: str) -> float:
+        if category not in self.rates:
+            self.rates[category] = float(os.getenv(f"LOG_SAMPLE_{category.upper()}", "1.0"))
+        return self.rates[category]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", "app")
+        if record.levelno < NOTICE and random.random() >= self.rate(category):
+            log_stats.sampled_out[category] = log_stats.sampled_out.get(category, 0) + 1
+            return False
+        log_stats.kept[category] = log_stats.kept.get(category, 0) + 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that only snapshots the record on the caller's side and never blocks"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Bounded reprs now (fields may be mutated after the call); full formatting on the listener
+        record.msg = record.getMessage() if record.args else str(record.msg)
+        record.args = None
+        fields = getattr(record, "fields", None)
+        record.fields = {key: value if isinstance(value, (int, float, bool)) or value is None
+                         else _field_repr.repr(value) for key, value in fields.items()} if fields else {}
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """Text or JSON lines with truncation and redaction (runs on the listener thread)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = _truncate(str(record.msg), LOG_MAX_MESSAGE_CHARS)
+        fields = getattr(record, "fields", {}) or {}
+        if LOG_REDACT:
+            message = redact(message)
+            fields = {key: redact(value) if isinstance(value, str) else value for key, value in fields.items()}
+        category = getattr(record, "category", "app")
+        if LOG_FORMAT == "json":
+            entry = {"ts": round(record.created, 3), "level": record.levelname.lower(),
+                     "category": category, "msg": message, **fields}
+            if record.exc_text:
+                entry["exc"] = _truncate(record.exc_text, 2000)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        stamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+        line = f"{stamp} {record.levelname:<7} [{category}] {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + _truncate(record.exc_text, 2000)
+        return line
+
+
+class CategoryLogger:
+    """Logger for one category: log.info("message", key=value, ...)"""
+
+    __slots__ = ("category", "_logger")
+
+    def __init__(self, category: str):
+        self.category = category
+        self._logger = logging.getLogger(f"loft.{category}")
+
+    def _log(self, level: int, message: str, fields: Dict[str, Any], exc_info: bool = False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, exc_info=exc_info,
+                             extra={"category": self.category, "fields": fields})
+
+    def debug(self, message: str, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def notice(self, message: str, **fields):
+        self._log(NOTICE, message, fields)
+
+    def warning(self, message: str, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, exc_info: bool = False, **fields):
+        self._log(logging.ERROR, message, fields, exc_info=exc_info)
+
+
+_listener = None
+
+
+def setup_logging():
+    """Route the 'loft' logger through the queue to stdout (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    root = logging.getLogger("loft")
+    root.handlers = [queue_handler]
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+
+
+def get_logger(category: str) -> CategoryLogger:
+    """Category logger ('chat', 'tool', 'voice', 'db', 'memory', 'stream', ...)"""
+    setup_logging()
+    return CategoryLogger(category)
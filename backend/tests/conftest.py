@@ -0,0 +1,63 @@
+"""Unit tests for the backend modules; they import them flat, as main.py does"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_store import InProcessBackend, state_store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_state_store(monkeypatch):
+    """Each test gets an empty in-process state backend (conversation ids, versions, ...)"""
+    monkeypatch.setattr(state_store, "backend", InProcessBackend())
+    return state_store
+
+
+class FakeConnection:
+    """asyncpg connection stand-in: records every call and answers through the pool's handler"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def _call(self, method, query, args):
+        self.pool.calls.append((method, " ".join(query.split()), args))
+        return self.pool.handler(method, query, args)
+
+    async def fetch(self, query, *args):
+        return await self._call("fetch", query, args) or []
+
+    async def fetchrow(self, query, *args):
+        return await self._call("fetchrow", query, args)
+
+    async def fetchval(self, query, *args):
+        return await self._call("fetchval", query, args)
+
+    async def execute(self, query, *args):
+        return await self._call("execute", query, args) or "OK"
+
+    async def executemany(self, query, rows):
+        return await self._call("executemany", query, (list(rows),))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    """asyncpg pool stand-in; handler(method, query, args) returns the result or raises"""
+
+    def __init__(self, handler=None):
+        self.calls = []
+        self.handler = handler or (lambda method, query, args: None)
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self)
+
+    def queries(self, method=None):
+        return [query for called, query, _ in self.calls if method is None or called == method]
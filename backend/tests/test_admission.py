@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+from deadlines import Deadline, current_deadline
+
+
+async def _queue_behind_one_slot(controller, turns):
+    """Queue (name, user, channel) turns while the only slot is held, then release it; returns the admission order"""
+    order = []
+    release = asyncio.Event()
+
+    async def holder():
+        async with controller.admit("holder", "webchat"):
+            await release.wait()
+
+    async def turn(name, user, channel):
+        async with controller.admit(user, channel, max_wait_seconds=5):
+            order.append(name)
+
+    held = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for name, user, channel in turns:
+        tasks.append(asyncio.create_task(turn(name, user, channel)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(held, *tasks)
+    return order
+
+
+def test_round_robin_over_users_within_a_channel():
+    controller = AdmissionController(max_concurrent=1)
+    turns = [("a1", "a", "webchat"), ("a2", "a", "webchat"), ("a3", "a", "webchat"),
+             ("b1", "b", "webchat"), ("c1", "c", "webchat")]
+    # b and c don't wait behind all of a's turns
+    assert asyncio.run(_queue_behind_one_slot(controller, turns)) == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_phone_is_weighted_ahead_of_webchat_without_starving_it():
+    controller = AdmissionController(max_concurrent=1)
+    turns = ([(f"web{i}", f"web{i}", "webchat") for i in range(3)] +
+             [(f"phone{i}", f"phone{i}", "phone") for i in range(6)])
+    order = asyncio.run(_queue_behind_one_slot(controller, turns))
+    # Weight 4:1: four phone turns per webchat turn while both channels wait...
+    assert sum(name.startswith("phone") for name in order[:5]) == 4
+    # ...and webchat still gets slots before the phone queue is drained
+    assert order.index("web0") < max(order.index(f"phone{i}") for i in range(6))
+    assert controller.in_flight == 0
+    assert controller.channels["phone"].admitted == 6
+
+
+def test_sheds_after_the_channel_max_wait():
+    controller = AdmissionController(max_concurrent=1)
+
+    async def run():
+        async with controller.admit("holder", "webchat"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.admit("caller", "phone", max_wait_seconds=0.05):
+                    pass
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.channel == "phone"
+    assert controller.channels["phone"].shed == 1
+    assert controller.channels["phone"].depth == 0
+    assert controller.in_flight == 0
+
+
+def test_wait_is_capped_by_the_turn_deadline():
+    controller = AdmissionController(max_concurrent=1)
+
+    async def run():
+        current_deadline.set(Deadline("phone", 0.2, 0.1))
+        async with controller.admit("holder", "webchat"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.admit("caller", "phone", max_wait_seconds=5):
+                    pass
+        return rejected.value
+
+    assert asyncio.run(run()).waited < 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1)
+
+    async def hang_up():
+        async with controller.admit("gone", "webchat", max_wait_seconds=5):
+            pass
+
+    async def run():
+        async with controller.admit("holder", "webchat"):
+            waiting = asyncio.create_task(hang_up())
+            await asyncio.sleep(0.01)
+            assert controller.channels["webchat"].depth == 1
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            assert controller.channels["webchat"].depth == 0
+
+    asyncio.run(run())
+    assert controller.in_flight == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+import call_ingestion
+from call_ingestion import CallIngestion, transcript_messages
+from conftest import FakePool
+from conversation_memory import memory
+
+TRANSCRIPT = [{"role": "bot", "message": "Thanks for calling LOFT!"}, {"role": "user", "content": "Is the Dakota in stock?"},
+              {"role": "system", "content": "dropped"}, {"role": "user", "content": ""}, "not a line"]
+
+
+def _run(ingestion, until, resolve=None, extract=None, on_failure=None):
+    async def resolve_default(phone):
+        return phone, "conv-1"
+
+    async def run():
+        ingestion.start(resolve or resolve_default, extract, on_failure)
+        ingestion.enqueue("call-1", "+14045551234", transcript_messages(TRANSCRIPT))
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        await ingestion.stop()
+
+    asyncio.run(run())
+
+
+def test_transcript_lines_are_normalized():
+    assert transcript_messages(TRANSCRIPT) == [("assistant", "Thanks for calling LOFT!"),
+                                              ("user", "Is the Dakota in stock?")]
+
+
+def test_whole_transcript_is_inserted_in_one_batch_then_memory_extracted_once(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(memory, "pool", pool)
+    extracted = []
+
+    async def extract(conversation_id, caller_key):
+        extracted.append((conversation_id, caller_key))
+
+    ingestion = CallIngestion()
+    _run(ingestion, lambda: extracted, extract=extract)
+    (method, query, (rows,)), = pool.calls
+    assert method == "executemany" and query.startswith("INSERT INTO chatbot_messages")
+    assert [(row[0], row[1], row[2]) for row in rows] == [("conv-1", "assistant", "Thanks for calling LOFT!"),
+                                                          ("conv-1", "user", "Is the Dakota in stock?")]
+    assert rows[0][3] < rows[1][3]      # the transcript keeps its order
+    assert extracted == [("conv-1", "+14045551234")]
+    assert ingestion.stats["calls"] == 1 and ingestion.stats["messages"] == 2
+
+
+def test_failed_insert_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(call_ingestion, "CALL_INGEST_RETRY_SECONDS", 0.01)
+    attempts = []
+
+    def handler(method, query, args):
+        attempts.append(method)
+        if len(attempts) < 3:
+            raise ConnectionError("database restarting")
+
+    monkeypatch.setattr(memory, "pool", FakePool(handler))
+    ingestion = CallIngestion()
+    _run(ingestion, lambda: ingestion.stats["calls"])
+    assert len(attempts) == 3
+    assert ingestion.stats["retries"] == 2 and ingestion.stats["failures"] == 0 and ingestion.stats["calls"] == 1
+
+
+def test_report_given_up_after_max_attempts_reports_its_call_id(monkeypatch):
+    monkeypatch.setattr(call_ingestion, "CALL_INGEST_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(call_ingestion, "CALL_INGEST_MAX_ATTEMPTS", 2)
+
+    async def resolve(phone):
+        raise ConnectionError("database down")
+
+    given_up = []
+    ingestion = CallIngestion()
+    _run(ingestion, lambda: given_up, resolve=resolve, on_failure=given_up.append)
+    assert given_up == ["call-1"]
+    assert ingestion.stats["retries"] == 1 and ingestion.stats["failures"] == 1
+
+
+def test_failed_memory_extraction_does_not_insert_the_transcript_again(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(memory, "pool", pool)
+    extractions = []
+
+    async def extract(conversation_id, caller_key):
+        extractions.append(conversation_id)
+        raise RuntimeError("embedding API down")
+
+    ingestion = CallIngestion()
+    _run(ingestion, lambda: extractions, extract=extract)
+    assert len(pool.calls) == 1 and ingestion.stats["retries"] == 0
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from context_steps import ContextSteps, step_deadline
+from deadlines import Deadline, current_deadline
+
+
+async def _value(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def _fail():
+    raise ConnectionError("enhanced memory down")
+
+
+def test_steps_run_concurrently():
+    steps = ContextSteps()
+
+    async def run():
+        started = time.monotonic()
+        history = steps.start("history", _value(["m1"], 0.1), fallback=[])
+        context = steps.start("enhanced_context", _value("likes grey", 0.1), fallback="")
+        return await history, await context, time.monotonic() - started
+
+    history, context, elapsed = asyncio.run(run())
+    assert (history, context) == (["m1"], "likes grey")
+    assert elapsed < 0.19
+
+
+def test_slow_or_failing_steps_fall_back_without_raising():
+    steps = ContextSteps()
+
+    async def run():
+        slow = steps.start("enhanced_context", _value("late", 1), fallback="", deadline=0.05)
+        broken = steps.start("history", _fail(), fallback=[])
+        return await slow, await broken
+
+    assert asyncio.run(run()) == ("", [])
+    snapshot = steps.snapshot()
+    assert snapshot["enhanced_context"]["timed_out"] == 1
+    assert snapshot["history"]["failed"] == 1
+
+
+def test_step_never_outlives_the_turn_deadline():
+    steps = ContextSteps()
+
+    async def run():
+        current_deadline.set(Deadline("phone", 0.2, 0.1))
+        started = time.monotonic()
+        result = await steps.start("history", _value(["m1"], 1), fallback=[], deadline=5)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == [] and elapsed < 0.5
+
+
+def test_step_deadlines_are_configurable(monkeypatch):
+    assert step_deadline("history") == 2.0
+    monkeypatch.setenv("CONTEXT_DEADLINE_HISTORY_MS", "350")
+    assert step_deadline("history") == 0.35
+    assert step_deadline("unknown_step") == 1.0
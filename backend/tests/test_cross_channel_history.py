@@ -0,0 +1,46 @@
+import asyncio
+
+from conftest import FakePool
+from conversation_memory import CrossChannelHistory, SimpleMemory
+
+ROWS = [
+    {"conversation_id": "web-1", "role": "user", "content": "Do you have the Dakota sofa in grey?", "platform_type": "webchat"},
+    {"conversation_id": "web-1", "role": "assistant", "content": "Yes, in stock at Acworth.", "platform_type": "webchat"},
+    {"conversation_id": "call-1", "role": "user", "content": "hi this is john", "platform_type": "phone"},
+    {"conversation_id": "call-1", "role": "assistant", "content": "Hi John!", "platform_type": "phone",
+     "executed_function_name": "get_customer_by_phone", "function_input_parameters": '{"phone": "+14045551234"}'},
+    {"conversation_id": "call-1", "role": "system", "content": "not replayed", "platform_type": "phone"},
+]
+
+
+def _text(message):
+    return message.parts[0].content
+
+
+def test_history_is_this_conversations_rows_in_order():
+    history = CrossChannelHistory(ROWS).history("call-1")
+    assert len(history) == 2
+    assert _text(history[0]) == "hi this is john"
+    assert _text(history[1]).startswith("\n\n[Function Call Context: get_customer_by_phone(")
+    assert _text(history[1]).endswith("Hi John!")
+
+
+def test_other_channels_become_one_bounded_context_block():
+    block = CrossChannelHistory(ROWS).other_channels("call-1", max_chars=20)
+    assert block == ("Previous conversation context (other channels):\n"
+                     "[webchat] user: Do you have the Dako\n"
+                     "[webchat] assistant: Yes, in stock at Acw")
+    assert CrossChannelHistory(ROWS).other_channels("call-1", max_messages=1).count("\n[") == 1
+    assert CrossChannelHistory(ROWS[2:]).other_channels("call-1") == ""
+
+
+def test_unified_history_reads_every_linked_identifier_once_newest_window():
+    pool = FakePool(lambda method, query, args: list(reversed(ROWS[:2])) if method == "fetch" else None)
+    memory = SimpleMemory()
+    memory.pool = pool
+    rows = asyncio.run(memory.get_unified_conversation_history(
+        "+14045551234", limit=50, aliases=["+14045551234", "session:web-1"]))
+    assert [row["content"] for row in rows] == [ROWS[0]["content"], ROWS[1]["content"]]
+    (_, query, args), = pool.calls
+    assert "cc.user_identifier = ANY($1::text[])" in query
+    assert args == (["+14045551234", "session:web-1"], 50)
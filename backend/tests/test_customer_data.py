@@ -0,0 +1,90 @@
+import asyncio
+
+import customer_data
+from customer_data import (Customer, OrderDetails, OrderLine, analyze_patterns, classify_identifier,
+                           fetch_order_details_many, load_customer_profile, resolve_customer)
+from deadlines import Deadline, current_deadline
+
+ENTRIES = {
+    ("GetCustomerByPhone", "407-555-0100"): [{"customerid": "1234567890", "firstname": "Jane", "lastname": "Doe",
+                                              "email": "jane@example.com", "address1": "1 Main St",
+                                              "city": "Orlando", "state": "FL", "zipcode": "32801"}],
+    ("GetOrdersByCustomer", "1234567890"): [
+        {"orderid": "A1", "orderstatus": "Delivered", "ordertotal": "1999.99", "orderdate": "2025-01-02"},
+        {"orderid": "A2", "orderstatus": "Open", "ordertotal": None, "orderdate": "2025-02-03"},
+    ],
+    ("GetDetailsByOrder", "A1"): [{"description": "Dakota Sectional", "itemprice": "1799.99"},
+                                  {"description": "3 YEAR BENEFIT PLAN", "itemprice": "199.99"}],
+    ("GetDetailsByOrder", "A2"): [{"description": "Aspen Power Recliner", "itemprice": "x"}],
+}
+
+
+def _fake_loft(monkeypatch, delays=None):
+    calls = []
+
+    async def get_entries(endpoint, params):
+        value = next(iter(params.values()))
+        calls.append((endpoint, value))
+        await asyncio.sleep((delays or {}).get(value, 0))
+        return ENTRIES.get((endpoint, value), [])
+
+    monkeypatch.setattr(customer_data, "_get_entries", get_entries)
+    return calls
+
+
+def test_classify_identifier():
+    assert classify_identifier("jane@example.com") == "email"
+    assert classify_identifier(" 1234567890 ") == "customer_id"
+    assert classify_identifier("407-555-0100") == "phone"
+
+
+def test_records_are_built_from_loft_entries():
+    customer = Customer.from_entry(ENTRIES[("GetCustomerByPhone", "407-555-0100")][0], phone="407-555-0100")
+    assert customer.name == "Jane Doe"
+    assert customer.address == "1 Main St, Orlando, FL"
+    assert customer.phone == "407-555-0100"
+
+
+def test_benefit_plans_are_not_products_and_patterns_use_typed_lines():
+    details = OrderDetails("A1", [OrderLine("Dakota Sectional", 1799.99), OrderLine("3 YEAR BENEFIT PLAN", 199.99),
+                                  OrderLine("", 5.0), OrderLine("Console Table", -10.0)])
+    assert [line.description for line in details.product_lines] == ["Dakota Sectional", "Console Table"]
+    assert details.total == 1799.99
+    patterns = analyze_patterns("1234567890", [], [details])
+    assert patterns.favorite_categories == ["Sectional", "Console"]
+    assert patterns.is_high_value
+
+
+def test_profile_composes_customer_orders_and_details(monkeypatch):
+    calls = _fake_loft(monkeypatch)
+
+    async def run():
+        customer = await resolve_customer("407-555-0100")
+        return await load_customer_profile(customer)
+
+    profile = asyncio.run(run())
+    assert profile.customer.customer_id == "1234567890"
+    assert [order.order_id for order in profile.orders] == ["A1", "A2"]
+    assert profile.orders[1].total == 0.0
+    assert profile.patterns.total_spent == 1799.99
+    assert profile.patterns.favorite_categories == ["Sectional", "Recliner"]
+    assert not profile.partial
+    assert ("GetCustomerByPhone", "407-555-0100") in calls
+
+
+def test_bare_customer_id_skips_the_lookup(monkeypatch):
+    calls = _fake_loft(monkeypatch)
+    customer = asyncio.run(resolve_customer("1234567890"))
+    assert customer.customer_id == "1234567890"
+    assert calls == []
+
+
+def test_order_details_keep_what_finished_before_the_deadline(monkeypatch):
+    _fake_loft(monkeypatch, delays={"A2": 5})
+
+    async def run():
+        current_deadline.set(Deadline("phone", 1.0, 0.5))
+        return await fetch_order_details_many(["A1", "A2"])
+
+    details = asyncio.run(run())
+    assert [order.order_id for order in details] == ["A1"]
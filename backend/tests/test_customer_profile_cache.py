@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from customer_data import Customer, CustomerPatterns, CustomerProfile
+from customer_profile_cache import CustomerProfileCache, normalize_profile_key
+
+
+def _profile(customer_id="1234567890", email="Jane@Example.com", phone="407-555-0100", partial=False):
+    customer = Customer(customer_id=customer_id, first_name="Jane", email=email, phone=phone)
+    return CustomerProfile(customer, [], [], CustomerPatterns(customer_id, 0, 0.0), partial=partial)
+
+
+def _cache_with_loader(fresh_seconds=300, stale_seconds=3600, delay=0.0, profile=None):
+    cache = CustomerProfileCache(fresh_seconds=fresh_seconds, stale_seconds=stale_seconds)
+    calls = []
+
+    async def fetch(identifier, type):
+        calls.append(identifier)
+        await asyncio.sleep(delay)
+        return profile or _profile()
+
+    cache._fetch = fetch
+    return cache, calls
+
+
+def test_keys_are_namespaced_by_identifier_kind():
+    assert normalize_profile_key("(407) 555-0100") == "phone:4075550100"
+    assert normalize_profile_key("+1 407 555 0100", "phone") == "phone:4075550100"
+    assert normalize_profile_key("1234567890") == "customer:1234567890"
+    assert normalize_profile_key("1234567890", "phone") == "phone:1234567890"
+    assert normalize_profile_key("Jane@Example.com") == "email:jane@example.com"
+
+
+def test_any_alias_reaches_the_same_profile():
+    cache, calls = _cache_with_loader()
+
+    async def run():
+        first = await cache.get("407-555-0100")
+        by_email = await cache.get("jane@example.com")
+        by_id = await cache.get("1234567890", "customer_id")
+        return first, by_email, by_id
+
+    first, by_email, by_id = asyncio.run(run())
+    assert first is by_email is by_id
+    assert calls == ["407-555-0100"]
+    assert cache.stats["hits"] == 2
+
+
+def test_invalidation_through_any_alias():
+    cache, calls = _cache_with_loader()
+
+    async def run():
+        await cache.get("407-555-0100")
+        cache.invalidate("JANE@example.com")
+        await cache.get("4075550100")
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats["invalidations"] == 1
+
+
+def test_stale_profile_is_served_and_refreshed_in_the_background():
+    cache, calls = _cache_with_loader(fresh_seconds=0, stale_seconds=3600)
+
+    async def run():
+        first = await cache.get("407-555-0100")
+        stale = await cache.get("407-555-0100")
+        await asyncio.gather(*cache._background_tasks)
+        return first, stale
+
+    first, stale = asyncio.run(run())
+    assert stale is first
+    assert cache.stats["stale_hits"] == 1
+    assert cache.stats["refreshes"] == 1
+    assert len(calls) == 2
+
+
+def test_partial_profiles_are_not_cached():
+    cache, calls = _cache_with_loader(profile=_profile(partial=True))
+
+    async def run():
+        await cache.get("407-555-0100")
+        await cache.get("407-555-0100")
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache, calls = _cache_with_loader(delay=0.02)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("407-555-0100") for _ in range(5)))
+
+    profiles = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(profile is profiles[0] for profile in profiles)
+
+
+def test_cancelled_first_caller_does_not_strand_the_others():
+    cache, calls = _cache_with_loader(delay=0.05)
+
+    async def run():
+        first = asyncio.create_task(cache.get("407-555-0100"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get("407-555-0100"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await asyncio.wait_for(second, timeout=1)
+
+    assert asyncio.run(run()).customer.customer_id == "1234567890"
+    assert calls == ["407-555-0100"]
+    assert not cache._loading
+
+
+def test_failed_load_reaches_every_waiter_and_is_retried():
+    cache = CustomerProfileCache()
+    attempts = []
+
+    async def fetch(identifier, type):
+        attempts.append(identifier)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("LOFT down")
+        return _profile()
+
+    cache._fetch = fetch
+
+    async def run():
+        results = await asyncio.gather(cache.get("407-555-0100"), cache.get("407-555-0100"),
+                                       return_exceptions=True)
+        return results, await cache.get("407-555-0100")
+
+    results, retried = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried.customer.customer_id == "1234567890"
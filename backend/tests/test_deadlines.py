@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from deadlines import (Deadline, DeadlineExceeded, ToolFallbacks, capped_wait, current_deadline, deadline_tool,
+                       tool_fallbacks, upstream_timeout)
+
+
+class _Deps:
+    def __init__(self, user_identifier, seconds=4.0, reserve=1.5):
+        self.user_identifier = user_identifier
+        self.conversation_id = f"conv-{user_identifier}"
+        self.deadline = Deadline("phone", seconds, reserve)
+
+
+class _Ctx:
+    def __init__(self, user_identifier, seconds=4.0, reserve=1.5):
+        self.deps = _Deps(user_identifier, seconds, reserve)
+
+
+def _slow_position_tool():
+    state = {"slow": False}
+
+    @deadline_tool
+    async def get_product_by_position(ctx, position: int = 1):
+        if state["slow"]:
+            await asyncio.sleep(5)
+        return f"#{position} from {ctx.deps.user_identifier}'s last search"
+
+    return get_product_by_position, state
+
+
+def test_timed_out_tool_serves_the_same_users_last_result():
+    tool, state = _slow_position_tool()
+
+    async def run():
+        await tool(_Ctx("alice-1"), position=2)
+        state["slow"] = True
+        return await tool(_Ctx("alice-1", seconds=0.2, reserve=0.1), position=2)
+
+    result = asyncio.run(run())
+    assert result.startswith("#2 from alice-1's last search")
+    assert "timed out" in result
+
+
+def test_timed_out_tool_never_serves_another_users_result():
+    tool, state = _slow_position_tool()
+
+    async def run():
+        await tool(_Ctx("alice-2"), position=2)
+        state["slow"] = True
+        return await tool(_Ctx("bob-2", seconds=0.2, reserve=0.1), position=2)
+
+    result = asyncio.run(run())
+    assert "alice-2" not in result
+    assert "time budget" in result
+
+
+def test_error_results_are_not_remembered():
+    @deadline_tool
+    async def lookup(ctx, query: str = ""):
+        return "❌ upstream error"
+
+    asyncio.run(lookup(_Ctx("carol"), query="x"))
+    assert tool_fallbacks.recall(ToolFallbacks.key("lookup", "carol", {"query": "x"})) is None
+
+
+def test_fallbacks_expire_and_stay_bounded():
+    fallbacks = ToolFallbacks(max_entries=2, ttl_seconds=60)
+    for i in range(3):
+        fallbacks.remember(ToolFallbacks.key("tool", "user", {"i": i}), i)
+    assert fallbacks.recall(ToolFallbacks.key("tool", "user", {"i": 0})) is None
+    assert fallbacks.recall(ToolFallbacks.key("tool", "user", {"i": 2}))[1] == 2
+
+    expired = ToolFallbacks(ttl_seconds=0)
+    expired.remember(ToolFallbacks.key("tool", "user", {}), "old")
+    assert expired.recall(ToolFallbacks.key("tool", "user", {})) is None
+
+
+def test_waits_and_upstream_timeouts_follow_the_deadline():
+    async def run():
+        assert capped_wait(3.0) == 3.0
+        assert upstream_timeout(10.0) == 10.0
+        current_deadline.set(Deadline("phone", 1.0, 0.5))
+        assert capped_wait(3.0) <= 0.5
+        assert upstream_timeout(10.0) < 1.0
+        current_deadline.set(Deadline("phone", 0.0, 0.0))
+        assert capped_wait(3.0) == 0.0
+        with pytest.raises(DeadlineExceeded):
+            upstream_timeout(10.0)
+
+    asyncio.run(run())
+
+
+def test_channel_budgets():
+    phone = Deadline.for_channel("phone")
+    webchat = Deadline.for_channel("webchat")
+    assert phone.remaining() < webchat.remaining()
+    # The answer reserve is never more than half of the budget
+    assert phone.tool_remaining() >= phone.remaining() / 2 - 0.01
+    assert phone.llm_timeout() >= phone.at - phone.tools_until
@@ -0,0 +1,63 @@
+import asyncio
+
+from conftest import FakePool
+from conversation_memory import HistoryCache, SimpleMemory, to_model_message
+
+
+def _text(message):
+    return message.parts[0].content
+
+
+def _rows(count):
+    # get_recent_messages fetches newest first
+    return [{"message_role": "user" if i % 2 == 0 else "assistant", "message_content": f"m{i}",
+             "executed_function_name": None, "function_input_parameters": None, "message_created_at": i}
+            for i in reversed(range(count))]
+
+
+def test_cache_keeps_the_tail_window_and_evicts_least_recent():
+    cache = HistoryCache(window=3, max_conversations=2)
+    cache.put("a", [to_model_message("user", f"m{i}") for i in range(5)])
+    assert [_text(m) for m in cache.get("a", 3)] == ["m2", "m3", "m4"]
+    assert cache.get("a", 10) is None    # more than the window: must come from the database
+    cache.put("b", [])
+    cache.get("a", 1)
+    cache.put("c", [])
+    assert cache.get("b", 1) is None and cache.get("a", 1) is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_append_only_updates_conversations_already_cached():
+    cache = HistoryCache(window=2)
+    cache.append("cold", to_model_message("user", "hi"))
+    assert cache.get("cold", 1) is None
+    cache.put("warm", [to_model_message("user", "m0")])
+    cache.append("warm", to_model_message("assistant", "m1"))
+    cache.append("warm", to_model_message("user", "m2"))
+    assert [_text(m) for m in cache.get("warm", 2)] == ["m1", "m2"]
+
+
+def test_history_is_loaded_once_then_served_and_appended_in_process():
+    pool = FakePool(lambda method, query, args: _rows(4) if method == "fetch" else None)
+    memory = SimpleMemory()
+    memory.pool = pool
+
+    async def run():
+        first = await memory.get_message_history("conv-1", limit=10)
+        await memory.save_user_message("conv-1", "new question")
+        second = await memory.get_message_history("conv-1", limit=10)
+        await memory.flush()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [_text(m) for m in first] == ["m0", "m1", "m2", "m3"]
+    assert [_text(m) for m in second] == ["m0", "m1", "m2", "m3", "new question"]
+    assert len(pool.queries("fetch")) == 1
+    assert memory.history_cache.stats["appends"] == 1
+
+
+def test_function_calls_are_replayed_as_context():
+    message = to_model_message("assistant", "Found you!", "get_customer_by_phone", '{"phone": "407-555-0100"}')
+    assert _text(message).startswith(
+        '\n\n[Function Call Context: get_customer_by_phone({"phone": "407-555-0100"}) executed]')
+    assert to_model_message("system", "x") is None
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore, RecordedStream, fingerprint
+
+
+def test_duplicate_while_running_attaches_to_the_first_execution():
+    store = IdempotencyStore()
+    calls = []
+
+    async def handle():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "transcript saved"
+
+    async def run():
+        return await asyncio.gather(store.run("vapi-eoc:call-1", handle, ttl_seconds=60),
+                                    store.run("vapi-eoc:call-1", handle, ttl_seconds=60))
+
+    first, second = asyncio.run(run())
+    assert calls == [1]
+    assert first == ("transcript saved", False)
+    assert second == ("transcript saved", True)
+    assert store.stats["attached"] == 1
+
+
+def test_completed_key_is_replayed_until_it_expires():
+    store = IdempotencyStore()
+    calls = []
+
+    async def handle():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        results = [await store.run("key", handle, ttl_seconds=60) for _ in range(2)]
+        results.append(await store.run("short", handle, ttl_seconds=0))
+        results.append(await store.run("short", handle, ttl_seconds=0))
+        return results
+
+    assert asyncio.run(run()) == [(1, False), (1, True), (2, False), (3, False)]
+    assert store.stats["replayed"] == 1
+
+
+def test_failed_execution_is_forgotten_so_the_retry_runs():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def handle():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("database down")
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await store.run("key", handle, ttl_seconds=60)
+        return await store.run("key", handle, ttl_seconds=60)
+
+    assert asyncio.run(run()) == ("ok", False)
+    assert store.stats["failed"] == 1
+
+
+def test_retryable_results_are_returned_but_not_stored():
+    store = IdempotencyStore()
+
+    async def busy():
+        return 503
+
+    async def run():
+        first = await store.run("key", busy, ttl_seconds=60, retryable=lambda status: status == 503)
+        second = await store.run("key", busy, ttl_seconds=60, retryable=lambda status: status == 503)
+        return first, second
+
+    assert asyncio.run(run()) == ((503, False), (503, False))
+
+
+def test_key_reused_for_a_different_body_is_a_conflict():
+    store = IdempotencyStore()
+
+    async def handle():
+        return "ok"
+
+    async def run():
+        await store.run("key", handle, ttl_seconds=60, request_fingerprint=fingerprint("user", "hi"))
+        with pytest.raises(IdempotencyConflict):
+            await store.run("key", handle, ttl_seconds=60, request_fingerprint=fingerprint("user", "bye"))
+
+    asyncio.run(run())
+    assert store.stats["conflicts"] == 1
+
+
+def test_keys_are_bounded():
+    store = IdempotencyStore(max_keys=2)
+
+    async def handle():
+        return "ok"
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await store.run(key, handle, ttl_seconds=60)
+
+    asyncio.run(run())
+    assert store.snapshot()["keys"] == 2
+    assert store.stats["evicted"] == 1
+
+
+async def _chunks(count, delay=0.01):
+    for i in range(count):
+        await asyncio.sleep(delay)
+        yield f"data: {i}\n\n"
+
+
+async def _read(stream, limit=None):
+    chunks = []
+    async for chunk in stream.subscribe():
+        chunks.append(chunk)
+        if limit and len(chunks) == limit:
+            break
+    return chunks
+
+
+def test_late_reader_replays_the_recorded_stream_then_follows_it():
+    async def run():
+        stream = RecordedStream(_chunks(4))
+        first = asyncio.create_task(_read(stream))
+        await asyncio.sleep(0.025)
+        second = asyncio.create_task(_read(stream))
+        return await first, await second, stream
+
+    first, second, stream = asyncio.run(run())
+    assert first == second == [f"data: {i}\n\n" for i in range(4)]
+    assert stream.complete
+
+
+def test_stream_abandoned_by_every_reader_is_cancelled_and_reported():
+    abandoned = []
+
+    async def run():
+        stream = RecordedStream(_chunks(100), on_abandoned=lambda: abandoned.append(True))
+        assert len(await _read(stream, limit=2)) == 2
+        await asyncio.sleep(0.02)
+        return stream
+
+    stream = asyncio.run(run())
+    assert stream.finished and not stream.complete
+    assert abandoned == [True]
+
+
+def test_stream_stays_alive_while_another_reader_follows():
+    abandoned = []
+
+    async def run():
+        stream = RecordedStream(_chunks(5), on_abandoned=lambda: abandoned.append(True))
+        follower = asyncio.create_task(_read(stream))
+        await _read(stream, limit=1)
+        return await follower
+
+    assert len(asyncio.run(run())) == 5
+    assert abandoned == []
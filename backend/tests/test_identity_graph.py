@@ -0,0 +1,61 @@
+import asyncio
+
+from identity_graph import IdentityGraph, classify_user_identifier, identity_key, normalize_phone
+
+
+def _resolve(graph, linked, lookup_only=None):
+    return asyncio.run(graph.resolve(linked, lookup_only))
+
+
+def test_phone_formats_normalize_to_e164():
+    assert normalize_phone("(407) 555-0100") == "+14075550100"
+    assert normalize_phone("1-407-555-0100") == "+14075550100"
+    assert normalize_phone("+44 20 7946 0958") == "+442079460958"
+    assert normalize_phone("call me") is None
+    assert identity_key("email", "Jane@Example.com") == "jane@example.com"
+    assert identity_key("customer", "1234567890") == "customer:1234567890"
+
+
+def test_free_form_identifiers_are_classified():
+    assert classify_user_identifier("jane@example.com") == ("email", "jane@example.com")
+    assert classify_user_identifier("1234567890") == ("customer", "1234567890")
+    assert classify_user_identifier("407-555-0100") == ("phone", "407-555-0100")
+    assert classify_user_identifier("web-abc") == ("session", "web-abc")
+
+
+def test_trusted_identifiers_link_to_one_canonical_key():
+    graph = IdentityGraph()
+    canonical = _resolve(graph, {"phone": "407-555-0100", "session": "web-1"})
+    assert canonical == "+14075550100"
+    assert _resolve(graph, {"session": "web-1"}) == canonical
+    assert graph.aliases(canonical) == ["+14075550100", "session:web-1"]
+    assert graph.stats["hits"] == 1
+
+
+def test_merging_two_identities_moves_every_member():
+    graph = IdentityGraph()
+    phone_identity = _resolve(graph, {"phone": "407-555-0100", "session": "call-1"})
+    email_identity = _resolve(graph, {"email": "jane@example.com", "session": "web-1"})
+    assert phone_identity != email_identity
+
+    # Logged in with both: one person, kept under the stronger of the existing keys (history stays put)
+    merged = _resolve(graph, {"phone": "4075550100", "email": "jane@example.com", "customer": "1234567890"})
+    assert merged == phone_identity
+    for key in ("customer:1234567890", "session:call-1", "jane@example.com", "session:web-1"):
+        assert graph.canonical_for(key) == merged
+    assert graph.stats["merged"] == 1
+
+
+def test_identifiers_from_message_text_are_resolved_but_never_linked():
+    graph = IdentityGraph()
+    _resolve(graph, {"phone": "407-555-0100"})
+    # An agent looking up someone else's email from the chat
+    looked_up = _resolve(graph, {}, lookup_only=("email", "other@example.com"))
+    assert looked_up == "other@example.com"
+    assert graph.canonical_for("other@example.com") != graph.canonical_for("+14075550100")
+    # ...and text is ignored once a trusted identifier is present
+    assert _resolve(graph, {"phone": "407-555-0100"}, lookup_only=("email", "other@example.com")) == "+14075550100"
+
+
+def test_no_identifier_is_anonymous():
+    assert _resolve(IdentityGraph(), {"phone": None}) == "anonymous"
@@ -0,0 +1,132 @@
+import asyncio
+import uuid
+
+import pytest
+
+from conftest import FakePool
+from conversation_memory import SimpleMemory
+from identity_graph import IdentityGraph
+from state_store import InProcessBackend, state_store
+
+
+class SharedBackend(InProcessBackend):
+    """Stands in for the postgres table: both workers of a test see the same values"""
+    shared = True
+
+
+@pytest.fixture(autouse=True)
+def shared_state(monkeypatch):
+    monkeypatch.setattr(state_store, "backend", SharedBackend())
+
+
+def _rows(*contents):
+    # get_recent_messages fetches newest first
+    return [{"message_role": "user", "message_content": content, "executed_function_name": None,
+             "function_input_parameters": None, "message_created_at": i}
+            for i, content in reversed(list(enumerate(contents)))]
+
+
+def _workers(handler):
+    pool = FakePool(handler)
+    workers = []
+    for _ in range(2):
+        memory = SimpleMemory()
+        memory.pool = pool
+        memory._upsert_ready = True
+        workers.append(memory)
+    return pool, workers
+
+
+def _text(messages):
+    return [message.parts[0].content for message in messages]
+
+
+def test_new_conversation_on_one_worker_is_used_by_the_other():
+    ids = iter(uuid.UUID(int=i) for i in range(1, 10))
+    pool, (a, b) = _workers(lambda method, query, args: next(ids) if method == "fetchval" else None)
+
+    async def run():
+        first = await b.get_or_create_conversation("+14075550100", "phone")
+        new = await a.start_new_conversation("+14075550100", "phone")
+        calls = len(pool.calls)
+        return first, new, await b.get_or_create_conversation("+14075550100", "phone"), calls
+
+    first, new, current, calls = asyncio.run(run())
+    assert new != first and current == new
+    assert len(pool.calls) == calls    # from the shared store, no query
+
+
+def test_messages_are_written_through_and_other_caches_reload():
+    table = ["m0", "m1"]
+
+    def handler(method, query, args):
+        if method == "execute" and query.lstrip().startswith("INSERT INTO chatbot_messages"):
+            table.append(args[2])
+        if method == "fetch":
+            return _rows(*table)
+
+    pool, (a, b) = _workers(handler)
+
+    async def run():
+        await a.get_message_history("conv-1")
+        await b.get_message_history("conv-1")
+        await a.save_user_message("conv-1", "sent to worker a")
+        assert not a._pending              # already in the database for worker b's reads
+        return await a.get_message_history("conv-1"), await b.get_message_history("conv-1")
+
+    on_a, on_b = asyncio.run(run())
+    assert _text(on_a) == _text(on_b) == ["m0", "m1", "sent to worker a"]
+    assert len(pool.queries("fetch")) == 3          # a kept its entry current, b reloaded once
+    assert a.history_cache.stats["stale"] == 0 and b.history_cache.stats["stale"] == 1
+    assert a.write_stats["written_through"] == 1
+
+
+def test_failed_write_through_is_queued_for_retry():
+    down = [True]
+
+    def handler(method, query, args):
+        if down[0]:
+            raise ConnectionError("pool closed")
+
+    pool, (a, _) = _workers(handler)
+
+    async def run():
+        await a.save_user_message("conv-1", "hi")
+        assert len(a._pending) == 1
+        down[0] = False
+        await a.flush()
+
+    asyncio.run(run())
+    assert a.write_stats["flushed"] == 1 and not a._pending
+
+
+def _links_table():
+    links = {}
+
+    def handler(method, query, args):
+        if method == "executemany" and "INSERT INTO chatbot_identity_links" in query:
+            links.update({identifier: canonical for identifier, _, canonical in args[0]})
+        if method == "fetch" and "FROM chatbot_identity_links l" in query:
+            canonicals = {links[key] for key in args[0] if key in links}
+            return [{"identifier": key, "canonical_key": canonical, "member": key}
+                    for key, canonical in links.items() if canonical in canonicals]
+
+    return FakePool(handler)
+
+
+def test_identity_linked_on_one_worker_is_reloaded_on_the_other():
+    pool = _links_table()
+    a, b = IdentityGraph(), IdentityGraph()
+    a.pool = b.pool = pool
+
+    async def run():
+        canonical = await a.resolve({"phone": "407-555-0100", "session": "call-1"})
+        assert await b.resolve({"session": "call-1"}) == canonical
+        assert await b.resolve({"session": "call-1"}) == canonical     # fast path, nothing changed
+        await a.resolve({"phone": "407-555-0100", "email": "jane@example.com"})
+        return canonical, await b.resolve({"session": "call-1"})
+
+    canonical, again = asyncio.run(run())
+    assert again == canonical
+    assert b.aliases(canonical) == ["+14075550100", "jane@example.com", "session:call-1"]
+    assert b.stats["hits"] == 1 and b.stats["reloads"] == 1
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import prompt_budget
+from prompt_budget import (PromptAssembler, RollingSummary, compact_history_text, count_tokens, fit_to_budget,
+                           message_text)
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+
+
+def _history(count, words=40):
+    filler = " ".join(["word"] * words)
+    return [ModelRequest(parts=[UserPromptPart(content=f"question {i} {filler}")]) if i % 2 == 0 else
+            ModelResponse(parts=[TextPart(content=f"answer {i} {filler}")])
+            for i in range(count)]
+
+
+def _assembler(monkeypatch, history_tokens):
+    monkeypatch.setattr(prompt_budget, "HISTORY_TOKENS", history_tokens)
+    assembler = PromptAssembler("You are a furniture store assistant.", system_prompt_in_history=False)
+    scheduled = []
+    assembler.summaries.schedule_update = lambda conversation_id, previous, messages: scheduled.append(messages)
+    return assembler, scheduled
+
+
+def test_fit_to_budget_trims_long_text_only():
+    assert fit_to_budget("short text", 100) == "short text"
+    trimmed = fit_to_budget("word " * 1000, 50)
+    assert trimmed.endswith(" …[trimmed]") and count_tokens(trimmed) <= 60
+
+
+def test_old_tool_output_is_compacted_to_what_the_model_needs():
+    carousel = {"products": [{"name": "Dakota Sofa", "sku": "D-1", "media": ["x"] * 50},
+                             {"name": "Aspen Chair", "sku": "A-2"}]}
+    text = f"<div><b>Here you go</b></div>\n\n\n**CAROUSEL_DATA:** {json.dumps(carousel)}"
+    compact = compact_history_text(text)
+    assert "<" not in compact and "media" not in compact
+    assert "[product carousel shown: 1. Dakota Sofa (SKU D-1); 2. Aspen Chair (SKU A-2)]" in compact
+
+
+def test_history_within_budget_is_sent_whole(monkeypatch):
+    assembler, scheduled = _assembler(monkeypatch, history_tokens=100000)
+    history = _history(6)
+    prompt = asyncio.run(assembler.assemble("conv-1", history, context="Customer: Jane"))
+    assert [message_text(m) for m in prompt.message_history] == [message_text(m) for m in history]
+    assert prompt.stats["dropped_messages"] == 0 and prompt.context == "Customer: Jane"
+    assert scheduled == []
+
+
+def test_history_over_budget_keeps_the_newest_turns_and_rolls_a_summary(monkeypatch):
+    history = _history(20)
+    per_message = count_tokens(message_text(history[0]))
+    assembler, scheduled = _assembler(monkeypatch, history_tokens=per_message * 8)
+    prompt = asyncio.run(assembler.assemble("conv-1", history))
+    kept = prompt.message_history
+    assert 2 <= len(kept) < 20
+    assert message_text(kept[-1]) == message_text(history[-1])
+    assert prompt.stats["history_tokens"] <= per_message * 8
+    assert len(scheduled) == 1 and len(scheduled[0]) == 20 - len(kept)
+
+
+def test_last_exchange_is_kept_even_when_over_budget(monkeypatch):
+    assembler, _ = _assembler(monkeypatch, history_tokens=1)
+    prompt = asyncio.run(assembler.assemble("conv-1", _history(4, words=200)))
+    assert len(prompt.message_history) == prompt_budget.MIN_HISTORY_MESSAGES
+
+
+def test_existing_summary_is_added_within_its_budget(monkeypatch):
+    history = _history(20)
+    assembler, scheduled = _assembler(monkeypatch, history_tokens=count_tokens(message_text(history[0])) * 8)
+    first_cut = asyncio.run(assembler.assemble("conv-1", history)).stats["dropped_messages"]
+    assembler.summaries._remember("conv-1", RollingSummary("Jane wants a grey sectional under $2000.",
+                                                            prompt_budget.message_marker(history[first_cut - 1])))
+    prompt = asyncio.run(assembler.assemble("conv-1", history))
+    assert prompt.summary == "Jane wants a grey sectional under $2000."
+    # Everything dropped is already covered by the summary: no second update
+    assert len(scheduled) == 1
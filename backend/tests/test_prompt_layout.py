@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import prompt_budget
+from prompt_budget import PromptAssembler, PromptCacheMetrics, count_tokens, message_text
+from pydantic_ai.messages import ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+
+SYSTEM_PROMPT = "You are a furniture store assistant."
+
+
+def _turn(i):
+    filler = " ".join(["word"] * 40)
+    return [ModelRequest(parts=[UserPromptPart(content=f"question {i} {filler}")]),
+            ModelResponse(parts=[TextPart(content=f"answer {i} {filler}")])]
+
+
+def _assembler(monkeypatch, turns_in_budget, system_prompt_in_history=False):
+    per_turn = sum(count_tokens(message_text(m)) for m in _turn(0))
+    monkeypatch.setattr(prompt_budget, "HISTORY_TOKENS", per_turn * turns_in_budget)
+    assembler = PromptAssembler(SYSTEM_PROMPT, system_prompt_in_history=system_prompt_in_history)
+    assembler.summaries.schedule_update = lambda *args: None
+    return assembler
+
+
+def test_system_prompt_leads_the_history_when_the_agent_needs_it(monkeypatch):
+    assembler = _assembler(monkeypatch, turns_in_budget=10, system_prompt_in_history=True)
+    prompt = asyncio.run(assembler.assemble("conv-1", _turn(0)))
+    head = prompt.message_history[0]
+    assert isinstance(head.parts[0], SystemPromptPart) and head.parts[0].content == SYSTEM_PROMPT
+    # Dynamic parts stay out of the cacheable prefix
+    prompt = asyncio.run(assembler.assemble("conv-1", _turn(0), context="Customer: Jane"))
+    assert all("Customer: Jane" not in message_text(m) for m in prompt.message_history)
+
+
+def test_cut_stays_put_while_history_grows_back_to_the_budget(monkeypatch):
+    assembler = _assembler(monkeypatch, turns_in_budget=10)
+    history = [message for i in range(12) for message in _turn(i)]
+    first_kept = []
+    for turn in range(12, 16):
+        prompt = asyncio.run(assembler.assemble("conv-1", history))
+        first_kept.append(message_text(prompt.message_history[0]))
+        history += _turn(turn)
+    # Each turn only appends behind the same first message, so the provider's cached prefix still matches
+    assert len(set(first_kept)) == 1
+    assert prompt.stats["history_messages"] > 2 * 10 * prompt_budget.HISTORY_REFILL_RATIO
+
+
+def test_cut_moves_once_the_kept_history_is_over_budget_again(monkeypatch):
+    assembler = _assembler(monkeypatch, turns_in_budget=10)
+    history = [message for i in range(12) for message in _turn(i)]
+    first = message_text(asyncio.run(assembler.assemble("conv-1", history)).message_history[0])
+    history += [message for i in range(12, 20) for message in _turn(i)]
+    moved = message_text(asyncio.run(assembler.assemble("conv-1", history)).message_history[0])
+    assert moved != first
+
+
+def test_cache_metrics_report_cached_ratio_and_ttft():
+    metrics = PromptCacheMetrics()
+    metrics.record(SimpleNamespace(request_tokens=1000, details={"cached_tokens": 800}), 10.0, 10.25)
+    metrics.record(SimpleNamespace(request_tokens=1000, details=None), 20.0, None, channel="phone")
+    snapshot = metrics.snapshot()
+    assert snapshot["cached_ratio"] == 0.4
+    assert snapshot["ttft_p50_ms"] == 250
+    assert snapshot["recent"][0]["cached_ratio"] == 0.8
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from response_cache import ResponseCache, cached_answer_chunks, normalize_question
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_only_general_questions_are_cacheable():
+    cache = ResponseCache()
+    assert cache.is_cacheable("What are your hours on Sunday?")
+    assert cache.is_cacheable("Do you deliver to Orlando?")
+    assert not cache.is_cacheable("What are the hours for my order pickup?")
+    assert not cache.is_cacheable("Call me at 407-555-0100 about financing")
+    assert not cache.is_cacheable("Show me grey sectionals")
+
+
+def test_exact_tier_matches_normalized_text():
+    cache = ResponseCache()
+    _run(cache.put("What are your hours?", "We're open 10am-8pm every day."))
+    assert normalize_question("  WHAT are your hours!! ") == "what are your hours"
+    assert _run(cache.get("what are your HOURS")) == ("We're open 10am-8pm every day.", "exact")
+    assert _run(cache.get("what is your return policy")) is None
+    assert cache.snapshot()["hit_rate"] == 0.5
+
+
+def test_error_answers_are_never_stored():
+    cache = ResponseCache()
+    _run(cache.put("What are your hours?", "❌ Error: upstream timeout"))
+    _run(cache.put("Do you deliver?", "Sorry, please try again."))
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_entries_expire_and_follow_the_cache_version():
+    cache = ResponseCache(ttl_seconds=0)
+    _run(cache.put("What are your hours?", "10am-8pm"))
+    assert _run(cache.get("What are your hours?")) is None
+    assert cache.stats["expired"] == 1
+
+    cache = ResponseCache()
+    cache.set_version("prompt v1", "gpt-4.1", "tools")
+    _run(cache.put("What are your hours?", "10am-8pm"))
+    cache.set_version("prompt v1", "gpt-4.1", "tools")
+    assert _run(cache.get("What are your hours?")) is not None
+    cache.set_version("prompt v2", "gpt-4.1", "tools")
+    assert _run(cache.get("What are your hours?")) is None
+
+
+def test_cache_is_bounded_least_recently_used_first():
+    cache = ResponseCache(max_entries=2)
+    for question in ("hours?", "directions?", "financing?"):
+        _run(cache.put(question, f"answer to {question}"))
+    assert _run(cache.get("hours?")) is None
+    assert _run(cache.get("financing?")) is not None
+
+
+def test_semantic_tier_matches_paraphrases_above_the_threshold():
+    pytest.importorskip("numpy")
+    vocabulary = ["hours", "open", "close", "time", "deliver", "delivery", "fee"]
+
+    async def embed(text):
+        words = normalize_question(text).split()
+        return [float(sum(word.startswith(term) for word in words)) for term in vocabulary]
+
+    cache = ResponseCache(similarity=0.7)
+    cache.attach_encoder(embed)
+    _run(cache.put("What time do you open and close?", "10am-8pm"))
+    assert _run(cache.get("When do you open, what time do you close")) == ("10am-8pm", "semantic")
+    assert _run(cache.get("What is the delivery fee?")) is None
+
+
+def test_cached_answers_stream_in_word_chunks():
+    text = "We're open 10am to 8pm, Monday through Saturday, and noon to 6pm on Sunday."
+    chunks = cached_answer_chunks(text, words_per_chunk=4)
+    assert "".join(chunks) == text and len(chunks) == 4
@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+
+from conftest import FakePool
+from conversation_memory import SimpleMemory
+
+
+def _memory(upsert_ready=True):
+    conversation_ids = iter(uuid.UUID(int=i) for i in range(1, 100))
+    pool = FakePool(lambda method, query, args: next(conversation_ids) if method == "fetchval" else None)
+    memory = SimpleMemory()
+    memory.pool = pool
+    memory._upsert_ready = upsert_ready
+    return memory, pool
+
+
+def test_session_resolves_with_one_upsert_then_from_cache():
+    memory, pool = _memory()
+
+    async def run():
+        return [await memory.get_or_create_conversation("+14075550100", "phone") for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert first == second == third == str(uuid.UUID(int=1))
+    assert len(pool.calls) == 1
+    assert "ON CONFLICT (user_identifier, platform_type) WHERE is_active = true" in pool.queries("fetchval")[0]
+
+
+def test_each_platform_has_its_own_session():
+    memory, _ = _memory()
+
+    async def run():
+        return (await memory.get_or_create_conversation("+14075550100", "phone"),
+                await memory.get_or_create_conversation("+14075550100", "webchat"))
+
+    phone, webchat = asyncio.run(run())
+    assert phone != webchat
+
+
+def test_without_the_unique_index_it_selects_then_inserts():
+    memory, pool = _memory(upsert_ready=False)
+    pool.handler = lambda method, query, args: None if "SELECT" in query else uuid.UUID(int=7)
+    conversation_id = asyncio.run(memory.get_or_create_conversation("jane@example.com"))
+    assert conversation_id == str(uuid.UUID(int=7))
+    assert [query.split()[0] for query in pool.queries("fetchval")] == ["SELECT", "INSERT"]
+
+
+def test_new_conversation_retires_the_active_one_and_replaces_the_cached_id():
+    memory, pool = _memory()
+
+    async def run():
+        old = await memory.get_or_create_conversation("+14075550100", "phone")
+        new = await memory.start_new_conversation("+14075550100", "phone")
+        return old, new, await memory.get_or_create_conversation("+14075550100", "phone")
+
+    old, new, current = asyncio.run(run())
+    assert new != old and current == new
+    assert any(query.startswith("UPDATE chatbot_conversations SET is_active = false") for query in pool.queries("execute"))
+
+
+def test_database_errors_fall_back_to_a_throwaway_id():
+    memory, pool = _memory()
+
+    def fail(method, query, args):
+        raise ConnectionError("database down")
+
+    pool.handler = fail
+    conversation_id = asyncio.run(memory.get_or_create_conversation("+14075550100", "phone"))
+    assert uuid.UUID(conversation_id)
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import speculation
+from speculation import TurnSpeculation, detect_lookups, speculation_stats, speculative_tool
+
+calls = []
+
+
+@speculative_tool
+async def get_customer_by_phone(ctx, phone: str):
+    calls.append(phone)
+    await asyncio.sleep(0.01)
+    return f"customer {phone}"
+
+
+@speculative_tool
+async def get_customer_by_email(ctx, email: str):
+    calls.append(email)
+    await asyncio.sleep(5)
+    return f"customer {email}"
+
+
+TOOLS = {"get_customer_by_phone": get_customer_by_phone, "get_customer_by_email": get_customer_by_email}
+
+
+def _ctx(turn):
+    return SimpleNamespace(deps=SimpleNamespace(speculation=turn))
+
+
+def test_detect_lookups_finds_each_identifier_once_in_order():
+    message = "I'm jane@example.com, call 407-555-0100 (or 407-555-0100) about sku: DAK-SOFA-1"
+    assert detect_lookups(message) == [("get_customer_by_phone", {"phone": "407-555-0100"}),
+                                       ("get_customer_by_email", {"email": "jane@example.com"}),
+                                       ("get_magento_product_by_sku", {"sku": "DAK-SOFA-1"})]
+    assert detect_lookups("do you have grey sofas?") == []
+
+
+def test_agent_call_reuses_the_speculative_lookup_and_the_rest_is_cancelled():
+    calls.clear()
+    hits, cancelled = speculation_stats.hits, speculation_stats.cancelled
+
+    async def run():
+        turn = TurnSpeculation()
+        assert turn.start_from_message("I'm jane@example.com, 407-555-0100", TOOLS, _ctx(None)) == 2
+        await asyncio.sleep(0)
+        result = await get_customer_by_phone(_ctx(turn), phone="407-555-0100")
+        email_task = turn._tasks[("get_customer_by_email", (("email", "jane@example.com"),))]
+        turn.finish()
+        await asyncio.sleep(0)
+        return result, email_task
+
+    result, email_task = asyncio.run(run())
+    assert result == "customer 407-555-0100"
+    assert calls.count("407-555-0100") == 1          # the agent's call didn't run the lookup again
+    assert email_task.cancelled()
+    assert speculation_stats.hits == hits + 1 and speculation_stats.cancelled == cancelled + 1
+
+
+def test_different_arguments_run_the_tool_normally():
+    calls.clear()
+
+    async def run():
+        turn = TurnSpeculation()
+        turn.start_from_message("call 407-555-0100", TOOLS, _ctx(None))
+        result = await get_customer_by_phone(_ctx(turn), phone="407-555-0199")
+        turn.finish()
+        return result
+
+    assert asyncio.run(run()) == "customer 407-555-0199"
+    assert sorted(calls) == ["407-555-0100", "407-555-0199"]
+
+
+def test_disabled_or_expired_speculation_starts_nothing_lasting(monkeypatch):
+    monkeypatch.setattr(speculation, "SPECULATION_ENABLED", False)
+    assert asyncio.run(_start_count()) == 0
+
+    monkeypatch.setattr(speculation, "SPECULATION_ENABLED", True)
+    monkeypatch.setattr(speculation, "SPECULATION_TTL_SECONDS", 0.01)
+
+    async def run():
+        turn = TurnSpeculation()
+        turn.start_from_message("jane@example.com", TOOLS, _ctx(None))
+        task = next(iter(turn._tasks.values()))
+        await asyncio.sleep(0.05)     # nobody called finish(): the TTL cancels it
+        return task
+
+    assert asyncio.run(run()).cancelled()
+
+
+async def _start_count():
+    return TurnSpeculation().start_from_message("call 407-555-0100", TOOLS, _ctx(None))
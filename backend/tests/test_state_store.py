@@ -0,0 +1,135 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from state_store import InProcessBackend, PostgresBackend
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+async def _backend(kind):
+    if kind == "memory":
+        return InProcessBackend()
+    import asyncpg
+    backend = PostgresBackend(await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=4))
+    await backend.init()
+    return backend
+
+
+@pytest.fixture(params=["memory", pytest.param("postgres", marks=pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set"))])
+def run_contract(request):
+    """Runs body(backend, namespace) on a fresh backend of each kind, in a namespace of its own"""
+    def run(body):
+        async def main():
+            backend = await _backend(request.param)
+            namespace = f"test-{uuid.uuid4().hex[:8]}"
+            try:
+                return await body(backend, namespace)
+            finally:
+                if request.param == "postgres":
+                    async with backend.pool.acquire() as conn:
+                        await conn.execute("DELETE FROM chatbot_state WHERE namespace = $1", namespace)
+                    await backend.pool.close()
+        return asyncio.run(main())
+    return run
+
+
+def test_values_round_trip_until_deleted(run_contract):
+    async def body(backend, namespace):
+        assert await backend.get(namespace, "missing") is None
+        await backend.set(namespace, "conv", {"searches": ["sofa"], "count": 2}, 60)
+        assert await backend.get(namespace, "conv") == {"searches": ["sofa"], "count": 2}
+        await backend.set(namespace, "conv", "replaced", 60)
+        assert await backend.get(namespace, "conv") == "replaced"
+        await backend.delete(namespace, "conv")
+        assert await backend.get(namespace, "conv") is None
+
+    run_contract(body)
+
+
+def test_expired_values_are_gone(run_contract):
+    async def body(backend, namespace):
+        await backend.set(namespace, "short", "x", 0.05)
+        await backend.set(namespace, "long", "y", 60)
+        await asyncio.sleep(0.1)
+        assert await backend.get(namespace, "short") is None
+        assert await backend.get(namespace, "long") == "y"
+
+    run_contract(body)
+
+
+def test_bump_reports_the_version_it_replaced(run_contract):
+    async def body(backend, namespace):
+        previous, first = await backend.bump(namespace, "conv", 60)
+        assert previous is None
+        assert await backend.bump(namespace, "conv", 60) == (first, first + 1)
+        assert await backend.get(namespace, "conv") == first + 1
+
+        # After expiry a key starts over above anything it reached before
+        await backend.bump(namespace, "short", 0.05)
+        _, before = await backend.bump(namespace, "short", 0.05)
+        await asyncio.sleep(0.1)
+        previous, after = await backend.bump(namespace, "short", 60)
+        assert previous is None and after > before
+
+    run_contract(body)
+
+
+def test_concurrent_bumps_hand_out_each_version_once(run_contract):
+    async def body(backend, namespace):
+        _, start = await backend.bump(namespace, "conv", 60)
+        results = await asyncio.gather(*(backend.bump(namespace, "conv", 60) for _ in range(20)))
+        versions = sorted(version for _, version in results)
+        assert versions == list(range(start + 1, start + 21))
+        assert all(previous == version - 1 for previous, version in results)
+
+    run_contract(body)
+
+
+def test_only_the_postgres_backend_is_shared_between_workers():
+    assert PostgresBackend.shared and not InProcessBackend.shared
+
+
+def test_in_process_store_evicts_the_least_recently_used_entry():
+    async def run():
+        backend = InProcessBackend(max_entries=2)
+        await backend.set("ctx", "a", 1, 60)
+        await backend.set("ctx", "b", 2, 60)
+        await backend.get("ctx", "a")
+        await backend.set("chains", "c", 3, 60)
+        return backend, [await backend.get(ns, key) for ns, key in (("ctx", "a"), ("ctx", "b"), ("chains", "c"))]
+
+    backend, values = asyncio.run(run())
+    assert values == [1, None, 3]
+    assert backend.size() == {"ctx": 1, "chains": 1} and backend.evicted == 1
+
+
+def test_in_process_expiry_skips_heap_items_of_rewritten_keys():
+    async def run():
+        backend = InProcessBackend()
+        await backend.set("ctx", "a", "old", 0.05)
+        await backend.set("ctx", "a", "new", 60)     # the first heap item is now stale
+        await asyncio.sleep(0.1)
+        return backend, await backend.get("ctx", "a"), await backend.purge_expired()
+
+    backend, value, purged = asyncio.run(run())
+    assert value == "new" and purged == 0
+    assert backend.gauges()["entries"] == 1 and backend.expired == 0
+
+
+def test_encoded_namespaces_keep_live_objects_in_process_only(fresh_state_store, monkeypatch):
+    class Live:
+        def to_dict(self):
+            return {"live": True}
+
+    contexts = fresh_state_store.namespace(f"test-{uuid.uuid4().hex[:8]}", 60, encode=Live.to_dict)
+    live = Live()
+    asyncio.run(contexts.set("conv", live))
+    assert asyncio.run(contexts.get("conv")) is live
+
+    monkeypatch.setattr(InProcessBackend, "serializes", True)
+    asyncio.run(contexts.set("conv", live))
+    assert asyncio.run(contexts.get("conv")) == {"live": True}
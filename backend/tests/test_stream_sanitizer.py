@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from stream_sanitizer import MAX_TAG_CHARS, StreamingHTMLSanitizer, strip_html_for_streaming
+
+SAMPLES = [
+    '<div class="product"><strong>Dakota</strong> sofa &amp; loveseat</div>',
+    "Prices under <$500 &lt;b&gt; stay &amp text",
+    "<p>Line one</p>\n<ul><li>Item &gt; one</li></ul> trailing <",
+    "Tom & Jerry < 3 <> ok &am",
+    "<" + "x" * (MAX_TAG_CHARS + 20) + " then text",
+]
+
+
+def _stream(deltas):
+    sanitizer = StreamingHTMLSanitizer()
+    return "".join(sanitizer.feed(delta) for delta in deltas) + sanitizer.finish()
+
+
+def _split(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_plain_text_passes_through_unchanged():
+    sanitizer = StreamingHTMLSanitizer()
+    assert sanitizer.feed("Hello there") == "Hello there"
+    assert sanitizer.finish() == ""
+
+
+def test_tags_and_entities_split_across_deltas():
+    assert _stream(["Our <div cla", 'ss="x">best</d', "iv> sofa &am", "p; chair"]) == "Our best sofa & chair"
+
+
+@pytest.mark.parametrize("text", SAMPLES[:4])
+def test_same_output_as_the_whole_string_for_any_split(text):
+    rng = random.Random(text)
+    for _ in range(200):
+        assert _stream(_split(text, rng)) == strip_html_for_streaming(text)
+
+
+def test_unterminated_lt_does_not_hold_back_the_answer():
+    sanitizer = StreamingHTMLSanitizer()
+    out = sanitizer.feed(SAMPLES[4][:MAX_TAG_CHARS + 10])
+    assert out.startswith("<xxx")
+    assert out + sanitizer.feed(SAMPLES[4][MAX_TAG_CHARS + 10:]) + sanitizer.finish() == SAMPLES[4]
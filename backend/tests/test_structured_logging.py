@@ -0,0 +1,54 @@
+import json
+import logging
+import queue
+
+import structured_logging
+from structured_logging import (NOTICE, NonBlockingQueueHandler, SamplingFilter, StructuredFormatter, log_stats,
+                                redact)
+
+
+def _record(level=logging.INFO, category="db", message="hello", **fields):
+    record = logging.LogRecord("loft.test", level, __file__, 1, message, None, None)
+    record.category = category
+    record.fields = fields
+    return record
+
+
+def test_redact_masks_contact_details_and_secrets_only():
+    text = redact("jane@example.com called from (407) 555-0100 with api_key=abcdef123456 and sk-abcdefghijklmnop")
+    assert text == "<email> called from <phone> with api_key=<secret> and <secret>"
+    # Words that merely contain "token" and plain numbers are left alone
+    assert redact("tiktoken fallback for order 12345") == "tiktoken fallback for order 12345"
+
+
+def test_sampling_keeps_warnings_and_samples_info_per_category(monkeypatch):
+    sampler = SamplingFilter()
+    sampler.rates["db"] = 0.0
+    monkeypatch.setattr(structured_logging.random, "random", lambda: 0.5)
+    assert not sampler.filter(_record(logging.INFO))
+    assert sampler.filter(_record(NOTICE)) and sampler.filter(_record(logging.WARNING))
+    assert sampler.filter(_record(logging.INFO, category="chat"))
+    assert log_stats.sampled_out["db"] >= 1
+
+
+def test_queue_handler_snapshots_fields_and_drops_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    payload = {"items": list(range(100))}
+    handler.handle(_record(payload=payload, count=3))
+    payload["items"].clear()
+    record = handler.queue.get_nowait()
+    assert record.fields["count"] == 3 and "99" not in record.fields["payload"] and "0, 1" in record.fields["payload"]
+
+    dropped = log_stats.dropped
+    handler.handle(_record())
+    handler.handle(_record())
+    assert log_stats.dropped == dropped + 1
+
+
+def test_formatter_truncates_and_redacts_json_lines(monkeypatch):
+    monkeypatch.setattr(structured_logging, "LOG_FORMAT", "json")
+    monkeypatch.setattr(structured_logging, "LOG_MAX_MESSAGE_CHARS", 20)
+    line = StructuredFormatter().format(_record(message="x" * 50, caller="+14075550100"))
+    entry = json.loads(line)
+    assert entry["category"] == "db" and entry["caller"] == "<phone>"
+    assert entry["msg"] == "x" * 20 + "…(+30 chars)"
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from tool_outputs import COMPACT_MAX_PRODUCTS, TurnToolOutputs, compact_result, compact_tool
+from turn_events import CAROUSEL_MARKER
+
+
+def _product_result(count):
+    products = [{"name": f"Sofa {i}", "sku": f"SKU-{i}", "price": 999 + i,
+                 "media": [f"https://img.example.com/{i}.jpg"] * 3, "custom_attributes": {"color": "grey"}}
+                for i in range(count)]
+    header = json.dumps({"message": f"Found {count} sectionals"})
+    listing = "\n".join(f"{i + 1}. **{p['name']}** - ${p['price']}" for i, p in enumerate(products))
+    return f"**Function Result**\n{header}\n\n{listing}\n\n{CAROUSEL_MARKER} {json.dumps({'products': products})}"
+
+
+class _Deps:
+    def __init__(self):
+        self.tool_outputs = TurnToolOutputs()
+
+
+class _Ctx:
+    def __init__(self):
+        self.deps = _Deps()
+
+
+def test_compact_result_keeps_names_skus_and_prices():
+    text = _product_result(2)
+    carousel = json.loads(text.split(CAROUSEL_MARKER)[1])
+    compact = compact_result("search_magento_products", text, carousel)
+    assert compact.splitlines() == [
+        "search_magento_products: Found 2 sectionals",
+        "2 products are shown to the customer as product cards (photos, prices, links).",
+        "1. Sofa 0 | SKU SKU-0 | $999.00",
+        "2. Sofa 1 | SKU SKU-1 | $1,000.00",
+    ]
+
+
+def test_compact_result_is_bounded():
+    products = [{"name": f"Sofa {i}", "sku": str(i), "price": "call us"} for i in range(COMPACT_MAX_PRODUCTS + 3)]
+    compact = compact_result("search", "Results", {"products": products})
+    assert compact.endswith("... and 3 more in the cards")
+    assert "| call us" in compact
+
+
+def test_compact_tool_moves_the_carousel_to_the_turn():
+    @compact_tool
+    async def search_magento_products(ctx, query: str = ""):
+        return _product_result(3)
+
+    ctx = _Ctx()
+    compact = asyncio.run(search_magento_products(ctx, query="sectional"))
+    assert CAROUSEL_MARKER not in compact and "media" not in compact
+    outputs = ctx.deps.tool_outputs
+    assert [p["sku"] for p in outputs.carousel()["products"]] == ["SKU-0", "SKU-1", "SKU-2"]
+    assert outputs.saved_tokens > 0
+
+
+def test_results_without_products_pass_unchanged():
+    @compact_tool
+    async def get_customer_by_phone(ctx, phone: str = ""):
+        return "Customer: Jane Doe"
+
+    @compact_tool
+    async def search_magento_products(ctx, query: str = ""):
+        return f"No matches. {CAROUSEL_MARKER} {{\"products\": []}}"
+
+    ctx = _Ctx()
+    assert asyncio.run(get_customer_by_phone(ctx, phone="407-555-0100")) == "Customer: Jane Doe"
+    assert asyncio.run(search_magento_products(ctx, query="x")).startswith("No matches.")
+    assert ctx.deps.tool_outputs.carousel() is None
@@ -0,0 +1,62 @@
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.models.test import TestModel
+
+from tool_routing import COMMON_TOOLS, INTENT_TOOL_GROUPS, ToolRouter, classify_intent
+
+
+def test_topic_words_pick_the_intent():
+    assert classify_intent("show me grey sectionals under $2000") == "products"
+    assert classify_intent("where is my order? it arrived damaged") == "customer"
+    assert classify_intent("my number is 407-555-0100") == "customer"
+    assert classify_intent("find orders for 1234567890") == "customer"
+    assert classify_intent("hi there!") == "general"
+
+
+def test_ambiguous_or_calendar_turns_get_every_tool():
+    assert classify_intent("recommend a recliner based on my past orders") == "full"
+    assert classify_intent("can I book an appointment to see sofas") == "full"
+    assert classify_intent("I was wondering whether you could help me figure something out about this") == "full"
+
+
+def test_my_questions_are_about_the_account_when_logged_in():
+    question = "can you remind me what my last visit covered"
+    assert classify_intent(question, is_authenticated=True) == "customer"
+    assert classify_intent(question) == "full"
+
+
+def test_short_follow_ups_stay_on_the_previous_intent():
+    assert classify_intent("yes please", previous_intent="customer") == "customer"
+    assert classify_intent("the second", previous_intent="products") == "products"
+    assert classify_intent("sure, check that", previous_intent="full") == "full"
+    assert classify_intent("show me more", has_product_context=True) == "products"
+    assert classify_intent("yes please") == "general"
+
+
+def _router():
+    agent = Agent(TestModel())
+    functions = {}
+    for name in {name for names in INTENT_TOOL_GROUPS.values() for name in names}:
+        async def tool(ctx: RunContext[None]) -> str:
+            return "ok"
+        tool.__name__ = name
+        agent.tool(tool)
+        functions[name] = tool
+    return ToolRouter(agent, {"model": TestModel()}, functions)
+
+
+def test_router_builds_one_agent_per_intent_with_only_its_tools():
+    router = _router()
+    assert router.tool_counts["general"] == len(COMMON_TOOLS)
+    assert router.tool_counts["products"] == len(INTENT_TOOL_GROUPS["products"])
+    assert router.tool_counts["full"] == len(router.agents["full"]._function_tools)
+    assert set(router.agents["customer"]._function_tools) == set(INTENT_TOOL_GROUPS["customer"])
+
+
+def test_router_remembers_each_conversations_intent():
+    router = _router()
+    assert router.select("show me sectionals", conversation_id="c1")[0] == "products"
+    assert router.select("yes", conversation_id="c1")[0] == "products"
+    # History this process has never seen (restart, other worker): follow-ups get every tool
+    assert router.select("yes", conversation_id="c2", has_history=True)[0] == "full"
+    assert router.select("hello", force_full=True)[0] == "full"
+    assert router.snapshot()["turns"]["products"] == 2
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from turn_events import TurnEvents, extract_carousel, publishing_tool, sse_event, tool_payload
+
+CAROUSEL = {"products": [{"name": "Dakota Sofa", "sku": "D-1"}]}
+TOOL_RESULT = f"Found 1 sofa.\n\n**CAROUSEL_DATA:** {json.dumps(CAROUSEL)}\n\nAsk about delivery!"
+
+
+@publishing_tool
+async def search_products(ctx, query: str):
+    return TOOL_RESULT
+
+
+@publishing_tool
+async def get_store_hours(ctx):
+    raise RuntimeError("store API down")
+
+
+def test_extract_carousel_reads_the_json_after_the_marker_only():
+    assert extract_carousel(TOOL_RESULT) == CAROUSEL
+    assert extract_carousel("no carousel here") is None
+    assert extract_carousel("**CAROUSEL_DATA:** {not json") is None
+    assert extract_carousel({"products": []}) is None
+    assert tool_payload(TOOL_RESULT) == {"carousel": CAROUSEL}
+    assert tool_payload('**CAROUSEL_DATA:** {"products": []}') is None
+
+
+def test_tool_events_are_published_while_the_turn_runs():
+    events = TurnEvents()
+    seen = []
+
+    async def turn():
+        await search_products(SimpleNamespace(tool_call_id="call-1"), query="grey sofa")
+        # The endpoint sees the carousel before the model has written anything
+        await asyncio.sleep(0)
+        assert [event["type"] for event in seen] == ["tool_start", "tool_result"]
+        events.publish("text_delta", text="Here is the Dakota Sofa.")
+
+    async def run():
+        events.start(turn)
+        async for event in events:
+            seen.append(event)
+
+    asyncio.run(run())
+    start, result, text = seen
+    assert start == {"type": "tool_start", "tool": "search_products", "call_id": "call-1",
+                     "arguments": {"query": "grey sofa"}}
+    assert result["ok"] and result["payload"] == {"carousel": CAROUSEL}
+    assert text["text"] == "Here is the Dakota Sofa."
+    assert events.tools[0]["tool"] == "search_products" and events.tools[0]["ok"]
+
+
+def test_failed_tools_are_reported_and_turn_errors_reach_the_endpoint():
+    events = TurnEvents()
+
+    async def turn():
+        await get_store_hours(SimpleNamespace(tool_call_id=None))
+
+    async def run():
+        events.start(turn)
+        return [event async for event in events]
+
+    with pytest.raises(RuntimeError, match="store API down"):
+        asyncio.run(run())
+    assert events.tools[0]["ok"] is False
+
+
+def test_tools_outside_a_turn_run_unwrapped():
+    assert asyncio.run(search_products(SimpleNamespace(), query="sofa")) == TOOL_RESULT
+
+
+def test_sse_event_keeps_the_openai_delta_shape_for_text():
+    line = sse_event({"type": "text_delta", "text": "Hi"})
+    assert line.startswith("data: ") and line.endswith("\n\n")
+    assert json.loads(line[6:])["choices"][0]["delta"]["content"] == "Hi"
+    assert json.loads(sse_event({"type": "done", "tools": []})[6:]) == {"type": "done", "tools": []}
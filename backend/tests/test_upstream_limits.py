@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+import upstream_limits
+from deadlines import Deadline, current_deadline
+from upstream_limits import RateLimitedModel, TokenBucket, UpstreamLimiter, UpstreamOverloaded
+
+
+def test_bucket_allows_the_burst_then_paces_at_the_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=2)
+        started = time.monotonic()
+        results = [await bucket.acquire(started + 1) for _ in range(4)]
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(run())
+    assert results == [True] * 4
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_bucket_refuses_a_token_it_cannot_get_before_the_deadline():
+    async def run():
+        bucket = TokenBucket(rate=1, burst=1)
+        assert await bucket.acquire(time.monotonic() + 1)
+        return await bucket.acquire(time.monotonic() + 0.1)
+
+    assert asyncio.run(run()) is False
+
+
+def test_bulkhead_sheds_callers_past_the_max_wait():
+    limiter = UpstreamLimiter("loft", rate=100, burst=100, max_concurrency=1, max_wait_seconds=0.05)
+
+    async def run():
+        async with limiter.slot():
+            with pytest.raises(UpstreamOverloaded):
+                async with limiter.slot():
+                    pass
+        async with limiter.slot():
+            pass
+
+    asyncio.run(run())
+    assert (limiter.shed, limiter.admitted, limiter.in_flight, limiter.queued) == (1, 2, 0, 0)
+
+
+def test_slot_wait_is_capped_by_the_turn_deadline():
+    limiter = UpstreamLimiter("loft", rate=100, burst=100, max_concurrency=1, max_wait_seconds=10)
+
+    async def run():
+        current_deadline.set(Deadline("phone", 0.2, 0.1))
+        async with limiter.slot():
+            started = time.monotonic()
+            with pytest.raises(UpstreamOverloaded):
+                async with limiter.slot():
+                    pass
+            return time.monotonic() - started
+
+    assert asyncio.run(run()) < 1
+
+
+def test_model_takes_a_slot_per_request_not_per_run(monkeypatch):
+    limiter = UpstreamLimiter("openai", rate=100, burst=100, max_concurrency=4, max_wait_seconds=1)
+    seen_in_flight = []
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        seen_in_flight.append(limiter.in_flight)
+        return ModelResponse(parts=[TextPart("Hello!")])
+
+    monkeypatch.setitem(upstream_limits.upstream_limiters, "openai", limiter)
+    model = RateLimitedModel(FunctionModel(respond), upstream_name="openai")
+    result = Agent(model).run_sync("hi")
+    assert result.data == "Hello!"
+    assert seen_in_flight == [1]
+    assert limiter.admitted == 1 and limiter.in_flight == 0
+    assert model.model_name == model.wrapped.model_name
@@ -0,0 +1,67 @@
+from voice_stream import SentenceChunker, SpeechStream, VOICE_MAX_SENTENCE_CHARS, completion_chunk, speech_text
+
+
+def _stream(deltas):
+    speech = SpeechStream()
+    sentences = []
+    for delta in deltas:
+        sentences += speech.feed(delta)
+    return sentences + speech.finish()
+
+
+def test_sentences_are_released_as_soon_as_they_end():
+    chunker = SentenceChunker()
+    assert chunker.feed("We have three sectionals") == []
+    assert chunker.feed(" in stock. The first") == ["We have three sectionals in stock. "]
+    assert chunker.flush() == "The first"
+
+
+def test_abbreviations_and_prices_do_not_end_a_sentence():
+    chunker = SentenceChunker()
+    assert chunker.feed("Dr. Smith paid $1,299.99 for it. Next") == ["Dr. Smith paid $1,299.99 for it. "]
+
+
+def test_line_breaks_end_a_sentence_and_list_markers_are_not_spoken():
+    assert _stream(["Here are your options:\n1. Dakota", " sofa\n2. Aspen chair"]) == \
+        ["Here are your options:", "Dakota sofa", "Aspen chair"]
+
+
+def test_overlong_runs_are_cut_at_a_comma():
+    chunker = SentenceChunker()
+    text = "word, " * (VOICE_MAX_SENTENCE_CHARS // 6 + 10)
+    sentences = chunker.feed(text)
+    assert sentences
+    assert all(len(sentence) <= VOICE_MAX_SENTENCE_CHARS for sentence in sentences)
+    assert all(sentence.endswith(",") for sentence in sentences)
+
+
+def test_speech_text_drops_markup_but_keeps_words():
+    assert speech_text("**Great news!** 🎉 The [Dakota sofa](https://x.com/p/1) is _on sale_.") == \
+        "Great news! The Dakota sofa is on sale."
+    assert speech_text("- Model: `ABC-123`") == "Model: ABC-123"
+    assert speech_text("I used search_magento_products for that.") == "I used search magento products for that."
+
+
+def test_html_split_across_deltas_is_not_spoken():
+    assert _stream(["Our <str", "ong>best</strong> pick.", " Anything else?"]) == \
+        ["Our best pick.", "Anything else?"]
+
+
+def test_carousel_data_is_never_spoken_even_split_across_deltas():
+    sentences = _stream(["Here are two sofas. **CAROUSEL", "_DATA:** {\"products\": [{\"name\": \"Sofa.\"}]}"])
+    assert sentences == ["Here are two sofas."]
+
+
+def test_partial_releases_the_first_clause_for_the_deadline():
+    speech = SpeechStream()
+    assert speech.feed("Sure, let me check that for you") == []
+    assert speech.partial() == ["Sure,"]
+    assert speech.finish() == ["let me check that for you"]
+    assert speech.sentences_sent == 2
+
+
+def test_completion_chunk_format():
+    line = completion_chunk("chatcmpl-1", "Hello.")
+    assert line.startswith("data: {") and line.endswith("\n\n")
+    assert '"content": "Hello."' in line
+    assert '"delta": {}' in completion_chunk("chatcmpl-1", finish_reason="stop")
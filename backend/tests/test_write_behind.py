@@ -0,0 +1,137 @@
+import asyncio
+
+import asyncpg
+
+from conftest import FakePool
+from conversation_memory import MESSAGE_FLUSH_MAX_RETRIES, SimpleMemory
+
+
+def _memory(handler=None):
+    memory = SimpleMemory()
+    memory.pool = FakePool(handler)
+    return memory
+
+
+def _inserted(pool):
+    rows = []
+    for method, query, args in pool.calls:
+        if query.startswith("INSERT INTO chatbot_messages"):
+            rows += args[0] if method == "executemany" else [args]
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+def test_saves_return_at_once_and_are_flushed_in_one_batch():
+    memory = _memory()
+
+    async def run():
+        await memory.save_user_message("conv-1", "hi")
+        await memory.save_assistant_message("conv-1", "Hello!", "get_store_hours", {"day": "mon"}, {"open": 9})
+        assert memory.pool.calls == []    # nothing written on the response path
+        await asyncio.sleep(0.2)          # the background flush runs after the interval
+
+    asyncio.run(run())
+    assert memory.pool.queries("executemany") and len(memory.pool.calls) == 1
+    assert _inserted(memory.pool) == [("conv-1", "user", "hi"), ("conv-1", "assistant", "Hello!")]
+    row = memory.pool.calls[0][2][0][1]
+    assert (row[3], row[4], row[5]) == ("get_store_hours", '{"day": "mon"}', '{"open": 9}')
+    assert memory.write_snapshot()["pending"] == 0
+
+
+def test_direct_reads_flush_queued_messages_first():
+    memory = _memory()
+
+    async def run():
+        await memory.save_user_message("conv-1", "hi")
+        await memory.get_recent_messages("conv-1")
+
+    asyncio.run(run())
+    assert [method for method, _, _ in memory.pool.calls] == ["executemany", "fetch"]
+
+
+def test_rejected_batch_falls_back_to_row_inserts_and_drops_only_bad_rows():
+    def handler(method, query, args):
+        if method == "executemany":
+            raise asyncpg.ForeignKeyViolationError("conversation does not exist")
+        if method == "execute" and args[0] == "missing":
+            raise asyncpg.ForeignKeyViolationError("conversation does not exist")
+
+    memory = _memory(handler)
+
+    async def run():
+        await memory.save_user_message("conv-1", "first")
+        await memory.save_user_message("missing", "orphan")
+        await memory.save_user_message("conv-2", "second")
+        await memory.flush()
+
+    asyncio.run(run())
+    executed = [args[:3] for method, _, args in memory.pool.calls if method == "execute"]
+    assert executed == [("conv-1", "user", "first"), ("missing", "user", "orphan"), ("conv-2", "user", "second")]
+    assert memory.write_stats["dropped"] == 1 and memory.write_stats["flushed"] == 2
+
+
+def test_connection_errors_requeue_in_order_then_give_up():
+    attempts = []
+
+    def handler(method, query, args):
+        attempts.append(method)
+        if len(attempts) <= 2:
+            raise ConnectionError("pool closed")
+
+    memory = _memory(handler)
+
+    async def run():
+        await memory.save_user_message("conv-1", "a")
+        await memory.save_user_message("conv-1", "b")
+        await memory.flush()
+        assert [row[2] for row in memory._pending] == ["a", "b"]
+        await memory.flush()
+        await memory.flush()
+
+    asyncio.run(run())
+    assert _inserted(memory.pool)[-2:] == [("conv-1", "user", "a"), ("conv-1", "user", "b")]
+    assert memory.write_stats["flushed"] == 2 and not memory._pending
+
+    def down(method, query, args):
+        raise ConnectionError("down")
+
+    always_down = _memory(down)
+
+    async def exhaust():
+        await always_down.save_user_message("conv-1", "lost")
+        for _ in range(MESSAGE_FLUSH_MAX_RETRIES + 1):
+            await always_down.flush()
+
+    asyncio.run(exhaust())
+    assert always_down.write_stats["dropped"] == 1 and not always_down._pending
+
+
+def test_close_drains_the_queue():
+    memory = _memory()
+
+    class ClosingPool(FakePool):
+        closed = False
+
+        async def close(self):
+            self.closed = True
+
+    memory.pool = ClosingPool()
+
+    async def run():
+        await memory.save_user_message("conv-1", "bye")
+        await memory.close()
+
+    asyncio.run(run())
+    assert _inserted(memory.pool) == [("conv-1", "user", "bye")] and memory.pool.closed
+
+
+def test_empty_and_oversized_messages():
+    memory = _memory()
+
+    async def run():
+        assert await memory.save_user_message("conv-1", "   ") is None
+        await memory.save_user_message("conv-1", "x" * 6000)
+        await memory.flush()
+
+    asyncio.run(run())
+    content = _inserted(memory.pool)[0][2]
+    assert len(content) < 5000 and content.endswith("[...message truncated for length...]")
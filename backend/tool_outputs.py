@@ -0,0 +1,147 @@
+"""
+🗜️ COMPACT TOOL OUTPUTS FOR THE MODEL
+Product tools return one string for everybody: a "Function Result" JSON dump,
+HTML headers, a numbered list, bullet menus and a **CAROUSEL_DATA:** blob with
+every product's media and custom_attributes. The model only needs names, SKUs,
+prices and counts, but got (and was told to repeat) all of it, and the repeated
+JSON was then stored in history.
+
+compact_tool() splits such a result in two:
+- the model gets a short summary (one line per product)
+- the carousel is the UI payload: streamed to the client as the tool_result
+  event (turn_events.publishing_tool sees the full result) and kept on the
+  turn's TurnToolOutputs for responses that aren't streamed
+
+Results without a carousel (customer records, directions, ...) pass unchanged.
+"""
+
+import functools
+import json
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from prompt_budget import count_tokens
+from turn_events import CAROUSEL_MARKER, extract_carousel
+
+COMPACT_MAX_PRODUCTS = 12
+
+
+def _result_message(text: str) -> Optional[str]:
+    """"message" of the **Function Result** JSON at the top of a tool result, if any"""
+    start = text.find("{")
+    if start == -1 or start > text.find(CAROUSEL_MARKER):
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+    except ValueError:
+        return None
+    return data.get("message") if isinstance(data, dict) else None
+
+
+def _headline(tool_name: str, text: str) -> str:
+    message = _result_message(text)
+    if message:
+        return f"{tool_name}: {message}"
+    for line in text.splitlines():
+        line = line.strip().strip("*").strip()
+        if line and not line.startswith(("{", "<")) and not line.startswith("Function Result"):
+            return f"{tool_name}: {line}"
+    return tool_name
+
+
+def _price(value: Any) -> str:
+    try:
+        return f"${float(value):,.2f}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def compact_result(tool_name: str, text: str, carousel: Dict[str, Any]) -> str:
+    """The model's view of a product result: headline, count and one line per product"""
+    products = carousel.get("products") or []
+    lines = [
+        _headline(tool_name, text),
+        f"{len(products)} products are shown to the customer as product cards (photos, prices, links).",
+    ]
+    for i, product in enumerate(products[:COMPACT_MAX_PRODUCTS], 1):
+        lines.append(f"{i}. {product.get('name', 'Product')} | SKU {product.get('sku', 'N/A')} | {_price(product.get('price', 0))}")
+    if len(products) > COMPACT_MAX_PRODUCTS:
+        lines.append(f"... and {len(products) - COMPACT_MAX_PRODUCTS} more in the cards")
+    return "\n".join(lines)
+
+
+class TurnToolOutputs:
+    """One turn's UI payloads and how many tool-output tokens compaction kept out of the prompt"""
+
+    __slots__ = ("payloads", "full_tokens", "compact_tokens")
+
+    def __init__(self):
+        self.payloads: List[Dict[str, Any]] = []
+        self.full_tokens = 0
+        self.compact_tokens = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.full_tokens - self.compact_tokens
+
+    def carousel(self) -> Optional[Dict[str, Any]]:
+        """The turn's products as one carousel (for clients that read CAROUSEL_DATA from the text)"""
+        products = [product for payload in self.payloads for product in payload.get("products", [])]
+        return {"products": products} if products else None
+
+
+class ToolOutputStats:
+    """Process-wide: tool-output prompt tokens saved per turn"""
+
+    def __init__(self, samples: int = 500):
+        self.compacted = 0
+        self.turns = 0
+        self.full_tokens = 0
+        self.compact_tokens = 0
+        self.saved_per_turn: "deque[int]" = deque(maxlen=samples)
+
+    def record_turn(self, outputs: TurnToolOutputs):
+        if not outputs.full_tokens:
+            return
+        self.turns += 1
+        self.full_tokens += outputs.full_tokens
+        self.compact_tokens += outputs.compact_tokens
+        self.saved_per_turn.append(outputs.saved_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.saved_per_turn)
+        return {
+            "compacted_results": self.compacted,
+            "turns": self.turns,
+            "full_tokens": self.full_tokens,
+            "compact_tokens": self.compact_tokens,
+            "saved_tokens": self.full_tokens - self.compact_tokens,
+            "saved_ratio": round(1 - self.compact_tokens / self.full_tokens, 3) if self.full_tokens else 0.0,
+            "saved_per_turn_p50": samples[len(samples) // 2] if samples else 0,
+            "saved_per_turn_max": samples[-1] if samples else 0,
+        }
+
+
+tool_output_stats = ToolOutputStats()
+
+
+def compact_tool(func):
+    """Wrap a tool so the model gets the compact view of product results"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        result = await func(ctx, *args, **kwargs)
+        carousel = extract_carousel(result)
+        if not carousel or not carousel.get("products"):
+            return result
+        compact = compact_result(name, result, carousel)
+        tool_output_stats.compacted += 1
+        outputs = getattr(getattr(ctx, "deps", None), "tool_outputs", None)
+        if outputs is not None:
+            outputs.payloads.append(carousel)
+            outputs.full_tokens += count_tokens(result)
+            outputs.compact_tokens += count_tokens(compact)
+        return compact
+
+    return wrapper
@@ -0,0 +1,133 @@
+"""
+🧭 PER-INTENT TOOL ROUTING
+A cheap keyword classifier picks the intent of a turn; each intent maps to the
+subset of tools it needs, so the LLM request only carries those tool schemas.
+Anything ambiguous (several intents, calendar requests) falls back to "full".
+Short follow-ups ("yes", "sure, check that") stay on the previous turn's intent,
+so the action the model just offered is still available.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pydantic_ai import Agent
+
+# Tools every intent keeps (handoffs the model may need in any conversation)
+COMMON_TOOLS = ["connect_to_support", "show_directions", "start_demo_call", "recall_user_memory"]
+
+INTENT_TOOL_GROUPS: Dict[str, List[str]] = {
+    "general": COMMON_TOOLS,
+    "products": COMMON_TOOLS + [
+        "search_magento_products", "get_product_by_position", "get_product_photos",
+        "get_magento_product_by_sku", "get_all_furniture_brands", "get_all_furniture_colors",
+        "search_products_by_price_range", "search_products_by_brand_and_category",
+        "get_featured_best_seller_products", "get_magento_categories", "get_magento_products_by_category",
+        "show_sectional_products", "show_recliner_products", "show_dining_products",
+        "get_product_recommendations",
+    ],
+    "customer": COMMON_TOOLS + [
+        "get_customer_by_phone", "get_customer_by_email", "get_orders_by_customer", "get_order_details",
+        "get_customer_journey", "get_complete_customer_journey", "analyze_customer_patterns",
+        "get_customer_analytics", "get_product_recommendations", "handle_support_escalation",
+        "get_magento_customer_by_email",
+    ],
+}
+
+PRODUCT_WORDS = re.compile(
+    r"\b(sofas?|couch(es)?|sectionals?|recliners?|loveseats?|dining|tables?|chairs?|beds?|bedroom|mattress(es)?|"
+    r"dressers?|ottomans?|furniture|brands?|colou?rs?|price|prices|budget|under \$?\d+|cheap|sku|photos?|"
+    r"pictures?|images?|featured|best ?sellers?|popular|catalog|categor(y|ies)|products?|in stock|"
+    r"(first|second|third|fourth|fifth|last) one|#\d+)\b"
+)
+CUSTOMER_WORDS = re.compile(
+    r"\b(orders?|purchases?|bought|delivery|deliveries|account|my info|about me|tell me everything|"
+    r"complete info|journey|analytics|patterns|spending|recommend(ations?)?|damaged|broken|defective|"
+    r"problem|issue|complaint|refund|return|warranty|escalat\w*|customer)\b"
+)
+CALENDAR_WORDS = re.compile(r"\b(appointment|schedule|calendar|book(ing)?|reschedule|meeting)\b")
+PHONE_RE = re.compile(r"\b\d{3}-\d{3}-\d{4}\b")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+IDENTIFIER_RE = re.compile(rf"{PHONE_RE.pattern}|\b\d{{10}}\b|{EMAIL_RE.pattern}")   # bare 10 digits: customer_id
+FOLLOW_UP_RE = re.compile(r"^\s*(yes|yeah|sure|ok(ay)?|more|another|next|show me|that one|the \w+ one)\b")
+GREETING_RE = re.compile(r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|bye|goodbye)\b[\s!.,]*$")
+SHORT_MESSAGE_WORDS = 6
+TRACKED_CONVERSATIONS = 5000
+
+
+def classify_intent(message: str, has_product_context: bool = False, is_authenticated: bool = False,
+                    previous_intent: Optional[str] = None) -> str:
+    """
+    Intent of one turn: "general", "products", "customer" or "full".
+
+    Args:
+        message: The user's message
+        has_product_context: The user has recent product search results (follow-ups stay on products)
+        is_authenticated: Customer is logged in ("my ..." questions are about their account)
+        previous_intent: Intent of the conversation's previous turn (None on the first turn)
+    """
+    text = message.lower()
+    if CALENDAR_WORDS.search(text):
+        return "full"
+
+    products = bool(PRODUCT_WORDS.search(text))
+    customer = bool(CUSTOMER_WORDS.search(text) or IDENTIFIER_RE.search(text))
+    if is_authenticated and re.search(r"\bmy\b", text) and not products:
+        customer = True
+
+    if products and customer:
+        return "full"
+    if products:
+        return "products"
+    if customer:
+        return "customer"
+    if GREETING_RE.match(text):
+        return "general"
+    short = len(text.split()) <= SHORT_MESSAGE_WORDS
+    # A short answer to what the assistant just said needs that turn's tools
+    if previous_intent in ("products", "customer", "full") and (short or FOLLOW_UP_RE.search(text)):
+        return previous_intent
+    if has_product_context and FOLLOW_UP_RE.search(text):
+        return "products"
+    # Short opening messages with no topic words are small talk
+    if short and previous_intent is None:
+        return "general"
+    return "full"
+
+
+class ToolRouter:
+    """Pre-built agents per intent (same prompt and model, subset of the tools) + routing stats"""
+
+    def __init__(self, full_agent, agent_kwargs: Dict, tool_functions: Dict):
+        self.agents = {"full": full_agent}
+        self.tool_counts = {"full": len(tool_functions)}
+        # MCP toolsets (calendar) only go with the full agent
+        subset_kwargs = {key: value for key, value in agent_kwargs.items() if key not in ("toolsets", "mcp_servers")}
+        for intent, names in INTENT_TOOL_GROUPS.items():
+            tools = [tool_functions[name] for name in names if name in tool_functions]
+            self.agents[intent] = Agent(**subset_kwargs, tools=tools)
+            self.tool_counts[intent] = len(tools)
+        self.turns = {intent: 0 for intent in self.agents}
+        self._last_intent: "OrderedDict[str, str]" = OrderedDict()   # conversation_id → previous turn's intent
+        print(f"🧭 Tool router ready: {self.tool_counts}")
+
+    def select(self, message: str, has_product_context: bool = False, is_authenticated: bool = False,
+               force_full: bool = False, conversation_id: Optional[str] = None, has_history: bool = False):
+        """
+        (intent, agent) for one turn. A conversation with history whose last intent this
+        process doesn't know (restart, other worker) counts as "full" for follow-ups.
+        """
+        previous = self._last_intent.get(conversation_id) if conversation_id else None
+        if previous is None and has_history:
+            previous = "full"
+        intent = "full" if force_full else classify_intent(message, has_product_context, is_authenticated, previous)
+        self.turns[intent] += 1
+        if conversation_id:
+            self._last_intent[conversation_id] = intent
+            self._last_intent.move_to_end(conversation_id)
+            while len(self._last_intent) > TRACKED_CONVERSATIONS:
+                self._last_intent.popitem(last=False)
+        return intent, self.agents[intent]
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {"turns": dict(self.turns), "tools": dict(self.tool_counts)}
@@ -0,0 +1,166 @@
+"""
+📡 TYPED EVENTS FOR THE CHAT STREAM
+The streaming endpoint used to send only LLM text deltas, so a product carousel
+reached the client only once the model had repeated the tool's
+**CAROUSEL_DATA:** line, and tool metadata only came after the whole stream.
+
+Now each turn has an event channel and the SSE stream is typed:
+- tool_start   a tool was called (name, call_id, bounded arguments)
+- tool_result  the tool returned (ok, duration_ms, structured payload such as
+               the carousel), sent the moment it returns
+- text_delta   LLM text (still carries choices[0].delta.content)
+- done         end of the turn, with a summary of the tools that ran
+
+The agent runs in a background task with the channel in a contextvar; every
+registered tool is wrapped by publishing_tool(), which publishes to the
+channel of the turn it runs in. The endpoint drains the channel into the
+response while the agent is still working.
+
+Usage:
+    events = TurnEvents()
+    events.start(run_turn)          # run_turn() calls agent.run_stream(...)
+    async for event in events:      # re-raises whatever run_turn raised
+        yield sse_event(event)
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import reprlib
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+CAROUSEL_MARKER = "**CAROUSEL_DATA:**"
+
+_argument_repr = reprlib.Repr()
+_argument_repr.maxstring = 200
+_argument_repr.maxother = 200
+
+current_turn_events: "contextvars.ContextVar[Optional[TurnEvents]]" = contextvars.ContextVar(
+    "current_turn_events", default=None
+)
+
+_CLOSED = object()
+
+
+def extract_carousel(text: Any) -> Optional[Dict[str, Any]]:
+    """The JSON object after **CAROUSEL_DATA:** in a tool result, if any"""
+    if not isinstance(text, str):
+        return None
+    marker = text.find(CAROUSEL_MARKER)
+    if marker == -1:
+        return None
+    start = text.find("{", marker)
+    if start == -1:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _bounded(value: Any) -> Any:
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, str):
+        return value[:200]
+    return _argument_repr.repr(value)
+
+
+def tool_payload(result: Any) -> Optional[Dict[str, Any]]:
+    """Structured part of a tool result the client can render on its own"""
+    carousel = extract_carousel(result)
+    if carousel and carousel.get("products"):
+        return {"carousel": carousel}
+    return None
+
+
+class TurnEvents:
+    """Event channel of one chat turn, fed by the agent task and drained by the endpoint"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self.usage = None                        # the run's usage, set by the turn
+        self.tools: List[Dict[str, Any]] = []   # one entry per finished tool call
+
+    def publish(self, event_type: str, **data):
+        self._queue.put_nowait({"type": event_type, **data})
+
+    def close(self, error: Optional[BaseException] = None):
+        self._error = error
+        self._queue.put_nowait(_CLOSED)
+
+    def start(self, turn: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        """Run the turn in a background task that publishes to this channel"""
+        async def runner():
+            current_turn_events.set(self)
+            try:
+                await turn()
+            except asyncio.CancelledError:
+                self.close()
+                raise
+            except Exception as e:
+                self.close(e)
+            else:
+                self.close()
+
+        self.task = asyncio.create_task(runner())
+        return self.task
+
+    def cancel(self):
+        """Stop the turn (the client went away)"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def __aiter__(self):
+        while True:
+            event = await self._queue.get()
+            if event is _CLOSED:
+                break
+            yield event
+        if self._error is not None:
+            raise self._error
+
+
+def publishing_tool(func):
+    """Wrap a tool so it publishes tool_start / tool_result to the current turn's channel"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        events = current_turn_events.get()
+        if events is None:
+            return await func(ctx, *args, **kwargs)
+        call_id = getattr(ctx, "tool_call_id", None) or uuid.uuid4().hex[:12]
+        events.publish("tool_start", tool=name, call_id=call_id,
+                       arguments={key: _bounded(value) for key, value in kwargs.items()})
+        started = time.monotonic()
+        try:
+            result = await func(ctx, *args, **kwargs)
+        except Exception as e:
+            duration_ms = round((time.monotonic() - started) * 1000, 1)
+            events.tools.append({"tool": name, "call_id": call_id, "arguments": kwargs,
+                                 "ok": False, "duration_ms": duration_ms})
+            events.publish("tool_result", tool=name, call_id=call_id, ok=False,
+                           duration_ms=duration_ms, error=str(e)[:200])
+            raise
+        duration_ms = round((time.monotonic() - started) * 1000, 1)
+        events.tools.append({"tool": name, "call_id": call_id, "arguments": kwargs,
+                             "ok": True, "duration_ms": duration_ms})
+        events.publish("tool_result", tool=name, call_id=call_id, ok=True,
+                       duration_ms=duration_ms, payload=tool_payload(result))
+        return result
+
+    return wrapper
+
+
+def sse_event(event: Dict[str, Any], model: str = "loft-chat") -> str:
+    """One SSE data line; text_delta keeps the OpenAI-style delta for older clients"""
+    if event["type"] == "text_delta":
+        event = {"type": "text_delta", "choices": [{"delta": {"content": event["text"]}}], "model": model}
+    return f"data: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,203 @@
+"""
+🚦 UPSTREAM RATE LIMITS + BULKHEADS
+Per-upstream token bucket (requests/second) and concurrency bulkhead.
+Callers queue for a slot up to a deadline and are shed with UpstreamOverloaded
+after that, so a slow or rate-limited dependency can't pile up unbounded work.
+
+Usage:
+    async with upstream("loft").slot():
+        response = await client.get(...)
+
+Agent runs pass model=rate_limited_model(name), so "openai" slots are taken per
+model request (one per tool round trip), not held while tools run.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pydantic_ai.models.wrapper import WrapperModel
+
+from deadlines import capped_wait
+from structured_logging import get_logger
+
+log = get_logger("tool")
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when a call could not get an upstream slot before its deadline"""
+    def __init__(self, upstream_name: str, waited: float):
+        self.upstream_name = upstream_name
+        self.waited = waited
+        super().__init__(f"{upstream_name} is overloaded (waited {waited:.2f}s for a slot)")
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/second, holding at most `burst` tokens"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()  # waiters take tokens in FIFO order
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, deadline: float) -> bool:
+        """Take one token, waiting no later than `deadline` (monotonic). False if it can't make it."""
+        # Waiting for the waiters ahead counts against the deadline too
+        try:
+            await asyncio.wait_for(self._lock.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            return False
+        try:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    return False
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            return True
+        finally:
+            self._lock.release()
+
+
+class UpstreamLimiter:
+    """Token bucket + concurrency bulkhead + queue metrics for one upstream"""
+
+    def __init__(self, name: str, rate: float, burst: int, max_concurrency: int, max_wait_seconds: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_wait_seconds = max_wait_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Metrics
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self, max_wait_seconds: Optional[float] = None):
+        """Wait (up to the deadline) for a rate token and a concurrency slot"""
+        started = time.monotonic()
+        # Never queue past the turn's deadline (phone turns have seconds, not the full max wait)
+        deadline = started + capped_wait(self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds)
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        acquired = False
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                acquired = True
+            except asyncio.TimeoutError:
+                pass
+            if acquired and not await self.bucket.acquire(deadline):
+                self._semaphore.release()
+                acquired = False
+        finally:
+            self.queued -= 1
+
+        waited = time.monotonic() - started
+        if not acquired:
+            self.shed += 1
+            log.warning(f"🚦 Shed {self.name} call after {waited:.2f}s", in_flight=self.in_flight, queued=self.queued)
+            raise UpstreamOverloaded(self.name, waited)
+
+        self.admitted += 1
+        self.total_wait_seconds += waited
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.admitted, 1) if self.admitted else 0.0,
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": self.bucket.rate,
+        }
+
+
+# Defaults per upstream: (requests/second, burst, max concurrency, max queue wait seconds)
+# Override with UPSTREAM_<NAME>_RPS / _BURST / _CONCURRENCY / _MAX_WAIT
+UPSTREAM_DEFAULTS = {
+    "magento_catalog": (10.0, 20, 8, 5.0),
+    "magento_customers": (5.0, 10, 4, 5.0),
+    "loft": (10.0, 20, 8, 5.0),
+    "vapi": (2.0, 5, 2, 10.0),
+    "openai": (20.0, 40, 16, 20.0),
+}
+
+
+def _build_limiter(name: str) -> UpstreamLimiter:
+    rate, burst, concurrency, max_wait = UPSTREAM_DEFAULTS[name]
+    prefix = f"UPSTREAM_{name.upper()}"
+    return UpstreamLimiter(
+        name=name,
+        rate=float(os.getenv(f"{prefix}_RPS", rate)),
+        burst=int(os.getenv(f"{prefix}_BURST", burst)),
+        max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        max_wait_seconds=float(os.getenv(f"{prefix}_MAX_WAIT", max_wait)),
+    )
+
+
+# Global limiters (name → UpstreamLimiter)
+upstream_limiters: Dict[str, UpstreamLimiter] = {name: _build_limiter(name) for name in UPSTREAM_DEFAULTS}
+
+
+def upstream(name: str) -> UpstreamLimiter:
+    """Get the limiter for an upstream (magento_catalog, magento_customers, loft, vapi, openai)"""
+    return upstream_limiters[name]
+
+
+def upstream_metrics() -> Dict[str, Dict[str, float]]:
+    """Queue/shed metrics for every upstream"""
+    return {name: limiter.snapshot() for name, limiter in upstream_limiters.items()}
+
+
+class RateLimitedModel(WrapperModel):
+    """Model whose requests each take a slot of an upstream limiter"""
+
+    def __init__(self, wrapped: Any, upstream_name: str = "openai"):
+        super().__init__(wrapped)
+        self.upstream_name = upstream_name
+
+    async def request(self, *args: Any, **kwargs: Any):
+        async with upstream(self.upstream_name).slot():
+            return await self.wrapped.request(*args, **kwargs)
+
+    @asynccontextmanager
+    async def request_stream(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        async with upstream(self.upstream_name).slot():
+            async with self.wrapped.request_stream(*args, **kwargs) as response_stream:
+                yield response_stream
+
+
+@functools.lru_cache(maxsize=None)
+def rate_limited_model(model_name: str, upstream_name: str = "openai") -> RateLimitedModel:
+    """
+    One RateLimitedModel per model name, built on first use: inferring the model
+    ("openai:gpt-4.1") needs its API key, which agents defer with defer_model_check
+    """
+    return RateLimitedModel(model_name, upstream_name)
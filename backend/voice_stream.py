@@ -0,0 +1,182 @@
+"""
+🗣️ SENTENCE STREAMING FOR THE VOICE CHANNEL
+Text-to-speech can start on the first complete sentence, so voice turns are
+streamed sentence by sentence instead of as one buffered answer:
+
+- StreamingHTMLSanitizer removes HTML from the deltas (tags split across
+  deltas included)
+- SentenceChunker cuts the text at sentence ends (not at "Dr." or "$1.99")
+  and at line breaks, and cuts overlong runs at a comma or space
+- speech_text() strips markdown, links, emojis and list markers, which TTS
+  would otherwise read out
+- everything from **CAROUSEL_DATA:** on is product JSON for screens and is
+  never spoken
+
+Chunks use the OpenAI chat.completion.chunk format that Vapi's custom-LLM
+integration consumes.
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from stream_sanitizer import StreamingHTMLSanitizer
+
+VOICE_FIRST_SENTENCE_DEADLINE_MS = int(os.getenv("VOICE_FIRST_SENTENCE_DEADLINE_MS", "1200"))
+VOICE_MAX_SENTENCE_CHARS = int(os.getenv("VOICE_MAX_SENTENCE_CHARS", "240"))
+
+# Said once when nothing is ready by the first-sentence deadline
+FILLER_THINKING = "One moment."
+FILLER_LOOKUP = "Let me look that up for you."
+
+CAROUSEL_MARKER = "**CAROUSEL_DATA:**"
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr", "vs", "etc", "no", "ave", "blvd", "rd", "hwy", "e.g", "i.e", "a.m", "p.m"}
+
+MARKDOWN_LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+URL_RE = re.compile(r"https?://\S+|www\.\S+")
+EMPHASIS_RE = re.compile(r"[*`#>|~]+|(?<!\w)_+|_+(?!\w)")
+SNAKE_CASE_RE = re.compile(r"(?<=[^\W_])_+(?=[^\W_])")    # tool_names → "tool names"
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-•]|\d+[.)])\s+")
+EMOJI_RE = re.compile(r"[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]")
+
+
+def speech_text(text: str) -> str:
+    """What TTS should say for one sentence of (HTML-free) chat text"""
+    text = MARKDOWN_LINK_RE.sub(r"\1", text)
+    text = URL_RE.sub("", text)
+    text = LIST_MARKER_RE.sub("", text)
+    text = EMPHASIS_RE.sub("", text)
+    text = SNAKE_CASE_RE.sub(" ", text)
+    text = EMOJI_RE.sub("", text)
+    return " ".join(text.split())
+
+
+class SentenceChunker:
+    """Buffers streamed text and releases complete sentences"""
+
+    __slots__ = ("_buffer",)
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(self._buffer):
+            if match.group()[0] == "." and self._is_abbreviation(self._buffer[start:match.start()]):
+                continue
+            sentences.append(self._buffer[start:match.end()])
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        while len(self._buffer) > VOICE_MAX_SENTENCE_CHARS:
+            sentences.append(self.split_clause(VOICE_MAX_SENTENCE_CHARS))
+        return sentences
+
+    def split_clause(self, limit: Optional[int] = None) -> str:
+        """Release the buffer up to its last comma (or space) before limit; "" if there is none"""
+        head = self._buffer[:limit] if limit else self._buffer
+        cut = head.rfind(", ") + 1 or head.rfind(" ") + 1
+        if limit and not cut:
+            cut = limit
+        clause, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return clause
+
+    def flush(self) -> str:
+        rest, self._buffer = self._buffer, ""
+        return rest
+
+    @staticmethod
+    def _is_abbreviation(text: str) -> bool:
+        words = text.rsplit(None, 1)
+        last = words[-1].lower() if words else ""
+        return last in ABBREVIATIONS or (len(last) == 1 and last.isalpha())
+
+
+class SpeechStream:
+    """Chat deltas in, speakable sentences out"""
+
+    def __init__(self):
+        self._sanitizer = StreamingHTMLSanitizer()
+        self._chunker = SentenceChunker()
+        self._tail = ""              # text that may be the start of the carousel marker
+        self._muted = False          # past the carousel marker
+        self.sentences_sent = 0
+
+    def feed(self, delta: str) -> List[str]:
+        if self._muted:
+            return []
+        text = self._tail + self._sanitizer.feed(delta)
+        marker = text.find(CAROUSEL_MARKER)
+        if marker != -1:
+            self._muted = True
+            text = text[:marker]
+            self._tail = ""
+        else:
+            # Hold back a suffix that could still turn into the marker
+            keep = next((i for i in range(min(len(text), len(CAROUSEL_MARKER) - 1), 0, -1)
+                         if CAROUSEL_MARKER.startswith(text[-i:])), 0)
+            text, self._tail = (text[:-keep], text[-keep:]) if keep else (text, "")
+        return self._speakable(self._chunker.feed(text))
+
+    def partial(self) -> List[str]:
+        """The first clause of the buffered text, for the first-sentence deadline"""
+        return self._speakable([self._chunker.split_clause()])
+
+    def finish(self) -> List[str]:
+        rest = "" if self._muted else self._tail + self._sanitizer.finish()
+        self._tail = ""
+        return self._speakable(self._chunker.feed(rest) + [self._chunker.flush()])
+
+    def _speakable(self, sentences: List[str]) -> List[str]:
+        spoken = [text for text in (speech_text(sentence) for sentence in sentences) if text]
+        self.sentences_sent += len(spoken)
+        return spoken
+
+
+class VoiceStats:
+    """Time to first sentence per voice turn and how often the deadline had to fill in"""
+
+    def __init__(self, samples: int = 500):
+        self.turns = 0
+        self.deadline_fills = 0
+        self.first_sentence_ms: "deque[float]" = deque(maxlen=samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.first_sentence_ms)
+        return {
+            "turns": self.turns,
+            "deadline_fills": self.deadline_fills,
+            "first_sentence_p50_ms": round(samples[len(samples) // 2], 1) if samples else 0.0,
+            "first_sentence_p95_ms": round(samples[int(len(samples) * 0.95)], 1) if samples else 0.0,
+            "deadline_ms": VOICE_FIRST_SENTENCE_DEADLINE_MS,
+        }
+
+
+voice_stats = VoiceStats()
+
+
+def completion_chunk(completion_id: str, content: Optional[str] = None, finish_reason: Optional[str] = None,
+                     model: str = "loft-voice") -> str:
+    """One OpenAI-style chat.completion.chunk SSE line"""
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": content} if content is not None else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def new_completion_id(call_id: str = "") -> str:
+    return f"chatcmpl-{call_id or uuid.uuid4().hex[:12]}"
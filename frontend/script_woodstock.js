@@ -454,28 +454,43 @@ class WoodstockChat {
         const messageDiv = this.addMessage('', 'assistant');
         const contentDiv = messageDiv.querySelector('.message-content');
         
+        // 📡 Typed SSE events: tool results (e.g. the product carousel) arrive the
+        // moment each tool returns and render here, above the streaming text
+        const toolResultsDiv = document.createElement('div');
+        toolResultsDiv.className = 'tool-results';
+        messageDiv.insertBefore(toolResultsDiv, contentDiv);
+        let carouselShown = false;
+        
         let fullResponse = '';
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
+        let buffered = '';
 
         try {
             while (true) {
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n').filter(line => line.trim() !== '');
+                // An event can be split across reads: keep the trailing partial line
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
 
-                for (const line of lines) {
+                for (const line of lines.filter(line => line.trim() !== '')) {
                     if (line.startsWith('data: ')) {
                         const data = line.slice(6).trim();
                         
                         if (data === '[DONE]') {
                             console.log('✅ Streaming completed');
-                            // NOW render components with complete response
                             if (fullResponse.trim()) {
-                                console.log('🎨 Rendering final components for complete response');
-                                this.detectAndRenderComponents(fullResponse, contentDiv);
+                                if (carouselShown) {
+                                    // The carousel is already on screen; only the commentary is left
+                                    contentDiv.innerHTML = this.formatAsHTML(this.stripCarouselData(fullResponse));
+                                } else {
+                                    // NOW render components with complete response
+                                    console.log('🎨 Rendering final components for complete response');
+                                    this.detectAndRenderComponents(fullResponse, contentDiv);
+                                }
                                 this.messageHistory.push({ role: 'assistant', content: fullResponse });
                                 console.log('💾 Added assistant response to history');
                             }
@@ -484,14 +499,34 @@ class WoodstockChat {
 
                         try {
                             const parsed = JSON.parse(data);
+                            
+                            if (parsed.type === 'tool_start') {
+                                console.log(`🔧 Tool started: ${parsed.tool}`, parsed.arguments);
+                                continue;
+                            }
+                            if (parsed.type === 'tool_result') {
+                                console.log(`✅ Tool finished: ${parsed.tool} (${parsed.duration_ms}ms)`);
+                                const products = parsed.payload?.carousel?.products;
+                                if (!carouselShown && products?.length) {
+                                    carouselShown = this.renderStreamedCarousel(products, toolResultsDiv);
+                                    this.scrollToBottom();
+                                }
+                                continue;
+                            }
+                            if (parsed.type === 'done') {
+                                console.log('🏁 Turn done, tools:', parsed.tools);
+                                continue;
+                            }
+                            
                             const delta = parsed.choices?.[0]?.delta;
                             
                             if (delta?.content) {
                                 // Accumulate delta text
                                 fullResponse += delta.content;
                             
-                                // Only show text during streaming (components will render at the end)
-                                contentDiv.innerHTML = this.formatAsHTML(fullResponse);
+                                // Only show text during streaming (components will render at the end);
+                                // the carousel JSON the model repeats is never shown as text
+                                contentDiv.innerHTML = this.formatAsHTML(this.stripCarouselData(fullResponse));
                                 this.scrollToBottom();
                             }
                             
@@ -507,6 +542,50 @@ class WoodstockChat {
         }
     }
 
+    renderStreamedCarousel(products, container) {
+        // Carousel from a tool_result event, rendered while the model is still writing
+        if (!window.woodstockCarousel) {
+            return false;
+        }
+        try {
+            container.innerHTML = window.woodstockCarousel.createProductCarousel(
+                products,
+                `Found ${products.length} Products`
+            );
+            setTimeout(() => {
+                const carouselEl = container.querySelector('[id^="carousel-"]');
+                if (carouselEl && window.swiffyslider) {
+                    window.swiffyslider.init(carouselEl);
+                }
+            }, 300);
+            return true;
+        } catch (error) {
+            console.error('❌ Streamed carousel rendering failed:', error);
+            return false;
+        }
+    }
+
+    stripCarouselData(text) {
+        // Remove **CAROUSEL_DATA:** {json} (complete or still streaming) from display text
+        const startIndex = text.indexOf('**CAROUSEL_DATA:**');
+        if (startIndex === -1) {
+            return text;
+        }
+        const jsonStart = text.indexOf('{', startIndex);
+        if (jsonStart === -1) {
+            return text.substring(0, startIndex);
+        }
+        let braceCount = 0;
+        for (let i = jsonStart; i < text.length; i++) {
+            if (text[i] === '{') braceCount++;
+            if (text[i] === '}') braceCount--;
+            if (braceCount === 0) {
+                return text.substring(0, startIndex) + this.stripCarouselData(text.substring(i + 1));
+            }
+        }
+        return text.substring(0, startIndex);
+    }
+
     detectAndRenderComponents(fullResponse, contentDiv) {
         // 🔥 BUG-030 FIX: Single CAROUSEL_DATA detection block to prevent conflicts
         if (fullResponse.includes('CAROUSEL_DATA:')) {